@@ -220,24 +220,55 @@ def create_app(test_config=None):
             from app.utils.data_storage import init_storage
             from app.utils.data_processor import init_processor_pipeline
             from app.utils.flow_collector import init_flow_collectors
+            from app.utils.counter_state import init_counter_store
+            from app.utils.interface_inventory import init_interface_inventory
+            from app.utils.snmp_poller import check_async_snmp
+            
+            # 记录SNMP并发轮询的执行方式（asyncio接口或线程池）
+            check_async_snmp()
             
             # 初始化OUI数据库
             init_oui_database()
             
+            # 加载接口计数器状态
+            init_counter_store(app.config.get(
+                'COUNTER_STATE_PATH', os.path.join(app.instance_path, 'counter_state.json')
+            ))
+            
+            # 加载接口清单缓存
+            init_interface_inventory(app.config.get(
+                'INTERFACE_INVENTORY_PATH', os.path.join(app.instance_path, 'interface_inventory.json')
+            ))
+            
             # 初始化数据存储层
             init_storage()
             
             # 初始化数据处理流水线
-            init_processor_pipeline()
+            init_processor_pipeline(app)
             
             # 初始化流量收集器
-            init_flow_collectors()
+            init_flow_collectors(app.config)
             
             # 添加调度任务
-            from app.utils.scheduler import poll_devices, discover_terminals
+            from app.utils.scheduler import (
+                poll_devices, poll_due_devices, discover_terminals, flush_flow_data, rebuild_seasonal_baselines
+            )
             
+            if app.config.get('SNMP_ADAPTIVE_POLLING', True):
+                # 按节拍轮询到期的设备，每台设备使用各自的轮询周期
+                if not scheduler.get_job('poll_scheduler_job'):
+                    scheduler.add_job(
+                        func=poll_due_devices,
+                        trigger='interval',
+                        seconds=app.config.get('SNMP_SCHEDULER_TICK', 10),
+                        id='poll_scheduler_job',
+                        replace_existing=True,
+                        max_instances=1,
+                        coalesce=True,
+                        name='设备流量数据采集'
+                    )
             # 添加每5分钟执行一次的设备数据采集任务
-            if not scheduler.get_job('poll_devices_job'):
+            elif not scheduler.get_job('poll_devices_job'):
                 scheduler.add_job(
                     func=poll_devices,
                     trigger='interval',
@@ -247,6 +278,33 @@ def create_app(test_config=None):
                     name='设备流量数据采集'
                 )
             
+            # 按节拍写入已结束的NetFlow/sFlow汇总周期
+            if not scheduler.get_job('flow_flush_job'):
+                scheduler.add_job(
+                    func=flush_flow_data,
+                    trigger='interval',
+                    seconds=app.config.get('FLOW_FLUSH_INTERVAL', 10),
+                    id='flow_flush_job',
+                    replace_existing=True,
+                    max_instances=1,
+                    coalesce=True,
+                    name='流量数据写入'
+                )
+            
+            # 使用同时段基线检测时，启动后立即建立画像，之后定期重建
+            if app.config.get('ANOMALY_DETECTOR') == 'seasonal' and not scheduler.get_job('seasonal_baseline_job'):
+                scheduler.add_job(
+                    func=rebuild_seasonal_baselines,
+                    trigger='interval',
+                    hours=app.config.get('ANOMALY_SEASONAL_REBUILD_HOURS', 24),
+                    next_run_time=datetime.now(),
+                    id='seasonal_baseline_job',
+                    replace_existing=True,
+                    max_instances=1,
+                    coalesce=True,
+                    name='同时段流量画像建立'
+                )
+            
             # 添加每15分钟执行一次的终端设备发现任务
             if not scheduler.get_job('discover_terminals_job'):
                 scheduler.add_job(
@@ -210,9 +210,13 @@ def api_history(device_id):
     # 格式化数据返回
     result = []
     for t in traffic_data:
-        # 计算入站和出站速率(Mbps)
-        in_rate = t.in_octets * 8 / 1000000  # 转换为Mbps
-        out_rate = t.out_octets * 8 / 1000000  # 转换为Mbps
+        # 计算入站和出站速率(Mbps)，优先使用采集时已算好的速率
+        if t.in_rate is not None:
+            in_rate = t.in_rate / 1000000
+            out_rate = (t.out_rate or 0) / 1000000
+        else:
+            in_rate = t.in_octets * 8 / 1000000  # 转换为Mbps
+            out_rate = t.out_octets * 8 / 1000000  # 转换为Mbps
         
         # 确定带宽值
         max_bandwidth = t.bandwidth / 1000000 if t.bandwidth else default_bandwidth
@@ -275,9 +279,13 @@ def api_heatmap():
             data_source = "无数据"
 
             if traffic:
-                # 计算入站和出站速率(Mbps)
-                in_rate = traffic.in_octets * 8 / 1000000  # 转换为Mbps
-                out_rate = traffic.out_octets * 8 / 1000000  # 转换为Mbps
+                # 计算入站和出站速率(Mbps)，优先使用采集时已算好的速率
+                if traffic.in_rate is not None:
+                    in_rate = traffic.in_rate / 1000000
+                    out_rate = (traffic.out_rate or 0) / 1000000
+                else:
+                    in_rate = traffic.in_octets * 8 / 1000000  # 转换为Mbps
+                    out_rate = traffic.out_octets * 8 / 1000000  # 转换为Mbps
 
                 # 记录原始数据用于调试
                 current_app.logger.debug(f"设备 {device.name}(ID:{device.id}) - 入站: {in_rate:.2f}Mbps, 出站: {out_rate:.2f}Mbps, " +
@@ -381,8 +389,8 @@ def api_heatmap_refresh():
 def recalculate_utilization():
     """重新计算所有流量记录的利用率，使用最大流量值（入站或出站）除以带宽"""
     try:
-        # 获取所有流量记录
-        traffic_records = Traffic.query.all()
+        # 获取所有流量记录（采集时已算好速率的记录无需重新计算）
+        traffic_records = Traffic.query.filter(Traffic.in_rate.is_(None)).all()
         
         # 计数器
         count = 0
@@ -422,4 +430,196 @@ def recalculate_utilization():
         })
     except Exception as e:
         current_app.logger.error(f"重新计算流量利用率出错: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500 
+
+@monitor.route('/api/poll_schedule')
+@login_required
+def api_poll_schedule():
+    """获取各设备的轮询周期和下次轮询时间"""
+    from app.utils.poll_scheduler import poll_scheduler
+    
+    try:
+        schedules = poll_scheduler.to_dict()
+        names = {device.id: device.name for device in Device.query.all()}
+        for schedule in schedules:
+            schedule['device_name'] = names.get(schedule['device_id'])
+            schedule['next_due'] = datetime.fromtimestamp(schedule['next_due']).isoformat()
+            if schedule['last_polled']:
+                schedule['last_polled'] = datetime.fromtimestamp(schedule['last_polled']).isoformat()
+        
+        return jsonify({"status": "success", "data": schedules, "count": len(schedules)})
+    except Exception as e:
+        current_app.logger.error(f"获取设备轮询计划出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@monitor.route('/api/poll_metrics')
+@login_required
+def api_poll_metrics():
+    """
+    获取轮询指标：每台设备的轮询耗时直方图、超时和错误次数，每个OID的请求耗时，每轮的PDU数和耗时
+    format=prometheus时返回Prometheus文本格式，供监控系统采集
+    """
+    from app.utils.poll_metrics import poll_metrics, to_prometheus
+    from app.utils.sharded_poller import current_sharded_poller
+    
+    try:
+        top = request.args.get('top', 50, type=int)
+        metrics = poll_metrics.to_dict(top=top)
+        sharded = current_sharded_poller()
+        shard_metrics = dict(sharded.shard_metrics) if sharded is not None else {}
+        
+        if request.args.get('format') == 'prometheus':
+            text = to_prometheus(metrics)
+            for shard, shard_data in sorted(shard_metrics.items()):
+                text += to_prometheus(shard_data, extra_labels=f'shard="{shard}"')
+            return current_app.response_class(text, mimetype='text/plain; version=0.0.4')
+        
+        if shard_metrics:
+            metrics['shards'] = {str(shard): data for shard, data in shard_metrics.items()}
+        return jsonify({"status": "success", "data": metrics})
+    except Exception as e:
+        current_app.logger.error(f"获取轮询指标出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@monitor.route('/api/flow_ingest')
+@login_required
+def api_flow_ingest():
+    """
+    获取NetFlow/sFlow接收指标：接收数、解码数、环形缓冲区等待次数、内核丢包数和解码延迟
+    format=prometheus时返回Prometheus文本格式，供监控系统采集
+    """
+    from app.utils import flow_collector
+    from app.utils.flow_ingest import ingest_to_prometheus
+    
+    try:
+        stats = {}
+        for name, collector in (('netflow', flow_collector.netflow_collector), ('sflow', flow_collector.sflow_collector)):
+            collector_stats = collector.ingest_stats()
+            if collector_stats is not None:
+                stats[name] = collector_stats
+        # 多进程模式下每个收集进程单独统计
+        if flow_collector.flow_collector_pool is not None:
+            stats.update(flow_collector.flow_collector_pool.stats())
+        
+        if request.args.get('format') == 'prometheus':
+            return current_app.response_class(ingest_to_prometheus(stats), mimetype='text/plain; version=0.0.4')
+        return jsonify({"status": "success", "data": stats})
+    except Exception as e:
+        current_app.logger.error(f"获取流量接收指标出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@monitor.route('/api/flow_sampling')
+@login_required
+def api_flow_sampling():
+    """
+    获取各导出设备的采样模式和采样率，以及采样率的来源（v5包头、v9/IPFIX选项或数据记录、sFlow）
+    多进程收集模式下采样率在各收集进程中登记和放大，这里只包含应用进程内收集器的登记
+    """
+    from app.utils.flow_sampling import sampling_registry
+    
+    return jsonify({"status": "success", "data": sampling_registry.to_dict()})
+
+@monitor.route('/api/pipeline_stats')
+@login_required
+def api_pipeline_stats():
+    """获取数据处理流水线的队列深度、丢弃和合并计数、排队等待时间和批处理耗时"""
+    from app.utils.data_processor import processor_pipeline
+    
+    return jsonify({"status": "success", "data": processor_pipeline.stats()})
+
+@monitor.route('/api/top_talkers')
+@login_required
+def api_top_talkers():
+    """
+    获取接口的流量大户
+    参数: device_id或exporter（导出设备IP）、interface（接口索引，不指定时合并所有接口）、
+    dimension（src、dst或conversation）、windows（合并的分钟窗口数）、limit
+    不指定设备时返回有流量大户统计的（导出设备, 接口）列表
+    """
+    from app.utils.top_talkers import top_talkers, DIMENSIONS
+    
+    exporter = request.args.get('exporter', type=str)
+    device_id = request.args.get('device_id', type=int)
+    if device_id is not None:
+        exporter = Device.query.get_or_404(device_id).ip_address
+    
+    try:
+        if not exporter:
+            interfaces = [{'exporter': ip, 'interface_id': interface_id} for ip, interface_id in top_talkers.interfaces()]
+            return jsonify({"status": "success", "data": interfaces})
+        
+        dimension = request.args.get('dimension', 'src', type=str)
+        if dimension not in DIMENSIONS:
+            return jsonify({"status": "error", "message": f"不支持的统计维度: {dimension}"}), 400
+        result = top_talkers.query(
+            exporter,
+            interface_id=request.args.get('interface', type=int),
+            dimension=dimension,
+            windows=max(1, request.args.get('windows', 1, type=int)),
+            limit=max(1, request.args.get('limit', 10, type=int))
+        )
+        return jsonify({"status": "success", "data": result})
+    except Exception as e:
+        current_app.logger.error(f"获取流量大户出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _flow_record_filters():
+    """从请求参数读取流记录过滤条件，时间为Unix时间戳，默认最近15分钟"""
+    end = request.args.get('end', type=float) or datetime.now().timestamp()
+    filters = {
+        'start': request.args.get('start', type=float) or end - 900,
+        'end': end,
+        'ip': request.args.get('ip', type=str),
+        'src': request.args.get('src', type=str),
+        'dst': request.args.get('dst', type=str),
+        'port': request.args.get('port', type=int),
+        'exporter': request.args.get('exporter', type=str),
+        'interface': request.args.get('interface', type=int),
+        'protocol': request.args.get('protocol', type=int)
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+@monitor.route('/api/flow_records')
+@login_required
+def api_flow_records():
+    """
+    按时间范围、IP、端口、导出设备、接口或协议查询落盘的原始流记录
+    参数: start、end（Unix时间戳）、ip、src、dst、port、exporter、interface、protocol、limit
+    """
+    from app.utils.flow_spool import FlowSpoolReader, records_to_dicts
+    
+    try:
+        reader = FlowSpoolReader(current_app.config.get('FLOW_SPOOL_PATH'),
+                                 current_app.config.get('FLOW_SPOOL_PARTITION_SECONDS', 3600))
+        limit = max(1, min(request.args.get('limit', 1000, type=int), 100000))
+        records = reader.read(limit=limit, **_flow_record_filters())
+        return jsonify({"status": "success", "data": records_to_dicts(records)})
+    except Exception as e:
+        current_app.logger.error(f"查询流记录出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@monitor.route('/api/flow_records/replay', methods=['POST'])
+@login_required
+def api_flow_records_replay():
+    """
+    把符合条件的流记录按（导出设备, 接口, 分钟）汇总后回放到数据处理流水线
+    参数与/api/flow_records相同，另有pipeline（默认feature_analysis）和bucket（汇总秒数，默认60）
+    """
+    from app.utils.flow_spool import FlowSpoolReader
+    from app.utils.data_processor import submit_data
+    
+    try:
+        reader = FlowSpoolReader(current_app.config.get('FLOW_SPOOL_PATH'),
+                                 current_app.config.get('FLOW_SPOOL_PARTITION_SECONDS', 3600))
+        submitted = reader.replay_to_pipeline(
+            submit_data,
+            bucket_seconds=max(1, request.args.get('bucket', 60, type=int)),
+            pipeline=request.args.get('pipeline', 'feature_analysis', type=str),
+            **_flow_record_filters()
+        )
+        return jsonify({"status": "success", "data": {"submitted": submitted}})
+    except Exception as e:
+        current_app.logger.error(f"回放流记录出错: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -17,6 +17,9 @@ class Traffic(db.Model):
     out_errors = db.Column(db.Integer)  # 出口错误数
     bandwidth = db.Column(db.BigInteger)  # 接口带宽（bps）
     utilization = db.Column(db.Float)  # 带宽利用率（百分比）
+    in_rate = db.Column(db.Float)  # 入口速率（bps），采集时由计数器增量计算
+    out_rate = db.Column(db.Float)  # 出口速率（bps），采集时由计数器增量计算
+    interval = db.Column(db.Integer)  # 采集间隔（秒），计数器字段为该间隔内的增量
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -36,6 +39,9 @@ class Traffic(db.Model):
             'out_errors': self.out_errors,
             'bandwidth': self.bandwidth,
             'utilization': self.utilization,
+            'in_rate': self.in_rate,
+            'out_rate': self.out_rate,
+            'interval': self.interval,
             'timestamp': self.timestamp.isoformat()
         }
 
@@ -0,0 +1,253 @@
+"""
+流量基线存储模块
+
+AnomalyDetector原来为每个数据源保存一个Python列表，每个样本都重新拼接最近24个值再调用np.mean/np.std，
+字典随见过的source_id无限增长，重启后所有基线从零开始。本模块把所有数据源的最近N个值保存在
+预先分配的二维NumPy数组中（每个数据源一行环形缓冲区），同时维护窗口内的和与平方和，
+每个样本的更新和均值/标准差计算都是O(1)。长时间没有样本的数据源按TTL淘汰，数据源数超过上限时
+淘汰最久未更新的数据源；基线定期保存为npz快照，重启后加载。
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认参数
+DEFAULT_WINDOW = 25  # 最近24个数据点加当前值，与原来的基线窗口一致
+DEFAULT_MAX_SOURCES = 100000  # 最多保存的数据源数
+DEFAULT_TTL = 24 * 3600  # 超过该时间没有样本的数据源被淘汰（秒）
+DEFAULT_SNAPSHOT_INTERVAL = 300  # 快照的保存间隔（秒）
+INITIAL_CAPACITY = 1024  # 数组的初始行数，不够时按倍数扩大
+
+
+class BaselineStore:
+    """按数据源保存最近N个值的环形缓冲区"""
+
+    def __init__(self, path=None, window=DEFAULT_WINDOW, max_sources=DEFAULT_MAX_SOURCES, ttl=DEFAULT_TTL,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        """
+        参数:
+            path: 快照文件路径，为None时不持久化
+            window: 每个数据源保存的值数
+            max_sources: 最多保存的数据源数，超过时淘汰最久未更新的数据源
+            ttl: 数据源的最长空闲时间（秒）
+            snapshot_interval: 更新时自动保存快照的间隔（秒）
+        """
+        self.path = path
+        self.window = max(2, int(window))
+        self.max_sources = max(1, int(max_sources))
+        self.ttl = ttl
+        self.snapshot_interval = snapshot_interval
+        self.evictions = {'ttl': 0, 'lru': 0}
+        self._slots = OrderedDict()  # 数据源 -> 行号，按最近更新时间排列
+        self._free = []  # 已淘汰、可以复用的行号
+        self._lock = threading.Lock()
+        self._saved_at = time.time()
+        self._dirty = False
+        self._allocate_arrays(min(INITIAL_CAPACITY, self.max_sources))
+
+    def _allocate_arrays(self, capacity):
+        """分配或扩大数组，已有的行保持不变"""
+        old_capacity = len(self._count) if hasattr(self, '_count') else 0
+        arrays = {
+            '_values': np.zeros((capacity, self.window)),  # 环形缓冲区
+            '_count': np.zeros(capacity, dtype=np.int32),  # 窗口中的值数
+            '_position': np.zeros(capacity, dtype=np.int32),  # 下一个写入位置
+            '_offset': np.zeros(capacity),  # 平移量，和与平方和按(值-平移量)累计，避免大数相减损失精度
+            '_sum': np.zeros(capacity),
+            '_sumsq': np.zeros(capacity),
+            '_last_seen': np.zeros(capacity),  # 最近一次更新的时间戳
+        }
+        for name, array in arrays.items():
+            if old_capacity:
+                array[:old_capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self._free.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def _allocate(self, source_id):
+        """为新的数据源分配一行（调用时已持有锁）"""
+        if len(self._slots) >= self.max_sources:
+            _, row = self._slots.popitem(last=False)
+            self._free.append(row)
+            self.evictions['lru'] += 1
+        if not self._free:
+            self._allocate_arrays(min(len(self._count) * 2, self.max_sources))
+        row = self._free.pop()
+        self._count[row] = 0
+        self._position[row] = 0
+        self._sum[row] = 0.0
+        self._sumsq[row] = 0.0
+        self._slots[source_id] = row
+        return row
+
+    def _expire(self, now):
+        """淘汰超过TTL没有更新的数据源（调用时已持有锁），最久未更新的数据源排在最前面"""
+        if not self.ttl:
+            return
+        deadline = now - self.ttl
+        while self._slots:
+            source_id, row = next(iter(self._slots.items()))
+            if self._last_seen[row] >= deadline:
+                break
+            del self._slots[source_id]
+            self._free.append(row)
+            self.evictions['ttl'] += 1
+
+    def update(self, source_id, value, now=None):
+        """
+        把一个值加入数据源的窗口，返回包含该值在内的窗口统计
+
+        参数:
+            source_id: 数据源标识
+            value: 新的值
+            now: 当前时间戳（秒），默认为time.time()
+
+        返回:
+            (均值, 标准差, 窗口中的值数)
+        """
+        now = time.time() if now is None else now
+        value = float(value)
+        with self._lock:
+            self._expire(now)
+            row = self._slots.get(source_id)
+            if row is None:
+                row = self._allocate(source_id)
+                self._offset[row] = value
+            else:
+                self._slots.move_to_end(source_id)
+
+            offset = self._offset[row]
+            position = int(self._position[row])
+            count = int(self._count[row])
+            if count == self.window:
+                old = self._values[row, position] - offset
+                self._sum[row] -= old
+                self._sumsq[row] -= old * old
+            else:
+                count += 1
+                self._count[row] = count
+            self._values[row, position] = value
+            shifted = value - offset
+            self._sum[row] += shifted
+            self._sumsq[row] += shifted * shifted
+            position = (position + 1) % self.window
+            self._position[row] = position
+            if position == 0:
+                # 每写满一圈按当前均值重新平移并重新计算和与平方和，消除累计的浮点误差
+                values = self._values[row]
+                offset = self._offset[row] = values.mean()
+                deviations = values - offset
+                self._sum[row] = deviations.sum()
+                self._sumsq[row] = (deviations * deviations).sum()
+            self._last_seen[row] = now
+            self._dirty = True
+
+            mean_shift = self._sum[row] / count
+            mean = offset + mean_shift
+            variance = max(self._sumsq[row] / count - mean_shift * mean_shift, 0.0)
+
+        if self.path and self.snapshot_interval and now - self._saved_at >= self.snapshot_interval:
+            self.save(now=now)
+        return float(mean), math.sqrt(variance), count
+
+    def get(self, source_id):
+        """获取数据源当前的窗口统计，没有记录时返回None"""
+        with self._lock:
+            row = self._slots.get(source_id)
+            if row is None:
+                return None
+            count = int(self._count[row])
+            values = self._values[row, :count]
+            return {'mean': float(values.mean()), 'std': float(values.std()), 'count': count,
+                    'last_seen': float(self._last_seen[row])}
+
+    def forget(self, source_id):
+        """删除数据源的基线"""
+        with self._lock:
+            row = self._slots.pop(source_id, None)
+            if row is not None:
+                self._free.append(row)
+
+    def load(self, path=None, now=None):
+        """从快照加载基线，窗口大小不一致的快照被忽略"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        try:
+            with np.load(path) as snapshot:
+                if int(snapshot['window']) != self.window:
+                    logger.warning(f"基线快照的窗口大小为{int(snapshot['window'])}，与当前配置不一致，已忽略")
+                    return 0
+                keys = json.loads(str(snapshot['keys']))
+                arrays = {name: snapshot[name] for name in ('values', 'count', 'position', 'offset', 'sum', 'sumsq',
+                                                             'last_seen')}
+            with self._lock:
+                for index, source_id in enumerate(keys[-self.max_sources:], start=max(len(keys) - self.max_sources, 0)):
+                    row = self._slots.get(source_id)
+                    if row is None:
+                        row = self._allocate(source_id)
+                    for name, array in arrays.items():
+                        getattr(self, f'_{name}')[row] = array[index]
+                self._expire(time.time() if now is None else now)
+            logger.info(f"已加载 {len(self._slots)} 个数据源的流量基线")
+            return len(self._slots)
+        except Exception as e:
+            logger.error(f"加载流量基线失败: {str(e)}")
+            return 0
+
+    def save(self, path=None, now=None):
+        """把基线保存为快照（先写临时文件再替换，避免写入中断导致文件损坏），没有更新时不写入"""
+        path = path or self.path
+        if not path:
+            return False
+
+        now = time.time() if now is None else now
+        with self._lock:
+            self._saved_at = now
+            if not self._dirty:
+                return True
+            self._expire(now)
+            # 按最近更新时间排列，加载时超过上限的部分优先保留最近更新的数据源
+            keys = [source_id if isinstance(source_id, (int, str)) else str(source_id) for source_id in self._slots]
+            rows = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            arrays = {name: getattr(self, f'_{name}')[rows] for name in ('values', 'count', 'position', 'offset', 'sum',
+                                                                         'sumsq', 'last_seen')}
+            self._dirty = False
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=np.array(json.dumps(keys)), window=np.array(self.window), **arrays)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"保存流量基线失败: {str(e)}")
+            self._dirty = True
+            return False
+
+    def to_dict(self):
+        """转换为字典"""
+        with self._lock:
+            return {
+                'sources': len(self._slots),
+                'capacity': len(self._count),
+                'window': self.window,
+                'max_sources': self.max_sources,
+                'ttl': self.ttl,
+                'evictions': dict(self.evictions),
+                'saved_at': self._saved_at
+            }
+
+    def __len__(self):
+        return len(self._slots)
@@ -0,0 +1,260 @@
+"""
+接口计数器状态模块
+
+为每个(设备, ifIndex)保存上一次轮询的计数器快照，在采集时计算两次轮询之间的真实增量和速率（bps）。
+处理32/64位计数器回绕，并通过sysUpTime识别设备重启；状态定期保存到磁盘，应用重启后不会丢失一个轮询周期。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 需要计算增量的计数器字段
+COUNTER_FIELDS = ('in_octets', 'out_octets', 'in_packets', 'out_packets', 'in_errors', 'out_errors')
+
+# 各计数器的位数，接口数据的counter_bits为整数（所有计数器相同）或按字段的字典
+COUNTER_BITS_32 = dict.fromkeys(COUNTER_FIELDS, 32)
+# ifXTable的字节数和单播包数为64位，错误数仍来自ifTable的32位ifInErrors/ifOutErrors
+COUNTER_BITS_HC = {'in_octets': 64, 'out_octets': 64, 'in_packets': 64, 'out_packets': 64,
+                   'in_errors': 32, 'out_errors': 32}
+
+# 两次轮询间隔超过该值时，32位计数器可能已多次回绕，增量不可信（秒）
+DEFAULT_MAX_INTERVAL = 3600
+
+# 超过该时间未更新的接口状态在保存时被淘汰（秒）
+DEFAULT_MAX_IDLE = 24 * 3600
+
+# 速率超过接口带宽的倍数时视为计数器不连续
+RATE_SANITY_FACTOR = 1.5
+
+
+def counter_delta(previous, current, bits=32):
+    """
+    计算计数器增量，处理一次回绕
+
+    参数:
+        previous: 上一次的计数器值
+        current: 本次的计数器值
+        bits: 计数器位数（32或64）
+
+    返回:
+        增量值
+    """
+    if current >= previous:
+        return current - previous
+    return current + (1 << bits) - previous
+
+
+def counter_widths(bits):
+    """
+    把counter_bits转换为与COUNTER_FIELDS顺序对应的位数元组
+
+    参数:
+        bits: 整数（所有计数器相同）、按字段的字典（未列出的字段为32位）或位数序列
+
+    返回:
+        位数元组
+    """
+    if isinstance(bits, int):
+        return (bits,) * len(COUNTER_FIELDS)
+    if isinstance(bits, dict):
+        return tuple(int(bits.get(field, 32)) for field in COUNTER_FIELDS)
+    return tuple(int(width) for width in bits)
+
+
+class CounterStateStore:
+    """接口计数器状态存储，每个接口只保存一个固定长度的快照"""
+
+    def __init__(self, path=None, max_interval=DEFAULT_MAX_INTERVAL, max_idle=DEFAULT_MAX_IDLE):
+        """
+        参数:
+            path: 状态文件路径，为None时不持久化
+            max_interval: 可信的最大轮询间隔（秒）
+            max_idle: 状态的最长保留时间（秒）
+        """
+        self.path = path
+        self.max_interval = max_interval
+        self.max_idle = max_idle
+        # (device_id, if_index) -> (采集时间, sysUpTime, 各计数器位数, 各计数器值...)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id, if_index, counters, timestamp, sys_uptime=None, bits=32):
+        """
+        写入新的计数器快照并返回与上一次快照之间的增量
+
+        参数:
+            device_id: 设备ID
+            if_index: 接口索引
+            counters: 计数器字典，键为COUNTER_FIELDS中的字段
+            timestamp: 采集时间（Unix时间戳）
+            sys_uptime: 设备sysUpTime（1/100秒），用于识别重启
+            bits: 计数器位数，整数或按字段的字典（见counter_widths）
+
+        返回:
+            包含各计数器增量和interval（秒）的字典；首次采集、设备重启或间隔不可信时返回None
+        """
+        key = (device_id, str(if_index))
+        values = tuple(int(counters.get(field) or 0) for field in COUNTER_FIELDS)
+        widths = counter_widths(bits)
+        state = (timestamp, sys_uptime, widths) + values
+
+        with self._lock:
+            previous = self._states.get(key)
+            self._states[key] = state
+
+        if previous is None:
+            return None
+
+        prev_timestamp, prev_uptime, prev_bits = previous[:3]
+
+        # 计数器位数变化（如切换到ifXTable）时重新建立基线
+        if counter_widths(prev_bits) != widths:
+            return None
+
+        # sysUpTime变小说明设备重启过，计数器已清零
+        if sys_uptime is not None and prev_uptime is not None:
+            if sys_uptime < prev_uptime:
+                logger.info(f"设备{device_id}的sysUpTime回退，判定为重启，重置接口{if_index}的计数器基线")
+                return None
+            interval = (sys_uptime - prev_uptime) / 100.0
+        else:
+            interval = timestamp - prev_timestamp
+
+        if interval <= 0 or interval > self.max_interval:
+            return None
+
+        deltas = {
+            field: counter_delta(prev_value, value, width)
+            for field, width, prev_value, value in zip(COUNTER_FIELDS, widths, previous[3:], values)
+        }
+        deltas['interval'] = interval
+        return deltas
+
+    def apply(self, device_id, interfaces, timestamp, sys_uptime=None):
+        """
+        为一台设备的接口数据计算增量和速率
+        成功计算的接口中，计数器字段被替换为本周期的增量，并增加in_rate/out_rate(bps)和interval
+
+        参数:
+            device_id: 设备ID
+            interfaces: 接口流量数据列表（包含if_index和累计计数器）
+            timestamp: 采集时间（Unix时间戳），接口数据中带有timestamp时使用接口自己的采集时间
+            sys_uptime: 设备sysUpTime（1/100秒），接口数据中带有sys_uptime时使用接口自己的值
+
+        返回:
+            interfaces（原地修改），无法计算速率的接口in_rate为None
+        """
+        for interface_data in interfaces:
+            deltas = self.update(
+                device_id,
+                interface_data.get('if_index', interface_data['interface']),
+                interface_data,
+                interface_data.get('timestamp', timestamp),
+                sys_uptime=interface_data.get('sys_uptime', sys_uptime),
+                bits=interface_data.get('counter_bits', 32)
+            )
+
+            interface_data['in_rate'] = None
+            interface_data['out_rate'] = None
+            interface_data['utilization'] = 0
+            if deltas is None:
+                continue
+
+            interval = deltas['interval']
+            in_rate = deltas['in_octets'] * 8 / interval
+            out_rate = deltas['out_octets'] * 8 / interval
+
+            # 速率明显超过接口带宽，说明计数器不连续（如多次回绕或被清零）
+            bandwidth = interface_data.get('bandwidth') or 0
+            if bandwidth > 0 and max(in_rate, out_rate) > bandwidth * RATE_SANITY_FACTOR:
+                logger.debug(f"设备{device_id}接口{interface_data['interface']}速率超过带宽，丢弃本周期数据")
+                continue
+
+            for field in COUNTER_FIELDS:
+                interface_data[field] = deltas[field]
+            interface_data['interval'] = interval
+            interface_data['in_rate'] = in_rate
+            interface_data['out_rate'] = out_rate
+
+            # 带宽利用率取入站和出站中的较大值
+            if bandwidth > 0:
+                interface_data['utilization'] = min(100, max(in_rate, out_rate) / bandwidth * 100)
+
+        return interfaces
+
+    def forget_device(self, device_id):
+        """删除一台设备的所有接口状态"""
+        with self._lock:
+            for key in [key for key in self._states if key[0] == device_id]:
+                del self._states[key]
+
+    def load(self, path=None):
+        """从磁盘加载状态"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        try:
+            with open(path, 'r') as f:
+                content = json.load(f)
+            states = {}
+            for key, state in content.get('states', {}).items():
+                device_id, if_index = key.split(':', 1)
+                states[(int(device_id), if_index)] = tuple(state)
+            with self._lock:
+                self._states.update(states)
+            logger.info(f"已加载 {len(states)} 个接口的计数器状态")
+            return len(states)
+        except Exception as e:
+            logger.error(f"加载计数器状态失败: {str(e)}")
+            return 0
+
+    def save(self, path=None):
+        """将状态保存到磁盘（先写临时文件再替换，避免写入中断导致文件损坏）"""
+        path = path or self.path
+        if not path:
+            return False
+
+        now = time.time()
+        with self._lock:
+            # 淘汰长时间未更新的接口
+            for key in [key for key, state in self._states.items() if now - state[0] > self.max_idle]:
+                del self._states[key]
+            states = {f'{device_id}:{if_index}': list(state)
+                      for (device_id, if_index), state in self._states.items()}
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': 1, 'states': states}, f)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"保存计数器状态失败: {str(e)}")
+            return False
+
+    def __len__(self):
+        return len(self._states)
+
+
+# 全局计数器状态存储
+counter_store = CounterStateStore()
+
+
+def init_counter_store(path):
+    """
+    初始化计数器状态存储并加载已保存的状态
+
+    参数:
+        path: 状态文件路径
+    """
+    counter_store.path = path
+    counter_store.load()
+    return counter_store
@@ -10,7 +10,7 @@ import threading
 import queue
 import time
 import json
-import numpy as np
+from collections import deque
 from datetime import datetime, timedelta
 from abc import ABC, abstractmethod
 from flask import current_app
@@ -18,16 +18,46 @@ from app import db
 from app.models.traffic import Traffic, TrafficStats
 from app.models.device import Device
 from app.models.alert import Alert
+from app.utils.poll_metrics import Histogram
+from app.utils.baseline_store import BaselineStore, DEFAULT_MAX_SOURCES, DEFAULT_TTL, DEFAULT_SNAPSHOT_INTERVAL
+from app.utils.sharded_poller import shard_state_path
+from app.utils.seasonal_baseline import SeasonalProfiles, WEEKDAY_NAMES, DEFAULT_MIN_SAMPLES
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 工作线程每批最多取出的数据数和凑批的最长等待时间（毫秒）
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BATCH_WAIT_MS = 50
+
+# 处理器的执行位置
+PLACEMENT_THREAD = 'thread'  # 在流水线工作线程中执行
+PLACEMENT_PROCESS = 'process'  # 在进程池中执行，CPU密集的处理器不与Web请求争用GIL
+
+# 队列容量和队列满时的处理策略
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BLOCK_TIMEOUT = 1.0  # block策略下生产者最长等待时间（秒），超时后丢弃新数据
+POLICY_BLOCK = 'block'  # 阻塞生产者，等待超时后丢弃新数据
+POLICY_DROP_OLDEST = 'drop_oldest'  # 丢弃最早入队的数据
+POLICY_PRIORITY = 'priority'  # 丢弃优先级最低的数据（同优先级丢弃最早的），数据的priority字段越大越重要
+POLICY_COALESCE = 'coalesce'  # 同一流水线、同一source_id只保留最新的数据，队列满时丢弃最早的数据
+QUEUE_POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_PRIORITY, POLICY_COALESCE)
+
+# 动态基线的检测方法
+DETECTOR_ZSCORE = 'zscore'  # 与同一数据源最近24个样本比较
+DETECTOR_SEASONAL = 'seasonal'  # 与一周中同一小时的历史画像比较，画像样本不足时按最近的样本比较
+DETECTORS = (DETECTOR_ZSCORE, DETECTOR_SEASONAL)
+
 # 定义处理器接口
 class Processor(ABC):
     """数据处理器基类，定义处理器接口"""
     
+    placement = PLACEMENT_THREAD  # 执行位置，可以按实例修改
+    remote_fields = None  # 放到进程池执行时发送给子进程的字段，None表示发送整个数据
+    result_fields = None  # 子进程返回后合并回数据的字段，None表示合并所有字段
+    
     def __init__(self, name):
         self.name = name
         self.next_processor = None
@@ -45,6 +75,47 @@ class Processor(ABC):
             return self.next_processor.process(result)
         return result
         
+    def process_batch(self, items):
+        """
+        批量处理数据并把结果整批传递给下一个处理器
+        
+        参数:
+            items: 数据列表
+        
+        返回:
+            最后一个处理器的结果列表，被过滤掉的数据不在其中
+        """
+        results = [result for result in self._process_batch_impl(items) if result]
+        
+        if self.next_processor and results:
+            return self.next_processor.process_batch(results)
+        return results
+        
+    def _process_batch_impl(self, items):
+        """批量处理逻辑，默认先执行_remote_batch_impl再执行_complete_batch，需要整批处理的子类覆盖此方法"""
+        return self._complete_batch([result for result in self._remote_batch_impl(items) if result])
+        
+    def _remote_batch_impl(self, items):
+        """
+        可以放到子进程中执行的批量处理逻辑，默认逐条调用_process_impl
+        
+        返回:
+            与items一一对应的结果列表，None表示该数据被过滤掉
+        """
+        return [self._process_impl(data) for data in items]
+        
+    def _complete_batch(self, items):
+        """子进程返回结果后在本进程中执行的部分（如写数据库），默认直接返回"""
+        return items
+        
+    def remote_options(self, shard):
+        """在进程池分片中创建处理器实例时使用的构造参数，默认不带参数"""
+        return {}
+        
+    def close(self):
+        """流水线停止时调用，保存需要持久化的状态"""
+        pass
+        
     @abstractmethod
     def _process_impl(self, data):
         """具体处理逻辑，由子类实现"""
@@ -197,11 +268,76 @@ class TrafficCalculator(Processor):
 class AnomalyDetector(Processor):
     """异常检测处理器"""
     
-    def __init__(self):
+    # 放到进程池执行时只发送检测需要的字段，只取回检测结果
+    remote_fields = ('source_id', 'calculated', 'metrics', 'device_id', 'interface', 'interface_id', 'timestamp')
+    result_fields = ('anomalies',)
+    
+    def __init__(self, baseline_options=None, detector=DETECTOR_ZSCORE, seasonal_options=None):
+        """
+        参数:
+            baseline_options: BaselineStore的参数（path、window、max_sources、ttl、snapshot_interval）
+            detector: 动态基线的检测方法，DETECTORS之一
+            seasonal_options: SeasonalProfiles的参数（path、min_samples、reload_interval、timezone），seasonal方法使用
+        """
         super().__init__("AnomalyDetector")
-        self.baseline_data = {}  # 存储基线数据
+        # 每个数据源最近N个值的环形缓冲区，按TTL/LRU淘汰，定期保存快照，重启后加载
+        self.baseline_options = dict(baseline_options or {})
+        self.baselines = BaselineStore(**self.baseline_options)
+        self.baselines.load()
+        
+        # 同时段画像由定时任务建立并写入文件，检测器只读取
+        if detector not in DETECTORS:
+            logger.warning(f"未知的异常检测方法: {detector}，使用{DETECTOR_ZSCORE}")
+            detector = DETECTOR_ZSCORE
+        self.detector = detector
+        self.seasonal_options = dict(seasonal_options or {})
+        self.seasonal = None
+        if detector == DETECTOR_SEASONAL:
+            self.seasonal = SeasonalProfiles(**self.seasonal_options)
+            self.seasonal.load()
+        
+    def remote_options(self, shard):
+        """子进程中的检测器使用各分片自己的快照文件，同时段画像文件由所有分片共享"""
+        path = shard_state_path(self.baseline_options.get('path'), shard)
+        return {
+            'baseline_options': dict(self.baseline_options, path=path),
+            'detector': self.detector,
+            'seasonal_options': self.seasonal_options
+        }
+        
+    def close(self):
+        """保存基线快照"""
+        self.baselines.save()
         
     def _process_impl(self, data):
+        """检测异常并生成告警"""
+        if self.seasonal is not None:
+            self.seasonal.refresh()
+        data = self._detect(data)
+        if data.get('anomalies'):
+            self._generate_alerts(data)
+        return data
+        
+    def _remote_batch_impl(self, items):
+        """逐条检测异常，不访问数据库，可以在子进程中执行"""
+        if self.seasonal is not None:
+            self.seasonal.refresh()
+        return [self._detect(data) for data in items]
+        
+    def _complete_batch(self, items):
+        """为整批中检测到异常的数据生成告警，一次提交"""
+        flagged = [data for data in items if data.get('anomalies')]
+        if flagged:
+            for data in flagged:
+                self._generate_alerts(data, commit=False)
+            try:
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"提交告警时出错: {str(e)}")
+                db.session.rollback()
+        return items
+        
+    def _detect(self, data):
         """
         实现异常检测逻辑
         - 阈值检测
@@ -276,30 +412,17 @@ class AnomalyDetector(Processor):
             if source_id and 'in_rate' in metrics:
                 current_value = metrics['in_rate']
                 
-                # 更新或创建基线
-                if source_id not in self.baseline_data:
-                    # 首次见到该数据源，初始化基线
-                    self.baseline_data[source_id] = {
-                        'values': [current_value],
-                        'mean': current_value,
-                        'std': 0,
-                        'last_updated': datetime.utcnow()
-                    }
-                else:
-                    # 更新基线统计数据
-                    baseline = self.baseline_data[source_id]
-                    values = baseline['values'][-24:] + [current_value]  # 保留最近24个数据点
-                    
-                    mean = np.mean(values)
-                    std = np.std(values) if len(values) > 1 else 0
-                    
-                    self.baseline_data[source_id] = {
-                        'values': values,
-                        'mean': mean,
-                        'std': std,
-                        'last_updated': datetime.utcnow()
-                    }
-                    
+                # 更新基线，返回包含当前值在内的最近24个数据点加当前值的统计
+                mean, std, count = self.baselines.update(source_id, current_value)
+                
+                # 同时段画像就绪时与一周中同一小时的历史比较，否则仍与最近的样本比较
+                anomaly = self._seasonal_anomaly(data, current_value)
+                if anomaly is not None:
+                    if anomaly['z_score'] > 3:
+                        data['anomalies'].append(anomaly)
+                
+                # 首次见到该数据源时只建立基线
+                elif count > 1:
                     # 检查是否偏离基线
                     # 使用z-score方法，偏离3个标准差视为异常
                     if std > 0:
@@ -315,10 +438,6 @@ class AnomalyDetector(Processor):
                                 'severity': 'warning' if z_score < 5 else 'critical'
                             }
                             data['anomalies'].append(anomaly)
-            
-            # 生成告警
-            if data['anomalies']:
-                self._generate_alerts(data)
                 
             return data
             
@@ -326,8 +445,53 @@ class AnomalyDetector(Processor):
             logger.error(f"异常检测处理出错: {str(e)}")
             return data
             
-    def _generate_alerts(self, data):
-        """根据检测到的异常生成告警"""
+    def _seasonal_anomaly(self, data, current_value):
+        """
+        与样本所在时段的画像比较
+        
+        参数:
+            data: 带有device_id、接口和timestamp的数据
+            current_value: 入向速率（字节/秒）
+            
+        返回:
+            包含z_score的异常记录，未启用画像或时段样本不足时返回None
+        """
+        if self.seasonal is None:
+            return None
+        
+        profile = self.seasonal.lookup(
+            data.get('device_id'),
+            data.get('interface') or data.get('interface_id'),
+            data.get('timestamp') or datetime.utcnow()
+        )
+        if profile is None:
+            return None
+        
+        # 画像与Traffic一致为bps，TrafficCalculator计算的速率为字节/秒
+        slot, mean, std, samples = profile
+        mean = mean / 8
+        z_score = abs(current_value - mean) / (std / 8) if std > 0 else 0.0
+        period = f"{WEEKDAY_NAMES[slot // 24]} {slot % 24}时"
+        return {
+            'type': 'seasonal',
+            'metric': 'in_rate',
+            'value': current_value,
+            'baseline': mean,
+            'z_score': z_score,
+            'slot': slot,
+            'samples': samples,
+            'message': f"入向流量偏离{period}的同时段基线 (z={z_score:.2f})",
+            'severity': 'warning' if z_score < 5 else 'critical'
+        }
+            
+    def _generate_alerts(self, data, commit=True):
+        """
+        根据检测到的异常生成告警
+        
+        参数:
+            data: 带有anomalies的数据
+            commit: 是否立即提交，批处理时由调用方统一提交
+        """
         try:
             source_id = data.get('source_id')
             timestamp = data.get('timestamp', datetime.utcnow())
@@ -371,7 +535,8 @@ class AnomalyDetector(Processor):
                 
                 db.session.add(alert)
             
-            db.session.commit()
+            if commit:
+                db.session.commit()
             logger.info(f"为数据源 {source_id} 生成了 {len(data['anomalies'])} 个告警")
             
         except Exception as e:
@@ -382,6 +547,10 @@ class AnomalyDetector(Processor):
 class TrafficFeatureAnalyzer(Processor):
     """流量特征分析处理器"""
     
+    # 放到进程池执行时只发送分析需要的字段，只取回分析结果
+    remote_fields = ('source_id', 'timestamp', 'data', 'metrics')
+    result_fields = ('features',)
+    
     def __init__(self):
         super().__init__("TrafficFeatureAnalyzer")
         
@@ -411,8 +580,9 @@ class TrafficFeatureAnalyzer(Processor):
 class DataPersister(Processor):
     """数据持久化处理器"""
     
-    def __init__(self):
+    def __init__(self, db_session=None):
         super().__init__("DataPersister")
+        self.db_session = db_session
         
     def _process_impl(self, data):
         """
@@ -420,97 +590,123 @@ class DataPersister(Processor):
         - 将处理后的数据保存到数据库
         - 根据数据类型选择不同的存储策略
         """
-        logger.debug(f"数据持久化: {data.get('source_id', 'unknown')}")
+        return self._process_batch_impl([data])[0]
         
-        try:
-            # 区分不同类型的数据
-            data_type = data.get('type', 'unknown')
-            
-            if data_type == 'traffic':
-                self._persist_traffic_data(data)
-            elif data_type == 'stats':
-                self._persist_stats_data(data)
-            elif data_type == 'event':
-                self._persist_event_data(data)
-            else:
-                logger.warning(f"未知的数据类型: {data_type}")
+    def _process_batch_impl(self, items):
+        """
+        批量持久化一批数据：流量数据和统计数据分别转换为行字典，整批一次批量插入、一次提交
+        
+        参数:
+            items: 数据列表
+        
+        返回:
+            数据列表，写入成功的数据标记persisted
+        """
+        traffic_rows = []
+        stats_rows = []
+        for data in items:
+            logger.debug(f"数据持久化: {data.get('source_id', 'unknown')}")
+            try:
+                # 区分不同类型的数据
+                data_type = data.get('type', 'unknown')
                 
-            data['persisted'] = True
-            return data
-            
-        except Exception as e:
-            logger.error(f"数据持久化出错: {str(e)}")
-            return data
-            
-    def _persist_traffic_data(self, data):
-        """持久化流量数据"""
-        try:
-            # 检查必要字段
-            if 'device_id' not in data or 'interface_id' not in data or 'data' not in data:
-                logger.warning("流量数据缺少必要字段")
-                return
+                if data_type == 'traffic':
+                    row = self._traffic_row(data)
+                    if row:
+                        traffic_rows.append(row)
+                elif data_type == 'stats':
+                    row = self._stats_row(data)
+                    if row:
+                        stats_rows.append(row)
+                elif data_type == 'event':
+                    self._persist_event_data(data)
+                elif data_type == 'replay':
+                    # 从流记录回放的数据只用于分析，原始数据已经保存过
+                    pass
+                else:
+                    logger.warning(f"未知的数据类型: {data_type}")
+                    
+            except Exception as e:
+                logger.error(f"数据持久化出错: {str(e)}")
                 
-            # 提取数据
-            device_id = data['device_id']
-            interface_id = data['interface_id']
-            timestamp = data.get('timestamp', datetime.utcnow())
-            raw_data = data['data']
-            
-            # 创建Traffic记录
-            traffic = Traffic(
-                device_id=device_id,
-                interface_id=interface_id,
-                timestamp=timestamp,
-                in_bytes=raw_data.get('in_bytes', 0),
-                out_bytes=raw_data.get('out_bytes', 0),
-                in_packets=raw_data.get('in_packets', 0),
-                out_packets=raw_data.get('out_packets', 0),
-                interval=data.get('interval_seconds', 300)
-            )
-            
-            # 保存到数据库
-            db.session.add(traffic)
-            db.session.commit()
-            
-            logger.debug(f"已保存设备 {device_id} 接口 {interface_id} 的流量数据")
-            
-        except Exception as e:
-            logger.error(f"持久化流量数据时出错: {str(e)}")
-            db.session.rollback()
-            
-    def _persist_stats_data(self, data):
-        """持久化统计数据"""
-        try:
-            # 检查必要字段
-            if 'device_id' not in data or 'metrics' not in data:
-                logger.warning("统计数据缺少必要字段")
-                return
+        if traffic_rows or stats_rows:
+            session = self.db_session or db.session
+            try:
+                if traffic_rows:
+                    session.bulk_insert_mappings(Traffic, traffic_rows)
+                if stats_rows:
+                    session.bulk_insert_mappings(TrafficStats, stats_rows)
+                session.commit()
+                logger.debug(f"已批量保存{len(traffic_rows)}条流量数据和{len(stats_rows)}条统计数据")
+            except Exception as e:
+                logger.error(f"批量持久化数据时出错: {str(e)}")
+                session.rollback()
+                return items
                 
-            # 提取数据
-            device_id = data['device_id']
-            timestamp = data.get('timestamp', datetime.utcnow())
-            metrics = data['metrics']
+        for data in items:
+            data['persisted'] = True
+        return items
+
+    @staticmethod
+    def _utilization(metrics):
+        """接口利用率：与SNMP采集的计数器状态一致，取入、出方向中较大的一个，不超过100"""
+        return min(100, max(metrics.get('in_utilization', 0), metrics.get('out_utilization', 0)))
             
-            # 创建TrafficStats记录
-            stats = TrafficStats(
-                device_id=device_id,
-                timestamp=timestamp,
-                in_rate=metrics.get('in_rate', 0),
-                out_rate=metrics.get('out_rate', 0),
-                in_utilization=metrics.get('in_utilization', 0),
-                out_utilization=metrics.get('out_utilization', 0),
-                details=json.dumps(metrics)
-            )
+    @staticmethod
+    def _traffic_row(data):
+        """把流量数据转换为Traffic的行字典，缺少必要字段时返回None"""
+        # 检查必要字段
+        if 'device_id' not in data or 'interface_id' not in data or 'data' not in data:
+            logger.warning("流量数据缺少必要字段")
+            return None
             
-            # 保存到数据库
-            db.session.add(stats)
-            db.session.commit()
+        raw_data = data['data']
+        metrics = data.get('metrics', {})
+        row = {
+            'device_id': data['device_id'],
+            'interface': str(data.get('interface') or data['interface_id']),
+            'in_octets': raw_data.get('in_bytes', 0),
+            'out_octets': raw_data.get('out_bytes', 0),
+            'in_packets': raw_data.get('in_packets', 0),
+            'out_packets': raw_data.get('out_packets', 0),
+            'bandwidth': raw_data.get('bandwidth'),
+            'interval': data.get('interval_seconds', 300),
+            'timestamp': data.get('timestamp') or datetime.utcnow()
+        }
+        # TrafficCalculator计算的速率单位为字节/秒，Traffic中为bps
+        if 'in_rate' in metrics:
+            row['in_rate'] = metrics['in_rate'] * 8
+        if 'out_rate' in metrics:
+            row['out_rate'] = metrics['out_rate'] * 8
+        if 'in_utilization' in metrics or 'out_utilization' in metrics:
+            row['utilization'] = DataPersister._utilization(metrics)
+        return row
             
-            logger.debug(f"已保存设备 {device_id} 的流量统计数据")
+    @staticmethod
+    def _stats_row(data):
+        """把统计数据转换为TrafficStats的行字典，缺少必要字段时返回None"""
+        # 检查必要字段
+        if 'device_id' not in data or 'metrics' not in data:
+            logger.warning("统计数据缺少必要字段")
+            return None
             
-        except Exception as e:
-            logger.error(f"持久化统计数据时出错: {str(e)}")
-            db.session.rollback()
+        timestamp = data.get('timestamp') or datetime.utcnow()
+        metrics = data['metrics']
+        in_rate = metrics.get('in_rate', 0) * 8
+        out_rate = metrics.get('out_rate', 0) * 8
+        return {
+            'device_id': data['device_id'],
+            'hour': timestamp.hour,
+            'day': timestamp.day,
+            'month': timestamp.month,
+            'year': timestamp.year,
+            'avg_in_rate': in_rate,
+            'avg_out_rate': out_rate,
+            'max_in_rate': in_rate,
+            'max_out_rate': out_rate,
+            'avg_utilization': DataPersister._utilization(metrics),
+            'peak_time': timestamp
+        }
             
     def _persist_event_data(self, data):
         """持久化事件数据"""
@@ -518,15 +714,242 @@ class DataPersister(Processor):
         pass
 
 
+class PipelineQueue:
+    """
+    有界的流水线队列，接口与queue.Queue的put/get/get_nowait/task_done一致
+
+    数据库变慢时队列不再无限增长：队列满后按策略阻塞生产者、丢弃最早的数据、丢弃优先级最低的数据，
+    或者按source_id合并，只保留每个数据源最新的样本。被丢弃或合并的条目先标记为失效，
+    出队时跳过，失效条目过多时整理一次，内存占用与容量成正比。
+    """
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, policy=POLICY_BLOCK, block_timeout=DEFAULT_BLOCK_TIMEOUT):
+        """
+        参数:
+            maxsize: 队列容量
+            policy: 队列满时的处理策略（block、drop_oldest、priority或coalesce）
+            block_timeout: block策略下生产者最长等待时间（秒）
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f'未知的队列策略: {policy}')
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._entries = deque()  # 按入队顺序排列的条目 [流水线名称, 数据, 入队时间, 优先级, 合并键, 有效]
+        self._by_priority = {}  # 优先级 -> 条目deque，priority策略下查找丢弃对象
+        self._by_key = {}  # 合并键 -> 条目，coalesce策略下查找同一数据源的条目
+        self._size = 0  # 有效条目数
+        self._dead = 0  # 已失效但尚未移出的条目数
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self.wait_latency = Histogram()  # 从入队到出队的等待时间
+        self.counters = {'submitted': 0, 'accepted': 0, 'dequeued': 0, 'coalesced': 0,
+                         'dropped_oldest': 0, 'dropped_priority': 0, 'rejected': 0, 'max_depth': 0}
+
+    def put(self, item, block=True, timeout=None):
+        """
+        加入一条数据
+
+        参数:
+            item: (流水线名称, 数据)
+            block: block策略下队列满时是否等待
+            timeout: 最长等待时间（秒），默认为block_timeout
+
+        返回:
+            是否加入了队列（被合并也视为加入）
+        """
+        pipeline_name, data = item
+        priority = data.get('priority', 0) if isinstance(data, dict) else 0
+        key = None
+        if self.policy == POLICY_COALESCE and isinstance(data, dict) and data.get('source_id') is not None:
+            key = (pipeline_name, data['source_id'])
+
+        with self._lock:
+            self.counters['submitted'] += 1
+            # 同一数据源的数据还在排队，直接替换为最新的样本，保留原来的位置和入队时间
+            if key is not None and key in self._by_key:
+                self._by_key[key][1] = data
+                self.counters['coalesced'] += 1
+                return True
+
+            if self._size >= self.maxsize and not self._make_room(priority, block, timeout):
+                self.counters['rejected'] += 1
+                return False
+
+            entry = [pipeline_name, data, time.monotonic(), priority, key, True]
+            self._entries.append(entry)
+            if self.policy == POLICY_PRIORITY:
+                self._by_priority.setdefault(priority, deque()).append(entry)
+            if key is not None:
+                self._by_key[key] = entry
+            self._size += 1
+            self._unfinished += 1
+            self.counters['accepted'] += 1
+            if self._size > self.counters['max_depth']:
+                self.counters['max_depth'] = self._size
+            self._not_empty.notify()
+            return True
+
+    def _make_room(self, priority, block, timeout):
+        """队列已满时按策略腾出一个位置（调用时已持有锁），返回是否可以加入新数据"""
+        if self.policy == POLICY_BLOCK:
+            if not block:
+                return False
+            timeout = self.block_timeout if timeout is None else timeout
+            deadline = time.monotonic() + timeout
+            while self._size >= self.maxsize:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._not_full.wait(remaining)
+            return True
+
+        if self.policy == POLICY_PRIORITY:
+            # 先移除各优先级头部已出队的条目，再找有排队数据的最低优先级
+            for level in list(self._by_priority):
+                entries = self._by_priority[level]
+                while entries and not entries[0][5]:
+                    entries.popleft()
+                    self._dead -= 1
+                if not entries:
+                    del self._by_priority[level]
+            lowest = min(self._by_priority)
+            # 新数据的优先级不高于队列中最低的优先级时丢弃新数据
+            if priority <= lowest:
+                self.counters['dropped_priority'] += 1
+                return False
+            self._discard(self._by_priority[lowest].popleft())
+            self.counters['dropped_priority'] += 1
+            return True
+
+        self._discard(self._pop_live(self._entries))
+        self.counters['dropped_oldest'] += 1
+        return True
+
+    def _pop_live(self, entries):
+        """从条目deque的头部取出第一个有效条目"""
+        while True:
+            entry = entries.popleft()
+            if entry[5]:
+                return entry
+            self._dead -= 1
+
+    def _discard(self, entry):
+        """把已从某个deque中取出的条目标记为失效，失效条目过多时整理队列"""
+        entry[5] = False
+        entry[1] = None
+        if entry[4] is not None:
+            self._by_key.pop(entry[4], None)
+        self._size -= 1
+        self._unfinished -= 1
+        if self.policy == POLICY_PRIORITY:
+            # 丢弃的条目取自优先级deque，仍留在按入队顺序排列的deque中
+            self._mark_dead()
+        if not self._unfinished:
+            self._all_done.notify_all()
+
+    def _mark_dead(self):
+        """记录一个仍留在deque中的失效条目，超过容量时整理所有deque"""
+        self._dead += 1
+        if self._dead > self.maxsize:
+            self._entries = deque(entry for entry in self._entries if entry[5])
+            self._by_priority = {level: deque(entry for entry in entries if entry[5])
+                                 for level, entries in self._by_priority.items()}
+            self._dead = 0
+
+    def get(self, block=True, timeout=None):
+        """
+        取出最早入队的一条数据
+
+        返回:
+            (流水线名称, 数据)，队列为空时抛出queue.Empty
+        """
+        with self._lock:
+            if not self._size:
+                if not block:
+                    raise queue.Empty
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+
+            entry = self._pop_live(self._entries)
+            # 条目出队后不再参与丢弃和合并
+            entry[5] = False
+            if entry[4] is not None:
+                self._by_key.pop(entry[4], None)
+            self._size -= 1
+            if self.policy == POLICY_PRIORITY:
+                # 仍留在优先级deque中，之后跳过
+                self._mark_dead()
+            self.counters['dequeued'] += 1
+            self.wait_latency.observe(time.monotonic() - entry[2])
+            self._not_full.notify()
+            return entry[0], entry[1]
+
+    def get_nowait(self):
+        """取出一条数据，队列为空时立即抛出queue.Empty"""
+        return self.get(block=False)
+
+    def task_done(self):
+        """标记一条取出的数据已处理完成"""
+        with self._lock:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._unfinished = 0
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """等待所有数据处理完成，返回是否在超时前完成"""
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self._unfinished, timeout)
+
+    def qsize(self):
+        """排队中的数据数"""
+        return self._size
+
+    def to_dict(self):
+        """转换为字典"""
+        with self._lock:
+            dropped = self.counters['dropped_oldest'] + self.counters['dropped_priority'] + self.counters['rejected']
+            return dict(self.counters, **{
+                'policy': self.policy,
+                'maxsize': self.maxsize,
+                'depth': self._size,
+                'dropped': dropped,
+                'wait_latency': self.wait_latency.to_dict()
+            })
+
+
 class ProcessorPipeline:
     """数据处理流水线"""
     
-    def __init__(self):
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, batch_wait_ms=DEFAULT_BATCH_WAIT_MS,
+                 queue_size=DEFAULT_QUEUE_SIZE, queue_policy=POLICY_BLOCK, block_timeout=DEFAULT_BLOCK_TIMEOUT):
+        """
+        参数:
+            batch_size: 工作线程每批最多取出的数据数，为1时逐条处理
+            batch_wait_ms: 凑满一批的最长等待时间（毫秒）
+            queue_size: 队列容量
+            queue_policy: 队列满时的处理策略（block、drop_oldest、priority或coalesce）
+            block_timeout: block策略下提交数据的最长等待时间（秒）
+        """
         self.processors = {}
         self.pipelines = {}
-        self.queue = queue.Queue()
+        self.queue = PipelineQueue(queue_size, queue_policy, block_timeout)
         self.worker_threads = []
         self.running = False
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        self.app = None  # 设置后工作线程在应用上下文中处理，持久化时可以使用db.session
+        self.batch_latency = Histogram()  # 每批数据通过整条流水线的耗时
+        self.stage_pool = None  # 执行位置为process的处理器使用的进程池
+        self.batch_counters = {'batches': 0, 'items': 0}
         
     def add_processor(self, processor):
         """添加处理器"""
@@ -564,14 +987,42 @@ class ProcessorPipeline:
             logger.warning(f"处理流水线 {pipeline_name} 不存在")
             return None
             
-        # 添加到处理队列
-        self.queue.put((pipeline_name, data))
+        # 添加到处理队列，队列满时按策略等待、丢弃或合并，被丢弃时返回False
+        return self.queue.put((pipeline_name, data))
+        
+    def set_placement(self, processor_name, placement):
+        """
+        设置处理器的执行位置，在start之前调用
+        
+        参数:
+            processor_name: 处理器名称
+            placement: thread或process
+        """
+        if placement not in (PLACEMENT_THREAD, PLACEMENT_PROCESS):
+            raise ValueError(f'未知的执行位置: {placement}')
+        processor = self.processors.get(processor_name)
+        if processor is None:
+            logger.warning(f"处理器 {processor_name} 不存在")
+            return False
+        processor.placement = placement
         return True
         
-    def start(self, num_workers=3):
-        """启动处理流水线"""
+    def start(self, num_workers=3, processes=0):
+        """
+        启动处理流水线
+        
+        参数:
+            num_workers: 工作线程数
+            processes: 进程池的进程数，大于0且有执行位置为process的处理器时启动进程池
+        """
         self.running = True
         
+        if processes > 0 and any(processor.placement == PLACEMENT_PROCESS for processor in self.processors.values()):
+            from app.utils.pipeline_workers import ProcessStagePool
+            
+            # 同一数据源固定由一个进程处理，基线等状态保留在该进程中
+            self.stage_pool = ProcessStagePool(processes)
+        
         # 创建工作线程
         for i in range(num_workers):
             thread = threading.Thread(target=self._worker_loop)
@@ -588,50 +1039,151 @@ class ProcessorPipeline:
         # 等待所有工作线程结束
         for thread in self.worker_threads:
             thread.join(timeout=3.0)
+        self.worker_threads = []
+        
+        if self.stage_pool is not None:
+            self.stage_pool.shutdown()
+            self.stage_pool = None
+            
+        for processor in self.processors.values():
+            try:
+                processor.close()
+            except Exception as e:
+                logger.error(f"关闭处理器 {processor.name} 时出错: {str(e)}")
             
         logger.info("数据处理流水线已停止")
         
+    def _next_batch(self):
+        """
+        从队列取出一批数据：最多batch_size条，凑批最多等待batch_wait_ms毫秒
+        
+        返回:
+            [(流水线名称, 数据)]，队列为空时返回空列表
+        """
+        # 从队列获取数据，设置超时以便能够响应停止信号
+        try:
+            batch = [self.queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+            
+        deadline = time.monotonic() + self.batch_wait_ms / 1000.0
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+        
+    def _process_batch(self, batch):
+        """按流水线分组后整批处理"""
+        groups = {}
+        for pipeline_name, data in batch:
+            groups.setdefault(pipeline_name, []).append(data)
+            
+        for pipeline_name, items in groups.items():
+            # 获取处理流水线
+            pipeline = self.pipelines.get(pipeline_name)
+            if not pipeline:
+                logger.warning(f"未找到处理流水线: {pipeline_name}")
+                continue
+                
+            # 处理数据
+            try:
+                self._run_chain(pipeline, items)
+                logger.debug(f"数据处理完成: 流水线 {pipeline_name}，{len(items)} 条")
+            except Exception as e:
+                logger.error(f"数据处理出错: {str(e)}")
+        
+    def _run_chain(self, head, items):
+        """沿处理链逐级整批处理，执行位置为process的处理器交给进程池执行"""
+        processor = head
+        while processor is not None and items:
+            if processor.placement == PLACEMENT_PROCESS and self.stage_pool is not None:
+                items = self.stage_pool.run(processor, items)
+            else:
+                items = [result for result in processor._process_batch_impl(items) if result]
+            processor = processor.next_processor
+        return items
+        
     def _worker_loop(self):
         """工作线程循环"""
         while self.running:
             try:
-                # 从队列获取数据，设置超时以便能够响应停止信号
-                try:
-                    pipeline_name, data = self.queue.get(timeout=1.0)
-                except queue.Empty:
+                batch = self._next_batch()
+                if not batch:
                     continue
                     
-                # 获取处理流水线
-                pipeline = self.pipelines.get(pipeline_name)
-                if not pipeline:
-                    logger.warning(f"未找到处理流水线: {pipeline_name}")
-                    self.queue.task_done()
-                    continue
-                    
-                # 处理数据
+                started = time.monotonic()
                 try:
-                    result = pipeline.process(data)
-                    logger.debug(f"数据处理完成: {data.get('source_id', 'unknown')}")
-                except Exception as e:
-                    logger.error(f"数据处理出错: {str(e)}")
-                    
-                self.queue.task_done()
+                    if self.app is not None:
+                        with self.app.app_context():
+                            self._process_batch(batch)
+                    else:
+                        self._process_batch(batch)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+                    self.batch_latency.observe(time.monotonic() - started)
+                    self.batch_counters['batches'] += 1
+                    self.batch_counters['items'] += len(batch)
                 
             except Exception as e:
                 logger.error(f"工作线程出错: {str(e)}")
                 time.sleep(1)  # 避免因错误导致CPU使用率过高
+        
+    def stats(self):
+        """获取队列深度、丢弃和合并计数、排队等待时间和批处理耗时"""
+        return {
+            'running': self.running,
+            'workers': len(self.worker_threads),
+            'batch_size': self.batch_size,
+            'batch_wait_ms': self.batch_wait_ms,
+            'queue': self.queue.to_dict(),
+            'placement': {name: processor.placement for name, processor in self.processors.items()},
+            'process_pool': self.stage_pool.stats() if self.stage_pool is not None else None,
+            'batches': dict(self.batch_counters, latency=self.batch_latency.to_dict())
+        }
 
 
 # 创建全局处理流水线实例
 processor_pipeline = ProcessorPipeline()
 
-def init_processor_pipeline():
-    """初始化数据处理流水线"""
+def init_processor_pipeline(app=None):
+    """
+    初始化数据处理流水线
+    
+    参数:
+        app: Flask应用，用于读取批处理参数，工作线程在其应用上下文中写入数据库
+    """
     try:
+        config = app.config if app is not None else {}
+        if app is not None:
+            processor_pipeline.app = app
+            processor_pipeline.batch_size = app.config.get('PIPELINE_BATCH_SIZE', processor_pipeline.batch_size)
+            processor_pipeline.batch_wait_ms = app.config.get('PIPELINE_BATCH_WAIT_MS',
+                                                              processor_pipeline.batch_wait_ms)
+            # 启动前按配置重新创建有界队列
+            if not processor_pipeline.running:
+                processor_pipeline.queue = PipelineQueue(
+                    app.config.get('PIPELINE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                    app.config.get('PIPELINE_QUEUE_POLICY', POLICY_BLOCK),
+                    app.config.get('PIPELINE_BLOCK_TIMEOUT', DEFAULT_BLOCK_TIMEOUT)
+                )
+        
         # 创建处理器
         data_clean = DataCleanProcessor()
         traffic_calc = TrafficCalculator()
-        anomaly_detector = AnomalyDetector()
+        anomaly_detector = AnomalyDetector({
+            'path': config.get('ANOMALY_BASELINE_PATH'),
+            'max_sources': config.get('ANOMALY_BASELINE_MAX_SOURCES', DEFAULT_MAX_SOURCES),
+            'ttl': config.get('ANOMALY_BASELINE_TTL', DEFAULT_TTL),
+            'snapshot_interval': config.get('ANOMALY_BASELINE_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL)
+        }, config.get('ANOMALY_DETECTOR', DETECTOR_ZSCORE), {
+            'path': config.get('ANOMALY_SEASONAL_PATH'),
+            'min_samples': config.get('ANOMALY_SEASONAL_MIN_SAMPLES', DEFAULT_MIN_SAMPLES),
+            'timezone': config.get('ANOMALY_SEASONAL_TIMEZONE', '')
+        })
         feature_analyzer = TrafficFeatureAnalyzer()
         data_persister = DataPersister()
         
@@ -653,8 +1205,14 @@ def init_processor_pipeline():
             ['DataCleanProcessor', 'TrafficFeatureAnalyzer', 'DataPersister']
         )
         
+        # CPU密集的处理器放到进程池执行
+        processes = config.get('PIPELINE_PROCESSES', 0)
+        if processes > 0:
+            for processor_name in config.get('PIPELINE_PROCESS_STAGES', ()):
+                processor_pipeline.set_placement(processor_name, PLACEMENT_PROCESS)
+        
         # 启动处理流水线
-        processor_pipeline.start()
+        processor_pipeline.start(config.get('PIPELINE_WORKERS', 3), processes)
         
         logger.info("数据处理流水线初始化完成")
         return True
@@ -2,43 +2,69 @@
 NetFlow/sFlow数据采集模块
 
 负责接收和解析来自网络设备的NetFlow/sFlow流量数据，为系统提供细粒度的流量信息。
-支持NetFlow v5/v9和sFlow v5协议。
+支持NetFlow v5/v9、IPFIX和sFlow v5协议。
 """
 
-import socket
 import struct
 import threading
-import time
 import logging
 import json
+import time
 from datetime import datetime
 from flask import current_app
 from app import db
 from app.models.traffic import Traffic
 from app.models.device import Device
+from app.utils.flow_ingest import FlowIngest, open_udp_socket, DEFAULT_RCVBUF
+from app.utils.netflow_v5 import decode_netflow_v5_batch, aggregate_interface_octets, sampling_scale
+from app.utils.netflow_v9 import NetFlowV9Decoder, aggregate_interface_bytes
+from app.utils.sflow import SFlowDecoder, sflow_counters
+from app.utils.flow_sampling import sampling_registry, SOURCE_V5_HEADER, SOURCE_SFLOW
+from app.utils.top_talkers import init_top_talkers
+from app.utils.flow_spool import init_flow_spool, spool_options, v5_to_spool, template_to_spool, flows_to_spool
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# NetFlow v5包头格式
-NETFLOW_V5_HEADER_FORMAT = '!HHIIIIBBH'
-# NetFlow v5记录格式
-NETFLOW_V5_RECORD_FORMAT = '!IIIIHHHHHIIIIHHBBBBHHBBI'
-
 # sFlow配置
 SFLOW_PORT = 6343
 NETFLOW_PORT = 2055
 
+# 接口流量的默认汇总周期（秒）
+DEFAULT_BUCKET_SECONDS = 300
+
+# 写入数据库失败的汇总周期最多重试的次数，超过后丢弃
+MAX_FLUSH_RETRIES = 5
+
 class FlowCollector:
     """流量收集器基类，定义通用接口"""
     
+    kind = 'flow'  # 收集器类型，用于线程名、指标标签和多进程模式下区分汇总结果
+    
     def __init__(self, db_session=None):
         self.db_session = db_session
         self.running = False
         self.collectors = []
         self.cache = {}  # 用于暂存处理结果
+        self.cache_lock = threading.Lock()  # 多个解码线程同时更新缓存
+        self.socket = None
+        self.ingest = None  # 接收环和解码线程池
+        self.ingest_options = {}  # 接收参数：rcvbuf、reuse_port、slots、slot_size、workers、batch_size
+        self.forward = None  # 多进程模式下的本地汇总器，设置后接口流量不写入本进程的缓存
+        self.talkers = None  # 流量大户统计，为None时不统计
+        self.spool = None  # 流记录写入器，为None时不落盘
+        self.bucket_seconds = DEFAULT_BUCKET_SECONDS  # 汇总周期（秒），按墙上时间对齐
+        self.device_map = device_address_map  # 导出设备IP到设备ID的映射
+        self._closed = []  # 已结束但尚未写入的汇总周期
+        self._flush_attempts = {}  # (设备IP, 接口索引, 周期开始时间戳) -> 写入失败次数
+        self.flush_stats = {'flushes': 0, 'written': 0, 'retried': 0, 'failed': 0, 'unknown_exporter': 0}
+    
+    def configure(self, **options):
+        """设置接收参数，在start之前调用，值为None的参数使用默认值"""
+        self.ingest_options.update({key: value for key, value in options.items() if value is not None})
+        return self
     
     def start(self):
         """启动收集器"""
@@ -49,72 +75,243 @@ class FlowCollector:
         """停止收集器"""
         self.running = False
         logger.info("流量收集器已停止")
+    
+    def _start_ingest(self):
+        """创建UDP套接字并启动接收环和解码线程池"""
+        options = dict(self.ingest_options)
+        # 加大接收缓冲区吸收突发流量
+        self.socket = open_udp_socket(self.listen_ip, self.listen_port, options.pop('rcvbuf', DEFAULT_RCVBUF),
+                                      reuse_port=options.pop('reuse_port', False))
+        # 接收线程只把数据报读入环形缓冲区，解码由线程池完成
+        self.ingest = FlowIngest(self.socket, self._process_packets, name=self.kind, **options).start()
+    
+    def _stop_ingest(self):
+        """停止接收环和解码线程池并关闭套接字"""
+        if self.ingest:
+            self.ingest.stop()
+        if self.socket:
+            self.socket.close()
+    
+    def _process_packets(self, packets):
+        """
+        处理一批数据包，默认逐个处理
         
-    def save_flow_data(self, device_ip, interface_id, in_bytes, out_bytes, timestamp=None):
-        """保存流量数据到数据库"""
-        if not timestamp:
-            timestamp = datetime.utcnow()
-            
-        try:
-            # 查找设备
-            device = Device.query.filter_by(ip_address=device_ip).first()
-            if not device:
-                logger.warning(f"未找到IP为{device_ip}的设备")
-                return False
-                
-            # 创建流量记录
-            traffic = Traffic(
-                device_id=device.id,
-                interface_id=interface_id,
-                timestamp=timestamp,
-                in_bytes=in_bytes,
-                out_bytes=out_bytes,
-                interval=300  # 默认5分钟间隔
-            )
-            
-            # 保存到数据库
-            if self.db_session:
-                self.db_session.add(traffic)
-                self.db_session.commit()
+        参数:
+            packets: [(数据, 源IP)]，数据只在调用期间有效
+        """
+        for data, src_ip in packets:
+            self._process_packet(data, src_ip)
+    
+    def _process_packet(self, data, src_ip):
+        """处理一个数据包，由子类实现"""
+        raise NotImplementedError
+    
+    def ingest_stats(self):
+        """获取接收和解码统计，收集器未启动时返回None"""
+        return self.ingest.to_dict() if self.ingest else None
+    
+    def _record_interface_traffic(self, device_ip, interface_id, in_bytes, out_bytes, now=None):
+        """
+        把接口流量累加到当前汇总周期
+        
+        参数:
+            device_ip: 导出设备IP
+            interface_id: 接口索引
+            in_bytes: 入方向字节数
+            out_bytes: 出方向字节数
+            now: 当前时间戳（秒），默认为time.time()
+        """
+        # 多进程模式下只在本地汇总，由父进程统一写入
+        if self.forward is not None:
+            self.forward.record(self.kind, device_ip, interface_id, in_bytes, out_bytes)
+            return
+        
+        # 生成缓存键
+        cache_key = f"{device_ip}:{interface_id}"
+        
+        # 汇总周期按墙上时间对齐，与接口何时收到数据无关
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds) * self.bucket_seconds
+        
+        # 多个解码线程共用缓存，锁内只做累加，写入数据库由定时任务完成
+        with self.cache_lock:
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                self.cache[cache_key] = (bucket, in_bytes, out_bytes)
+            elif entry[0] == bucket:
+                self.cache[cache_key] = (bucket, entry[1] + in_bytes, entry[2] + out_bytes)
             else:
-                db.session.add(traffic)
-                db.session.commit()
-                
-            logger.debug(f"已保存设备{device_ip}接口{interface_id}的流量数据")
-            return True
-            
+                # 定时任务还没来得及关闭上一个周期，先移到待写入列表
+                self._closed.append((device_ip, interface_id) + entry)
+                self.cache[cache_key] = (bucket, in_bytes, out_bytes)
+    
+    def _close_buckets(self, now):
+        """
+        取出所有已结束的汇总周期，并从缓存中删除对应的接口
+        
+        参数:
+            now: 当前时间戳（秒）
+        
+        返回:
+            [(设备IP, 接口索引, 周期开始时间戳, 入字节数, 出字节数)]
+        """
+        current = int(now // self.bucket_seconds) * self.bucket_seconds
+        with self.cache_lock:
+            closed, self._closed = self._closed, []
+            # 周期结束后接口条目直接删除，空闲接口不会一直留在缓存中
+            for cache_key in [key for key, entry in self.cache.items() if entry[0] < current]:
+                device_ip, interface_id = cache_key.rsplit(':', 1)
+                closed.append((device_ip, int(interface_id)) + self.cache.pop(cache_key))
+        return closed
+    
+    def flush(self, now=None):
+        """
+        把已结束的汇总周期批量写入数据库，由定时任务按较短的节拍调用
+        
+        参数:
+            now: 当前时间戳（秒），默认为time.time()
+        
+        返回:
+            写入的流量记录数
+        """
+        from app.utils.interface_inventory import interface_inventory
+        from app.utils.snmp_collector import OID_IF_DESCR
+        
+        closed = self._close_buckets(time.time() if now is None else now)
+        if not closed:
+            return 0
+        
+        rows = []
+        written = []  # 与rows对应的汇总周期，写入失败时放回待写入列表
+        names = {}  # 设备ID -> {ifIndex: 接口描述}
+        for entry in closed:
+            device_ip, interface_id, bucket, in_bytes, out_bytes = entry
+            device_id = self.device_map.resolve(device_ip)
+            if device_id is None:
+                self.flush_stats['unknown_exporter'] += 1
+                continue
+            if device_id not in names:
+                names[device_id] = interface_inventory.column_values(device_id, OID_IF_DESCR)
+            rows.append({
+                'device_id': device_id,
+                'interface': names[device_id].get(str(interface_id)) or f'ifIndex{interface_id}',
+                'in_octets': in_bytes,
+                'out_octets': out_bytes,
+                'in_rate': in_bytes * 8 / self.bucket_seconds,
+                'out_rate': out_bytes * 8 / self.bucket_seconds,
+                'interval': self.bucket_seconds,
+                # 与流水线的其他部分一致，时间统一为UTC
+                'timestamp': datetime.utcfromtimestamp(bucket)
+            })
+            written.append(entry)
+        if not rows:
+            return 0
+        
+        session = self.db_session or db.session
+        try:
+            # 一个节拍内关闭的所有周期一次批量插入、一次提交
+            session.bulk_insert_mappings(Traffic, rows)
+            session.commit()
         except Exception as e:
-            logger.error(f"保存流量数据时出错: {str(e)}")
-            if self.db_session:
-                self.db_session.rollback()
+            logger.error(f"批量保存流量数据时出错: {str(e)}")
+            session.rollback()
+            self._requeue(written)
+            return 0
+        
+        for device_ip, interface_id, bucket, _, _ in written:
+            self._flush_attempts.pop((device_ip, interface_id, bucket), None)
+        self.flush_stats['written'] += len(rows)
+        self.flush_stats['flushes'] += 1
+        logger.debug(f"已保存{len(rows)}条{self.kind}接口流量数据")
+        return len(rows)
+    
+    def _requeue(self, entries):
+        """把写入失败的汇总周期放回待写入列表，下一个节拍重试，超过重试次数的丢弃"""
+        retry = []
+        for entry in entries:
+            key = entry[:3]
+            attempts = self._flush_attempts.get(key, 0) + 1
+            if attempts > MAX_FLUSH_RETRIES:
+                self._flush_attempts.pop(key, None)
+                self.flush_stats['failed'] += 1
             else:
-                db.session.rollback()
-            return False
+                self._flush_attempts[key] = attempts
+                retry.append(entry)
+        with self.cache_lock:
+            self._closed[:0] = retry
+        self.flush_stats['retried'] += len(retry)
+        if len(retry) < len(entries):
+            logger.error(f"{len(entries) - len(retry)}条{self.kind}接口流量数据重试{MAX_FLUSH_RETRIES}次后仍写入失败，已丢弃")
+
+
+class DeviceAddressMap:
+    """导出设备IP到设备ID的内存映射，定期整体重新加载，写入流量数据时不再逐条查询设备表"""
+    
+    MISS_REFRESH_INTERVAL = 30  # 遇到未知IP时重新加载映射的最短间隔（秒）
+    
+    def __init__(self, ttl=300, loader=None):
+        """
+        参数:
+            ttl: 映射的有效期（秒），过期或遇到未知IP时重新加载
+            loader: 返回[(IP, 设备ID)]的函数，默认查询设备表
+        """
+        self.ttl = ttl
+        self.loader = loader or self._load_devices
+        self._map = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _load_devices():
+        """从设备表加载IP和设备ID"""
+        return db.session.query(Device.ip_address, Device.id).all()
+    
+    def refresh(self, now=None):
+        """重新加载映射"""
+        mapping = {ip: device_id for ip, device_id in self.loader()}
+        with self._lock:
+            self._map = mapping
+            self._loaded_at = time.monotonic() if now is None else now
+        return len(mapping)
+    
+    def resolve(self, device_ip, now=None):
+        """
+        查找导出设备IP对应的设备ID
+        
+        参数:
+            device_ip: 导出设备IP
+            now: 当前单调时间，默认为time.monotonic()
+        
+        返回:
+            设备ID，未知设备返回None
+        """
+        now = time.monotonic() if now is None else now
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl:
+            self.refresh(now)
+        device_id = self._map.get(device_ip)
+        # 新添加的设备不必等到映射过期，但未知IP最多每MISS_REFRESH_INTERVAL秒触发一次重新加载
+        if device_id is None and now - self._loaded_at >= self.MISS_REFRESH_INTERVAL:
+            self.refresh(now)
+            device_id = self._map.get(device_ip)
+        return device_id
 
 
 class NetFlowCollector(FlowCollector):
-    """NetFlow数据收集器，支持v5/v9协议"""
+    """NetFlow数据收集器，支持v5/v9/IPFIX协议"""
+    
+    kind = 'netflow'
     
     def __init__(self, listen_ip='0.0.0.0', listen_port=NETFLOW_PORT, db_session=None):
         super().__init__(db_session)
         self.listen_ip = listen_ip
         self.listen_port = listen_port
-        self.socket = None
-        self.collector_thread = None
+        self.v9_decoder = NetFlowV9Decoder()  # v9/IPFIX模板缓存和解码器
         
     def start(self):
         """启动NetFlow收集器"""
         super().start()
         try:
-            # 创建UDP套接字
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.bind((self.listen_ip, self.listen_port))
-            
-            # 启动收集线程
-            self.collector_thread = threading.Thread(target=self._collect_loop)
-            self.collector_thread.daemon = True
-            self.collector_thread.start()
-            
+            self._start_ingest()
             logger.info(f"NetFlow收集器已启动，监听 {self.listen_ip}:{self.listen_port}")
             return True
             
@@ -125,27 +322,25 @@ class NetFlowCollector(FlowCollector):
     def stop(self):
         """停止NetFlow收集器"""
         super().stop()
-        if self.socket:
-            self.socket.close()
+        self._stop_ingest()
         logger.info("NetFlow收集器已停止")
         
-    def _collect_loop(self):
-        """NetFlow数据收集循环"""
-        while self.running:
-            try:
-                # 接收数据
-                data, addr = self.socket.recvfrom(4096)
-                src_ip = addr[0]
-                
-                # 处理数据包
+    def _process_packets(self, packets):
+        """
+        处理一批NetFlow数据包，NetFlow v5数据包按导出设备分组后批量解码
+        
+        参数:
+            packets: [(数据, 源IP)]
+        """
+        v5_packets = {}
+        for data, src_ip in packets:
+            if data[:2] == b'\x00\x05':
+                v5_packets.setdefault(src_ip, []).append(data)
+            else:
                 self._process_packet(data, src_ip)
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                logger.error(f"NetFlow数据收集错误: {str(e)}")
-                time.sleep(1)  # 避免因错误导致CPU使用率过高
-                
+        for src_ip, datagrams in v5_packets.items():
+            self._process_netflow_v5_batch(datagrams, src_ip)
+            
     def _process_packet(self, data, src_ip):
         """处理NetFlow数据包"""
         try:
@@ -154,7 +349,7 @@ class NetFlowCollector(FlowCollector):
             
             if version == 5:
                 self._process_netflow_v5(data, src_ip)
-            elif version == 9:
+            elif version in (9, 10):
                 self._process_netflow_v9(data, src_ip)
             else:
                 logger.warning(f"不支持的NetFlow版本: {version}")
@@ -164,90 +359,78 @@ class NetFlowCollector(FlowCollector):
             
     def _process_netflow_v5(self, data, src_ip):
         """处理NetFlow v5数据包"""
+        self._process_netflow_v5_batch([data], src_ip)
+        
+    def _process_netflow_v5_batch(self, datagrams, src_ip):
+        """处理同一导出设备的一批NetFlow v5数据包"""
         try:
-            # 解析包头
-            header = struct.unpack(NETFLOW_V5_HEADER_FORMAT, data[0:24])
-            version, count, sys_uptime, unix_secs, unix_nsecs, flow_sequence, engine_type, engine_id, sampling_interval = header
+            # 单个数据报零拷贝地映射为结构化数组，多个数据报拼接后一次映射
+            records = decode_netflow_v5_batch(datagrams)
             
-            # 处理流记录
-            for i in range(count):
-                # 计算记录的起始位置
-                start_pos = 24 + i * 48
-                
-                # 确保数据长度足够
-                if start_pos + 48 > len(data):
-                    logger.warning("NetFlow v5数据包长度不足")
-                    break
-                    
-                # 解析流记录
-                record = struct.unpack(NETFLOW_V5_RECORD_FORMAT, data[start_pos:start_pos+48])
-                
-                # 提取关键字段
-                src_addr, dst_addr, next_hop, input_if, output_if = record[0:5]
-                d_pkts, d_octets = record[6:8]
-                
-                # 记录流量数据
-                self._record_interface_traffic(src_ip, input_if, d_octets, 0)
-                self._record_interface_traffic(src_ip, output_if, 0, d_octets)
+            # 开启采样的导出设备按包头中的采样率放大字节数
+            scale, mode, rate = sampling_scale(datagrams)
+            sampling_registry.observe(src_ip, SOURCE_V5_HEADER, rate, mode)
+            
+            # 先在NumPy中按接口组合汇总，再写入接口流量缓存
+            in_totals, out_totals = aggregate_interface_octets(records, scale)
+            if self.talkers is not None:
+                self.talkers.observe_v5(src_ip, records, scale=scale)
+            if self.spool is not None:
+                self.spool.append(v5_to_spool(records, src_ip, scale))
+            for interface_id, in_bytes in in_totals.items():
+                self._record_interface_traffic(src_ip, interface_id, in_bytes, 0)
+            for interface_id, out_bytes in out_totals.items():
+                self._record_interface_traffic(src_ip, interface_id, 0, out_bytes)
                 
-            logger.debug(f"处理了来自{src_ip}的NetFlow v5数据包，包含{count}条记录")
+            logger.debug(f"处理了来自{src_ip}的{len(datagrams)}个NetFlow v5数据包，包含{len(records)}条记录")
             
         except Exception as e:
             logger.error(f"处理NetFlow v5数据包时出错: {str(e)}")
             
     def _process_netflow_v9(self, data, src_ip):
-        """处理NetFlow v9数据包 (简化实现)"""
-        # NetFlow v9使用模板定义数据格式，完整实现较为复杂
-        # 这里仅提供简化的框架实现
-        logger.info(f"收到来自{src_ip}的NetFlow v9数据包，当前为简化实现")
-        
-    def _record_interface_traffic(self, device_ip, interface_id, in_bytes, out_bytes):
-        """记录接口流量数据"""
-        # 生成缓存键
-        cache_key = f"{device_ip}:{interface_id}"
-        
-        # 获取当前时间
-        now = datetime.utcnow()
-        
-        # 检查缓存中是否已有该接口的数据
-        if cache_key in self.cache:
-            last_update, last_in, last_out = self.cache[cache_key]
+        """处理NetFlow v9/IPFIX数据包"""
+        try:
+            count = 0
+            for template, records in self.v9_decoder.decode(data, src_ip):
+                # 按数据记录或选项数据中的采样率放大字节数
+                scale, source = self.v9_decoder.sampling_scale(src_ip, template, records)
+                if source is not None:
+                    sampling_registry.observe(src_ip, source, scale if not isinstance(scale, list) else max(scale))
+                
+                # 先在本批记录内按接口汇总，再写入接口流量缓存
+                in_totals, out_totals = aggregate_interface_bytes(template, records, scale)
+                if self.talkers is not None:
+                    self.talkers.observe_template(src_ip, template, records, scale=scale)
+                if self.spool is not None:
+                    self.spool.append(template_to_spool(template, records, src_ip, scale))
+                for interface_id, in_bytes in in_totals.items():
+                    self._record_interface_traffic(src_ip, interface_id, in_bytes, 0)
+                for interface_id, out_bytes in out_totals.items():
+                    self._record_interface_traffic(src_ip, interface_id, 0, out_bytes)
+                count += len(records)
+                
+            logger.debug(f"处理了来自{src_ip}的NetFlow v9/IPFIX数据包，包含{count}条记录")
             
-            # 如果距离上次更新超过5分钟，保存数据并更新缓存
-            if (now - last_update).total_seconds() >= 300:
-                self.save_flow_data(device_ip, interface_id, last_in + in_bytes, last_out + out_bytes, last_update)
-                self.cache[cache_key] = (now, in_bytes, out_bytes)
-            else:
-                # 更新缓存中的流量数据
-                self.cache[cache_key] = (last_update, last_in + in_bytes, last_out + out_bytes)
-        else:
-            # 添加到缓存
-            self.cache[cache_key] = (now, in_bytes, out_bytes)
+        except Exception as e:
+            logger.error(f"处理NetFlow v9/IPFIX数据包时出错: {str(e)}")
 
 
 class SFlowCollector(FlowCollector):
     """sFlow数据收集器，支持v5协议"""
     
+    kind = 'sflow'
+    
     def __init__(self, listen_ip='0.0.0.0', listen_port=SFLOW_PORT, db_session=None):
         super().__init__(db_session)
         self.listen_ip = listen_ip
         self.listen_port = listen_port
-        self.socket = None
-        self.collector_thread = None
+        self.decoder = SFlowDecoder()
         
     def start(self):
         """启动sFlow收集器"""
         super().start()
         try:
-            # 创建UDP套接字
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.bind((self.listen_ip, self.listen_port))
-            
-            # 启动收集线程
-            self.collector_thread = threading.Thread(target=self._collect_loop)
-            self.collector_thread.daemon = True
-            self.collector_thread.start()
-            
+            self._start_ingest()
             logger.info(f"sFlow收集器已启动，监听 {self.listen_ip}:{self.listen_port}")
             return True
             
@@ -258,40 +441,102 @@ class SFlowCollector(FlowCollector):
     def stop(self):
         """停止sFlow收集器"""
         super().stop()
-        if self.socket:
-            self.socket.close()
+        self._stop_ingest()
         logger.info("sFlow收集器已停止")
         
-    def _collect_loop(self):
-        """sFlow数据收集循环"""
-        while self.running:
-            try:
-                # 接收数据
-                data, addr = self.socket.recvfrom(4096)
-                src_ip = addr[0]
-                
-                # 处理数据包
-                self._process_packet(data, src_ip)
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                logger.error(f"sFlow数据收集错误: {str(e)}")
-                time.sleep(1)  # 避免因错误导致CPU使用率过高
-                
     def _process_packet(self, data, src_ip):
-        """处理sFlow数据包 (简化实现)"""
-        # sFlow协议解析较为复杂，这里仅提供简化的框架实现
-        logger.info(f"收到来自{src_ip}的sFlow数据包，当前为简化实现")
+        """处理sFlow数据包"""
+        try:
+            datagram = self.decoder.decode(data, src_ip)
+            agent = datagram.agent
+            
+            # 计数器样本保存到计数器样本缓存，轮询时代替SNMP采集；多进程模式下发送给父进程
+            if self.forward is not None:
+                self.forward.counters(agent, datagram.counters, datagram.uptime)
+            else:
+                sflow_counters.update(agent, datagram.counters, datagram.uptime)
+            
+            # 流样本的字节数已按采样率放大，按接口汇总后写入接口流量缓存
+            if datagram.flows:
+                sampling_registry.observe(agent, SOURCE_SFLOW, datagram.flows[-1]['sampling_rate'], 'random')
+            if self.talkers is not None:
+                self.talkers.observe_flows(agent, datagram.flows)
+            if self.spool is not None and datagram.flows:
+                self.spool.append(flows_to_spool(datagram.flows, agent))
+            in_totals, out_totals = {}, {}
+            for flow in datagram.flows:
+                if flow['input_if'] is not None:
+                    in_totals[flow['input_if']] = in_totals.get(flow['input_if'], 0) + flow['bytes']
+                if flow['output_if'] is not None:
+                    out_totals[flow['output_if']] = out_totals.get(flow['output_if'], 0) + flow['bytes']
+            for interface_id, in_bytes in in_totals.items():
+                self._record_interface_traffic(agent, interface_id, in_bytes, 0)
+            for interface_id, out_bytes in out_totals.items():
+                self._record_interface_traffic(agent, interface_id, 0, out_bytes)
+                
+            logger.debug(f"处理了来自{agent}的sFlow数据包，包含{len(datagram.counters)}个接口计数器和"
+                         f"{len(datagram.flows)}个流样本")
+            
+        except Exception as e:
+            logger.error(f"处理sFlow数据包时出错: {str(e)}")
+
 
+# 导出设备IP到设备ID的映射，两个收集器共用
+device_address_map = DeviceAddressMap()
 
 # 创建全局收集器实例
 netflow_collector = NetFlowCollector()
 sflow_collector = SFlowCollector()
 
-def init_flow_collectors():
-    """初始化流量收集器"""
+# 多进程收集器，FLOW_COLLECTOR_PROCESSES大于1时创建
+flow_collector_pool = None
+
+def init_flow_collectors(config=None):
+    """
+    初始化流量收集器
+    
+    参数:
+        config: 应用配置，用于读取接收缓冲区、环形缓冲区槽位数、解码线程数、收集进程数、汇总周期和流量大户统计参数
+    """
+    global flow_collector_pool
     try:
+        config = config or {}
+        device_address_map.ttl = config.get('FLOW_DEVICE_MAP_TTL', device_address_map.ttl)
+        talkers = init_top_talkers(config) if config.get('TOP_TALKERS_ENABLED', True) else None
+        for collector in (netflow_collector, sflow_collector):
+            collector.bucket_seconds = config.get('FLOW_BUCKET_SECONDS', collector.bucket_seconds)
+            collector.talkers = talkers
+        
+        options = {
+            'rcvbuf': config.get('FLOW_RCVBUF'),
+            'slots': config.get('FLOW_RING_SLOTS'),
+            'workers': config.get('FLOW_DECODE_WORKERS'),
+            'batch_size': config.get('FLOW_DECODE_BATCH')
+        }
+        options = {key: value for key, value in options.items() if value is not None}
+        
+        processes = int(config.get('FLOW_COLLECTOR_PROCESSES') or 1)
+        if processes > 1:
+            from app.utils.flow_workers import FlowCollectorPool
+            
+            # 各收集进程用SO_REUSEPORT绑定同一端口，本进程只负责合并汇总结果
+            options.update(listen_ip=netflow_collector.listen_ip, netflow_port=netflow_collector.listen_port,
+                           sflow_port=sflow_collector.listen_port)
+            if talkers is not None:
+                # 各收集进程各自统计，定期把摘要发送给本进程合并
+                options['top_talkers'] = {'capacity': talkers.capacity, 'window_seconds': talkers.window_seconds}
+            if spool_options(config) is not None:
+                # 各收集进程写入同一目录下各自的分段
+                options['spool'] = spool_options(config)
+            flow_collector_pool = FlowCollectorPool(processes, options).start()
+            logger.info(f"流量收集器初始化完成，{processes}个收集进程")
+            return True
+        
+        spool = init_flow_spool(config)
+        for collector in (netflow_collector, sflow_collector):
+            collector.configure(**options)
+            collector.spool = spool
+        
         # 启动NetFlow收集器
         netflow_collector.start()
         
@@ -304,11 +549,33 @@ def init_flow_collectors():
         logger.error(f"初始化流量收集器失败: {str(e)}")
         return False
         
+def flush_flow_collectors(now=None):
+    """
+    写入所有收集器已结束的汇总周期
+    
+    参数:
+        now: 当前时间戳（秒），默认为time.time()
+    
+    返回:
+        写入的流量记录数
+    """
+    written = sum(collector.flush(now) for collector in (netflow_collector, sflow_collector))
+    # 两个收集器共用一个流记录写入器，缓冲区写入文件后读取方才能看到最新的记录
+    if netflow_collector.spool is not None:
+        netflow_collector.spool.flush()
+    return written
+
 def stop_flow_collectors():
     """停止流量收集器"""
+    global flow_collector_pool
     try:
+        if flow_collector_pool is not None:
+            flow_collector_pool.stop()
+            flow_collector_pool = None
         netflow_collector.stop()
         sflow_collector.stop()
+        if netflow_collector.spool is not None:
+            netflow_collector.spool.close()
         logger.info("流量收集器已停止")
         return True
     except Exception as e:
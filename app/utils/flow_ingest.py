@@ -0,0 +1,255 @@
+"""
+流量数据接收模块
+
+收集器原来在接收线程中直接解码数据报，解码或数据库提交一旦变慢，套接字缓冲区很快被填满，
+内核开始丢弃数据报。本模块把接收和解码分开：接收线程只负责用recvfrom_into把数据报读入
+预先分配的环形缓冲区槽位，解码线程池从环中批量取出数据报进行解码，处理完后归还槽位。
+套接字使用加大的SO_RCVBUF吸收突发流量，接收、解码和内核丢包计数可以导出为JSON或Prometheus文本。
+"""
+
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+from app.utils.poll_metrics import Histogram
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认参数
+DEFAULT_RCVBUF = 32 * 1024 * 1024  # 套接字接收缓冲区（字节）
+DEFAULT_SLOTS = 4096  # 环形缓冲区槽位数
+DEFAULT_SLOT_SIZE = 9216  # 每个槽位的大小（字节），可容纳巨型帧
+DEFAULT_WORKERS = 2  # 解码线程数
+DEFAULT_BATCH_SIZE = 64  # 解码线程每次最多取出的数据报数
+
+
+def open_udp_socket(listen_ip, listen_port, rcvbuf=DEFAULT_RCVBUF, reuse_port=False):
+    """
+    创建并绑定UDP套接字，尽量加大接收缓冲区
+
+    参数:
+        listen_ip: 监听地址
+        listen_port: 监听端口
+        rcvbuf: 期望的接收缓冲区大小（字节）
+        reuse_port: 是否设置SO_REUSEPORT，允许多个进程绑定同一端口，由内核分配数据报
+
+    返回:
+        套接字
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        # SO_RCVBUFFORCE可以超过net.core.rmem_max，但需要CAP_NET_ADMIN权限
+        force = getattr(socket, 'SO_RCVBUFFORCE', None)
+        try:
+            if force is None:
+                raise PermissionError
+            sock.setsockopt(socket.SOL_SOCKET, force, rcvbuf)
+        except OSError:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        actual = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        # Linux返回的值是设置值的两倍（包含内核簿记开销）
+        if actual < rcvbuf:
+            logger.warning(f"UDP接收缓冲区只能设置为{actual}字节，请调大net.core.rmem_max")
+    sock.bind((listen_ip, listen_port))
+    return sock
+
+
+def kernel_drops(sock):
+    """
+    从/proc/net/udp读取套接字的内核丢包计数（仅Linux）
+
+    参数:
+        sock: UDP套接字
+
+    返回:
+        丢包数，无法读取时返回None
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+    except (OSError, ValueError):
+        return None
+    for path in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # 第10列为inode，最后一列为drops
+                    if len(fields) >= 13 and fields[9] == inode:
+                        return int(fields[-1])
+        except (OSError, StopIteration, ValueError):
+            continue
+    return None
+
+
+class FlowIngest:
+    """接收环和解码线程池"""
+
+    def __init__(self, sock, handler, name='flow', slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE,
+                 workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        参数:
+            sock: 已绑定的UDP套接字
+            handler: 解码函数，以[(数据, 源IP)]调用；数据是指向槽位的memoryview，只在调用期间有效
+            name: 名称，用于线程名和指标标签
+            slots: 环形缓冲区槽位数
+            slot_size: 每个槽位的大小（字节）
+            workers: 解码线程数
+            batch_size: 解码线程每次最多取出的数据报数
+        """
+        self.sock = sock
+        self.handler = handler
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.slot_size = slot_size
+        self._buffers = [bytearray(slot_size) for _ in range(slots)]
+        self._views = [memoryview(buffer) for buffer in self._buffers]
+        self._free = queue.SimpleQueue()
+        for index in range(slots):
+            self._free.put(index)
+        self._filled = queue.SimpleQueue()  # (槽位, 长度, 源IP, 接收时间)
+        self._threads = []
+        self._running = False
+        self._lock = threading.Lock()
+        self.decode_latency = Histogram()  # 从接收到解码完成的耗时
+        self.counters = {'received': 0, 'received_bytes': 0, 'ring_full': 0, 'truncated': 0,
+                         'decoded': 0, 'decode_errors': 0, 'batches': 0}
+        self._kernel_drops_base = kernel_drops(sock) or 0
+
+    def start(self):
+        """启动接收线程和解码线程"""
+        self._running = True
+        receiver = threading.Thread(target=self._receive_loop, name=f'{self.name}-receive', daemon=True)
+        self._threads = [receiver] + [
+            threading.Thread(target=self._decode_loop, name=f'{self.name}-decode-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        """停止所有线程（套接字由调用方关闭）"""
+        self._running = False
+        for _ in range(self.workers):
+            self._filled.put(None)
+        for thread in self._threads[1:]:
+            thread.join(timeout=timeout)
+
+    def _receive_loop(self):
+        """接收线程：只把数据报读入空闲槽位，不做任何解码"""
+        counters = self.counters
+        while self._running:
+            try:
+                index = self._free.get(timeout=0.5)
+            except queue.Empty:
+                # 环已满，数据暂时留在内核缓冲区中，记录等待次数
+                counters['ring_full'] += 1
+                continue
+            try:
+                nbytes, addr = self.sock.recvfrom_into(self._buffers[index])
+            except OSError:
+                self._free.put(index)
+                if not self._running:
+                    break
+                logger.error(f"{self.name}数据接收错误", exc_info=True)
+                time.sleep(1)  # 避免因错误导致CPU使用率过高
+                continue
+            counters['received'] += 1
+            counters['received_bytes'] += nbytes
+            if nbytes >= self.slot_size:
+                counters['truncated'] += 1
+            self._filled.put((index, nbytes, addr[0], time.monotonic()))
+
+    def _decode_loop(self):
+        """解码线程：批量取出数据报交给解码函数，处理完后归还槽位"""
+        while True:
+            item = self._filled.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._filled.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._filled.put(None)
+                    break
+                batch.append(item)
+            self._decode(batch)
+
+    def _decode(self, batch):
+        """解码一批数据报并记录指标"""
+        packets = [(self._views[index][:nbytes], src_ip) for index, nbytes, src_ip, _ in batch]
+        try:
+            self.handler(packets)
+            failed = False
+        except Exception:
+            failed = True
+            logger.error(f"{self.name}数据解码错误", exc_info=True)
+        finally:
+            # 归还槽位后数据会被接收线程覆盖，解码函数不能保留数据的引用
+            for index, _, _, _ in batch:
+                self._free.put(index)
+
+        now = time.monotonic()
+        with self._lock:
+            self.counters['batches'] += 1
+            if failed:
+                self.counters['decode_errors'] += len(batch)
+            else:
+                self.counters['decoded'] += len(batch)
+            for _, _, _, received_at in batch:
+                self.decode_latency.observe(now - received_at)
+
+    def backlog(self):
+        """等待解码的数据报数"""
+        return self._filled.qsize()
+
+    def to_dict(self):
+        """转换为字典"""
+        drops = kernel_drops(self.sock)
+        with self._lock:
+            return dict(self.counters, **{
+                'name': self.name,
+                'backlog': self.backlog(),
+                'slots': len(self._buffers),
+                'workers': self.workers,
+                'rcvbuf': self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                'kernel_drops': drops - self._kernel_drops_base if drops is not None else None,
+                'decode_latency': self.decode_latency.to_dict()
+            })
+
+
+def ingest_to_prometheus(stats):
+    """
+    将FlowIngest.to_dict()的结果转换为Prometheus文本格式
+
+    参数:
+        stats: 收集器名称到统计字典的映射
+
+    返回:
+        Prometheus文本
+    """
+    lines = []
+    for name, data in stats.items():
+        labels = f'collector="{name}"'
+        for key in ('received', 'received_bytes', 'ring_full', 'truncated', 'decoded', 'decode_errors', 'batches'):
+            lines.append(f'flow_ingest_{key}_total{{{labels}}} {data[key]}')
+        if data['kernel_drops'] is not None:
+            lines.append(f'flow_ingest_kernel_drops_total{{{labels}}} {data["kernel_drops"]}')
+        lines.append(f'flow_ingest_backlog{{{labels}}} {data["backlog"]}')
+        latency = data['decode_latency']
+        for bound, count in latency['buckets']:
+            lines.append(f'flow_ingest_decode_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'flow_ingest_decode_latency_seconds_sum{{{labels}}} {latency["sum"]}')
+        lines.append(f'flow_ingest_decode_latency_seconds_count{{{labels}}} {latency["count"]}')
+    return '\n'.join(lines) + '\n'
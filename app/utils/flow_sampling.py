@@ -0,0 +1,110 @@
+"""
+流量采样率模块
+
+开启采样的导出设备每N个报文只统计一个，流记录中的字节数只是真实流量的1/N，
+不放大就无法与同一接口的SNMP计数器比较。本模块从各协议中解析采样率：
+NetFlow v5包头的sampling_interval（高2位为采样模式，低14位为采样间隔），
+NetFlow v9/IPFIX的选项数据（整个导出设备或按sampler_id区分的采样器），
+以及sFlow流样本的sampling_rate（解码时已经放大），并按导出设备登记采样模式，
+收集器在字节数进入接口流量缓存之前按采样率放大。
+"""
+
+import threading
+import time
+
+# NetFlow v5的采样模式
+V5_SAMPLING_MODES = {0: 'none', 1: 'deterministic', 2: 'random', 3: 'reserved'}
+
+# 采样率的来源
+SOURCE_V5_HEADER = 'v5_header'
+SOURCE_V9_OPTIONS = 'v9_options'
+SOURCE_V9_RECORD = 'v9_record'
+SOURCE_SFLOW = 'sflow'
+
+
+def decode_v5_sampling(sampling_interval):
+    """
+    解析NetFlow v5包头的sampling_interval字段
+
+    参数:
+        sampling_interval: 16位字段值
+
+    返回:
+        (采样模式名称, 采样率)，未采样时采样率为1
+    """
+    mode = V5_SAMPLING_MODES[(sampling_interval >> 14) & 0x3]
+    interval = sampling_interval & 0x3FFF
+    # 部分设备只填写间隔、不设置模式位，间隔大于1即视为采样
+    return mode, interval if interval > 1 else 1
+
+
+def options_sampling_rate(values):
+    """
+    从NetFlow v9/IPFIX的选项数据或数据记录中解析采样率
+
+    参数:
+        values: 字段名到值的字典
+
+    返回:
+        采样率，没有采样字段时返回None
+    """
+    for name in ('sampler_random_interval', 'sampling_interval'):
+        interval = values.get(name)
+        if interval:
+            return max(int(interval), 1)
+    # IPFIX（RFC 5477）：每sampling_packet_space个报文中统计sampling_packet_interval个
+    interval = values.get('sampling_packet_interval')
+    if interval:
+        return (interval + values.get('sampling_packet_space', 0)) / interval
+    return None
+
+
+class SamplingRegistry:
+    """按导出设备登记采样模式和采样率"""
+
+    def __init__(self):
+        self._exporters = {}  # 导出设备 -> {'source', 'mode', 'rate', 'updated_at'}
+        self._lock = threading.Lock()
+
+    def observe(self, exporter, source, rate, mode=None, now=None):
+        """
+        登记导出设备当前的采样率
+
+        参数:
+            exporter: 导出设备IP
+            source: 采样率的来源（v5_header、v9_options、v9_record或sflow）
+            rate: 采样率
+            mode: 采样模式
+            now: 当前时间戳（秒），默认为time.time()
+        """
+        entry = self._exporters.get(exporter)
+        if entry is not None and entry['rate'] == rate and entry['source'] == source and entry['mode'] == mode:
+            entry['updated_at'] = time.time() if now is None else now
+            return
+        with self._lock:
+            self._exporters[exporter] = {'source': source, 'mode': mode, 'rate': rate,
+                                         'updated_at': time.time() if now is None else now}
+
+    def get(self, exporter):
+        """获取导出设备的采样信息，没有登记时返回None"""
+        entry = self._exporters.get(exporter)
+        return dict(entry) if entry is not None else None
+
+    def rate(self, exporter):
+        """获取导出设备的采样率，没有登记时返回1"""
+        entry = self._exporters.get(exporter)
+        return entry['rate'] if entry is not None else 1
+
+    def forget_exporter(self, exporter):
+        """删除导出设备的登记"""
+        with self._lock:
+            self._exporters.pop(exporter, None)
+
+    def to_dict(self):
+        """转换为字典 {导出设备: 采样信息}"""
+        with self._lock:
+            return {exporter: dict(entry) for exporter, entry in sorted(self._exporters.items())}
+
+
+# 全局采样率登记
+sampling_registry = SamplingRegistry()
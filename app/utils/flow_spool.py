@@ -0,0 +1,516 @@
+"""
+流记录落盘模块
+
+接口流量汇总后原始流记录就被丢弃，事后排查只能看到接口总量；把原始流记录作为ORM对象写入数据库又会
+压垮数据库。本模块把解码后的流记录按定长二进制格式追加写入分段文件：按时间分区（默认每小时），
+单个分段超过大小上限时轮换，每个分段附带一个时间索引文件，记录每个索引间隔内第一条记录的位置。
+
+读取时用内存映射打开分段，按分区时间跳过无关的分段，用时间索引定位记录范围，再用NumPy按时间、
+IP、端口等条件向量化过滤，速度接近磁盘读取速度；读出的记录可以回放到数据处理流水线进行分析。
+目前只保存IPv4流记录。
+"""
+
+import logging
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 分段文件头：magic, 版本, 记录长度, 保留
+SEGMENT_MAGIC = b'FLSP'
+SEGMENT_VERSION = 2  # 版本2起接口索引为32位
+SEGMENT_HEADER = struct.Struct('<4sHH8x')
+
+# 流记录格式（小端序，44字节），字节数和报文数已按采样率放大
+SPOOL_DTYPE = np.dtype([
+    ('timestamp', '<u4'),
+    ('exporter', '<u4'),
+    ('src_addr', '<u4'),
+    ('dst_addr', '<u4'),
+    ('octets', '<u8'),
+    ('packets', '<u4'),
+    ('src_port', '<u2'),
+    ('dst_port', '<u2'),
+    ('input_if', '<u4'),
+    ('output_if', '<u4'),
+    ('protocol', 'u1'),
+    ('tcp_flags', 'u1'),
+    ('sampling_rate', '<u2'),
+])
+
+# 时间索引项：索引间隔内第一条记录的（时间戳, 记录序号）
+INDEX_DTYPE = np.dtype([('timestamp', '<u4'), ('record', '<u8')])
+
+# 分段文件名：分区开始时间戳-写入者-序号
+SEGMENT_PATTERN = re.compile(r'^(\d+)-([A-Za-z0-9_]+)-(\d+)\.flows$')
+
+# 默认参数
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024  # 单个分段的大小上限（字节）
+DEFAULT_PARTITION_SECONDS = 3600  # 时间分区长度（秒）
+DEFAULT_INDEX_INTERVAL = 10  # 时间索引间隔（秒）
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600  # 分段保留时间（秒）
+DEFAULT_CHUNK_RECORDS = 1 << 20  # 读取时每次过滤的记录数
+
+
+def ip_to_int(address):
+    """将点分IPv4地址转换为整数，不是IPv4地址时返回None"""
+    if isinstance(address, (int, np.integer)):
+        return int(address)
+    try:
+        return struct.unpack('!I', socket.inet_aton(address))[0]
+    except (OSError, TypeError):
+        return None
+
+
+def int_to_ip(value):
+    """将整数转换为点分IPv4地址"""
+    return socket.inet_ntoa(struct.pack('!I', int(value)))
+
+
+def _scaled(values, scale):
+    """按采样率放大并取整"""
+    if np.isscalar(scale) and scale == 1:
+        return values
+    return np.rint(np.asarray(values, dtype=np.float64) * scale)
+
+
+def _sampling_rates(scale, count):
+    """采样率字段，超过16位时截断"""
+    return np.clip(np.rint(np.broadcast_to(np.asarray(scale, dtype=np.float64), (count,))), 1, 0xFFFF)
+
+
+def v5_to_spool(records, exporter, scale=1):
+    """
+    将NetFlow v5记录数组转换为落盘格式
+
+    参数:
+        records: decode_netflow_v5返回的记录数组
+        exporter: 导出设备IP
+        scale: 采样率，标量或逐条记录的数组
+
+    返回:
+        SPOOL_DTYPE数组，时间戳在写入时填写
+    """
+    result = np.zeros(len(records), dtype=SPOOL_DTYPE)
+    result['exporter'] = ip_to_int(exporter) or 0
+    for name in ('src_addr', 'dst_addr', 'src_port', 'dst_port', 'input_if', 'output_if', 'protocol', 'tcp_flags'):
+        result[name] = records[name]
+    result['octets'] = _scaled(records['octets'], scale)
+    result['packets'] = _scaled(records['packets'], scale)
+    result['sampling_rate'] = _sampling_rates(scale, len(records))
+    return result
+
+
+def template_to_spool(template, records, exporter, scale=1):
+    """
+    将NetFlow v9/IPFIX数据记录转换为落盘格式，模板中没有IPv4地址时返回空数组
+
+    参数:
+        template: 记录所属的模板
+        records: 记录元组列表
+        exporter: 导出设备IP
+        scale: 采样率，标量或逐条记录的列表
+    """
+    positions = template.positions
+    if not records or 'src_addr' not in positions or 'dst_addr' not in positions:
+        return np.zeros(0, dtype=SPOOL_DTYPE)
+    result = np.zeros(len(records), dtype=SPOOL_DTYPE)
+    result['exporter'] = ip_to_int(exporter) or 0
+    columns = {'octets': positions.get('in_bytes', positions.get('total_bytes')), 'packets': positions.get('in_pkts')}
+    for name in ('src_addr', 'dst_addr', 'src_port', 'dst_port', 'input_if', 'output_if', 'protocol', 'tcp_flags'):
+        columns[name] = positions.get(name)
+    for name, index in columns.items():
+        if index is not None:
+            values = [record[index] for record in records]
+            result[name] = _scaled(values, scale) if name in ('octets', 'packets') else values
+    result['sampling_rate'] = _sampling_rates(scale, len(records))
+    return result
+
+
+def flows_to_spool(flows, exporter):
+    """
+    将sFlow流样本转换为落盘格式，跳过不是IPv4地址的样本
+
+    参数:
+        flows: SFlowDecoder解码得到的流样本字典列表（bytes已按采样率放大）
+        exporter: 代理IP
+    """
+    rows = []
+    for flow in flows:
+        src, dst = ip_to_int(flow.get('src_addr')), ip_to_int(flow.get('dst_addr'))
+        if src is None or dst is None:
+            continue
+        rate = flow.get('sampling_rate') or 1
+        rows.append((0, ip_to_int(exporter) or 0, src, dst, flow.get('bytes') or 0, rate,
+                     flow.get('src_port') or 0, flow.get('dst_port') or 0, flow.get('input_if') or 0,
+                     flow.get('output_if') or 0, flow.get('protocol') or 0, 0, min(rate, 0xFFFF)))
+    return np.array(rows, dtype=SPOOL_DTYPE)
+
+
+class FlowSpool:
+    """流记录分段写入器"""
+
+    def __init__(self, directory, writer='main', segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 partition_seconds=DEFAULT_PARTITION_SECONDS, index_interval=DEFAULT_INDEX_INTERVAL,
+                 retention_seconds=DEFAULT_RETENTION_SECONDS):
+        """
+        参数:
+            directory: 分段目录
+            writer: 写入者名称，多个收集进程写入同一目录时用于区分分段文件
+            segment_bytes: 单个分段的大小上限（字节）
+            partition_seconds: 时间分区长度（秒）
+            index_interval: 时间索引间隔（秒）
+            retention_seconds: 分段保留时间（秒），为None时不删除
+        """
+        self.directory = directory
+        self.writer = writer
+        self.segment_bytes = segment_bytes
+        self.partition_seconds = partition_seconds
+        self.index_interval = index_interval
+        self.retention_seconds = retention_seconds
+        self.stats = {'records': 0, 'bytes': 0, 'segments': 0, 'purged': 0}
+        self._lock = threading.Lock()
+        self._file = None
+        self._index_file = None
+        self._partition = None
+        self._records = 0  # 当前分段的记录数
+        self._last_index = None  # 当前分段最后一个索引项的索引间隔
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, records, now=None):
+        """
+        追加一批流记录
+
+        参数:
+            records: SPOOL_DTYPE数组
+            now: 写入时间戳（秒），默认为time.time()；记录按写入时间排序，时间索引依赖这一点
+        """
+        if not len(records):
+            return
+        with self._lock:
+            now = int(time.time() if now is None else now)
+            records['timestamp'] = now
+            partition = now // self.partition_seconds * self.partition_seconds
+            if (self._file is None or partition != self._partition
+                    or self._file.tell() + records.nbytes > self.segment_bytes):
+                self._rotate(partition, now)
+
+            interval = now // self.index_interval
+            if interval != self._last_index:
+                self._index_file.write(np.array([(now, self._records)], dtype=INDEX_DTYPE).tobytes())
+                self._last_index = interval
+            self._file.write(records.tobytes())
+            self._records += len(records)
+            self.stats['records'] += len(records)
+            self.stats['bytes'] += records.nbytes
+
+    def _rotate(self, partition, now):
+        """关闭当前分段，创建新分段"""
+        self._close()
+        sequence = 0
+        prefix = f'{partition}-{self.writer}-'
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.flows'):
+                sequence = max(sequence, int(name[len(prefix):-len('.flows')]) + 1)
+        path = os.path.join(self.directory, f'{prefix}{sequence:06d}.flows')
+        self._file = open(path, 'ab', buffering=1024 * 1024)
+        self._file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, SPOOL_DTYPE.itemsize))
+        self._index_file = open(path[:-len('.flows')] + '.idx', 'ab')
+        self._partition = partition
+        self._records = 0
+        self._last_index = None
+        self.stats['segments'] += 1
+        self._purge(now)
+
+    def _purge(self, now):
+        """删除超过保留时间的分段"""
+        if not self.retention_seconds:
+            return
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if not match or int(match.group(1)) + self.partition_seconds > now - self.retention_seconds:
+                continue
+            for path in (os.path.join(self.directory, name), os.path.join(self.directory, name[:-len('.flows')] + '.idx')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.stats['purged'] += 1
+
+    def flush(self):
+        """把缓冲区中的记录写入文件，读取方只能看到已写入的记录"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index_file.flush()
+
+    def _close(self):
+        """关闭当前分段"""
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._file = self._index_file = None
+
+    def close(self):
+        """关闭写入器"""
+        with self._lock:
+            self._close()
+
+
+class FlowSpoolReader:
+    """流记录分段读取器，通过内存映射按条件过滤"""
+
+    def __init__(self, directory, partition_seconds=DEFAULT_PARTITION_SECONDS, chunk_records=DEFAULT_CHUNK_RECORDS):
+        """
+        参数:
+            directory: 分段目录
+            partition_seconds: 写入时使用的时间分区长度（秒）
+            chunk_records: 每次过滤的记录数
+        """
+        self.directory = directory
+        self.partition_seconds = partition_seconds
+        self.chunk_records = chunk_records
+
+    def segments(self, start=None, end=None):
+        """
+        获取与时间范围有交集的分段
+
+        返回:
+            [分段路径]，按分区时间排序
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if not match:
+                continue
+            partition = int(match.group(1))
+            if end is not None and partition >= end:
+                continue
+            if start is not None and partition + self.partition_seconds <= start:
+                continue
+            result.append((partition, match.group(2), int(match.group(3)), os.path.join(self.directory, name)))
+        return [path for _, _, _, path in sorted(result)]
+
+    def _open(self, path):
+        """内存映射一个分段，返回记录数组；分段为空或格式不符时返回None"""
+        size = os.path.getsize(path)
+        count = (size - SEGMENT_HEADER.size) // SPOOL_DTYPE.itemsize
+        if count <= 0:
+            return None
+        with open(path, 'rb') as f:
+            magic, version, record_size = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or record_size != SPOOL_DTYPE.itemsize:
+            logger.warning(f"跳过格式或版本不符的流记录分段: {path}")
+            return None
+        # 只映射完整的记录，写入方正在追加的部分记录不可见
+        return np.memmap(path, dtype=SPOOL_DTYPE, mode='r', offset=SEGMENT_HEADER.size, shape=(count,))
+
+    @staticmethod
+    def _index_range(path, count, start, end):
+        """用时间索引确定可能包含时间范围内记录的区间"""
+        index_path = path[:-len('.flows')] + '.idx'
+        try:
+            index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+        except (OSError, ValueError):
+            return 0, count
+        if not len(index):
+            return 0, count
+        low, high = 0, count
+        if start is not None:
+            position = np.searchsorted(index['timestamp'], start, side='right') - 1
+            if position >= 0:
+                low = int(index['record'][position])
+        if end is not None:
+            position = np.searchsorted(index['timestamp'], end, side='left')
+            if position < len(index):
+                high = min(count, int(index['record'][position]))
+        return low, high
+
+    def scan(self, start=None, end=None, ip=None, src=None, dst=None, port=None, exporter=None,
+             interface=None, protocol=None):
+        """
+        按条件读取流记录，逐块返回
+
+        参数:
+            start, end: 时间范围（时间戳，秒），包含start、不包含end
+            ip: 源或目的地址
+            src, dst: 源地址、目的地址
+            port: 源或目的端口
+            exporter: 导出设备IP
+            interface: 输入或输出接口
+            protocol: IP协议号
+
+        返回:
+            SPOOL_DTYPE数组的生成器
+        """
+        values = {name: ip_to_int(value) if value is not None else None
+                  for name, value in (('ip', ip), ('src', src), ('dst', dst), ('exporter', exporter))}
+        for path in self.segments(start, end):
+            records = self._open(path)
+            if records is None:
+                continue
+            low, high = self._index_range(path, len(records), start, end)
+            for offset in range(low, high, self.chunk_records):
+                chunk = records[offset:min(offset + self.chunk_records, high)]
+                mask = np.ones(len(chunk), dtype=bool)
+                if start is not None:
+                    mask &= chunk['timestamp'] >= start
+                if end is not None:
+                    mask &= chunk['timestamp'] < end
+                if values['ip'] is not None:
+                    mask &= (chunk['src_addr'] == values['ip']) | (chunk['dst_addr'] == values['ip'])
+                if values['src'] is not None:
+                    mask &= chunk['src_addr'] == values['src']
+                if values['dst'] is not None:
+                    mask &= chunk['dst_addr'] == values['dst']
+                if values['exporter'] is not None:
+                    mask &= chunk['exporter'] == values['exporter']
+                if port is not None:
+                    mask &= (chunk['src_port'] == port) | (chunk['dst_port'] == port)
+                if interface is not None:
+                    mask &= (chunk['input_if'] == interface) | (chunk['output_if'] == interface)
+                if protocol is not None:
+                    mask &= chunk['protocol'] == protocol
+                if mask.any():
+                    # 拷贝出匹配的记录，不持有映射的引用
+                    yield np.array(chunk[mask])
+
+    def read(self, limit=None, **filters):
+        """
+        按条件读取流记录
+
+        参数:
+            limit: 最多返回的记录数
+            filters: 与scan相同的过滤条件
+
+        返回:
+            SPOOL_DTYPE数组
+        """
+        chunks, total = [], 0
+        for chunk in self.scan(**filters):
+            chunks.append(chunk)
+            total += len(chunk)
+            if limit is not None and total >= limit:
+                break
+        result = np.concatenate(chunks) if chunks else np.zeros(0, dtype=SPOOL_DTYPE)
+        return result[:limit] if limit is not None else result
+
+    def replay(self, handler, batch_size=10000, **filters):
+        """
+        把符合条件的流记录按批回放给处理函数
+
+        参数:
+            handler: 处理函数，以SPOOL_DTYPE数组调用
+            batch_size: 每批的记录数
+            filters: 与scan相同的过滤条件
+
+        返回:
+            回放的记录数
+        """
+        total = 0
+        for chunk in self.scan(**filters):
+            for offset in range(0, len(chunk), batch_size):
+                batch = chunk[offset:offset + batch_size]
+                handler(batch)
+                total += len(batch)
+        return total
+
+    def replay_to_pipeline(self, submit, bucket_seconds=60, pipeline='feature_analysis', **filters):
+        """
+        按（导出设备, 接口, 时间段）汇总流记录，作为回放数据提交到数据处理流水线
+
+        参数:
+            submit: 提交函数，与data_processor.submit_data相同
+            bucket_seconds: 汇总时间段（秒）
+            pipeline: 流水线名称
+            filters: 与scan相同的过滤条件
+
+        返回:
+            提交的数据条数
+        """
+        totals = {}  # (导出设备, 接口, 时间段) -> [入字节数, 出字节数, 流数]
+        for chunk in self.scan(**filters):
+            buckets = chunk['timestamp'] // bucket_seconds * bucket_seconds
+            for column, direction in (('input_if', 0), ('output_if', 1)):
+                keys = np.stack([chunk['exporter'].astype(np.uint64), chunk[column].astype(np.uint64),
+                                 buckets.astype(np.uint64)], axis=1)
+                unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                octets = np.bincount(inverse, weights=chunk['octets'], minlength=len(unique_keys))
+                flows = np.bincount(inverse, minlength=len(unique_keys))
+                for key, total, count in zip(map(tuple, unique_keys.tolist()), octets.tolist(), flows.tolist()):
+                    entry = totals.setdefault(key, [0, 0, 0])
+                    entry[direction] += int(total)
+                    if direction == 0:
+                        entry[2] += count
+
+        for (exporter, interface_id, bucket), (in_bytes, out_bytes, flows) in sorted(totals.items(), key=lambda item: item[0][2]):
+            submit({
+                'type': 'replay',
+                'source_id': f'{int_to_ip(exporter)}:{interface_id}',
+                'interface_id': interface_id,
+                'timestamp': datetime.utcfromtimestamp(bucket),
+                'interval_seconds': bucket_seconds,
+                'data': {'in_bytes': in_bytes, 'out_bytes': out_bytes, 'flows': flows}
+            }, pipeline)
+        return len(totals)
+
+
+def records_to_dicts(records):
+    """将落盘格式的记录转换为字典列表，用于接口返回"""
+    result = []
+    for record in records.tolist():
+        timestamp, exporter, src, dst, octets, packets, src_port, dst_port, input_if, output_if, protocol, flags, rate = record
+        result.append({
+            'timestamp': timestamp, 'exporter': int_to_ip(exporter), 'src_addr': int_to_ip(src),
+            'dst_addr': int_to_ip(dst), 'octets': octets, 'packets': packets, 'src_port': src_port,
+            'dst_port': dst_port, 'input_if': input_if, 'output_if': output_if, 'protocol': protocol,
+            'tcp_flags': flags, 'sampling_rate': rate
+        })
+    return result
+
+
+# 全局流记录写入器，FLOW_SPOOL_ENABLED为True时创建
+flow_spool = None
+
+
+def spool_options(config):
+    """从应用配置读取写入器参数，未开启落盘时返回None"""
+    config = config or {}
+    if not config.get('FLOW_SPOOL_ENABLED'):
+        return None
+    return {
+        'directory': config.get('FLOW_SPOOL_PATH', 'flow_spool'),
+        'segment_bytes': config.get('FLOW_SPOOL_SEGMENT_BYTES', DEFAULT_SEGMENT_BYTES),
+        'partition_seconds': config.get('FLOW_SPOOL_PARTITION_SECONDS', DEFAULT_PARTITION_SECONDS),
+        'index_interval': config.get('FLOW_SPOOL_INDEX_INTERVAL', DEFAULT_INDEX_INTERVAL),
+        'retention_seconds': config.get('FLOW_SPOOL_RETENTION', DEFAULT_RETENTION_SECONDS)
+    }
+
+
+def init_flow_spool(config=None):
+    """
+    按配置创建全局流记录写入器
+
+    参数:
+        config: 应用配置
+
+    返回:
+        FlowSpool，未开启落盘时返回None
+    """
+    global flow_spool
+    options = spool_options(config)
+    if options is not None:
+        flow_spool = FlowSpool(**options)
+        logger.info(f"流记录落盘已开启: {options['directory']}")
+    return flow_spool
@@ -0,0 +1,305 @@
+"""
+多进程流量收集模块
+
+即使解码已经向量化，一个Python进程仍然处理不了所有边界和汇聚设备发送的NetFlow。
+本模块启动N个收集进程，每个进程都用SO_REUSEPORT绑定同一个NetFlow/sFlow端口，
+由内核按（源地址, 源端口）把导出设备分散到各个进程；同一导出设备总是落在同一进程，
+v9/IPFIX模板不需要在进程间共享。各进程只在本地汇总接口字节数，每秒把汇总结果、
+sFlow计数器样本和流量大户摘要发送给父进程，由父进程中唯一的写入线程合并到全局收集器的缓存中。
+开启流记录落盘时，各进程直接写入同一目录下以进程序号区分的分段文件。
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from app.utils.multiprocess import spawn_context
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 收集进程向父进程发送汇总结果的间隔（秒）
+FORWARD_INTERVAL = 1.0
+
+# 收集进程启动失败（如端口绑定失败）后重启的最长等待时间（秒），等待时间按连续失败次数加倍
+MAX_RESTART_BACKOFF = 60
+
+# 消息类型
+MESSAGE_READY = 'ready'
+MESSAGE_AGGREGATES = 'aggregates'
+MESSAGE_ERROR = 'error'
+
+
+class ForwardingAggregator:
+    """收集进程中的本地汇总器，代替收集器的接口流量缓存，定期把增量发送给父进程"""
+
+    def __init__(self):
+        self._traffic = {}  # (收集器类型, 设备IP, 接口) -> [入字节数, 出字节数]
+        self._counters = []  # [(代理IP, 计数器样本列表, 运行时间, 接收时间)]
+        self._lock = threading.Lock()
+
+    def record(self, kind, device_ip, interface_id, in_bytes, out_bytes):
+        """累加一个接口的字节数"""
+        key = (kind, device_ip, interface_id)
+        with self._lock:
+            totals = self._traffic.get(key)
+            if totals is None:
+                self._traffic[key] = [in_bytes, out_bytes]
+            else:
+                totals[0] += in_bytes
+                totals[1] += out_bytes
+
+    def counters(self, agent, counters, uptime):
+        """暂存sFlow计数器样本"""
+        if counters:
+            with self._lock:
+                self._counters.append((agent, counters, uptime, time.time()))
+
+    def drain(self):
+        """取出并清空本地汇总结果"""
+        with self._lock:
+            traffic, self._traffic = self._traffic, {}
+            counters, self._counters = self._counters, []
+        return traffic, counters
+
+
+def _collector_main(index, options, results, stop_event):
+    """
+    收集进程入口
+
+    参数:
+        index: 进程序号
+        options: 收集器参数（listen_ip、netflow_port、sflow_port及接收参数）
+        results: 发送给父进程的消息队列
+        stop_event: 退出事件
+    """
+    from app.utils.flow_collector import NetFlowCollector, SFlowCollector
+    from app.utils.top_talkers import TopTalkers
+    from app.utils.flow_spool import FlowSpool
+
+    options = dict(options)
+    listen_ip = options.pop('listen_ip', '0.0.0.0')
+    netflow_port = options.pop('netflow_port')
+    sflow_port = options.pop('sflow_port')
+    talker_options = options.pop('top_talkers', None)
+    spool_options = options.pop('spool', None)
+
+    aggregator = ForwardingAggregator()
+    talkers = TopTalkers(**talker_options) if talker_options is not None else None
+    spool = FlowSpool(writer=f'p{index}', **spool_options) if spool_options is not None else None
+    collectors = {
+        'netflow': NetFlowCollector(listen_ip, netflow_port),
+        'sflow': SFlowCollector(listen_ip, sflow_port),
+    }
+    failed = []
+    for name, collector in collectors.items():
+        collector.configure(reuse_port=True, **options)
+        collector.forward = aggregator
+        collector.talkers = talkers
+        collector.spool = spool
+        if not collector.start():
+            failed.append(name)
+    if failed:
+        # 启动失败时不发送就绪消息，由父进程按退避时间重启
+        for collector in collectors.values():
+            collector.stop()
+        if spool is not None:
+            spool.close()
+        results.put((index, MESSAGE_ERROR, f"{'、'.join(failed)}收集器启动失败"))
+        return
+    results.put((index, MESSAGE_READY, os.getpid()))
+
+    try:
+        while not stop_event.wait(FORWARD_INTERVAL):
+            traffic, counters = aggregator.drain()
+            windows = talkers.drain() if talkers is not None else []
+            if spool is not None:
+                spool.flush()
+            stats = {name: collector.ingest_stats() for name, collector in collectors.items()}
+            results.put((index, MESSAGE_AGGREGATES, (traffic, counters, windows, stats)))
+    finally:
+        for collector in collectors.values():
+            collector.stop()
+        if spool is not None:
+            spool.close()
+        # 退出前发送最后一批汇总结果
+        traffic, counters = aggregator.drain()
+        windows = talkers.drain() if talkers is not None else []
+        results.put((index, MESSAGE_AGGREGATES, (traffic, counters, windows, {})))
+
+
+class FlowCollectorPool:
+    """多进程流量收集器，父进程负责合并各进程的汇总结果并监督收集进程"""
+
+    def __init__(self, processes=4, options=None, netflow_collector=None, sflow_collector=None, counter_store=None,
+                 talkers=None):
+        """
+        参数:
+            processes: 收集进程数
+            options: 收集器参数（listen_ip、netflow_port、sflow_port、top_talkers及接收参数）
+            netflow_collector: 接收合并结果的NetFlow收集器，默认为全局收集器
+            sflow_collector: 接收合并结果的sFlow收集器，默认为全局收集器
+            counter_store: 接收sFlow计数器样本的缓存，默认为全局缓存
+            talkers: 接收流量大户摘要的统计实例，默认为全局实例
+        """
+        from app.utils.flow_collector import netflow_collector as default_netflow, sflow_collector as default_sflow
+        from app.utils.sflow import sflow_counters
+        from app.utils.top_talkers import top_talkers
+
+        self.processes = max(1, int(processes))
+        self.options = dict(options or {})
+        self.collectors = {
+            'netflow': netflow_collector if netflow_collector is not None else default_netflow,
+            'sflow': sflow_collector if sflow_collector is not None else default_sflow,
+        }
+        self.counter_store = counter_store if counter_store is not None else sflow_counters
+        self.talkers = talkers if talkers is not None else top_talkers
+        self.restarts = 0
+        self.process_stats = {}  # 进程序号 -> {收集器类型: 接收统计}
+        self.merged = 0  # 已合并的接口汇总条目数
+        self.failures = {}  # 进程序号 -> 最近一次启动失败的原因
+        # 使用spawn启动，避免子进程继承父进程的套接字和数据库连接
+        self._context = spawn_context()
+        self._failure_counts = {}  # 进程序号 -> 连续启动失败次数
+        self._restart_at = {}  # 进程序号 -> 启动失败后允许重启的时间
+        self._results = None
+        self._stop_event = None
+        self._processes = {}  # 进程序号 -> 进程
+        self._writer = None
+        self._running = False
+
+    def start(self, ready_timeout=30):
+        """启动收集进程和写入线程"""
+        self._results = self._context.Queue()
+        self._stop_event = self._context.Event()
+        self._running = True
+        for index in range(self.processes):
+            self._spawn(index)
+        self._writer = threading.Thread(target=self._writer_loop, name='flow-writer', daemon=True)
+        self._writer.start()
+        self._wait_ready(ready_timeout)
+        return self
+
+    def _spawn(self, index):
+        """启动一个收集进程"""
+        process = self._context.Process(
+            target=_collector_main,
+            args=(index, self.options, self._results, self._stop_event),
+            name=f'flow-collector-{index}',
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"流量收集进程{index}已启动，PID {process.pid}")
+
+    def _wait_ready(self, timeout):
+        """等待所有收集进程完成绑定或报告启动失败"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if len(self.process_stats) >= self.processes:
+                return True
+            if len(set(self.process_stats) | set(self.failures)) >= self.processes:
+                logger.error(f"部分流量收集进程启动失败: {self.failures}")
+                return False
+            time.sleep(0.1)
+        logger.warning(f"部分流量收集进程未能在{timeout}秒内完成启动")
+        return False
+
+    def _writer_loop(self):
+        """写入线程：合并各收集进程的汇总结果，并重启退出的收集进程"""
+        last_supervise = time.monotonic()
+        while self._running:
+            # 持续有汇总结果时也要定期检查收集进程
+            if time.monotonic() - last_supervise >= FORWARD_INTERVAL:
+                self.supervise()
+                last_supervise = time.monotonic()
+            try:
+                index, kind, payload = self._results.get(timeout=FORWARD_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if kind == MESSAGE_READY:
+                self.process_stats.setdefault(index, {})
+                self.failures.pop(index, None)
+                self._failure_counts.pop(index, None)
+            elif kind == MESSAGE_ERROR:
+                self._record_failure(index, payload)
+            elif kind == MESSAGE_AGGREGATES:
+                traffic, counters, windows, stats = payload
+                self.merge(traffic, counters, windows)
+                if stats:
+                    self.process_stats[index] = stats
+
+    def merge(self, traffic, counters, windows=None):
+        """
+        把一个收集进程的汇总结果合并到父进程的收集器、计数器样本缓存和流量大户统计
+
+        参数:
+            traffic: {(收集器类型, 设备IP, 接口): [入字节数, 出字节数]}
+            counters: [(代理IP, 计数器样本列表, 运行时间, 接收时间)]
+            windows: TopTalkers.drain()取出的流量大户窗口
+        """
+        for (kind, device_ip, interface_id), (in_bytes, out_bytes) in traffic.items():
+            self.collectors[kind]._record_interface_traffic(device_ip, interface_id, in_bytes, out_bytes)
+        for agent, samples, uptime, received in counters:
+            self.counter_store.update(agent, samples, uptime, now=received)
+        if windows:
+            self.talkers.merge_windows(windows)
+        self.merged += len(traffic)
+
+    def _record_failure(self, index, reason):
+        """记录收集进程启动失败，推迟重启"""
+        count = self._failure_counts.get(index, 0) + 1
+        self._failure_counts[index] = count
+        self.failures[index] = reason
+        self.process_stats.pop(index, None)
+        self._restart_at[index] = time.monotonic() + min(FORWARD_INTERVAL * 2 ** count, MAX_RESTART_BACKOFF)
+        logger.error(f"流量收集进程{index}启动失败（第{count}次）: {reason}")
+
+    def supervise(self):
+        """重启已退出的收集进程，启动失败的进程等到退避时间之后再重启"""
+        if not self._running:
+            return 0
+        now = time.monotonic()
+        dead = [index for index, process in self._processes.items()
+                if not process.is_alive() and self._restart_at.get(index, 0) <= now]
+        for index in dead:
+            self.restarts += 1
+            logger.warning(f"流量收集进程{index}已退出（退出码 {self._processes[index].exitcode}），重新启动")
+            self._spawn(index)
+        return len(dead)
+
+    def stats(self):
+        """获取各收集进程的接收统计 {'netflow/0': 统计}"""
+        result = {}
+        for index, stats in sorted(self.process_stats.items()):
+            for name, collector_stats in stats.items():
+                if collector_stats is not None:
+                    result[f'{name}/{index}'] = collector_stats
+        return result
+
+    def stop(self, timeout=5):
+        """通知收集进程退出，合并最后一批汇总结果"""
+        if not self._running:
+            return
+        self._stop_event.set()
+        for process in self._processes.values():
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self._running = False
+        if self._writer is not None:
+            self._writer.join(timeout=timeout)
+        # 写入线程退出后队列中可能还有最后一批汇总结果
+        while True:
+            try:
+                index, kind, payload = self._results.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                break
+            if kind == MESSAGE_AGGREGATES:
+                self.merge(*payload[:3])
+        self._processes.clear()
@@ -0,0 +1,215 @@
+"""
+接口清单缓存模块
+
+ifDescr、ifSpeed、ifHighSpeed等接口静态信息几乎不会变化，没有必要在每个轮询周期重新遍历。
+本模块为每台设备缓存这些静态列，只有当ifTableLastChange变化、ifNumber变化或sysUpTime回退（设备重启，
+ifIndex可能重新编号）时才重新遍历；其余轮询只需获取计数器列，再与缓存合并为完整的表格行。
+缓存定期保存到磁盘，应用重启后无需重新遍历所有设备的静态列。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 缓存的最长有效期（秒），即使设备没有报告变化也定期重新遍历一次
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+def plain_value(value):
+    """将pyasn1的值转换为可以保存为JSON的Python值"""
+    if isinstance(value, (int, float, str)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class InterfaceInventory:
+    """接口清单缓存，每台设备保存一份静态列快照"""
+
+    def __init__(self, path=None, max_age=DEFAULT_MAX_AGE):
+        """
+        参数:
+            path: 缓存文件路径，为None时不持久化
+            max_age: 缓存的最长有效期（秒）
+        """
+        self.path = path
+        self.max_age = max_age
+        # 设备ID -> {'last_change', 'if_number', 'sys_uptime', 'updated_at', 'columns', 'rows'}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def needs_refresh(self, device_id, columns, last_change=None, if_number=None, sys_uptime=None):
+        """
+        判断设备的静态列是否需要重新遍历
+
+        参数:
+            device_id: 设备ID
+            columns: 本次需要的静态列OID列表
+            last_change: 设备的ifTableLastChange（1/100秒）
+            if_number: 设备的ifNumber
+            sys_uptime: 设备的sysUpTime（1/100秒）
+
+        返回:
+            需要重新遍历时返回True
+        """
+        entry = self._entries.get(device_id)
+        if entry is None or time.time() - entry['updated_at'] > self.max_age:
+            return True
+
+        # 计数器类型变化时需要的静态列也不同
+        if entry['columns'] != list(columns):
+            return True
+
+        # sysUpTime回退说明设备重启过，ifIndex可能重新编号
+        if sys_uptime is not None and entry['sys_uptime'] is not None and sys_uptime < entry['sys_uptime']:
+            return True
+
+        # 不支持ifTableLastChange的设备只能依靠ifNumber判断接口增减
+        if last_change != entry['last_change'] or if_number != entry['if_number']:
+            return True
+
+        return False
+
+    def update(self, device_id, rows, columns, last_change=None, if_number=None, sys_uptime=None):
+        """
+        从完整的表格行中提取静态列并写入缓存
+
+        参数:
+            device_id: 设备ID
+            rows: 表格行字典 {ifIndex: {列OID: 值}}
+            columns: 需要缓存的静态列OID列表
+            last_change: 设备的ifTableLastChange
+            if_number: 设备的ifNumber
+            sys_uptime: 设备的sysUpTime
+        """
+        static_rows = {}
+        for index, row in rows.items():
+            static_rows[index] = {column: plain_value(row[column]) for column in columns if column in row}
+
+        with self._lock:
+            self._entries[device_id] = {
+                'last_change': last_change,
+                'if_number': if_number,
+                'sys_uptime': sys_uptime,
+                'updated_at': time.time(),
+                'columns': list(columns),
+                'rows': static_rows
+            }
+
+    def touch(self, device_id, sys_uptime=None):
+        """记录设备最新的sysUpTime，用于下一次判断设备是否重启"""
+        entry = self._entries.get(device_id)
+        if entry is not None and sys_uptime is not None:
+            entry['sys_uptime'] = sys_uptime
+
+    def merge(self, device_id, rows):
+        """
+        将缓存的静态列合并到只包含计数器列的表格行中
+
+        参数:
+            device_id: 设备ID
+            rows: 表格行字典（原地修改）
+
+        返回:
+            所有行都在缓存中时返回True；出现未知的ifIndex时返回False，调用方应重新遍历静态列
+        """
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return False
+
+        static_rows = entry['rows']
+        complete = True
+        for index, row in rows.items():
+            static_row = static_rows.get(index)
+            if static_row is None:
+                complete = False
+                continue
+            for column, value in static_row.items():
+                row.setdefault(column, value)
+        return complete
+
+    def column_values(self, device_id, column):
+        """
+        获取设备所有接口的某个静态列
+
+        参数:
+            device_id: 设备ID
+            column: 静态列OID，如ifDescr
+
+        返回:
+            {ifIndex: 值}，设备不在缓存中时返回空字典
+        """
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return {}
+        return {index: row[column] for index, row in entry['rows'].items() if column in row}
+
+    def forget_device(self, device_id):
+        """删除设备的缓存，下次轮询时重新遍历静态列"""
+        with self._lock:
+            self._entries.pop(device_id, None)
+
+    def load(self, path=None):
+        """从磁盘加载缓存"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        try:
+            with open(path, 'r') as f:
+                content = json.load(f)
+            entries = {int(device_id): entry for device_id, entry in content.get('devices', {}).items()}
+            with self._lock:
+                self._entries.update(entries)
+            logger.info(f"已加载 {len(entries)} 台设备的接口清单")
+            return len(entries)
+        except Exception as e:
+            logger.error(f"加载接口清单失败: {str(e)}")
+            return 0
+
+    def save(self, path=None):
+        """将缓存保存到磁盘（先写临时文件再替换，避免写入中断导致文件损坏）"""
+        path = path or self.path
+        if not path:
+            return False
+
+        with self._lock:
+            devices = {str(device_id): entry for device_id, entry in self._entries.items()}
+            content = json.dumps({'version': 1, 'devices': devices})
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"保存接口清单失败: {str(e)}")
+            return False
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 全局接口清单缓存
+interface_inventory = InterfaceInventory()
+
+
+def init_interface_inventory(path):
+    """
+    初始化接口清单缓存并加载已保存的清单
+
+    参数:
+        path: 缓存文件路径
+    """
+    interface_inventory.path = path
+    interface_inventory.load()
+    return interface_inventory
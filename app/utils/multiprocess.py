@@ -0,0 +1,60 @@
+"""
+多进程启动模块
+
+分片轮询、多进程流量收集和流水线进程池都用spawn方式启动子进程，避免子进程继承父进程的
+SnmpEngine套接字、数据库连接和线程。spawn启动的子进程会重新导入主模块（如run.py），主模块中的
+create_app()又会启动一个调度器，重复注册流量统计任务。create_app()在设置了FLASK_RUN_FROM_CLI时
+不启动调度器，子进程的环境变量在启动时从父进程复制，所以本模块只在启动子进程的那一刻设置它，
+启动后立即恢复，父进程之后再调用create_app()时仍然正常启动调度器。
+"""
+
+import contextlib
+import multiprocessing
+import multiprocessing.context
+import os
+import threading
+
+# 子进程中不启动调度器的标记
+CHILD_ENVIRONMENT = {'FLASK_RUN_FROM_CLI': '1'}
+
+# 修改环境变量期间的锁，多个线程同时启动子进程时保证恢复的是原来的值
+_environment_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def child_environment():
+    """在with块内设置子进程的环境变量，退出时恢复父进程原来的值"""
+    with _environment_lock:
+        previous = {name: os.environ.get(name) for name in CHILD_ENVIRONMENT}
+        os.environ.update(CHILD_ENVIRONMENT)
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+class SpawnProcess(multiprocessing.context.SpawnProcess):
+    """启动时带上子进程环境变量的spawn进程"""
+
+    def start(self):
+        with child_environment():
+            super().start()
+
+
+class SpawnContext(multiprocessing.context.SpawnContext):
+    """创建SpawnProcess的spawn上下文，ProcessPoolExecutor按需创建的工作进程也经过这里"""
+    Process = SpawnProcess
+
+
+def spawn_context():
+    """
+    获取spawn启动方式的多进程上下文
+
+    返回:
+        SpawnContext，可以传给ProcessPoolExecutor的mp_context
+    """
+    return SpawnContext()
@@ -0,0 +1,545 @@
+"""
+NetFlow v9/IPFIX解码模块
+
+NetFlow v9（RFC 3954）和IPFIX（RFC 7011）的数据记录格式由导出设备发送的模板定义。
+本模块按（导出设备, source_id/观察域, 模板ID）缓存模板，并把每个模板预编译为一个struct格式：
+只解析需要的字段，其余字段编译为填充字节直接跳过，解码一个数据FlowSet只需要一次批量解包，
+而不是逐条记录、逐个字段地解析。选项模板的数据记录（如采样间隔）按导出设备和观察域保存。
+"""
+
+import itertools
+import logging
+import struct
+import threading
+import time
+
+from app.utils.flow_sampling import options_sampling_rate, SOURCE_V9_OPTIONS, SOURCE_V9_RECORD
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 协议版本
+NETFLOW_V9 = 9
+IPFIX = 10
+
+# 报文头格式
+NETFLOW_V9_HEADER = struct.Struct('!HHIIII')  # version, count, sys_uptime, unix_secs, sequence, source_id
+IPFIX_HEADER = struct.Struct('!HHIII')  # version, length, export_time, sequence, observation_domain
+SET_HEADER = struct.Struct('!HH')  # FlowSet ID, 长度
+
+# FlowSet ID
+V9_TEMPLATE_SET = 0
+V9_OPTIONS_TEMPLATE_SET = 1
+IPFIX_TEMPLATE_SET = 2
+IPFIX_OPTIONS_TEMPLATE_SET = 3
+MIN_DATA_SET_ID = 256
+
+# IPFIX可变长度字段
+VARIABLE_LENGTH = 65535
+
+# 模板的默认有效期（秒），UDP传输时导出设备会定期重发模板
+DEFAULT_TEMPLATE_TTL = 1800
+
+# 需要解析的字段类型 -> 字段名，其余字段在解码时跳过
+# v9和IPFIX的信息元素编号在这一范围内是一致的
+FIELD_NAMES = {
+    1: 'in_bytes',
+    2: 'in_pkts',
+    4: 'protocol',
+    5: 'tos',
+    6: 'tcp_flags',
+    7: 'src_port',
+    8: 'src_addr',
+    10: 'input_if',
+    11: 'dst_port',
+    12: 'dst_addr',
+    14: 'output_if',
+    15: 'next_hop',
+    21: 'last_switched',
+    22: 'first_switched',
+    23: 'out_bytes',
+    24: 'out_pkts',
+    27: 'src_addr_v6',
+    28: 'dst_addr_v6',
+    34: 'sampling_interval',
+    35: 'sampling_algorithm',
+    48: 'sampler_id',
+    49: 'sampler_mode',
+    50: 'sampler_random_interval',
+    61: 'direction',
+    85: 'total_bytes',
+    152: 'flow_start_ms',
+    153: 'flow_end_ms',
+    302: 'selector_id',
+    304: 'selector_algorithm',
+    305: 'sampling_packet_interval',
+    306: 'sampling_packet_space',
+}
+
+# 定长整数字段的struct格式字符
+INTEGER_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# 按字节串保留的字段（IPv6地址）
+BYTES_FIELDS = {'src_addr_v6', 'dst_addr_v6'}
+
+# 数据记录中可能直接携带的采样字段
+SAMPLING_FIELDS = ('sampler_random_interval', 'sampling_interval', 'sampling_packet_interval', 'sampling_packet_space')
+
+
+class FlowTemplate:
+    """编译后的模板，一个数据FlowSet通过一次批量解包解码"""
+
+    __slots__ = ('template_id', 'fields', 'names', 'is_options', 'scope_count', 'record_length',
+                 'struct', 'positions', 'int_positions', 'updated_at', 'domain')
+
+    def __init__(self, template_id, fields, is_options=False, scope_count=0, domain=None):
+        """
+        参数:
+            template_id: 模板ID
+            fields: 字段列表 [(字段类型, 长度, 企业编号)]，企业编号为0表示标准字段
+            is_options: 是否为选项模板
+            scope_count: 选项模板的范围字段数
+            domain: 模板所属的source_id/观察域
+        """
+        self.template_id = template_id
+        self.domain = domain
+        self.fields = tuple(fields)
+        self.is_options = is_options
+        self.scope_count = scope_count
+        self.updated_at = time.time()
+        self._compile()
+
+    def _compile(self):
+        """将字段列表编译为struct格式，不需要的字段编译为填充字节"""
+        codes = []
+        names = []
+        int_positions = []  # 长度不是1/2/4/8的整数字段，解包为字节串后再转换
+        self.record_length = 0
+        for position, (field_type, length, enterprise) in enumerate(self.fields):
+            if length == VARIABLE_LENGTH:
+                # 含可变长度字段的模板无法预编译，逐条解析
+                self.struct = None
+                self.record_length = None
+                break
+
+            self.record_length += length
+            name = FIELD_NAMES.get(field_type) if not enterprise else None
+            # 选项模板的范围字段只用于区分选项记录的来源
+            if name is None or (self.is_options and position < self.scope_count):
+                if codes and codes[-1].endswith('x'):
+                    codes[-1] = f'{int(codes[-1][:-1]) + length}x'
+                else:
+                    codes.append(f'{length}x')
+                continue
+
+            if name not in BYTES_FIELDS and length in INTEGER_CODES:
+                codes.append(INTEGER_CODES[length])
+            else:
+                codes.append(f'{length}s')
+                if name not in BYTES_FIELDS:
+                    int_positions.append(len(names))
+            names.append(name)
+        else:
+            self.struct = struct.Struct('!' + ''.join(codes))
+
+        self.names = tuple(names)
+        self.positions = {name: index for index, name in enumerate(names)}
+        self.int_positions = tuple(int_positions)
+
+    def same_fields(self, fields, is_options, scope_count):
+        """判断模板定义是否与已缓存的相同，相同时无需重新编译"""
+        return self.fields == tuple(fields) and self.is_options == is_options and self.scope_count == scope_count
+
+    def decode(self, data, offset, end):
+        """
+        解码一个数据FlowSet中的所有记录
+
+        参数:
+            data: 报文（bytes或memoryview）
+            offset: 记录的起始位置
+            end: FlowSet的结束位置
+
+        返回:
+            记录元组列表，元组中字段的顺序与names一致
+        """
+        if self.struct is None:
+            return self._decode_variable(data, offset, end)
+
+        length = self.record_length
+        if length <= 0:
+            return []
+        # 末尾不足一条记录的部分为填充字节
+        count = (end - offset) // length
+        if not count:
+            return []
+        records = list(self.struct.iter_unpack(memoryview(data)[offset:offset + count * length]))
+        if self.int_positions:
+            records = [self._convert(record) for record in records]
+        return records
+
+    def _convert(self, record):
+        """将非标准长度的整数字段从字节串转换为整数"""
+        record = list(record)
+        for index in self.int_positions:
+            record[index] = int.from_bytes(record[index], 'big')
+        return tuple(record)
+
+    def _decode_variable(self, data, offset, end):
+        """逐条解析含可变长度字段的记录"""
+        records = []
+        while offset < end:
+            values = []
+            try:
+                for position, (field_type, length, enterprise) in enumerate(self.fields):
+                    if length == VARIABLE_LENGTH:
+                        length = data[offset]
+                        offset += 1
+                        if length == 255:
+                            length = struct.unpack_from('!H', data, offset)[0]
+                            offset += 2
+                    if offset + length > end:
+                        raise ValueError('记录超出FlowSet边界')
+                    name = FIELD_NAMES.get(field_type) if not enterprise else None
+                    if name is not None and not (self.is_options and position < self.scope_count):
+                        raw = bytes(data[offset:offset + length])
+                        values.append(raw if name in BYTES_FIELDS else int.from_bytes(raw, 'big'))
+                    offset += length
+            except (IndexError, ValueError, struct.error):
+                # 剩余部分为填充字节或不完整的记录
+                break
+            records.append(tuple(values))
+        return records
+
+    def records_as_dicts(self, records):
+        """将记录元组转换为字典列表"""
+        names = self.names
+        return [dict(zip(names, record)) for record in records]
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'template_id': self.template_id,
+            'is_options': self.is_options,
+            'fields': [list(field) for field in self.fields],
+            'record_length': self.record_length,
+            'names': list(self.names),
+            'updated_at': self.updated_at
+        }
+
+
+class TemplateCache:
+    """模板缓存，按（导出设备, source_id/观察域, 模板ID）保存编译后的模板"""
+
+    def __init__(self, ttl=DEFAULT_TEMPLATE_TTL):
+        """
+        参数:
+            ttl: 模板的有效期（秒），超过有效期未刷新的模板视为失效
+        """
+        self.ttl = ttl
+        self._templates = {}  # (导出设备, 观察域, 模板ID) -> FlowTemplate
+        self._lock = threading.Lock()
+
+    def get(self, exporter, domain, template_id, now=None):
+        """获取模板，不存在或已过期时返回None"""
+        template = self._templates.get((exporter, domain, template_id))
+        if template is None:
+            return None
+        now = time.time() if now is None else now
+        if self.ttl and now - template.updated_at > self.ttl:
+            return None
+        return template
+
+    def put(self, exporter, domain, template_id, fields, is_options=False, scope_count=0):
+        """
+        添加或刷新模板，定义不变时只更新刷新时间
+
+        返回:
+            FlowTemplate
+        """
+        key = (exporter, domain, template_id)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None and template.same_fields(fields, is_options, scope_count):
+                template.updated_at = time.time()
+                return template
+            template = FlowTemplate(template_id, fields, is_options, scope_count, domain)
+            self._templates[key] = template
+            return template
+
+    def withdraw(self, exporter, domain, template_id=None):
+        """撤销模板，template_id为None时撤销该观察域的所有模板"""
+        with self._lock:
+            if template_id is not None:
+                return self._templates.pop((exporter, domain, template_id), None) is not None
+            keys = [key for key in self._templates if key[0] == exporter and key[1] == domain]
+            for key in keys:
+                del self._templates[key]
+            return bool(keys)
+
+    def forget_exporter(self, exporter):
+        """删除一个导出设备的所有模板"""
+        with self._lock:
+            for key in [key for key in self._templates if key[0] == exporter]:
+                del self._templates[key]
+
+    def to_dict(self):
+        """转换为字典 {导出设备: [模板]}"""
+        result = {}
+        with self._lock:
+            for (exporter, domain, template_id), template in sorted(self._templates.items()):
+                result.setdefault(exporter, []).append(dict(template.to_dict(), domain=domain))
+        return result
+
+    def __len__(self):
+        return len(self._templates)
+
+
+class NetFlowV9Decoder:
+    """NetFlow v9/IPFIX报文解码器"""
+
+    def __init__(self, templates=None):
+        """
+        参数:
+            templates: 模板缓存，默认创建新的缓存
+        """
+        self.templates = templates if templates is not None else TemplateCache()
+        self.options = {}  # (导出设备, 观察域) -> 选项数据记录中的字段值（如sampling_interval）
+        self.samplers = {}  # (导出设备, 观察域) -> {sampler_id: 采样率}
+        self.stats = {'packets': 0, 'records': 0, 'templates': 0, 'options_records': 0,
+                      'missing_template': 0, 'malformed': 0}
+
+    def decode(self, data, exporter):
+        """
+        解码一个NetFlow v9或IPFIX报文
+
+        参数:
+            data: 报文（bytes或memoryview）
+            exporter: 导出设备IP地址
+
+        返回:
+            [(FlowTemplate, 记录元组列表)]，只包含数据记录，选项数据已保存到options
+        """
+        self.stats['packets'] += 1
+        version = struct.unpack_from('!H', data, 0)[0]
+        if version == NETFLOW_V9:
+            domain = NETFLOW_V9_HEADER.unpack_from(data, 0)[5]
+            offset = NETFLOW_V9_HEADER.size
+            end = len(data)
+            template_set, options_set = V9_TEMPLATE_SET, V9_OPTIONS_TEMPLATE_SET
+        elif version == IPFIX:
+            _, length, _, _, domain = IPFIX_HEADER.unpack_from(data, 0)
+            offset = IPFIX_HEADER.size
+            end = min(length, len(data))
+            template_set, options_set = IPFIX_TEMPLATE_SET, IPFIX_OPTIONS_TEMPLATE_SET
+        else:
+            raise ValueError(f'不是NetFlow v9/IPFIX报文: 版本{version}')
+
+        batches = []
+        # 同一报文中模板可能出现在数据之后，先解析所有模板再解码数据
+        data_sets = []
+        while offset + SET_HEADER.size <= end:
+            set_id, set_length = SET_HEADER.unpack_from(data, offset)
+            if set_length < SET_HEADER.size or offset + set_length > end:
+                self.stats['malformed'] += 1
+                break
+            body, set_end = offset + SET_HEADER.size, offset + set_length
+            if set_id == template_set:
+                self._parse_templates(data, body, set_end, exporter, domain, version)
+            elif set_id == options_set:
+                self._parse_options_templates(data, body, set_end, exporter, domain, version)
+            elif set_id >= MIN_DATA_SET_ID:
+                data_sets.append((set_id, body, set_end))
+            offset = set_end
+
+        for set_id, body, set_end in data_sets:
+            template = self.templates.get(exporter, domain, set_id)
+            if template is None:
+                # 尚未收到模板的数据无法解码，导出设备重发模板后恢复
+                self.stats['missing_template'] += 1
+                continue
+            records = template.decode(data, body, set_end)
+            if template.is_options:
+                self._store_options(exporter, domain, template, records)
+            elif records:
+                self.stats['records'] += len(records)
+                batches.append((template, records))
+        return batches
+
+    def _parse_templates(self, data, offset, end, exporter, domain, version):
+        """解析模板FlowSet"""
+        while offset + 4 <= end:
+            template_id, field_count = struct.unpack_from('!HH', data, offset)
+            offset += 4
+            if template_id < MIN_DATA_SET_ID:
+                # 剩余部分为填充字节
+                break
+            if field_count == 0:
+                # IPFIX模板撤销
+                self.templates.withdraw(exporter, domain, template_id)
+                continue
+            fields, offset = self._parse_fields(data, offset, end, field_count, version)
+            if fields is None:
+                self.stats['malformed'] += 1
+                break
+            self.templates.put(exporter, domain, template_id, fields)
+            self.stats['templates'] += 1
+
+    def _parse_options_templates(self, data, offset, end, exporter, domain, version):
+        """解析选项模板FlowSet"""
+        while offset + 6 <= end:
+            if version == NETFLOW_V9:
+                # v9的范围和选项长度以字节为单位
+                template_id, scope_length, option_length = struct.unpack_from('!HHH', data, offset)
+                offset += 6
+                scope_count = scope_length // 4
+                field_count = scope_count + option_length // 4
+            else:
+                template_id, field_count = struct.unpack_from('!HH', data, offset)
+                offset += 4
+                if field_count == 0:
+                    self.templates.withdraw(exporter, domain, template_id)
+                    continue
+                scope_count = struct.unpack_from('!H', data, offset)[0]
+                offset += 2
+            if template_id < MIN_DATA_SET_ID:
+                break
+            fields, offset = self._parse_fields(data, offset, end, field_count, version)
+            if fields is None:
+                self.stats['malformed'] += 1
+                break
+            self.templates.put(exporter, domain, template_id, fields, is_options=True, scope_count=scope_count)
+            self.stats['templates'] += 1
+
+    @staticmethod
+    def _parse_fields(data, offset, end, field_count, version):
+        """
+        解析字段定义
+
+        返回:
+            (字段列表, 新的偏移量)，数据不完整时字段列表为None
+        """
+        fields = []
+        for _ in range(field_count):
+            if offset + 4 > end:
+                return None, offset
+            field_type, length = struct.unpack_from('!HH', data, offset)
+            offset += 4
+            enterprise = 0
+            # IPFIX字段类型最高位表示企业私有字段，后跟4字节企业编号
+            if version == IPFIX and field_type & 0x8000:
+                if offset + 4 > end:
+                    return None, offset
+                enterprise = struct.unpack_from('!I', data, offset)[0]
+                field_type &= 0x7FFF
+                offset += 4
+            fields.append((field_type, length, enterprise))
+        return fields, offset
+
+    def _store_options(self, exporter, domain, template, records):
+        """保存选项数据记录中的字段值"""
+        if not records:
+            return
+        self.stats['options_records'] += len(records)
+        values = self.options.setdefault((exporter, domain), {})
+        for record in records:
+            record = dict(zip(template.names, record))
+            values.update(record)
+            # 带采样器ID的选项记录分别登记，数据记录按自己的sampler_id放大
+            sampler = record.get('sampler_id', record.get('selector_id'))
+            rate = options_sampling_rate(record)
+            if sampler is not None and rate:
+                self.samplers.setdefault((exporter, domain), {})[sampler] = rate
+
+    def exporter_options(self, exporter, domain=None):
+        """
+        获取导出设备的选项数据
+
+        参数:
+            exporter: 导出设备IP地址
+            domain: source_id/观察域，为None时合并该设备所有观察域的选项
+
+        返回:
+            字段名到值的字典
+        """
+        if domain is not None:
+            return dict(self.options.get((exporter, domain), {}))
+        merged = {}
+        for (options_exporter, _), values in self.options.items():
+            if options_exporter == exporter:
+                merged.update(values)
+        return merged
+
+    def sampling_scale(self, exporter, template, records):
+        """
+        计算一批数据记录的字节数放大倍数
+
+        优先使用数据记录中的采样字段，其次按记录的sampler_id查找采样器选项，最后使用导出设备的选项数据
+
+        参数:
+            exporter: 导出设备IP地址
+            template: 记录所属的模板
+            records: 记录元组列表
+
+        返回:
+            (放大倍数, 采样率来源)：放大倍数为标量或逐条记录的列表，没有采样信息时为(1, None)
+        """
+        positions = template.positions
+        inline = [name for name in SAMPLING_FIELDS if name in positions]
+        if inline:
+            indexes = [positions[name] for name in inline]
+            scale = [options_sampling_rate({name: record[index] for name, index in zip(inline, indexes)}) or 1
+                     for record in records]
+            return _uniform(scale), SOURCE_V9_RECORD
+
+        default = options_sampling_rate(self.options.get((exporter, template.domain), {}))
+        samplers = self.samplers.get((exporter, template.domain))
+        sampler_index = positions.get('sampler_id', positions.get('selector_id'))
+        if samplers and sampler_index is not None:
+            scale = [samplers.get(record[sampler_index], default or 1) for record in records]
+            return _uniform(scale), SOURCE_V9_OPTIONS
+        if default is None:
+            return 1, None
+        return default, SOURCE_V9_OPTIONS
+
+
+def _uniform(scale):
+    """所有记录的放大倍数相同时返回标量"""
+    if scale and min(scale) == max(scale):
+        return scale[0]
+    return scale
+
+
+def aggregate_interface_bytes(template, records, scale=1):
+    """
+    按接口汇总一批数据记录的字节数
+
+    参数:
+        template: 记录所属的模板
+        records: 记录元组列表
+        scale: 字节数的放大倍数（采样率），标量或逐条记录的列表
+
+    返回:
+        (入方向字节数字典 {input_if: 字节数}, 出方向字节数字典 {output_if: 字节数})
+    """
+    positions = template.positions
+    bytes_index = positions.get('in_bytes', positions.get('total_bytes'))
+    input_index = positions.get('input_if')
+    output_index = positions.get('output_if')
+    in_totals, out_totals = {}, {}
+    if bytes_index is None:
+        return in_totals, out_totals
+
+    factors = scale if isinstance(scale, list) else itertools.repeat(scale)
+    for record, factor in zip(records, factors):
+        octets = record[bytes_index] * factor
+        if input_index is not None:
+            interface = record[input_index]
+            in_totals[interface] = in_totals.get(interface, 0) + octets
+        if output_index is not None:
+            interface = record[output_index]
+            out_totals[interface] = out_totals.get(interface, 0) + octets
+    if scale != 1:
+        # 按报文间隔采样时放大倍数可能不是整数
+        in_totals = {interface: int(round(octets)) for interface, octets in in_totals.items()}
+        out_totals = {interface: int(round(octets)) for interface, octets in out_totals.items()}
+    return in_totals, out_totals
@@ -0,0 +1,166 @@
+"""
+数据处理流水线进程池模块
+
+流水线的工作线程与Flask请求处理在同一进程中，AnomalyDetector等逐条调用NumPy的处理器
+会和Web请求争用GIL。执行位置设为process的处理器由本模块放到进程池中执行：
+每个分片是只有一个进程的ProcessPoolExecutor，数据按source_id哈希到固定分片，
+同一数据源的基线等状态始终保留在同一进程中。发送给子进程的只有处理器声明的remote_fields，
+返回的只有result_fields，整批一次提交，序列化开销与批大小而不是数据字典的大小成正比。
+写数据库等副作用由处理器的_complete_batch在本进程中执行。
+"""
+
+import importlib
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.poll_metrics import Histogram
+from app.utils.multiprocess import spawn_context
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 子进程中的处理器实例，按处理器名称缓存，保存基线等状态
+_stages = {}
+
+
+def _run_stage(spec, payloads):
+    """
+    子进程入口：用缓存的处理器实例处理一批数据
+
+    参数:
+        spec: (模块名, 类名, 处理器名称, 返回字段, 构造参数)
+        payloads: 只包含remote_fields的数据列表
+
+    返回:
+        与payloads一一对应的结果列表，只包含返回字段，None表示被过滤掉
+    """
+    module_name, class_name, name, result_fields, options = spec
+    stage = _stages.get(name)
+    if stage is None:
+        stage = _stages[name] = getattr(importlib.import_module(module_name), class_name)(**options)
+    results = stage._remote_batch_impl(payloads)
+    if result_fields is None:
+        return results
+    return [None if result is None else {key: result[key] for key in result_fields if key in result}
+            for result in results]
+
+
+def _close_stages():
+    """子进程退出前关闭所有处理器，保存基线等状态"""
+    for stage in _stages.values():
+        stage.close()
+    return len(_stages)
+
+
+def shard_for(source_id, shards):
+    """按source_id计算分片，与进程的启动顺序和Python的哈希随机化无关"""
+    return zlib.crc32(str(source_id).encode('utf-8')) % shards
+
+
+class ProcessStagePool:
+    """按数据源分片的处理器进程池"""
+
+    def __init__(self, processes=2):
+        """
+        参数:
+            processes: 进程数（分片数）
+        """
+        self.processes = max(1, int(processes))
+        # 使用spawn启动，避免子进程继承父进程的数据库连接和线程；子进程重新导入主模块时不启动调度器
+        self._context = spawn_context()
+        self._executors = [None] * self.processes
+        self._lock = threading.Lock()
+        self._stats = {}  # 处理器名称 -> {'batches', 'items', 'fallbacks', 'latency'}
+
+    def _executor(self, shard):
+        """获取分片的进程池，首次使用或进程退出后重新创建"""
+        with self._lock:
+            executor = self._executors[shard]
+            if executor is None:
+                executor = self._executors[shard] = ProcessPoolExecutor(max_workers=1, mp_context=self._context)
+            return executor
+
+    def _reset(self, shard):
+        """丢弃出错的分片进程池，下次使用时重新创建"""
+        with self._lock:
+            executor, self._executors[shard] = self._executors[shard], None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, processor, items):
+        """
+        把一批数据按分片发送给子进程处理，合并结果后在本进程中完成处理
+
+        参数:
+            processor: 执行位置为process的处理器
+            items: 数据列表
+
+        返回:
+            处理后的数据列表，被过滤掉的数据不在其中
+        """
+        started = time.monotonic()
+        fields = processor.remote_fields
+
+        shards = {}
+        for position, data in enumerate(items):
+            shards.setdefault(shard_for(data.get('source_id'), self.processes), []).append(position)
+
+        futures = {}
+        for shard, positions in shards.items():
+            payloads = [items[position] if fields is None else
+                        {key: items[position][key] for key in fields if key in items[position]}
+                        for position in positions]
+            try:
+                spec = (type(processor).__module__, type(processor).__name__, processor.name, processor.result_fields,
+                        processor.remote_options(shard))
+                futures[shard] = self._executor(shard).submit(_run_stage, spec, payloads)
+            except Exception as e:
+                logger.error(f"提交到处理进程{shard}失败: {str(e)}")
+                self._reset(shard)
+
+        stats = self._stats.setdefault(processor.name, {'batches': 0, 'items': 0, 'fallbacks': 0,
+                                                        'latency': Histogram()})
+        results = [None] * len(items)
+        for shard, positions in shards.items():
+            future = futures.get(shard)
+            try:
+                if future is None:
+                    raise RuntimeError('未能提交到处理进程')
+                remote = future.result()
+            except Exception as e:
+                # 子进程退出或出错时在本进程中处理这一批，本进程中的基线与子进程中的相互独立
+                logger.error(f"处理进程{shard}执行{processor.name}出错，改在本进程中处理: {str(e)}")
+                self._reset(shard)
+                stats['fallbacks'] += len(positions)
+                remote = processor._remote_batch_impl([items[position] for position in positions])
+            for position, result in zip(positions, remote):
+                if result is not None:
+                    if result is not items[position]:
+                        items[position].update(result)
+                    results[position] = items[position]
+
+        completed = processor._complete_batch([data for data in results if data is not None])
+        stats['batches'] += 1
+        stats['items'] += len(items)
+        stats['latency'].observe(time.monotonic() - started)
+        return completed
+
+    def stats(self):
+        """获取各处理器在进程池中的批次数、数据条数、回退次数和耗时"""
+        return {
+            'processes': self.processes,
+            'stages': {name: dict(stats, latency=stats['latency'].to_dict()) for name, stats in self._stats.items()}
+        }
+
+    def shutdown(self, timeout=10):
+        """关闭处理器（保存各分片的状态）后关闭所有分片进程池"""
+        for shard, executor in enumerate(self._executors):
+            if executor is not None:
+                try:
+                    executor.submit(_close_stages).result(timeout=timeout)
+                except Exception as e:
+                    logger.error(f"关闭处理进程{shard}中的处理器时出错: {str(e)}")
+            self._reset(shard)
@@ -0,0 +1,360 @@
+"""
+轮询指标模块
+
+为每个SNMP请求和每台设备的轮询计时，在内存中保存有界的指标：
+每台设备的轮询耗时直方图、超时和错误次数，每个OID的请求耗时，每轮的PDU数和变量绑定数，
+以及每轮耗时与轮询周期的对比，用于找出拖慢整轮轮询的慢设备和慢OID。
+指标可以导出为JSON或Prometheus文本格式。
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# 耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 最多保存指标的设备数和OID数，超过时淘汰最久未更新的条目
+DEFAULT_MAX_DEVICES = 10000
+DEFAULT_MAX_OIDS = 500
+
+# 保存的轮询周期数
+DEFAULT_MAX_CYCLES = 100
+
+
+class Histogram:
+    """固定桶的耗时直方图"""
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一个桶为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """记录一个观测值"""
+        index = len(LATENCY_BUCKETS)
+        for position, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """根据桶估算分位数（返回所在桶的上限）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for position, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return LATENCY_BUCKETS[position] if position < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        """转换为字典，桶计数为累计值"""
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': buckets
+        }
+
+
+class SeriesStats:
+    """一台设备或一个OID的统计"""
+
+    __slots__ = ('latency', 'timeouts', 'errors', 'pdus', 'varbinds', 'last_duration', 'last_status')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.timeouts = 0
+        self.errors = 0
+        self.pdus = 0
+        self.varbinds = 0
+        self.last_duration = None
+        self.last_status = None
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'latency': self.latency.to_dict(),
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'pdus': self.pdus,
+            'varbinds': self.varbinds,
+            'last_duration': round(self.last_duration, 6) if self.last_duration is not None else None,
+            'last_status': self.last_status
+        }
+
+
+class RequestTimer:
+    """SNMP请求计时器，在请求结束时调用stop()写入指标"""
+
+    __slots__ = ('metrics', 'device', 'operation', 'oid', 'start', 'status', 'pdus', 'varbinds')
+
+    def __init__(self, metrics, device, operation, oid):
+        self.metrics = metrics
+        self.device = device
+        self.operation = operation
+        self.oid = oid
+        self.start = time.monotonic()
+        self.status = 'ok'
+        self.pdus = 1
+        self.varbinds = 0
+
+    def fail(self, error):
+        """标记请求失败，pysnmp的超时错误记为timeout"""
+        self.status = 'timeout' if 'timeout' in str(error).lower() else 'error'
+
+    def stop(self):
+        """结束计时并写入指标"""
+        duration = time.monotonic() - self.start
+        self.metrics.observe_request(self.device, self.operation, self.oid, duration,
+                                     self.pdus, self.varbinds, self.status)
+        return duration
+
+
+class PollMetrics:
+    """轮询指标注册表，所有集合都有容量上限"""
+
+    def __init__(self, max_devices=DEFAULT_MAX_DEVICES, max_oids=DEFAULT_MAX_OIDS, max_cycles=DEFAULT_MAX_CYCLES):
+        """
+        参数:
+            max_devices: 最多保存指标的设备数
+            max_oids: 最多保存指标的OID数
+            max_cycles: 保存的轮询周期数
+        """
+        self.max_devices = max_devices
+        self.max_oids = max_oids
+        self._devices = OrderedDict()  # 设备IP -> SeriesStats（设备轮询耗时和该设备的请求数）
+        self._oids = OrderedDict()  # (操作, OID) -> SeriesStats（SNMP请求耗时）
+        self._cycles = deque(maxlen=max_cycles)
+        self._totals = {'requests': 0, 'pdus': 0, 'varbinds': 0, 'timeouts': 0, 'errors': 0,
+                        'device_polls': 0, 'cycles': 0, 'overruns': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _series(collection, key, limit):
+        """获取或创建一个统计条目，超出容量时淘汰最久未更新的条目"""
+        stats = collection.get(key)
+        if stats is None:
+            stats = collection[key] = SeriesStats()
+            if len(collection) > limit:
+                collection.popitem(last=False)
+        else:
+            collection.move_to_end(key)
+        return stats
+
+    def time_request(self, device, operation, oid):
+        """
+        开始为一次SNMP请求计时
+
+        返回:
+            RequestTimer
+        """
+        return RequestTimer(self, device, operation, oid)
+
+    def observe_request(self, device, operation, oid, duration, pdus=1, varbinds=0, status='ok'):
+        """
+        记录一次SNMP请求
+
+        参数:
+            device: 设备IP地址
+            operation: 请求类型（get、walk、table、probe）
+            oid: 请求的OID（多个OID时为第一个）
+            duration: 耗时（秒）
+            pdus: 发送的PDU数（WALK和GETBULK遍历可能有多个）
+            varbinds: 响应中的变量绑定数
+            status: ok、timeout或error
+        """
+        with self._lock:
+            stats = self._series(self._oids, (operation, oid), self.max_oids)
+            stats.latency.observe(duration)
+            stats.last_duration = duration
+            stats.last_status = status
+            if status == 'timeout':
+                stats.timeouts += 1
+            elif status != 'ok':
+                stats.errors += 1
+            # 设备的超时和错误次数由observe_device按整台设备的轮询结果记录，这里只累加请求数
+            device_stats = self._series(self._devices, device, self.max_devices)
+            for series in (stats, device_stats):
+                series.pdus += pdus
+                series.varbinds += varbinds
+            self._totals['requests'] += 1
+            self._totals['pdus'] += pdus
+            self._totals['varbinds'] += varbinds
+            if status == 'timeout':
+                self._totals['timeouts'] += 1
+            elif status != 'ok':
+                self._totals['errors'] += 1
+
+    def observe_device(self, device, duration, status='ok'):
+        """
+        记录一台设备的完整轮询
+
+        参数:
+            device: 设备IP地址
+            duration: 耗时（秒）
+            status: ok、offline、skipped、timeout或error（超过设备截止时间）
+        """
+        with self._lock:
+            stats = self._series(self._devices, device, self.max_devices)
+            stats.latency.observe(duration)
+            stats.last_duration = duration
+            stats.last_status = status
+            self._totals['device_polls'] += 1
+            if status == 'timeout':
+                stats.timeouts += 1
+            elif status == 'error':
+                stats.errors += 1
+
+    def begin_cycle(self):
+        """
+        开始一轮轮询
+
+        返回:
+            传给end_cycle的起始快照
+        """
+        with self._lock:
+            return time.monotonic(), dict(self._totals)
+
+    def end_cycle(self, token, devices=0, interval=None):
+        """
+        结束一轮轮询并记录本轮的耗时、PDU数和变量绑定数
+
+        参数:
+            token: begin_cycle返回的快照
+            devices: 本轮轮询的设备数
+            interval: 轮询周期（秒），用于判断是否超时运行
+
+        返回:
+            本轮的统计字典
+        """
+        start, totals = token
+        duration = time.monotonic() - start
+        with self._lock:
+            cycle = {
+                'finished_at': time.time(),
+                'duration': round(duration, 3),
+                'interval': interval,
+                'overrun': bool(interval) and duration > interval,
+                'devices': devices,
+                'requests': self._totals['requests'] - totals['requests'],
+                'pdus': self._totals['pdus'] - totals['pdus'],
+                'varbinds': self._totals['varbinds'] - totals['varbinds'],
+                'timeouts': self._totals['timeouts'] - totals['timeouts'],
+                'errors': self._totals['errors'] - totals['errors']
+            }
+            self._cycles.append(cycle)
+            self._totals['cycles'] += 1
+            if cycle['overrun']:
+                self._totals['overruns'] += 1
+            return cycle
+
+    def slowest_devices(self, top=20):
+        """按p95耗时排序的最慢设备"""
+        with self._lock:
+            items = list(self._devices.items())
+        items.sort(key=lambda item: (item[1].latency.quantile(0.95), item[1].latency.max), reverse=True)
+        return items[:top]
+
+    def slowest_oids(self, top=20):
+        """按p95耗时排序的最慢OID"""
+        with self._lock:
+            items = list(self._oids.items())
+        items.sort(key=lambda item: (item[1].latency.quantile(0.95), item[1].latency.max), reverse=True)
+        return items[:top]
+
+    def to_dict(self, top=50):
+        """
+        转换为字典
+
+        参数:
+            top: 输出的最慢设备和最慢OID数量，为None时输出全部
+        """
+        top = top or max(len(self._devices), len(self._oids), 1)
+        devices = self.slowest_devices(top)
+        oids = self.slowest_oids(top)
+        with self._lock:
+            return {
+                'totals': dict(self._totals),
+                'cycles': list(self._cycles),
+                'devices': {device: stats.to_dict() for device, stats in devices},
+                'oids': [dict(stats.to_dict(), operation=operation, oid=oid) for (operation, oid), stats in oids]
+            }
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._devices.clear()
+            self._oids.clear()
+            self._cycles.clear()
+            for key in self._totals:
+                self._totals[key] = 0
+
+
+def _prometheus_histogram(lines, name, labels, histogram):
+    """输出一个直方图的Prometheus文本"""
+    for bound, count in histogram['buckets']:
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]}')
+    lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+
+
+def to_prometheus(metrics, extra_labels=''):
+    """
+    将to_dict的输出转换为Prometheus文本格式
+
+    参数:
+        metrics: PollMetrics.to_dict()的结果
+        extra_labels: 附加到每个指标的标签，如'shard="0"'
+
+    返回:
+        Prometheus文本
+    """
+    prefix = f'{extra_labels},' if extra_labels else ''
+    plain = f'{{{extra_labels}}}' if extra_labels else ''
+    lines = []
+
+    for key, value in metrics['totals'].items():
+        lines.append(f'snmp_poll_{key}_total{plain} {value}')
+
+    if metrics['cycles']:
+        cycle = metrics['cycles'][-1]
+        lines.append(f'snmp_poll_last_cycle_duration_seconds{plain} {cycle["duration"]}')
+        lines.append(f'snmp_poll_last_cycle_interval_seconds{plain} {cycle["interval"] or 0}')
+        lines.append(f'snmp_poll_last_cycle_pdus{plain} {cycle["pdus"]}')
+        lines.append(f'snmp_poll_last_cycle_varbinds{plain} {cycle["varbinds"]}')
+
+    for device, stats in metrics['devices'].items():
+        labels = f'{prefix}device="{device}"'
+        _prometheus_histogram(lines, 'snmp_device_poll_duration_seconds', labels, stats['latency'])
+        lines.append(f'snmp_device_poll_timeouts_total{{{labels}}} {stats["timeouts"]}')
+        lines.append(f'snmp_device_poll_errors_total{{{labels}}} {stats["errors"]}')
+
+    for stats in metrics['oids']:
+        labels = f'{prefix}operation="{stats["operation"]}",oid="{stats["oid"]}"'
+        _prometheus_histogram(lines, 'snmp_request_duration_seconds', labels, stats['latency'])
+        lines.append(f'snmp_request_timeouts_total{{{labels}}} {stats["timeouts"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# 全局轮询指标
+poll_metrics = PollMetrics()
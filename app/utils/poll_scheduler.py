@@ -0,0 +1,323 @@
+"""
+设备轮询调度模块
+
+为每台设备维护独立的轮询周期和下次到期时间，替代每5分钟集中轮询所有设备的方式。
+轮询周期的上限由设备角色（device_type）决定，流量波动大的设备会缩短周期，平稳后逐渐恢复；
+新设备的首次轮询时间在周期内均匀分布，每次重新调度都加入随机抖动，
+调度任务以较短的节拍只轮询到期的设备，采集结果持续写入数据库而不是集中在同一时刻。
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认轮询周期（秒）
+DEFAULT_INTERVAL = 300
+
+# 各设备角色的轮询周期上限（秒），未列出的角色使用默认周期
+DEFAULT_ROLE_INTERVALS = {
+    'router': 60,
+    'firewall': 60,
+    'switch': 300,
+    'ap': 600,
+}
+
+# 最短轮询周期（秒）
+DEFAULT_MIN_INTERVAL = 30
+
+# 波动率的指数加权系数
+VOLATILITY_ALPHA = 0.3
+
+# 波动率高于该值时缩短周期，低于LOW值时逐步恢复
+VOLATILITY_HIGH = 0.3
+VOLATILITY_LOW = 0.1
+
+
+class DeviceSchedule:
+    """单台设备的调度状态"""
+
+    __slots__ = ('device_id', 'base_interval', 'interval', 'next_due', 'last_polled',
+                 'last_status', 'mean_rate', 'volatility', 'polls')
+
+    def __init__(self, device_id, base_interval, next_due):
+        self.device_id = device_id
+        self.base_interval = base_interval  # 角色决定的周期上限
+        self.interval = base_interval  # 当前周期
+        self.next_due = next_due
+        self.last_polled = None
+        self.last_status = None
+        self.mean_rate = None  # 设备总速率的指数加权平均值（bps）
+        self.volatility = 0.0  # 速率相对平均值的指数加权偏离程度
+        self.polls = 0
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'device_id': self.device_id,
+            'interval': round(self.interval, 1),
+            'base_interval': self.base_interval,
+            'next_due': self.next_due,
+            'next_due_in': round(self.next_due - time.time(), 1),
+            'last_polled': self.last_polled,
+            'last_status': self.last_status,
+            'volatility': round(self.volatility, 3),
+            'polls': self.polls
+        }
+
+
+class PollScheduler:
+    """自适应、带抖动的设备轮询调度器"""
+
+    def __init__(self, default_interval=DEFAULT_INTERVAL, role_intervals=None,
+                 min_interval=DEFAULT_MIN_INTERVAL, jitter=0.1):
+        """
+        参数:
+            default_interval: 未配置角色的设备的轮询周期（秒）
+            role_intervals: 设备角色到轮询周期上限的映射
+            min_interval: 最短轮询周期（秒）
+            jitter: 每次重新调度时加入的随机抖动占周期的比例
+        """
+        self.default_interval = default_interval
+        self.role_intervals = dict(DEFAULT_ROLE_INTERVALS if role_intervals is None else role_intervals)
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self._schedules = {}  # 设备ID -> DeviceSchedule
+        self._heap = []  # (下次到期时间, 设备ID)，过期条目在弹出时丢弃
+        self._lock = threading.Lock()
+
+    def configure(self, default_interval=None, role_intervals=None, min_interval=None, jitter=None):
+        """更新调度参数，新的周期上限在下一次同步设备时生效"""
+        if default_interval is not None:
+            self.default_interval = default_interval
+        if role_intervals is not None:
+            self.role_intervals = dict(role_intervals)
+        if min_interval is not None:
+            self.min_interval = min_interval
+        if jitter is not None:
+            self.jitter = jitter
+        return self
+
+    def base_interval(self, device):
+        """根据设备角色获取轮询周期上限"""
+        role = (device.device_type or '').lower()
+        return self.role_intervals.get(role, self.default_interval)
+
+    def sync(self, devices, now=None):
+        """
+        与设备列表同步：为新设备安排首次轮询，移除已删除的设备，更新角色变化的设备
+
+        参数:
+            devices: Device对象列表
+            now: 当前时间（Unix时间戳）
+
+        返回:
+            新加入调度的设备数
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            current_ids = set()
+            new_devices = []
+            for device in devices:
+                current_ids.add(device.id)
+                schedule = self._schedules.get(device.id)
+                if schedule is None:
+                    new_devices.append(device)
+                    continue
+                base_interval = self.base_interval(device)
+                if schedule.base_interval != base_interval:
+                    schedule.base_interval = base_interval
+                    schedule.interval = min(schedule.interval, base_interval)
+
+            for device_id in set(self._schedules) - current_ids:
+                del self._schedules[device_id]
+
+            # 新设备的首次轮询时间在各自周期内分层均匀分布，避免同时到期
+            count = len(new_devices)
+            for position, device in enumerate(sorted(new_devices, key=lambda d: d.id)):
+                base_interval = self.base_interval(device)
+                offset = (position + random.random()) / count * base_interval
+                schedule = DeviceSchedule(device.id, base_interval, now + offset)
+                self._schedules[device.id] = schedule
+                heapq.heappush(self._heap, (schedule.next_due, device.id))
+
+            # 过期条目过多时重建堆
+            if len(self._heap) > 2 * len(self._schedules) + 64:
+                self._heap = [(s.next_due, s.device_id) for s in self._schedules.values()]
+                heapq.heapify(self._heap)
+
+        return count
+
+    def due(self, now=None, limit=None):
+        """
+        取出已到期的设备
+
+        参数:
+            now: 当前时间（Unix时间戳）
+            limit: 最多取出的设备数，其余到期设备留到下一个节拍
+
+        返回:
+            到期设备ID列表，按到期时间排序
+        """
+        now = time.time() if now is None else now
+        device_ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                if limit is not None and len(device_ids) >= limit:
+                    break
+                next_due, device_id = heapq.heappop(self._heap)
+                schedule = self._schedules.get(device_id)
+                # 设备已删除或已重新调度的条目直接丢弃
+                if schedule is None or schedule.next_due != next_due:
+                    continue
+                device_ids.append(device_id)
+        return device_ids
+
+    def record(self, device_id, status='ok', total_rate=None, now=None):
+        """
+        记录一次轮询结果，更新波动率和周期并安排下一次轮询
+
+        参数:
+            device_id: 设备ID
+            status: 轮询状态（ok、offline、skipped、timeout、error）
+            total_rate: 设备所有接口的入站和出站速率之和（bps），无法计算时为None
+            now: 当前时间（Unix时间戳）
+
+        返回:
+            下次到期时间，设备不在调度中时返回None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            schedule = self._schedules.get(device_id)
+            if schedule is None:
+                return None
+
+            schedule.polls += 1
+            schedule.last_polled = now
+            schedule.last_status = status
+
+            if status == 'ok' and total_rate is not None:
+                self._adapt(schedule, total_rate)
+            elif status != 'ok':
+                # 离线或出错的设备按角色周期轮询，退避由设备健康状态负责
+                schedule.interval = schedule.base_interval
+
+            # 从上次到期时间开始计算，保持设备在周期内的相位
+            jitter = random.uniform(-self.jitter, self.jitter) * schedule.interval
+            schedule.next_due = max(now, schedule.next_due + schedule.interval + jitter)
+            heapq.heappush(self._heap, (schedule.next_due, device_id))
+            return schedule.next_due
+
+    def _adapt(self, schedule, total_rate):
+        """根据速率波动调整轮询周期"""
+        if schedule.mean_rate is None:
+            schedule.mean_rate = total_rate
+            return
+
+        deviation = abs(total_rate - schedule.mean_rate) / max(schedule.mean_rate, 1.0)
+        schedule.volatility += VOLATILITY_ALPHA * (min(deviation, 1.0) - schedule.volatility)
+        schedule.mean_rate += VOLATILITY_ALPHA * (total_rate - schedule.mean_rate)
+
+        min_interval = min(self.min_interval, schedule.base_interval)
+        if schedule.volatility > VOLATILITY_HIGH:
+            schedule.interval = max(min_interval, schedule.interval / 2)
+        elif schedule.volatility < VOLATILITY_LOW:
+            schedule.interval = min(schedule.base_interval, schedule.interval * 1.5)
+
+    def next_due(self, device_id):
+        """获取设备的下次到期时间"""
+        schedule = self._schedules.get(device_id)
+        return schedule.next_due if schedule else None
+
+    def to_dict(self):
+        """转换为字典，按下次到期时间排序"""
+        with self._lock:
+            schedules = sorted(self._schedules.values(), key=lambda s: s.next_due)
+            return [schedule.to_dict() for schedule in schedules]
+
+    def __len__(self):
+        return len(self._schedules)
+
+
+def total_rate(interfaces):
+    """
+    计算设备所有接口的入站和出站速率之和
+
+    参数:
+        interfaces: 接口流量数据列表（已由计数器状态计算出速率）
+
+    返回:
+        速率之和（bps），没有接口算出速率时返回None
+    """
+    rates = [interface['in_rate'] + interface['out_rate'] for interface in interfaces
+             if interface.get('in_rate') is not None]
+    return sum(rates) if rates else None
+
+
+# 全局轮询调度器
+poll_scheduler = PollScheduler()
+
+# 状态文件的保存间隔（秒），避免每个节拍都写盘
+STATE_SAVE_INTERVAL = 60
+_last_state_save = 0.0
+
+
+def poll_due_devices(config=None, now=None, devices=None):
+    """
+    轮询已到期的设备，由调度任务以较短的节拍调用
+
+    参数:
+        config: 应用配置，用于读取调度参数
+        now: 当前时间（Unix时间戳）
+        devices: 参与调度的设备列表，默认为所有设备（分片工作进程只传入本分片的设备）
+
+    返回:
+        本节拍的PollReport；没有到期设备或使用顺序采集时返回None
+    """
+    global _last_state_save
+    from app.models.device import Device
+    from app.utils.counter_state import counter_store
+    from app.utils.interface_inventory import interface_inventory
+    from app.utils.snmp_collector import poll_devices
+
+    config = config or {}
+    poll_scheduler.configure(
+        default_interval=config.get('SNMP_POLL_INTERVAL'),
+        role_intervals=config.get('SNMP_POLL_ROLE_INTERVALS'),
+        min_interval=config.get('SNMP_POLL_MIN_INTERVAL'),
+        jitter=config.get('SNMP_POLL_JITTER')
+    )
+
+    if devices is None:
+        devices = Device.query.all()
+    poll_scheduler.sync(devices, now)
+    due_ids = set(poll_scheduler.due(now, limit=config.get('SNMP_POLL_MAX_BATCH')))
+    if not due_ids:
+        return None
+
+    recorded = set()
+
+    def on_result(result):
+        recorded.add(result['device_id'])
+        poll_scheduler.record(
+            result['device_id'], result['status'], total_rate(result.get('interfaces') or [])
+        )
+
+    report = None
+    try:
+        report = poll_devices([device for device in devices if device.id in due_ids],
+                              on_result=on_result, pause=0, interval=config.get('SNMP_SCHEDULER_TICK'))
+    finally:
+        # 没有返回结果的设备也要重新调度，否则会从调度中消失
+        for device_id in due_ids - recorded:
+            poll_scheduler.record(device_id, 'error')
+
+    if time.time() - _last_state_save > STATE_SAVE_INTERVAL:
+        counter_store.save()
+        interface_inventory.save()
+        _last_state_save = time.time()
+    return report
@@ -16,11 +16,100 @@ def poll_devices():
     """
     print(f"[{datetime.now()}] 开始执行设备流量数据采集...")
     try:
-        poll_all_devices()
-        print(f"[{datetime.now()}] 设备流量数据采集完成")
+        sharded = _get_sharded_poller()
+        if sharded is not None:
+            from app.utils.sharded_poller import COMMAND_POLL
+            print(f"[{datetime.now()}] 设备流量数据采集完成: {sharded.run(COMMAND_POLL)}")
+            return
+        
+        report = poll_all_devices()
+        if report is not None:
+            print(f"[{datetime.now()}] 设备流量数据采集完成: {report.to_dict()}")
+        else:
+            print(f"[{datetime.now()}] 设备流量数据采集完成")
     except Exception as e:
         print(f"[{datetime.now()}] 设备流量数据采集出错: {e}")
 
+def poll_due_devices():
+    """
+    轮询已到期的设备
+    此函数由调度器以较短的节拍调用，每台设备按各自的周期轮询
+    """
+    from app import scheduler
+    from app.utils.poll_scheduler import poll_due_devices as run_due_polls
+    
+    try:
+        sharded = _get_sharded_poller()
+        if sharded is not None:
+            from app.utils.sharded_poller import COMMAND_TICK
+            summary = sharded.run(COMMAND_TICK)
+            if summary['timed_out'] or summary['failed'] or summary['missing_shards']:
+                print(f"[{datetime.now()}] 设备轮询节拍完成: {summary}")
+            return
+        
+        with scheduler.app.app_context():
+            report = run_due_polls(scheduler.app.config)
+        if report is not None and (report.timed_out or report.failed):
+            print(f"[{datetime.now()}] 设备轮询节拍完成: {report.to_dict()}")
+    except Exception as e:
+        print(f"[{datetime.now()}] 设备轮询节拍出错: {e}")
+
+def _get_sharded_poller():
+    """
+    配置了多个轮询工作进程时获取分片轮询引擎，否则返回None
+    """
+    from app import scheduler
+    
+    config = scheduler.app.config
+    workers = config.get('SNMP_POLL_WORKERS', 0) or 0
+    if workers <= 1:
+        return None
+    
+    from app.utils.sharded_poller import get_sharded_poller
+    return get_sharded_poller(
+        workers,
+        cycle_timeout=config.get('SNMP_POLL_INTERVAL', 300)
+    )
+
+def flush_flow_data():
+    """
+    写入NetFlow/sFlow已结束的接口流量汇总周期
+    此函数由调度器以较短的节拍调用，汇总周期按墙上时间关闭，不依赖接口是否还有新的流量
+    """
+    from app import scheduler
+    from app.utils.flow_collector import flush_flow_collectors
+    
+    try:
+        with scheduler.app.app_context():
+            flush_flow_collectors()
+    except Exception as e:
+        print(f"[{datetime.now()}] 流量数据写入出错: {e}")
+
+def rebuild_seasonal_baselines():
+    """
+    从TrafficStats和Traffic历史重新建立同时段流量画像
+    此函数由调度器定期调用，检测器按画像文件的修改时间加载新的画像
+    """
+    from app import scheduler
+    from app.utils.seasonal_baseline import rebuild_seasonal_profiles, DEFAULT_WEEKS
+    from app.utils.data_processor import processor_pipeline
+    
+    config = scheduler.app.config
+    try:
+        with scheduler.app.app_context():
+            profiles = rebuild_seasonal_profiles(
+                config.get('ANOMALY_SEASONAL_PATH'),
+                config.get('ANOMALY_SEASONAL_WEEKS', DEFAULT_WEEKS),
+                timezone=config.get('ANOMALY_SEASONAL_TIMEZONE', '')
+            )
+        # 工作线程中的检测器立即加载，进程池中的检测器在下次检查文件时加载
+        detector = processor_pipeline.processors.get('AnomalyDetector')
+        if detector is not None and detector.seasonal is not None:
+            detector.seasonal.refresh(force=True)
+        print(f"[{datetime.now()}] 同时段流量画像建立完成: {profiles.to_dict()}")
+    except Exception as e:
+        print(f"[{datetime.now()}] 同时段流量画像建立出错: {e}")
+
 def discover_terminals():
     """
     发现和更新终端设备
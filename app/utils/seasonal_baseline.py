@@ -0,0 +1,425 @@
+"""
+同时段流量基线模块
+
+AnomalyDetector的z-score检测与最近24个样本比较，每周一早上上班时的流量爬升等有规律的变化都会被当作异常，
+产生大量告警。本模块按一周168个小时时段为每个设备和接口建立流量画像（均值、标准差、样本数），
+新样本与一周中同一小时的画像比较。TrafficStats没有接口字段，接口画像来自Traffic明细，
+设备画像来自TrafficStats小时统计。画像由定时任务分块读取历史数据、按时段向量化汇总后整体替换，
+保存在内存中并写入npz文件，进程池中的检测器按文件修改时间重新加载。
+
+Traffic、TrafficStats和处理管道中的样本时间都是UTC，一周中的规律跟随本地作息，
+建立画像和查找画像时都先把UTC时间换算为ANOMALY_SEASONAL_TIMEZONE（默认为服务器本地时区）再计算时段。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 一周的小时时段数，时段号为星期几（周一为0）*24+小时
+SLOTS_PER_WEEK = 7 * 24
+WEEKDAY_NAMES = ('周一', '周二', '周三', '周四', '周五', '周六', '周日')
+
+# 画像的指标，单位与Traffic、TrafficStats一致（bps）
+METRICS = ('in_rate', 'out_rate')
+
+# 设备级画像（来自TrafficStats）的接口名
+DEVICE_LEVEL = ''
+
+# 默认参数
+DEFAULT_WEEKS = 4  # 建立画像使用的历史周数
+DEFAULT_MIN_SAMPLES = 3  # 时段至少有该数量的样本才用于检测
+DEFAULT_RELOAD_INTERVAL = 60  # 检查画像文件是否更新的间隔（秒）
+MIN_RELATIVE_STD = 0.05  # 标准差不低于均值的5%，避免历史几乎不变的时段对微小波动告警
+CHUNK_SIZE = 50000  # 读取历史数据时每块的行数
+
+
+def resolve_timezone(name=None):
+    """
+    获取计算时段使用的时区
+
+    参数:
+        name: IANA时区名称（如Asia/Shanghai），为空时使用服务器本地时区
+
+    返回:
+        tzinfo对象
+    """
+    if name:
+        return ZoneInfo(name)
+    local_name = os.environ.get('TZ', '').lstrip(':')
+    try:
+        if local_name:
+            return ZoneInfo(local_name)
+        with open('/etc/localtime', 'rb') as f:
+            return ZoneInfo.from_file(f, key='localtime')
+    except Exception:
+        # 无法读取时区数据库时使用当前的固定偏移
+        return datetime.now().astimezone().tzinfo
+
+
+def hour_of_week(timestamp, tz=timezone.utc):
+    """
+    计算时间所在的一周小时时段
+
+    参数:
+        timestamp: datetime、ISO格式字符串或Unix时间戳（秒），不带时区的时间按UTC处理
+        tz: 计算时段使用的时区
+
+    返回:
+        时段号（0-167）
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    elif not isinstance(timestamp, datetime):
+        timestamp = datetime.fromtimestamp(timestamp, timezone.utc)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(tz)
+    return timestamp.weekday() * 24 + timestamp.hour
+
+
+def hours_of_week(timestamps, tz=timezone.utc):
+    """hour_of_week的向量化版本，timestamps为UTC的datetime64数组"""
+    minutes = np.asarray(timestamps).astype('datetime64[m]')
+    if tz is not timezone.utc:
+        # 时区偏移只在整点变化，按块中不同的小时各计算一次（夏令时切换前后的偏移不同）
+        unique_hours, inverse = np.unique(minutes.astype('datetime64[h]'), return_inverse=True)
+        offsets = np.array([
+            hour.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset() // timedelta(minutes=1)
+            for hour in unique_hours.tolist()
+        ], dtype=np.int64)
+        minutes = minutes + offsets[inverse.reshape(minutes.shape)].astype('timedelta64[m]')
+    hours = minutes.astype('datetime64[h]').astype(np.int64)
+    # 1970-01-01是周四，按周一为0计算星期几
+    return ((hours // 24 + 3) % 7) * 24 + hours % 24
+
+
+class ProfileBuilder:
+    """按块累加历史样本，计算每个设备/接口每个时段的均值和标准差"""
+
+    def __init__(self, tz=timezone.utc):
+        self.tz = tz  # 计算时段使用的时区
+        self.keys = []  # (设备ID, 接口名)，行号为列表中的位置
+        self._index = {}
+        self._count = np.zeros((0, len(METRICS)))
+        self._mean = np.zeros((0, len(METRICS)))
+        self._m2 = np.zeros((0, len(METRICS)))  # 与均值之差的平方和
+        self.samples = 0
+
+    def _rows(self, device_ids, interfaces):
+        """把每个样本的(设备ID, 接口名)映射为画像行号，只对块中不同的键做字典查找"""
+        names, name_codes = np.unique(interfaces, return_inverse=True)
+        combined = device_ids * len(names) + name_codes
+        unique_keys, inverse = np.unique(combined, return_inverse=True)
+        rows = np.empty(len(unique_keys), dtype=np.int64)
+        for position, combined_key in enumerate(unique_keys.tolist()):
+            key = (combined_key // len(names), str(names[combined_key % len(names)]))
+            row = self._index.get(key)
+            if row is None:
+                row = self._index[key] = len(self.keys)
+                self.keys.append(key)
+            rows[position] = row
+
+        # 新出现的键扩大累加数组
+        size = len(self.keys) * SLOTS_PER_WEEK
+        if size > len(self._count):
+            for name in ('_count', '_mean', '_m2'):
+                array = np.zeros((size, len(METRICS)))
+                array[:len(getattr(self, name))] = getattr(self, name)
+                setattr(self, name, array)
+        return rows[inverse]
+
+    def add(self, device_ids, interfaces, timestamps, values):
+        """
+        累加一块样本
+
+        参数:
+            device_ids: 设备ID数组
+            interfaces: 接口名数组，设备级样本为DEVICE_LEVEL
+            timestamps: UTC的datetime64数组
+            values: 形状为(样本数, len(METRICS))的数组，缺失值为nan
+        """
+        device_ids = np.asarray(device_ids, dtype=np.int64)
+        if not len(device_ids):
+            return
+        values = np.asarray(values, dtype=float).reshape(len(device_ids), len(METRICS))
+        cells = self._rows(device_ids, np.asarray(interfaces, dtype=str)) * SLOTS_PER_WEEK + hours_of_week(timestamps, self.tz)
+        size = len(self._count)
+
+        for metric in range(len(METRICS)):
+            valid = ~np.isnan(values[:, metric])
+            cell, value = cells[valid], values[valid, metric]
+            # 块内按时段两遍计算均值和平方和，再与已累加的结果合并（Chan等人的并行方差合并公式）
+            count_b = np.bincount(cell, minlength=size).astype(float)
+            mean_b = np.bincount(cell, weights=value, minlength=size) / np.maximum(count_b, 1)
+            deviation = value - mean_b[cell]
+            m2_b = np.bincount(cell, weights=deviation * deviation, minlength=size)
+
+            count_a, mean_a = self._count[:, metric], self._mean[:, metric]
+            total = count_a + count_b
+            delta = mean_b - mean_a
+            share = np.divide(count_b, total, out=np.zeros(size), where=total > 0)
+            self._m2[:, metric] += m2_b + delta * delta * count_a * share
+            self._mean[:, metric] = mean_a + delta * share
+            self._count[:, metric] = total
+        self.samples += len(device_ids)
+
+    def build(self):
+        """
+        生成画像数组
+
+        返回:
+            (keys, mean, std, count)，数组形状为(键数, SLOTS_PER_WEEK, len(METRICS))
+        """
+        shape = (len(self.keys), SLOTS_PER_WEEK, len(METRICS))
+        count = self._count.reshape(shape)
+        std = np.sqrt(np.divide(self._m2.reshape(shape), count, out=np.zeros(shape), where=count > 0))
+        return list(self.keys), self._mean.reshape(shape).copy(), std, count.astype(np.int32)
+
+
+class SeasonalProfiles:
+    """保存在内存中的同时段流量画像"""
+
+    def __init__(self, path=None, min_samples=DEFAULT_MIN_SAMPLES, reload_interval=DEFAULT_RELOAD_INTERVAL,
+                 timezone=''):
+        """
+        参数:
+            path: 画像文件路径，为None时只保存在内存中
+            min_samples: 时段至少有该数量的样本才用于检测
+            reload_interval: 检查画像文件是否更新的间隔（秒）
+            timezone: 计算时段使用的时区名称，为空时使用服务器本地时区
+        """
+        self.path = path
+        self.timezone = timezone or ''
+        self.tz = resolve_timezone(self.timezone)
+        self.min_samples = max(1, int(min_samples))
+        self.reload_interval = reload_interval
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0
+        self.replace([], *(np.zeros((0, SLOTS_PER_WEEK, len(METRICS))) for _ in range(3)))
+
+    def replace(self, keys, mean, std, count, built_at=None):
+        """整体替换画像，检测线程看到的始终是完整的一组画像"""
+        index = {(int(device_id), str(interface)): row for row, (device_id, interface) in enumerate(keys)}
+        with self._lock:
+            self.keys = list(keys)
+            self._index = index
+            self._mean, self._std, self._count = mean, std, count
+            self.built_at = built_at
+
+    def lookup(self, device_id, interface, timestamp, metric='in_rate'):
+        """
+        获取样本所在时段的画像
+
+        参数:
+            device_id: 设备ID
+            interface: 接口名或接口ID，为空时查找设备级画像
+            timestamp: 样本时间，不带时区的时间按UTC处理
+            metric: METRICS中的指标
+
+        返回:
+            (时段号, 均值, 标准差, 样本数)，没有画像或样本数不足时返回None
+        """
+        if device_id is None:
+            return None
+        key = (int(device_id), DEVICE_LEVEL if interface in (None, '') else str(interface))
+        slot = hour_of_week(timestamp, self.tz)
+        with self._lock:
+            row = self._index.get(key)
+            if row is None:
+                return None
+            column = METRICS.index(metric)
+            count = int(self._count[row, slot, column])
+            if count < self.min_samples:
+                return None
+            mean = float(self._mean[row, slot, column])
+            std = float(self._std[row, slot, column])
+        return slot, mean, max(std, abs(mean) * MIN_RELATIVE_STD), count
+
+    def save(self, path=None):
+        """把画像保存为npz文件（先写临时文件再替换）"""
+        path = path or self.path
+        if not path:
+            return False
+
+        with self._lock:
+            keys, mean, std, count = self.keys, self._mean, self._std, self._count
+            built_at = self.built_at
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=np.array(json.dumps(keys)), metrics=np.array(json.dumps(METRICS)),
+                         built_at=np.array(built_at.isoformat() if built_at else ''),
+                         timezone=np.array(self.timezone), mean=mean, std=std, count=count)
+            os.replace(tmp_path, path)
+            self._mtime = os.stat(path).st_mtime
+            return True
+        except Exception as e:
+            logger.error(f"保存同时段流量画像失败: {str(e)}")
+            return False
+
+    def load(self, path=None):
+        """从npz文件加载画像，返回加载的键数"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        try:
+            mtime = os.stat(path).st_mtime
+            with np.load(path) as snapshot:
+                if tuple(json.loads(str(snapshot['metrics']))) != METRICS:
+                    logger.warning("同时段流量画像的指标与当前版本不一致，已忽略")
+                    return 0
+                # 旧版本的画像文件没有时区，时段按UTC计算
+                profile_timezone = str(snapshot['timezone']) if 'timezone' in snapshot.files else 'UTC'
+                if profile_timezone != self.timezone:
+                    logger.warning(f"同时段流量画像的时区为{profile_timezone or '服务器本地时区'}，与当前配置不一致，已忽略")
+                    return 0
+                keys = [tuple(key) for key in json.loads(str(snapshot['keys']))]
+                built_at = str(snapshot['built_at'])
+                self.replace(keys, snapshot['mean'], snapshot['std'], snapshot['count'],
+                             datetime.fromisoformat(built_at) if built_at else None)
+            self._mtime = mtime
+            logger.info(f"已加载 {len(keys)} 个设备/接口的同时段流量画像")
+            return len(keys)
+        except Exception as e:
+            logger.error(f"加载同时段流量画像失败: {str(e)}")
+            return 0
+
+    def refresh(self, now=None, force=False):
+        """画像文件被定时任务更新后重新加载，按reload_interval限制检查频率"""
+        if not self.path:
+            return False
+        now = time.monotonic() if now is None else now
+        if not force and now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.load() > 0
+
+    def to_dict(self):
+        """转换为字典"""
+        with self._lock:
+            return {
+                'keys': len(self.keys),
+                'ready_slots': int((self._count[..., 0] >= self.min_samples).sum()),
+                'min_samples': self.min_samples,
+                'timezone': self.timezone or None,
+                'built_at': self.built_at.isoformat() if self.built_at else None
+            }
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _chunks(query, chunk_size):
+    """按块读取查询结果"""
+    rows = iter(query.yield_per(chunk_size))
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_seasonal_profiles(session=None, now=None, weeks=DEFAULT_WEEKS, chunk_size=CHUNK_SIZE, timezone=''):
+    """
+    从历史数据建立同时段流量画像
+
+    接口画像按Traffic明细的采集时间归入时段；设备画像按TrafficStats的年月日和小时归入时段，
+    跳过每日汇总记录（hour为0且在次日生成）。两者都是UTC时间，按timezone换算后计算时段。
+
+    参数:
+        session: 数据库会话，默认为db.session
+        now: 画像的截止时间，默认为当前UTC时间
+        weeks: 使用的历史周数
+        chunk_size: 每块读取的行数
+        timezone: 计算时段使用的时区名称，为空时使用服务器本地时区
+
+    返回:
+        ProfileBuilder.build()的结果加上截止时间：(keys, mean, std, count, now)
+    """
+    from sqlalchemy import func
+    from app import db
+    from app.models.traffic import Traffic, TrafficStats
+
+    session = session or db.session
+    now = now or datetime.utcnow()
+    since = now - timedelta(weeks=weeks)
+    builder = ProfileBuilder(resolve_timezone(timezone))
+
+    # 接口画像，与process_traffic_stats一致，旧记录没有速率时按5秒字节数换算为bps
+    traffic_query = session.query(
+        Traffic.device_id, Traffic.interface, Traffic.timestamp,
+        func.coalesce(Traffic.in_rate, Traffic.in_octets * 8 / 5),
+        func.coalesce(Traffic.out_rate, Traffic.out_octets * 8 / 5)
+    ).filter(
+        Traffic.device_id.isnot(None),
+        Traffic.interface.isnot(None),
+        Traffic.timestamp >= since,
+        Traffic.timestamp < now
+    )
+    for chunk in _chunks(traffic_query, chunk_size):
+        device_ids, interfaces, timestamps, in_rates, out_rates = zip(*chunk)
+        builder.add(device_ids, interfaces, np.array(timestamps, dtype='datetime64[s]'),
+                    np.array([in_rates, out_rates], dtype=float).T)
+
+    # 设备画像
+    stats_query = session.query(
+        TrafficStats.device_id, TrafficStats.year, TrafficStats.month, TrafficStats.day, TrafficStats.hour,
+        TrafficStats.created_at, TrafficStats.avg_in_rate, TrafficStats.avg_out_rate
+    ).filter(
+        TrafficStats.device_id.isnot(None),
+        TrafficStats.created_at >= since,
+        TrafficStats.created_at < now
+    )
+    for chunk in _chunks(stats_query, chunk_size):
+        device_ids, years, months, days, hours, created, in_rates, out_rates = (np.array(column) for column in zip(*chunk))
+        dates = ((years.astype(np.int64) - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+                 + (months.astype(np.int64) - 1)).astype('datetime64[D]') + (days.astype(np.int64) - 1)
+        created = created.astype('datetime64[s]')
+        hourly = ~((hours == 0) & (created.astype('datetime64[D]') > dates))
+        builder.add(device_ids[hourly], np.full(int(hourly.sum()), DEVICE_LEVEL),
+                    dates[hourly] + hours[hourly].astype('timedelta64[h]'),
+                    np.array([in_rates[hourly], out_rates[hourly]], dtype=float).T)
+
+    logger.info(f"同时段流量画像建立完成，{builder.samples} 个样本，{len(builder.keys)} 个设备/接口")
+    return (*builder.build(), now)
+
+
+def rebuild_seasonal_profiles(path, weeks=DEFAULT_WEEKS, session=None, now=None, timezone=''):
+    """
+    重新建立画像并写入文件，检测器按文件修改时间加载新的画像
+
+    参数:
+        path: 画像文件路径
+        weeks: 使用的历史周数
+        session: 数据库会话，默认为db.session
+        now: 画像的截止时间
+        timezone: 计算时段使用的时区名称，为空时使用服务器本地时区
+
+    返回:
+        新的SeasonalProfiles
+    """
+    keys, mean, std, count, built_at = build_seasonal_profiles(session, now, weeks, timezone=timezone)
+    profiles = SeasonalProfiles(path, timezone=timezone)
+    profiles.replace(keys, mean, std, count, built_at)
+    profiles.save()
+    return profiles
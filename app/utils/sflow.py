@@ -0,0 +1,366 @@
+"""
+sFlow v5解码模块
+
+解析sFlow v5数据报中的通用接口计数器样本和流样本。
+计数器样本携带与ifTable/ifXTable相同的接口计数器，保存在计数器样本缓存中，
+轮询时直接使用，支持sFlow的交换机因此不再需要SNMP遍历接口表；
+流样本按采样率放大为估计的字节数，并解析原始报文头得到地址、协议和端口。
+"""
+
+import socket
+import struct
+import threading
+import time
+
+# sFlow版本
+SFLOW_VERSION = 5
+
+# 样本类型（企业编号0）
+SAMPLE_FLOW = 1
+SAMPLE_COUNTERS = 2
+SAMPLE_FLOW_EXPANDED = 3
+SAMPLE_COUNTERS_EXPANDED = 4
+
+# 流记录类型
+FLOW_RAW_HEADER = 1
+FLOW_SAMPLED_IPV4 = 3
+
+# 计数器记录类型
+COUNTERS_GENERIC_INTERFACE = 1
+
+# 原始报文头的协议类型
+HEADER_PROTOCOL_ETHERNET = 1
+
+# 以太网类型
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+
+# 数据报头和样本头格式
+DATAGRAM_VERSION = struct.Struct('!II')  # version, agent_address_type
+DATAGRAM_BODY = struct.Struct('!IIII')  # sub_agent_id, sequence, uptime, sample_count
+SAMPLE_HEADER = struct.Struct('!II')  # data_format, length
+FLOW_SAMPLE = struct.Struct('!IIIIIIII')  # sequence, source_id, sampling_rate, sample_pool, drops, input, output, record_count
+FLOW_SAMPLE_EXPANDED = struct.Struct('!IIIIIIIIIII')  # sequence, source_type, source_index, ..., record_count
+COUNTER_SAMPLE = struct.Struct('!III')  # sequence, source_id, record_count
+COUNTER_SAMPLE_EXPANDED = struct.Struct('!IIII')  # sequence, source_type, source_index, record_count
+RAW_HEADER = struct.Struct('!IIII')  # header_protocol, frame_length, stripped, header_length
+SAMPLED_IPV4 = struct.Struct('!II4s4sIIII')  # length, protocol, src, dst, src_port, dst_port, tcp_flags, tos
+
+# 通用接口计数器：ifIndex, ifType, ifSpeed, ifDirection, ifStatus, ifInOctets, ifInUcastPkts,
+# ifInMulticastPkts, ifInBroadcastPkts, ifInDiscards, ifInErrors, ifInUnknownProtos, ifOutOctets,
+# ifOutUcastPkts, ifOutMulticastPkts, ifOutBroadcastPkts, ifOutDiscards, ifOutErrors, ifPromiscuousMode
+GENERIC_INTERFACE = struct.Struct('!IIQIIQIIIIIIQIIIIII')
+
+# 通用接口计数器中只有ifInOctets/ifOutOctets为64位，包数和错误数为32位，按字段分别处理回绕
+SFLOW_COUNTER_BITS = {'in_octets': 64, 'out_octets': 64, 'in_packets': 32, 'out_packets': 32,
+                      'in_errors': 32, 'out_errors': 32}
+
+# 紧凑格式接口值的最高两位表示格式，格式0的低30位为ifIndex
+INTERFACE_FORMAT_SHIFT = 30
+# 表示交换机内部接口（如发往CPU的报文）的接口值
+INTERFACE_INTERNAL = 0x3FFFFFFF
+
+# 计数器样本缓存中数据的默认有效期（秒），sFlow计数器样本通常每20~30秒发送一次
+DEFAULT_COUNTER_MAX_AGE = 120
+
+
+class SFlowDatagram:
+    """一个sFlow数据报的解码结果"""
+
+    __slots__ = ('agent', 'sequence', 'uptime', 'counters', 'flows')
+
+    def __init__(self, agent, sequence, uptime):
+        self.agent = agent  # 代理（设备）IP地址
+        self.sequence = sequence
+        self.uptime = uptime  # 代理运行时间（毫秒）
+        self.counters = []  # 通用接口计数器字典列表
+        self.flows = []  # 流样本字典列表
+
+
+def _address(data, offset):
+    """
+    解析sFlow地址
+
+    返回:
+        (IP地址字符串, 新的偏移量)
+    """
+    address_type = struct.unpack_from('!I', data, offset)[0]
+    offset += 4
+    if address_type == 1:
+        return socket.inet_ntoa(bytes(data[offset:offset + 4])), offset + 4
+    if address_type == 2:
+        return socket.inet_ntop(socket.AF_INET6, bytes(data[offset:offset + 16])), offset + 16
+    return None, offset
+
+
+def _interface(value):
+    """解析紧凑格式的接口值，返回ifIndex，丢弃、多播或内部接口返回None"""
+    if value >> INTERFACE_FORMAT_SHIFT or value == INTERFACE_INTERNAL:
+        return None
+    return value
+
+
+def parse_ethernet_header(header):
+    """
+    解析流样本中的以太网报文头
+
+    参数:
+        header: 报文头字节串
+
+    返回:
+        包含src_addr、dst_addr、protocol、src_port、dst_port的字典，非IPv4报文返回空字典
+    """
+    if len(header) < 14:
+        return {}
+    offset = 12
+    ethertype = struct.unpack_from('!H', header, offset)[0]
+    offset += 2
+    while ethertype == ETHERTYPE_VLAN and len(header) >= offset + 4:
+        ethertype = struct.unpack_from('!H', header, offset + 2)[0]
+        offset += 4
+    if ethertype != ETHERTYPE_IPV4 or len(header) < offset + 20:
+        return {}
+
+    ihl = (header[offset] & 0x0F) * 4
+    protocol = header[offset + 9]
+    result = {
+        'src_addr': socket.inet_ntoa(header[offset + 12:offset + 16]),
+        'dst_addr': socket.inet_ntoa(header[offset + 16:offset + 20]),
+        'protocol': protocol
+    }
+    # TCP和UDP的端口位于IP头之后
+    if protocol in (6, 17) and len(header) >= offset + ihl + 4:
+        result['src_port'], result['dst_port'] = struct.unpack_from('!HH', header, offset + ihl)
+    return result
+
+
+class SFlowDecoder:
+    """sFlow v5数据报解码器"""
+
+    def __init__(self):
+        self.stats = {'datagrams': 0, 'counter_samples': 0, 'flow_samples': 0, 'malformed': 0, 'ignored': 0}
+
+    def decode(self, data, exporter=None):
+        """
+        解码一个sFlow v5数据报
+
+        参数:
+            data: 数据报（bytes或memoryview）
+            exporter: UDP源地址，代理地址不是IPv4/IPv6时使用
+
+        返回:
+            SFlowDatagram
+        """
+        version, _ = DATAGRAM_VERSION.unpack_from(data, 0)
+        if version != SFLOW_VERSION:
+            raise ValueError(f'不支持的sFlow版本: {version}')
+        agent, offset = _address(data, 4)
+        _, sequence, uptime, sample_count = DATAGRAM_BODY.unpack_from(data, offset)
+        offset += DATAGRAM_BODY.size
+
+        self.stats['datagrams'] += 1
+        datagram = SFlowDatagram(agent or exporter, sequence, uptime)
+        end = len(data)
+        for _ in range(sample_count):
+            if offset + SAMPLE_HEADER.size > end:
+                self.stats['malformed'] += 1
+                break
+            data_format, length = SAMPLE_HEADER.unpack_from(data, offset)
+            body, offset = offset + SAMPLE_HEADER.size, offset + SAMPLE_HEADER.size + length
+            if offset > end:
+                self.stats['malformed'] += 1
+                break
+            # 企业编号不为0的样本无法解析
+            if data_format >> 12:
+                self.stats['ignored'] += 1
+                continue
+            try:
+                sample_type = data_format & 0xFFF
+                if sample_type in (SAMPLE_COUNTERS, SAMPLE_COUNTERS_EXPANDED):
+                    self._counter_sample(data, body, offset, sample_type, datagram)
+                elif sample_type in (SAMPLE_FLOW, SAMPLE_FLOW_EXPANDED):
+                    self._flow_sample(data, body, offset, sample_type, datagram)
+                else:
+                    self.stats['ignored'] += 1
+            except (struct.error, IndexError, ValueError, OSError):
+                self.stats['malformed'] += 1
+        return datagram
+
+    @staticmethod
+    def _records(data, offset, end, count):
+        """遍历样本中的记录，生成(记录类型, 起始位置, 结束位置)"""
+        for _ in range(count):
+            if offset + SAMPLE_HEADER.size > end:
+                return
+            record_format, length = SAMPLE_HEADER.unpack_from(data, offset)
+            start = offset + SAMPLE_HEADER.size
+            offset = start + length
+            if offset > end:
+                return
+            if not record_format >> 12:
+                yield record_format & 0xFFF, start, offset
+
+    def _counter_sample(self, data, offset, end, sample_type, datagram):
+        """解析计数器样本，只保留通用接口计数器"""
+        if sample_type == SAMPLE_COUNTERS:
+            _, _, record_count = COUNTER_SAMPLE.unpack_from(data, offset)
+            offset += COUNTER_SAMPLE.size
+        else:
+            _, _, _, record_count = COUNTER_SAMPLE_EXPANDED.unpack_from(data, offset)
+            offset += COUNTER_SAMPLE_EXPANDED.size
+
+        self.stats['counter_samples'] += 1
+        for record_type, start, _ in self._records(data, offset, end, record_count):
+            if record_type != COUNTERS_GENERIC_INTERFACE:
+                continue
+            values = GENERIC_INTERFACE.unpack_from(data, start)
+            datagram.counters.append({
+                'if_index': values[0],
+                'if_type': values[1],
+                'speed': values[2],
+                'status': values[4],
+                'in_octets': values[5],
+                'in_packets': values[6],
+                'in_errors': values[10],
+                'out_octets': values[12],
+                'out_packets': values[13],
+                'out_errors': values[17],
+            })
+
+    def _flow_sample(self, data, offset, end, sample_type, datagram):
+        """解析流样本，字节数按采样率放大"""
+        if sample_type == SAMPLE_FLOW:
+            _, _, sampling_rate, _, _, input_if, output_if, record_count = FLOW_SAMPLE.unpack_from(data, offset)
+            input_if, output_if = _interface(input_if), _interface(output_if)
+            offset += FLOW_SAMPLE.size
+        else:
+            values = FLOW_SAMPLE_EXPANDED.unpack_from(data, offset)
+            sampling_rate, record_count = values[3], values[10]
+            # 扩展格式的接口格式和值分开编码，格式0为ifIndex
+            input_if = values[7] if values[6] == 0 else None
+            output_if = values[9] if values[8] == 0 else None
+            offset += FLOW_SAMPLE_EXPANDED.size
+
+        self.stats['flow_samples'] += 1
+        flow = {'input_if': input_if, 'output_if': output_if, 'sampling_rate': max(sampling_rate, 1)}
+        for record_type, start, record_end in self._records(data, offset, end, record_count):
+            if record_type == FLOW_RAW_HEADER:
+                protocol, frame_length, _, header_length = RAW_HEADER.unpack_from(data, start)
+                flow['frame_length'] = frame_length
+                if protocol == HEADER_PROTOCOL_ETHERNET:
+                    header_start = start + RAW_HEADER.size
+                    header = bytes(data[header_start:min(header_start + header_length, record_end)])
+                    flow.update(parse_ethernet_header(header))
+            elif record_type == FLOW_SAMPLED_IPV4:
+                length, protocol, src, dst, src_port, dst_port, _, _ = SAMPLED_IPV4.unpack_from(data, start)
+                flow.setdefault('frame_length', length)
+                flow.setdefault('src_addr', socket.inet_ntoa(src))
+                flow.setdefault('dst_addr', socket.inet_ntoa(dst))
+                flow.setdefault('protocol', protocol)
+                flow.setdefault('src_port', src_port)
+                flow.setdefault('dst_port', dst_port)
+
+        if 'frame_length' not in flow:
+            return
+        # 一个样本代表sampling_rate个报文，放大后才能与SNMP计数器比较
+        flow['bytes'] = flow['frame_length'] * flow['sampling_rate']
+        datagram.flows.append(flow)
+
+
+class SFlowCounterStore:
+    """sFlow计数器样本缓存，为每个代理的每个接口保存最新的计数器样本"""
+
+    def __init__(self, max_age=DEFAULT_COUNTER_MAX_AGE):
+        """
+        参数:
+            max_age: 计数器样本的有效期（秒），超过有效期的代理重新使用SNMP轮询
+        """
+        self.max_age = max_age
+        # 代理IP -> {ifIndex: (接收时间, 代理运行时间(毫秒), 计数器字典)}
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def update(self, agent, counters, uptime=None, now=None):
+        """
+        写入一个数据报中的计数器样本
+
+        参数:
+            agent: 代理IP地址
+            counters: 通用接口计数器字典列表
+            uptime: 代理运行时间（毫秒）
+            now: 接收时间（Unix时间戳）
+        """
+        if not counters:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            interfaces = self._agents.setdefault(agent, {})
+            for counter in counters:
+                interfaces[counter['if_index']] = (now, uptime, counter)
+
+    def is_fresh(self, agent, max_age=None, now=None):
+        """判断代理是否有未过期的计数器样本"""
+        interfaces = self._agents.get(agent)
+        if not interfaces:
+            return False
+        now = time.time() if now is None else now
+        max_age = self.max_age if max_age is None else max_age
+        return any(now - received <= max_age for received, _, _ in list(interfaces.values()))
+
+    def interface_records(self, agent, names=None, max_age=None, now=None):
+        """
+        将代理的计数器样本转换为与SNMP采集相同格式的接口流量数据
+
+        参数:
+            agent: 代理IP地址
+            names: ifIndex到接口名称的映射（来自接口清单），sFlow计数器样本不包含接口名称
+            max_age: 样本有效期（秒）
+            now: 当前时间（Unix时间戳）
+
+        返回:
+            接口流量数据列表（累计计数器），每个接口带有各自样本的timestamp和sys_uptime
+        """
+        now = time.time() if now is None else now
+        max_age = self.max_age if max_age is None else max_age
+        names = names or {}
+        with self._lock:
+            samples = list(self._agents.get(agent, {}).items())
+
+        interfaces = []
+        for if_index, (received, uptime, counter) in sorted(samples):
+            if now - received > max_age:
+                continue
+            interfaces.append({
+                'if_index': str(if_index),
+                'interface': str(names.get(str(if_index)) or f'ifIndex{if_index}'),
+                'in_octets': counter['in_octets'],
+                'out_octets': counter['out_octets'],
+                'in_packets': counter['in_packets'],
+                'out_packets': counter['out_packets'],
+                'in_errors': counter['in_errors'],
+                'out_errors': counter['out_errors'],
+                'bandwidth': counter['speed'],
+                'utilization': 0,
+                'counter_bits': SFLOW_COUNTER_BITS,
+                # ifStatus第0位为管理状态，第1位为操作状态
+                'status': 'up' if counter['status'] & 0x2 else 'down',
+                'timestamp': received,
+                'sys_uptime': uptime // 10 if uptime is not None else None,  # 换算为1/100秒
+            })
+        return interfaces
+
+    def forget_agent(self, agent):
+        """删除一个代理的所有样本"""
+        with self._lock:
+            self._agents.pop(agent, None)
+
+    def agents(self):
+        """获取所有有样本的代理IP地址"""
+        return list(self._agents)
+
+    def __len__(self):
+        return len(self._agents)
+
+
+# 全局sFlow计数器样本缓存
+sflow_counters = SFlowCounterStore()
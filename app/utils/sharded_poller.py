@@ -0,0 +1,323 @@
+"""
+多进程分片轮询模块
+
+即使网络I/O已经异步化，解析pysnmp响应和构建Traffic ORM对象仍然受GIL限制。
+本模块把设备按稳定的哈希分配到N个工作进程，每个进程拥有独立的SNMP引擎、数据库会话、
+计数器状态和接口清单，由父进程下发轮询命令、汇总各分片的报告，并在工作进程退出或卡死时重启它。
+
+分片使用最高随机权重（rendezvous）哈希：同一设备在重启后总是落在同一分片，
+调整工作进程数时只有约1/N的设备会迁移到其他分片。
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+from app.utils.multiprocess import spawn_context
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 工作进程命令：完整轮询一次分片内的所有设备，或只轮询到期的设备
+COMMAND_POLL = 'poll'
+COMMAND_TICK = 'tick'
+
+
+@functools.lru_cache(maxsize=65536)
+def shard_for(device_id, shard_count):
+    """
+    计算设备所属的分片
+
+    参数:
+        device_id: 设备ID
+        shard_count: 分片数
+
+    返回:
+        分片序号（0到shard_count-1）
+    """
+    if shard_count <= 1:
+        return 0
+    key = str(device_id).encode()
+    return max(range(shard_count),
+               key=lambda shard: hashlib.blake2b(key + b':%d' % shard, digest_size=8).digest())
+
+
+def shard_state_path(path, shard):
+    """获取分片的状态文件路径，如counter_state.json -> counter_state.shard3.json"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard{shard}{ext}'
+
+
+def shard_devices(shard, shard_count):
+    """
+    查询属于某个分片的设备
+
+    参数:
+        shard: 分片序号
+        shard_count: 分片数
+
+    返回:
+        Device对象列表
+    """
+    from app import db
+    from app.models.device import Device
+
+    device_ids = [device_id for (device_id,) in db.session.query(Device.id)
+                  if shard_for(device_id, shard_count) == shard]
+    if not device_ids:
+        return []
+    return Device.query.filter(Device.id.in_(device_ids)).all()
+
+
+def _worker_main(shard, shard_count, config_name, commands, results):
+    """
+    工作进程入口：创建独立的应用和数据库会话，循环执行父进程下发的命令
+
+    参数:
+        shard: 分片序号
+        shard_count: 分片数
+        config_name: 应用配置名称
+        commands: 本进程的命令队列
+        results: 所有工作进程共用的结果队列
+    """
+    from app import create_app, db
+    from app.utils.counter_state import counter_store, init_counter_store
+    from app.utils.interface_inventory import interface_inventory, init_interface_inventory
+    from app.utils.poll_metrics import poll_metrics
+    from app.utils.poll_scheduler import poll_due_devices
+    from app.utils.snmp_collector import poll_devices
+
+    app = create_app(config_name)
+    with app.app_context():
+        init_counter_store(shard_state_path(app.config.get(
+            'COUNTER_STATE_PATH', os.path.join(app.instance_path, 'counter_state.json')), shard))
+        init_interface_inventory(shard_state_path(app.config.get(
+            'INTERFACE_INVENTORY_PATH', os.path.join(app.instance_path, 'interface_inventory.json')), shard))
+        results.put((shard, None, {'status': 'ready', 'pid': os.getpid()}))
+
+        while True:
+            command = commands.get()
+            if command is None:
+                break
+
+            name, cycle_id = command
+            start = time.monotonic()
+            summary = {'status': 'ok', 'pid': os.getpid(), 'devices': 0, 'report': None}
+            try:
+                devices = shard_devices(shard, shard_count)
+                summary['devices'] = len(devices)
+                if name == COMMAND_TICK:
+                    report = poll_due_devices(app.config, devices=devices)
+                else:
+                    report = poll_devices(devices, pause=0)
+                    counter_store.save()
+                    interface_inventory.save()
+                summary['report'] = report.to_dict() if report is not None else None
+            except Exception as e:
+                summary['status'] = 'error'
+                summary['error'] = str(e)
+                logger.error(f"分片{shard}执行{name}命令出错: {e}")
+            finally:
+                db.session.remove()
+            summary['duration'] = time.monotonic() - start
+            summary['metrics'] = poll_metrics.to_dict(top=20)
+            results.put((shard, cycle_id, summary))
+
+        counter_store.save()
+        interface_inventory.save()
+
+
+class ShardedPoller:
+    """多进程分片轮询引擎，父进程负责分发命令、汇总结果和监督工作进程"""
+
+    def __init__(self, workers=4, config_name=None, cycle_timeout=600, start_timeout=60):
+        """
+        参数:
+            workers: 工作进程数（分片数）
+            config_name: 工作进程使用的应用配置名称，默认读取FLASK_CONFIG
+            cycle_timeout: 单次命令的最长等待时间（秒），超时的工作进程会被重启
+            start_timeout: 等待工作进程启动完成的最长时间（秒）
+        """
+        self.workers = max(1, int(workers))
+        self.config_name = config_name or os.environ.get('FLASK_CONFIG', 'development')
+        self.cycle_timeout = cycle_timeout
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        self.last_report = None
+        self.shard_metrics = {}  # 分片序号 -> 工作进程最近一次上报的轮询指标
+        # 使用spawn启动，避免子进程继承父进程的SnmpEngine套接字和数据库连接
+        self._context = spawn_context()
+        self._results = None
+        self._processes = {}  # 分片序号 -> (进程, 命令队列)
+        self._cycle_id = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动所有工作进程并等待它们完成初始化"""
+        if self._results is None:
+            self._results = self._context.Queue()
+        for shard in range(self.workers):
+            if shard not in self._processes:
+                self._spawn(shard)
+        self._wait_ready(set(range(self.workers)))
+        return self
+
+    def _spawn(self, shard):
+        """启动一个分片的工作进程"""
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(shard, self.workers, self.config_name, commands, self._results),
+            name=f'snmp-poller-shard-{shard}',
+            daemon=True
+        )
+        process.start()
+        self._processes[shard] = (process, commands)
+        logger.info(f"分片{shard}工作进程已启动，PID {process.pid}")
+
+    def _wait_ready(self, shards):
+        """等待工作进程发送就绪消息"""
+        deadline = time.monotonic() + self.start_timeout
+        pending = set(shards)
+        while pending and time.monotonic() < deadline:
+            try:
+                shard, cycle_id, summary = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if summary.get('status') == 'ready':
+                pending.discard(shard)
+        if pending:
+            logger.warning(f"分片{sorted(pending)}的工作进程未能在{self.start_timeout}秒内完成启动")
+
+    def _restart(self, shard):
+        """终止并重启一个分片的工作进程"""
+        process, commands = self._processes.pop(shard)
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=5)
+        self.restarts += 1
+        logger.warning(f"重启分片{shard}的工作进程（退出码 {process.exitcode}）")
+        self._spawn(shard)
+
+    def supervise(self):
+        """检查工作进程是否存活，重启已退出的进程"""
+        dead = [shard for shard, (process, _) in self._processes.items() if not process.is_alive()]
+        for shard in dead:
+            self._restart(shard)
+        if dead:
+            self._wait_ready(dead)
+        return len(dead)
+
+    def run(self, command=COMMAND_POLL, timeout=None):
+        """
+        向所有分片下发一条命令并等待结果
+
+        参数:
+            command: COMMAND_POLL（完整轮询）或COMMAND_TICK（只轮询到期设备）
+            timeout: 最长等待时间（秒），默认使用cycle_timeout
+
+        返回:
+            汇总报告字典
+        """
+        with self._lock:
+            if self._results is None:
+                self.start()
+            self.supervise()
+
+            self._cycle_id += 1
+            cycle_id = self._cycle_id
+            start = time.monotonic()
+            for process, commands in self._processes.values():
+                commands.put((command, cycle_id))
+
+            summaries = {}
+            deadline = start + (timeout or self.cycle_timeout)
+            while len(summaries) < len(self._processes) and time.monotonic() < deadline:
+                try:
+                    shard, result_cycle, summary = self._results.get(timeout=0.5)
+                except queue.Empty:
+                    # 工作进程在执行命令时退出，不再等待它的结果
+                    if any(not process.is_alive() for shard, (process, _) in self._processes.items()
+                           if shard not in summaries):
+                        break
+                    continue
+                # 丢弃上一轮超时后才返回的结果
+                if result_cycle == cycle_id:
+                    if 'metrics' in summary:
+                        self.shard_metrics[shard] = summary.pop('metrics')
+                    summaries[shard] = summary
+
+            # 超时或退出的工作进程在下一轮之前重启
+            missing = [shard for shard in self._processes if shard not in summaries]
+            for shard in missing:
+                self._restart(shard)
+
+            self.last_report = self._summarize(command, summaries, missing, time.monotonic() - start)
+            return self.last_report
+
+    def _summarize(self, command, summaries, missing, duration):
+        """汇总各分片的报告"""
+        devices = sum(summary.get('devices', 0) for summary in summaries.values())
+        totals = {'succeeded': 0, 'offline': 0, 'skipped': 0, 'timed_out': 0, 'failed': 0}
+        for summary in summaries.values():
+            report = summary.get('report') or {}
+            for key in totals:
+                totals[key] += report.get(key, 0)
+
+        return dict(totals, **{
+            'command': command,
+            'workers': self.workers,
+            'devices': devices,
+            'duration': round(duration, 3),
+            'devices_per_second': round(devices / duration, 2) if duration > 0 else 0,
+            'missing_shards': missing,
+            'restarts': self.restarts,
+            'shards': {shard: {key: summary.get(key) for key in ('status', 'pid', 'devices', 'duration', 'error')}
+                       for shard, summary in sorted(summaries.items())}
+        })
+
+    def close(self, timeout=10):
+        """通知所有工作进程退出并等待它们保存状态"""
+        with self._lock:
+            for process, commands in self._processes.values():
+                commands.put(None)
+            for process, commands in self._processes.values():
+                process.join(timeout=timeout)
+                if process.is_alive():
+                    process.terminate()
+            self._processes.clear()
+
+
+# 全局分片轮询引擎
+_sharded_poller = None
+_sharded_poller_lock = threading.Lock()
+
+
+def current_sharded_poller():
+    """获取已创建的全局分片轮询引擎，未启用分片轮询时返回None"""
+    return _sharded_poller
+
+
+def get_sharded_poller(workers=4, config_name=None, cycle_timeout=600):
+    """
+    获取全局分片轮询引擎，首次调用时创建并启动工作进程
+    工作进程数变化时关闭旧的进程并按新的分片数重新启动
+
+    返回:
+        ShardedPoller
+    """
+    global _sharded_poller
+    with _sharded_poller_lock:
+        if _sharded_poller is not None and _sharded_poller.workers != int(workers):
+            _sharded_poller.close()
+            _sharded_poller = None
+        if _sharded_poller is None:
+            _sharded_poller = ShardedPoller(workers, config_name, cycle_timeout).start()
+        _sharded_poller.cycle_timeout = cycle_timeout
+        return _sharded_poller
@@ -4,17 +4,24 @@ SNMP数据采集模块
 """
 
 import time
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
+from pyasn1.type.univ import Null
 from pysnmp.hlapi import (
     SnmpEngine, CommunityData, UdpTransportTarget, 
-    ContextData, ObjectType, ObjectIdentity, getCmd, nextCmd
+    ContextData, ObjectType, ObjectIdentity, getCmd, nextCmd, bulkCmd
 )
 from app import db
 from app.models.traffic import Traffic
 from app.models.device import Device
 from app.models.alert import Alert
+from app.utils.counter_state import counter_store, COUNTER_BITS_32, COUNTER_BITS_HC
+from app.utils.interface_inventory import interface_inventory
+from app.utils.poll_metrics import poll_metrics
+from app.utils.sflow import sflow_counters
 
 # 常用SNMP OID
+OID_IF_NUMBER = '1.3.6.1.2.1.2.1.0'    # 接口数量
 OID_IF_DESCR = '1.3.6.1.2.1.2.2.1.2'  # 接口描述
 OID_IF_TYPE = '1.3.6.1.2.1.2.2.1.3'    # 接口类型
 OID_IF_MTU = '1.3.6.1.2.1.2.2.1.4'     # 接口MTU
@@ -29,6 +36,45 @@ OID_IF_OUT_OCTETS = '1.3.6.1.2.1.2.2.1.16'   # 接口输出字节数
 OID_IF_OUT_UCAST = '1.3.6.1.2.1.2.2.1.17'    # 接口输出单播包数
 OID_IF_OUT_ERRORS = '1.3.6.1.2.1.2.2.1.20'   # 接口输出错误数
 
+# IF-MIB ifXTable高容量计数器OID
+OID_IF_NAME = '1.3.6.1.2.1.31.1.1.1.1'           # 接口名称
+OID_IF_HC_IN_OCTETS = '1.3.6.1.2.1.31.1.1.1.6'   # 接口输入字节数（64位）
+OID_IF_HC_IN_UCAST = '1.3.6.1.2.1.31.1.1.1.7'    # 接口输入单播包数（64位）
+OID_IF_HC_OUT_OCTETS = '1.3.6.1.2.1.31.1.1.1.10'  # 接口输出字节数（64位）
+OID_IF_HC_OUT_UCAST = '1.3.6.1.2.1.31.1.1.1.11'   # 接口输出单播包数（64位）
+OID_IF_HIGH_SPEED = '1.3.6.1.2.1.31.1.1.1.15'    # 接口速度（Mbps）
+OID_IF_TABLE_LAST_CHANGE = '1.3.6.1.2.1.31.1.5.0'  # 接口表最近一次变化时的sysUpTime
+
+# ifSpeed的最大值，接口速度超过该值时需要使用ifHighSpeed
+IF_SPEED_MAX = 4294967295
+
+# GETBULK每次请求返回的最大行数
+SNMP_MAX_REPETITIONS = 25
+
+# 计数器类型：32位ifTable计数器或64位ifXTable计数器
+COUNTER_FAMILY_32 = 'ifTable'
+COUNTER_FAMILY_64 = 'ifXTable'
+
+# 接口静态列，由接口清单缓存保存，只在接口表变化时重新遍历
+INTERFACE_STATIC_COLUMNS = [OID_IF_DESCR, OID_IF_SPEED]
+INTERFACE_HC_STATIC_COLUMNS = [OID_IF_DESCR, OID_IF_SPEED, OID_IF_HIGH_SPEED]
+
+# 接口计数器列，每个轮询周期都需要遍历
+INTERFACE_COUNTER_COLUMNS = [
+    OID_IF_IN_OCTETS, OID_IF_OUT_OCTETS, OID_IF_IN_ERRORS, OID_IF_OUT_ERRORS,
+    OID_IF_IN_UCAST, OID_IF_OUT_UCAST, OID_IF_OPER_STATUS
+]
+INTERFACE_HC_COUNTER_COLUMNS = [
+    OID_IF_HC_IN_OCTETS, OID_IF_HC_OUT_OCTETS, OID_IF_IN_ERRORS, OID_IF_OUT_ERRORS,
+    OID_IF_HC_IN_UCAST, OID_IF_HC_OUT_UCAST, OID_IF_OPER_STATUS
+]
+
+# 接口流量采集需要遍历的全部列（32位计数器）
+INTERFACE_TRAFFIC_COLUMNS = INTERFACE_STATIC_COLUMNS + INTERFACE_COUNTER_COLUMNS
+
+# 接口流量采集需要遍历的全部列（64位计数器），ifTable和ifXTable同以ifIndex为索引，可在一次遍历中获取
+INTERFACE_HC_TRAFFIC_COLUMNS = INTERFACE_HC_STATIC_COLUMNS + INTERFACE_HC_COUNTER_COLUMNS
+
 # CPU和内存OID (Cisco设备)
 OID_CISCO_CPU_5SEC = '1.3.6.1.4.1.9.9.109.1.1.1.1.3.1'  # 5秒CPU使用率
 OID_CISCO_MEM_USED = '1.3.6.1.4.1.9.9.48.1.1.1.5.1'     # 已用内存
@@ -42,6 +88,378 @@ OID_SYS_NAME = '1.3.6.1.2.1.1.5.0'  # 系统名称
 OID_SYS_LOCATION = '1.3.6.1.2.1.1.6.0'  # 系统位置
 
 
+class SnmpSessionPool:
+    """
+    SNMP会话池
+    缓存长期存活的SnmpEngine、认证数据、传输目标和已解析的OID对象，
+    避免每次请求都重新创建引擎和进行MIB解析
+    """
+    
+    def __init__(self, transport_cls=UdpTransportTarget, timeout=2.0, retries=3, idle_timeout=900):
+        """
+        参数:
+            transport_cls: 传输目标类（同步或asyncio版本的UdpTransportTarget）
+            timeout: 请求超时时间（秒）
+            retries: 重试次数
+            idle_timeout: 传输目标闲置多久后被淘汰（秒）
+        """
+        self.transport_cls = transport_cls
+        self.timeout = timeout
+        self.retries = retries
+        self.idle_timeout = idle_timeout
+        self._targets = {}  # (ip, port, community, version) -> [认证数据, 传输目标, 最近使用时间]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_eviction = time.monotonic()
+    
+    def get_engine(self):
+        """获取当前线程的SnmpEngine（同步引擎不是线程安全的，每个线程一个）"""
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = SnmpEngine()
+            self._local.engine = engine
+        return engine
+    
+    def get_object_type(self, oid):
+        """获取当前线程缓存的已解析ObjectType，避免重复的MIB解析"""
+        object_types = getattr(self._local, 'object_types', None)
+        if object_types is None:
+            object_types = self._local.object_types = {}
+        object_type = object_types.get(oid)
+        if object_type is None:
+            object_type = ObjectType(ObjectIdentity(oid))
+            object_types[oid] = object_type
+        return object_type
+    
+    def get_target(self, ip, port=161, community='public', version='2c'):
+        """
+        获取设备的认证数据和传输目标
+        
+        返回:
+            (CommunityData, UdpTransportTarget)
+        """
+        key = (ip, port, community, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._targets.get(key)
+            if entry is None:
+                entry = [
+                    CommunityData(community, mpModel={'1': 0, '2c': 1}[version]),
+                    self.transport_cls((ip, port), timeout=self.timeout, retries=self.retries),
+                    now
+                ]
+                self._targets[key] = entry
+            else:
+                entry[2] = now
+            
+            if now - self._last_eviction > self.idle_timeout:
+                self._evict_idle(now)
+            
+            return entry[0], entry[1]
+    
+    def evict_idle(self):
+        """淘汰闲置的传输目标"""
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+    
+    def _evict_idle(self, now):
+        expired = [key for key, entry in self._targets.items()
+                   if now - entry[2] > self.idle_timeout]
+        for key in expired:
+            del self._targets[key]
+        self._last_eviction = now
+        return len(expired)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._targets.clear()
+    
+    def __len__(self):
+        return len(self._targets)
+
+
+# 全局SNMP会话池，供采集器、设备状态检查和终端识别共用
+session_pool = SnmpSessionPool()
+
+
+class CounterFamilyCache:
+    """
+    设备计数器类型缓存
+    每台设备只探测一次是否支持ifXTable的64位计数器，探测结果在有效期内复用
+    """
+    
+    def __init__(self, ttl=24 * 3600):
+        """
+        参数:
+            ttl: 探测结果的有效期（秒），过期后重新探测以适应设备升级
+        """
+        self.ttl = ttl
+        self._families = {}  # 设备ID -> (计数器类型, 探测时间)
+        self._lock = threading.Lock()
+    
+    def get(self, device_id):
+        """获取设备的计数器类型，未探测或已过期时返回None"""
+        entry = self._families.get(device_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+    
+    def set(self, device_id, family):
+        """记录设备的计数器类型"""
+        with self._lock:
+            self._families[device_id] = (family, time.monotonic())
+    
+    def forget(self, device_id):
+        """删除设备的探测结果，下次采集时重新探测"""
+        with self._lock:
+            self._families.pop(device_id, None)
+
+
+# 全局计数器类型缓存
+counter_families = CounterFamilyCache()
+
+
+class DeviceHealthTracker:
+    """
+    设备健康状态跟踪
+    设备连续失败达到阈值后断路，按指数退避等待一段时间后才允许再次尝试（半开状态），
+    半开时只放行一个线程探测，其他调用方在探测结果记录之前仍被拒绝，
+    避免离线设备在每个轮询周期都耗尽超时和重试时间；
+    同时为每台设备记录返回noSuchObject/noSuchInstance的OID，在有效期内不再请求这些OID
+    """
+    
+    def __init__(self, failure_threshold=3, base_backoff=60, max_backoff=3600, unsupported_ttl=6 * 3600,
+                 probe_timeout=120):
+        """
+        参数:
+            failure_threshold: 连续失败多少次后断路
+            base_backoff: 首次断路的等待时间（秒），之后每次失败翻倍
+            max_backoff: 最长等待时间（秒）
+            unsupported_ttl: 不支持OID记录的有效期（秒），过期后重新尝试以适应设备升级
+            probe_timeout: 半开探测的最长占用时间（秒），探测方未记录结果时超时后允许其他调用方探测
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.unsupported_ttl = unsupported_ttl
+        self.probe_timeout = probe_timeout
+        self._failures = {}  # 设备IP -> (连续失败次数, 下次允许尝试的时间)
+        self._probes = {}  # 设备IP -> (探测线程ID, 开始时间)，半开状态下正在探测的调用方
+        self._unsupported = {}  # 设备IP -> {OID: 记录时间}
+        self._lock = threading.Lock()
+    
+    def configure(self, failure_threshold=None, base_backoff=None, max_backoff=None):
+        """更新断路参数（不影响已记录的状态）"""
+        if failure_threshold is not None:
+            self.failure_threshold = max(1, int(failure_threshold))
+        if base_backoff is not None:
+            self.base_backoff = base_backoff
+        if max_backoff is not None:
+            self.max_backoff = max_backoff
+        return self
+    
+    def allow(self, device):
+        """
+        判断当前是否允许向设备发送请求
+        
+        参数:
+            device: 设备IP地址
+        
+        返回:
+            断路器闭合时返回True；退避时间已过时只对第一个调用方（及其所在线程的后续请求）返回True
+        """
+        entry = self._failures.get(device)
+        if entry is None or entry[0] < self.failure_threshold:
+            return True
+        now = time.monotonic()
+        if now < entry[1]:
+            return False
+        
+        # 半开状态，同一线程中同一次采集的后续请求沿用探测资格
+        owner = threading.get_ident()
+        with self._lock:
+            if device not in self._failures:
+                return True
+            probe = self._probes.get(device)
+            if probe is not None and probe[0] != owner and now - probe[1] < self.probe_timeout:
+                return False
+            self._probes[device] = (owner, now)
+        return True
+    
+    def record_success(self, device):
+        """记录一次成功的请求，断路器恢复闭合"""
+        if device in self._failures:
+            with self._lock:
+                self._failures.pop(device, None)
+                self._probes.pop(device, None)
+    
+    def record_failure(self, device):
+        """
+        记录一次失败的请求（超时或无响应）
+        
+        返回:
+            断路时返回退避时间（秒），否则返回0
+        """
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.get(device, (0, now))[0] + 1
+            backoff = 0
+            if failures >= self.failure_threshold:
+                backoff = min(self.max_backoff,
+                              self.base_backoff * 2 ** (failures - self.failure_threshold))
+            self._failures[device] = (failures, now + backoff)
+            self._probes.pop(device, None)
+        if failures == self.failure_threshold:
+            print(f"设备{device}连续{failures}次请求失败，暂停采集{backoff}秒")
+        return backoff
+    
+    def failure_count(self, device):
+        """获取设备的连续失败次数"""
+        entry = self._failures.get(device)
+        return entry[0] if entry else 0
+    
+    def is_unsupported(self, device, oid):
+        """判断OID是否已知不被设备支持"""
+        recorded_at = self._unsupported.get(device, {}).get(oid)
+        return recorded_at is not None and time.monotonic() - recorded_at < self.unsupported_ttl
+    
+    def mark_unsupported(self, device, oid):
+        """记录设备不支持的OID"""
+        with self._lock:
+            self._unsupported.setdefault(device, {})[oid] = time.monotonic()
+    
+    def forget(self, device):
+        """删除设备的所有健康状态"""
+        with self._lock:
+            self._failures.pop(device, None)
+            self._probes.pop(device, None)
+            self._unsupported.pop(device, None)
+    
+    def to_dict(self):
+        """转换为字典，用于查看当前断路的设备"""
+        now = time.monotonic()
+        return {
+            device: {'failures': failures, 'retry_in': max(0, round(retry_at - now, 1)),
+                     'probing': device in self._probes}
+            for device, (failures, retry_at) in list(self._failures.items())
+        }
+
+
+# 全局设备健康状态，同步采集和异步轮询引擎共用
+device_health = DeviceHealthTracker()
+
+
+def interface_columns(family):
+    """
+    获取计数器类型对应的接口表格列
+    
+    参数:
+        family: COUNTER_FAMILY_32或COUNTER_FAMILY_64
+    
+    返回:
+        列OID列表
+    """
+    if family == COUNTER_FAMILY_64:
+        return INTERFACE_HC_TRAFFIC_COLUMNS
+    return INTERFACE_TRAFFIC_COLUMNS
+
+
+def interface_static_columns(family):
+    """获取计数器类型对应的接口静态列"""
+    if family == COUNTER_FAMILY_64:
+        return INTERFACE_HC_STATIC_COLUMNS
+    return INTERFACE_STATIC_COLUMNS
+
+
+def interface_counter_columns(family):
+    """获取计数器类型对应的接口计数器列"""
+    if family == COUNTER_FAMILY_64:
+        return INTERFACE_HC_COUNTER_COLUMNS
+    return INTERFACE_COUNTER_COLUMNS
+
+
+def interface_table_state(values):
+    """
+    将ifTableLastChange和ifNumber的GET结果转换为整数
+
+    参数:
+        values: [ifTableLastChange, ifNumber]的值列表，请求失败时为None
+
+    返回:
+        (last_change, if_number)，不可用的值为None
+    """
+    if not values:
+        return None, None
+    return tuple(int(value) if value is not None else None for value in values)
+
+
+def counter_family_from_response(var_binds):
+    """
+    根据对ifHCInOctets的GETNEXT响应判断设备支持的计数器类型
+    
+    参数:
+        var_binds: GETNEXT响应中的变量绑定
+    
+    返回:
+        COUNTER_FAMILY_64（响应落在ifHCInOctets列内）或COUNTER_FAMILY_32
+    """
+    for name, value in var_binds:
+        if str(name).startswith(OID_IF_HC_IN_OCTETS + '.') and not isinstance(value, Null):
+            return COUNTER_FAMILY_64
+    return COUNTER_FAMILY_32
+
+
+def probe_counter_family(device, port=161, community='public', version='2c'):
+    """
+    探测设备是否支持ifXTable的64位计数器
+    SNMPv1不支持Counter64，直接使用32位计数器
+    
+    参数:
+        device: 设备IP地址
+        port: SNMP端口，默认161
+        community: SNMP community，默认public
+        version: SNMP版本，默认2c
+    
+    返回:
+        COUNTER_FAMILY_64或COUNTER_FAMILY_32，探测失败时返回None
+    """
+    if version == '1':
+        return COUNTER_FAMILY_32
+    if not device_health.allow(device):
+        return None
+    
+    timer = poll_metrics.time_request(device, 'probe', OID_IF_HC_IN_OCTETS)
+    try:
+        auth_data, transport = session_pool.get_target(device, port, community, version)
+        error_indication, error_status, error_index, var_binds = next(
+            nextCmd(
+                session_pool.get_engine(),
+                auth_data,
+                transport,
+                ContextData(),
+                session_pool.get_object_type(OID_IF_HC_IN_OCTETS),
+                lookupMib=False
+            )
+        )
+        if error_indication:
+            print(f"探测设备{device}的64位计数器时出错: {error_indication}")
+            timer.fail(error_indication)
+            device_health.record_failure(device)
+            return None
+        device_health.record_success(device)
+        timer.varbinds = len(var_binds)
+        if error_status:
+            return COUNTER_FAMILY_32
+        return counter_family_from_response(var_binds)
+    except Exception as e:
+        print(f"探测设备{device}的64位计数器时出错: {e}")
+        timer.fail(e)
+        return None
+    finally:
+        timer.stop()
+
+
 def snmp_get(device, oid, port=161, community='public', version='2c'):
     """
     获取单个SNMP OID的值
@@ -54,31 +472,118 @@ def snmp_get(device, oid, port=161, community='public', version='2c'):
         version: SNMP版本，默认2c
     
     返回:
-        OID对应的值，或者None（如果出错）
+        OID对应的值，或者None（如果出错、设备处于断路状态或OID不被设备支持）
     """
+    # 跳过断路中的设备和已知不支持的OID
+    if not device_health.allow(device) or device_health.is_unsupported(device, oid):
+        return None
+    
+    timer = poll_metrics.time_request(device, 'get', oid)
     try:
+        auth_data, transport = session_pool.get_target(device, port, community, version)
         error_indication, error_status, error_index, var_binds = next(
             getCmd(
-                SnmpEngine(),
-                CommunityData(community, mpModel={'1': 0, '2c': 1}[version]),
-                UdpTransportTarget((device, port), timeout=2.0, retries=3),
+                session_pool.get_engine(),
+                auth_data,
+                transport,
                 ContextData(),
-                ObjectType(ObjectIdentity(oid))
+                session_pool.get_object_type(oid),
+                lookupMib=False
             )
         )
         
         if error_indication:
             print(f"SNMP错误: {error_indication}")
+            timer.fail(error_indication)
+            device_health.record_failure(device)
             return None
-        elif error_status:
+        
+        device_health.record_success(device)
+        timer.varbinds = len(var_binds)
+        if error_status:
+            # SNMPv1设备对不存在的OID返回noSuchName
+            if error_status.prettyPrint() == 'noSuchName':
+                device_health.mark_unsupported(device, oid)
             print(f"SNMP错误状态: {error_status.prettyPrint()} at {error_index and var_binds[int(error_index) - 1][0] or '?'}")
             return None
         else:
             for var_bind in var_binds:
+                # SNMPv2c设备对不存在的OID返回noSuchObject/noSuchInstance
+                if isinstance(var_bind[1], Null):
+                    device_health.mark_unsupported(device, oid)
+                    return None
                 return var_bind[1]
     except Exception as e:
         print(f"获取SNMP数据时出错: {e}")
+        timer.fail(e)
         return None
+    finally:
+        timer.stop()
+
+
+def snmp_get_many(device, oids, port=161, community='public', version='2c'):
+    """
+    在一个GET请求中获取多个SNMP OID的值
+    
+    参数:
+        device: 设备IP地址
+        oids: SNMP OID列表
+        port: SNMP端口，默认161
+        community: SNMP community，默认public
+        version: SNMP版本，默认2c
+    
+    返回:
+        与oids顺序对应的值列表（不被设备支持的OID为None），或者None（如果出错或设备处于断路状态）
+    """
+    if not device_health.allow(device):
+        return None
+    
+    # 已知设备不支持的OID不再请求
+    requested = [oid for oid in oids if not device_health.is_unsupported(device, oid)]
+    values = dict.fromkeys(oids)
+    if not requested:
+        return list(values.values())
+    
+    timer = poll_metrics.time_request(device, 'get', requested[0])
+    try:
+        auth_data, transport = session_pool.get_target(device, port, community, version)
+        error_indication, error_status, error_index, var_binds = next(
+            getCmd(
+                session_pool.get_engine(),
+                auth_data,
+                transport,
+                ContextData(),
+                *[session_pool.get_object_type(oid) for oid in requested],
+                lookupMib=False
+            )
+        )
+        
+        if error_indication:
+            print(f"SNMP错误: {error_indication}")
+            timer.fail(error_indication)
+            device_health.record_failure(device)
+            return None
+        
+        device_health.record_success(device)
+        timer.varbinds = len(var_binds)
+        if error_status:
+            if error_status.prettyPrint() == 'noSuchName' and error_index:
+                device_health.mark_unsupported(device, requested[int(error_index) - 1])
+            print(f"SNMP错误状态: {error_status.prettyPrint()} at {error_index and var_binds[int(error_index) - 1][0] or '?'}")
+            return None
+        
+        for oid, (name, value) in zip(requested, var_binds):
+            if isinstance(value, Null):
+                device_health.mark_unsupported(device, oid)
+            else:
+                values[oid] = value
+        return list(values.values())
+    except Exception as e:
+        print(f"获取SNMP数据时出错: {e}")
+        timer.fail(e)
+        return None
+    finally:
+        timer.stop()
 
 
 def snmp_walk(device, oid, port=161, community='public', version='2c'):
@@ -93,25 +598,38 @@ def snmp_walk(device, oid, port=161, community='public', version='2c'):
         version: SNMP版本，默认2c
     
     返回:
-        OID-值对的字典，或者空字典（如果出错）
+        OID-值对的字典，或者空字典（如果出错或设备处于断路状态）
     """
     result = {}
+    if not device_health.allow(device):
+        return result
+    
+    timer = poll_metrics.time_request(device, 'walk', oid)
+    timer.pdus = 0
     try:
+        auth_data, transport = session_pool.get_target(device, port, community, version)
         for (error_indication, error_status, error_index, var_binds) in nextCmd(
-                SnmpEngine(),
-                CommunityData(community, mpModel={'1': 0, '2c': 1}[version]),
-                UdpTransportTarget((device, port), timeout=2.0, retries=3),
+                session_pool.get_engine(),
+                auth_data,
+                transport,
                 ContextData(),
-                ObjectType(ObjectIdentity(oid)),
-                lexicographicMode=False
+                session_pool.get_object_type(oid),
+                lexicographicMode=False,
+                lookupMib=False
         ):
+            # 每次GETNEXT是一个PDU
+            timer.pdus += 1
             if error_indication:
                 print(f"SNMP错误: {error_indication}")
+                timer.fail(error_indication)
+                device_health.record_failure(device)
                 break
             elif error_status:
                 print(f"SNMP错误状态: {error_status.prettyPrint()} at {error_index and var_binds[int(error_index) - 1][0] or '?'}")
                 break
             else:
+                device_health.record_success(device)
+                timer.varbinds += len(var_binds)
                 for var_bind in var_binds:
                     # 获取OID和对应的值
                     oid = str(var_bind[0])
@@ -120,7 +638,102 @@ def snmp_walk(device, oid, port=161, community='public', version='2c'):
         return result
     except Exception as e:
         print(f"执行SNMP WALK时出错: {e}")
+        timer.fail(e)
         return {}
+    finally:
+        timer.stop()
+
+
+def snmp_table(device, columns, port=161, community='public', version='2c', max_repetitions=25):
+    """
+    一次遍历获取表格的多个列（SNMP表格WALK）
+    所有列放在同一个请求中，SNMPv2c使用GETBULK，SNMPv1回退为多变量GETNEXT
+    
+    参数:
+        device: 设备IP地址
+        columns: 列OID列表
+        port: SNMP端口，默认161
+        community: SNMP community，默认public
+        version: SNMP版本，默认2c
+        max_repetitions: GETBULK每次请求返回的最大行数
+    
+    返回:
+        按索引组织的表格行字典 {索引: {列OID: 值}}，或者空字典（如果出错或设备处于断路状态）
+    """
+    rows = {}
+    if not device_health.allow(device):
+        return rows
+    
+    timer = poll_metrics.time_request(device, 'table', columns[0])
+    iterations = 0
+    try:
+        auth_data, transport = session_pool.get_target(device, port, community, version)
+        var_binds = [session_pool.get_object_type(column) for column in columns]
+        
+        if version == '1':
+            iterator = nextCmd(
+                session_pool.get_engine(), auth_data, transport, ContextData(),
+                *var_binds, lookupMib=False
+            )
+        else:
+            iterator = bulkCmd(
+                session_pool.get_engine(), auth_data, transport, ContextData(),
+                0, max_repetitions, *var_binds, lookupMib=False
+            )
+        
+        for (error_indication, error_status, error_index, var_bind_row) in iterator:
+            iterations += 1
+            if error_indication:
+                print(f"SNMP错误: {error_indication}")
+                timer.fail(error_indication)
+                device_health.record_failure(device)
+                break
+            
+            device_health.record_success(device)
+            timer.varbinds += len(var_bind_row)
+            if error_status:
+                print(f"SNMP错误状态: {error_status.prettyPrint()} at {error_index and var_bind_row[int(error_index) - 1][0] or '?'}")
+                break
+            elif not var_bind_row or not collect_table_rows(columns, [var_bind_row], rows):
+                # 所有列都已超出子树范围，遍历结束
+                break
+        return rows
+    except Exception as e:
+        print(f"执行SNMP表格WALK时出错: {e}")
+        timer.fail(e)
+        return {}
+    finally:
+        # 同步迭代器逐行返回结果，GETBULK每个PDU最多返回max_repetitions行
+        timer.pdus = max(1, iterations if version == '1' else -(-iterations // max_repetitions))
+        timer.stop()
+
+
+def collect_table_rows(columns, var_bind_table, rows):
+    """
+    将GETBULK/GETNEXT响应中的变量绑定按索引归入表格行
+    
+    参数:
+        columns: 列OID列表，与每行变量绑定的顺序一致
+        var_bind_table: 响应中的变量绑定行列表
+        rows: 待填充的表格行字典 {索引: {列OID: 值}}
+    
+    返回:
+        最后一行中是否仍有列在子树范围内，False表示遍历结束
+    """
+    prefixes = [column + '.' for column in columns]
+    in_scope = False
+    for var_bind_row in var_bind_table:
+        in_scope = False
+        for prefix, column, (name, value) in zip(prefixes, columns, var_bind_row):
+            oid = str(name)
+            # 超出列子树或endOfMibView/noSuchObject等异常值都不属于本表
+            if not oid.startswith(prefix) or isinstance(value, Null):
+                continue
+            in_scope = True
+            rows.setdefault(oid[len(prefix):], {})[column] = value
+        if not in_scope:
+            break
+    return in_scope
 
 
 def check_device_status(device):
@@ -145,151 +758,135 @@ def check_device_status(device):
     return sysDescr is not None
 
 
-def get_interface_traffic(device):
+def get_interface_traffic(device, max_repetitions=SNMP_MAX_REPETITIONS, sys_uptime=None):
     """
     获取设备所有接口的流量数据
+    支持ifXTable的设备使用64位计数器，其余设备回退到ifTable的32位计数器；
+    接口表没有变化时只遍历计数器列，接口描述和速率从接口清单缓存中获取
     
     参数:
         device: Device对象
+        max_repetitions: GETBULK每次请求返回的最大行数
+        sys_uptime: 设备sysUpTime（1/100秒），用于识别设备重启
     
     返回:
         接口流量数据的列表，每个元素包含接口名称、输入字节数、输出字节数等
     """
+    snmp_args = {
+        'port': device.snmp_port or 161,
+        'community': device.snmp_community or 'public',
+        'version': device.snmp_version or '2c'
+    }
     try:
-        # 获取接口描述
-        if_descr = snmp_walk(
-            device.ip_address, 
-            OID_IF_DESCR, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
+        # 每台设备只探测一次计数器类型
+        family = counter_families.get(device.id)
+        if family is None:
+            family = probe_counter_family(device.ip_address, **snmp_args)
+            if family is not None:
+                counter_families.set(device.id, family)
         
-        # 获取接口速度
-        if_speed = snmp_walk(
-            device.ip_address, 
-            OID_IF_SPEED, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
+        # 根据ifTableLastChange/ifNumber判断接口表是否变化
+        last_change, if_number = interface_table_state(
+            snmp_get_many(device.ip_address, [OID_IF_TABLE_LAST_CHANGE, OID_IF_NUMBER], **snmp_args)
         )
-        
-        # 获取接口输入字节数
-        if_in_octets = snmp_walk(
-            device.ip_address, 
-            OID_IF_IN_OCTETS, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
+        static_columns = interface_static_columns(family)
+        refresh = interface_inventory.needs_refresh(
+            device.id, static_columns, last_change, if_number, sys_uptime
         )
         
-        # 获取接口输出字节数
-        if_out_octets = snmp_walk(
-            device.ip_address, 
-            OID_IF_OUT_OCTETS, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
+        # 一次表格遍历获取所需的接口列
+        rows = snmp_table(
+            device.ip_address,
+            interface_columns(family) if refresh else interface_counter_columns(family),
+            max_repetitions=max_repetitions,
+            **snmp_args
         )
         
-        # 获取接口输入错误数
-        if_in_errors = snmp_walk(
-            device.ip_address, 
-            OID_IF_IN_ERRORS, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
-        
-        # 获取接口输出错误数
-        if_out_errors = snmp_walk(
-            device.ip_address, 
-            OID_IF_OUT_ERRORS, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
-        
-        # 获取接口输入包数
-        if_in_ucast = snmp_walk(
-            device.ip_address, 
-            OID_IF_IN_UCAST, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
-        
-        # 获取接口输出包数
-        if_out_ucast = snmp_walk(
-            device.ip_address, 
-            OID_IF_OUT_UCAST, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
+        if not refresh and not interface_inventory.merge(device.id, rows):
+            # 出现了缓存中没有的接口，补充遍历静态列
+            for index, row in snmp_table(device.ip_address, static_columns,
+                                         max_repetitions=max_repetitions, **snmp_args).items():
+                if index in rows:
+                    rows[index].update(row)
+            refresh = True
         
-        # 获取接口操作状态
-        if_oper_status = snmp_walk(
-            device.ip_address, 
-            OID_IF_OPER_STATUS, 
-            port=device.snmp_port or 161,
-            community=device.snmp_community or 'public',
-            version=device.snmp_version or '2c'
-        )
+        if refresh and rows:
+            interface_inventory.update(device.id, rows, static_columns, last_change, if_number, sys_uptime)
+        else:
+            interface_inventory.touch(device.id, sys_uptime)
         
         # 整合数据
-        interfaces = []
-        for oid, descr in if_descr.items():
-            # 获取接口索引
-            index = oid.split('.')[-1]
-            if_index_oid = f'{OID_IF_DESCR}.{index}'
-            
-            # 组装完整OID
-            speed_oid = f'{OID_IF_SPEED}.{index}'
-            in_octets_oid = f'{OID_IF_IN_OCTETS}.{index}'
-            out_octets_oid = f'{OID_IF_OUT_OCTETS}.{index}'
-            in_errors_oid = f'{OID_IF_IN_ERRORS}.{index}'
-            out_errors_oid = f'{OID_IF_OUT_ERRORS}.{index}'
-            in_ucast_oid = f'{OID_IF_IN_UCAST}.{index}'
-            out_ucast_oid = f'{OID_IF_OUT_UCAST}.{index}'
-            oper_status_oid = f'{OID_IF_OPER_STATUS}.{index}'
-            
-            # 获取各项数据
-            speed = int(if_speed.get(speed_oid, 0))
-            in_octets = int(if_in_octets.get(in_octets_oid, 0))
-            out_octets = int(if_out_octets.get(out_octets_oid, 0))
-            in_errors = int(if_in_errors.get(in_errors_oid, 0))
-            out_errors = int(if_out_errors.get(out_errors_oid, 0))
-            in_packets = int(if_in_ucast.get(in_ucast_oid, 0))
-            out_packets = int(if_out_ucast.get(out_ucast_oid, 0))
-            oper_status = int(if_oper_status.get(oper_status_oid, 0))
-            
-            # 计算带宽利用率
-            utilization = 0
-            if speed > 0:
-                utilization = ((in_octets + out_octets) * 8 / speed) * 100
-            
-            # 添加到结果列表
-            interface_data = {
-                'interface': str(descr),
-                'in_octets': in_octets,
-                'out_octets': out_octets,
-                'in_packets': in_packets,
-                'out_packets': out_packets,
-                'in_errors': in_errors,
-                'out_errors': out_errors,
-                'bandwidth': speed,
-                'utilization': utilization,
-                'status': 'up' if oper_status == 1 else 'down'
-            }
-            interfaces.append(interface_data)
-        
-        return interfaces
+        return build_interface_records(rows)
     except Exception as e:
         print(f"获取设备{device.ip_address}接口流量数据时出错: {e}")
         return []
 
 
+def build_interface_records(rows):
+    """
+    将按ifIndex组织的表格行整合为接口流量数据列表
+    同步采集和异步轮询引擎共用此函数，保证两者产生的数据一致
+
+    参数:
+        rows: 表格行字典 {ifIndex: {列OID: 值}}
+
+    返回:
+        接口流量数据的列表
+    """
+    interfaces = []
+    for index, row in rows.items():
+        # 没有接口描述的行不是有效接口
+        if OID_IF_DESCR not in row:
+            continue
+
+        # 获取各项数据，有64位计数器时优先使用
+        if OID_IF_HC_IN_OCTETS in row or OID_IF_HC_OUT_OCTETS in row:
+            in_octets = int(row.get(OID_IF_HC_IN_OCTETS, 0))
+            out_octets = int(row.get(OID_IF_HC_OUT_OCTETS, 0))
+            in_packets = int(row.get(OID_IF_HC_IN_UCAST, 0))
+            out_packets = int(row.get(OID_IF_HC_OUT_UCAST, 0))
+            counter_bits = COUNTER_BITS_HC
+        else:
+            in_octets = int(row.get(OID_IF_IN_OCTETS, 0))
+            out_octets = int(row.get(OID_IF_OUT_OCTETS, 0))
+            in_packets = int(row.get(OID_IF_IN_UCAST, 0))
+            out_packets = int(row.get(OID_IF_OUT_UCAST, 0))
+            counter_bits = COUNTER_BITS_32
+        in_errors = int(row.get(OID_IF_IN_ERRORS, 0))
+        out_errors = int(row.get(OID_IF_OUT_ERRORS, 0))
+        oper_status = int(row.get(OID_IF_OPER_STATUS, 0))
+
+        # ifSpeed在4.29Gbps处饱和，更高速率的接口使用ifHighSpeed（Mbps）
+        speed = int(row.get(OID_IF_SPEED, 0))
+        high_speed = int(row.get(OID_IF_HIGH_SPEED, 0))
+        if high_speed > 0 and (speed == 0 or speed >= IF_SPEED_MAX):
+            speed = high_speed * 1000000
+
+        # 计算带宽利用率
+        utilization = 0
+        if speed > 0:
+            utilization = ((in_octets + out_octets) * 8 / speed) * 100
+
+        # 添加到结果列表
+        interface_data = {
+            'if_index': index,
+            'interface': str(row[OID_IF_DESCR]),
+            'in_octets': in_octets,
+            'out_octets': out_octets,
+            'in_packets': in_packets,
+            'out_packets': out_packets,
+            'in_errors': in_errors,
+            'out_errors': out_errors,
+            'bandwidth': speed,
+            'utilization': utilization,
+            'counter_bits': counter_bits,
+            'status': 'up' if oper_status == 1 else 'down'
+        }
+        interfaces.append(interface_data)
+
+    return interfaces
+
+
 def get_device_cpu_memory(device):
     """
     获取设备CPU和内存使用率
@@ -328,36 +925,142 @@ def get_device_cpu_memory(device):
             version=device.snmp_version or '2c'
         )
         
-        # 计算内存使用率
-        mem_usage = 0
-        if mem_used is not None and mem_free is not None:
-            total_mem = int(mem_used) + int(mem_free)
-            if total_mem > 0:
-                mem_usage = (int(mem_used) / total_mem) * 100
-        
-        return {
-            'cpu': int(cpu_usage) if cpu_usage else 0,
-            'memory': mem_usage
-        }
+        return build_resource_usage(cpu_usage, mem_used, mem_free)
     except Exception as e:
         print(f"获取设备{device.ip_address}的CPU和内存使用率时出错: {e}")
         return {'cpu': 0, 'memory': 0}
 
 
-def collect_traffic_data(device):
+def build_resource_usage(cpu_usage, mem_used, mem_free):
+    """
+    根据CPU和内存OID的原始值计算资源使用率
+
+    参数:
+        cpu_usage: 5秒CPU使用率原始值
+        mem_used: 已用内存原始值
+        mem_free: 剩余内存原始值
+
+    返回:
+        包含CPU和内存使用率的字典
+    """
+    # 计算内存使用率
+    mem_usage = 0
+    if mem_used is not None and mem_free is not None:
+        total_mem = int(mem_used) + int(mem_free)
+        if total_mem > 0:
+            mem_usage = (int(mem_used) / total_mem) * 100
+
+    return {
+        'cpu': int(cpu_usage) if cpu_usage else 0,
+        'memory': mem_usage
+    }
+
+
+def collect_traffic_data(device, on_result=None):
     """
     收集设备流量数据并保存到数据库
     
     参数:
         device: Device对象
+        on_result: 可选的回调函数，采集结束后以结果字典（device_id、status、interfaces）调用
     
     返回:
         成功收集数据返回True，否则返回False
     """
+    # 断路中的设备本轮不采集，也不更新状态，等待退避时间结束
+    if not device_health.allow(device.ip_address):
+        if on_result:
+            on_result({'device_id': device.id, 'status': 'skipped', 'interfaces': []})
+        return False
+    
+    start = time.monotonic()
+    
+    def finish(status, interfaces):
+        # 记录设备的轮询耗时并通知调用方
+        poll_metrics.observe_device(device.ip_address, time.monotonic() - start, status)
+        if on_result:
+            on_result({'device_id': device.id, 'status': status, 'interfaces': interfaces})
+    
     try:
         # 先检查设备状态
         is_online = check_device_status(device)
         
+        interfaces = []
+        resource_usage = None
+        sys_uptime = None
+        if is_online:
+            # 获取系统运行时间，用于识别设备重启
+            sys_uptime = snmp_get(
+                device.ip_address,
+                OID_SYS_UPTIME,
+                port=device.snmp_port or 161,
+                community=device.snmp_community or 'public',
+                version=device.snmp_version or '2c'
+            )
+            
+            # 获取所有接口的流量数据
+            interfaces = get_interface_traffic(
+                device, sys_uptime=int(sys_uptime) if sys_uptime is not None else None
+            )
+            
+            # 获取CPU和内存使用率
+            resource_usage = get_device_cpu_memory(device)
+        
+        saved = save_poll_result(
+            device, is_online, interfaces, resource_usage,
+            sys_uptime=int(sys_uptime) if sys_uptime is not None else None
+        )
+        finish('ok' if is_online else 'offline', interfaces)
+        return saved
+    except Exception as e:
+        db.session.rollback()
+        print(f"收集设备{device.ip_address}流量数据时出错: {e}")
+        finish('error', [])
+        return False
+
+
+def collect_sflow_counters(device, on_result=None):
+    """
+    使用sFlow计数器样本代替SNMP轮询保存设备流量数据
+    接口的累计计数器来自设备主动发送的计数器样本，不向设备发送任何SNMP请求
+    
+    参数:
+        device: Device对象
+        on_result: 可选的回调函数，保存结束后以结果字典（device_id、status、interfaces）调用
+    
+    返回:
+        成功保存数据返回True，否则返回False
+    """
+    start = time.monotonic()
+    # sFlow计数器样本不包含接口名称，使用接口清单中缓存的ifDescr
+    interfaces = sflow_counters.interface_records(
+        device.ip_address, names=interface_inventory.column_values(device.id, OID_IF_DESCR)
+    )
+    saved = save_poll_result(device, True, interfaces, None)
+    poll_metrics.observe_device(device.ip_address, time.monotonic() - start, 'ok' if saved else 'error')
+    if on_result:
+        on_result({'device_id': device.id, 'status': 'ok' if saved else 'error', 'interfaces': interfaces})
+    return saved
+
+
+def save_poll_result(device, is_online, interfaces, resource_usage, timestamp=None, sys_uptime=None):
+    """
+    保存一次设备轮询的结果：更新设备状态、写入流量记录并检查告警
+    同步采集和异步轮询引擎共用此函数，保证两者的数据库副作用一致
+    接口的累计计数器在这里转换为本周期的增量和速率，首次采集的接口只建立基线不写入记录
+    
+    参数:
+        device: Device对象
+        is_online: 设备是否在线
+        interfaces: 接口流量数据列表（累计计数器）
+        resource_usage: CPU和内存使用率，设备离线时为None
+        timestamp: 采集时间（UTC），默认为当前时间
+        sys_uptime: 设备sysUpTime（1/100秒），用于识别重启
+    
+    返回:
+        成功保存数据返回True，设备离线或出错返回False
+    """
+    try:
         # 更新设备状态
         device.status = 'online' if is_online else 'offline'
         device.updated_at = datetime.now()
@@ -368,14 +1071,16 @@ def collect_traffic_data(device):
             create_offline_alert(device)
             return False
         
-        # 获取所有接口的流量数据
-        interfaces = get_interface_traffic(device)
+        # 将累计计数器转换为本周期的增量和速率
+        # Traffic的时间与模型默认值、统计任务和流量收集器一致，统一为UTC
+        timestamp = timestamp or datetime.utcnow()
+        counter_store.apply(device.id, interfaces, timestamp.replace(tzinfo=timezone.utc).timestamp(),
+                            sys_uptime=sys_uptime)
         
         # 存储流量数据
-        timestamp = datetime.now()
         for interface_data in interfaces:
-            # 只记录状态为up的接口数据
-            if interface_data['status'] == 'up':
+            # 只记录状态为up且已算出速率的接口数据
+            if interface_data['status'] == 'up' and interface_data['in_rate'] is not None:
                 traffic = Traffic(
                     device_id=device.id,
                     interface=interface_data['interface'],
@@ -387,22 +1092,22 @@ def collect_traffic_data(device):
                     out_errors=interface_data['out_errors'],
                     bandwidth=interface_data['bandwidth'],
                     utilization=interface_data['utilization'],
+                    in_rate=interface_data['in_rate'],
+                    out_rate=interface_data['out_rate'],
+                    interval=round(interface_data['interval']),
                     timestamp=timestamp
                 )
                 db.session.add(traffic)
         
-        # 获取CPU和内存使用率
-        resource_usage = get_device_cpu_memory(device)
-        
         # 检查是否需要创建告警
-        check_and_create_alerts(device, interfaces, resource_usage)
+        check_and_create_alerts(device, interfaces, resource_usage or {'cpu': 0, 'memory': 0})
         
         # 提交数据库事务
         db.session.commit()
         return True
     except Exception as e:
         db.session.rollback()
-        print(f"收集设备{device.ip_address}流量数据时出错: {e}")
+        print(f"保存设备{device.ip_address}轮询结果时出错: {e}")
         return False
 
 
@@ -570,12 +1275,82 @@ def create_memory_alert(device, memory_usage):
         db.session.add(alert)
 
 
-def poll_all_devices():
+def poll_all_devices(concurrent=True):
     """
     轮询所有设备的流量数据
+    
+    参数:
+        concurrent: 是否使用异步并发轮询引擎，False时逐台设备顺序采集
+    
+    返回:
+        异步模式下返回本轮的PollReport，顺序模式下返回None
+    """
+    report = poll_devices(Device.query.all(), concurrent=concurrent)
+    counter_store.save()
+    interface_inventory.save()
+    return report
+
+
+def poll_devices(devices, concurrent=True, on_result=None, pause=1, interval=None):
+    """
+    轮询一组设备的流量数据并保存结果
+    
+    参数:
+        devices: Device对象列表
+        concurrent: 是否使用异步并发轮询引擎，False时逐台设备顺序采集
+        on_result: 可选的回调函数，每台设备采集结束后以结果字典调用
+        pause: 顺序采集时每台设备之间的暂停时间（秒）
+        interval: 本轮允许的最长耗时（秒），默认为轮询周期，用于判断是否超时运行
+    
+    返回:
+        异步模式下返回本轮的PollReport，顺序模式下返回None
     """
-    devices = Device.query.all()
+    from flask import current_app
+    interval = interval or current_app.config.get('SNMP_POLL_INTERVAL', 300)
+    cycle = poll_metrics.begin_cycle()
+    try:
+        return _poll_devices(devices, concurrent, on_result, pause, interval)
+    finally:
+        poll_metrics.end_cycle(cycle, devices=len(devices), interval=interval)
+
+
+def _poll_devices(devices, concurrent, on_result, pause, interval):
+    """执行一轮轮询，参数见poll_devices"""
+    from flask import current_app
+    device_health.configure(
+        failure_threshold=current_app.config.get('SNMP_FAILURE_THRESHOLD'),
+        base_backoff=current_app.config.get('SNMP_BACKOFF_BASE'),
+        max_backoff=current_app.config.get('SNMP_BACKOFF_MAX')
+    )
+    
+    # 有未过期sFlow计数器样本的设备直接使用样本，不再进行SNMP轮询
+    if current_app.config.get('SFLOW_COUNTER_POLLING', True):
+        max_age = current_app.config.get('SFLOW_COUNTER_MAX_AGE')
+        sflow_ids = set()
+        for device in devices:
+            if sflow_counters.is_fresh(device.ip_address, max_age):
+                collect_sflow_counters(device, on_result=on_result)
+                sflow_ids.add(device.id)
+        if sflow_ids:
+            devices = [device for device in devices if device.id not in sflow_ids]
+    
+    if concurrent:
+        from app.utils.snmp_poller import get_async_poller
+        
+        # asyncio接口不可用时轮询引擎在线程池中发送请求，并发数和截止时间同样生效
+        poller = get_async_poller(
+            concurrency=current_app.config.get('SNMP_POLL_CONCURRENCY', 100),
+            device_deadline=current_app.config.get('SNMP_DEVICE_DEADLINE', 30),
+            timeout=current_app.config.get('SNMP_TIMEOUT', 2),
+            retries=current_app.config.get('SNMP_RETRIES', 1),
+            interval=interval,
+            max_repetitions=current_app.config.get('SNMP_MAX_REPETITIONS', SNMP_MAX_REPETITIONS)
+        )
+        return poller.poll_and_save(devices, on_result=on_result)
+    
     for device in devices:
-        collect_traffic_data(device)
+        collect_traffic_data(device, on_result=on_result)
         # 暂停一会儿，避免过多请求导致远程设备负载过高
-        time.sleep(1) 
\ No newline at end of file
+        if pause:
+            time.sleep(pause)
+    return None
@@ -0,0 +1,620 @@
+"""
+异步SNMP轮询模块
+
+在asyncio事件循环中并发轮询所有设备，替代逐台设备阻塞采集的方式。
+通过信号量限制同时在途的设备数，为每台设备设置采集截止时间，并为每轮轮询生成完成报告。
+采集结果仍通过snmp_collector.save_poll_result写入数据库，流量记录和告警与同步采集完全一致。
+
+SNMP请求有两种执行方式：pysnmp的asyncio接口可用时直接在事件循环中发送；
+pysnmp 4.4.x的asyncio接口使用了Python 3.11中已移除的asyncio.coroutine，无法导入时，
+每个请求交给有界线程池中的asyncore接口执行（每个线程一个SnmpEngine），
+信号量、截止时间和完成报告仍由事件循环负责，两种方式的采集逻辑相同。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pysnmp.carrier.asyncore.dgram import udp
+from pysnmp.entity import config as engine_config
+from pysnmp.hlapi import ContextData, ObjectType, ObjectIdentity
+from pysnmp.hlapi import UdpTransportTarget as ThreadUdpTransportTarget
+from pysnmp.hlapi.asyncore import cmdgen as thread_cmdgen
+from pysnmp.proto.rfc1905 import EndOfMibView, NoSuchObject, NoSuchInstance
+
+from app.utils.interface_inventory import interface_inventory
+from app.utils.poll_metrics import poll_metrics
+from app.utils.snmp_collector import (
+    OID_SYS_DESCR, OID_SYS_UPTIME, OID_CISCO_CPU_5SEC, OID_CISCO_MEM_USED, OID_CISCO_MEM_FREE,
+    OID_IF_HC_IN_OCTETS, OID_IF_NUMBER, OID_IF_TABLE_LAST_CHANGE, COUNTER_FAMILY_32, SNMP_MAX_REPETITIONS,
+    SnmpSessionPool, counter_families, device_health, build_interface_records, build_resource_usage,
+    collect_table_rows, counter_family_from_response, interface_columns, interface_counter_columns,
+    interface_static_columns, interface_table_state, save_poll_result
+)
+
+# 尝试导入pysnmp的asyncio接口，如果不可用则在线程池中执行请求
+# pysnmp 4.4.x的asyncio接口使用了Python 3.11中已移除的asyncio.coroutine，在3.11及以上无法导入
+ASYNC_SNMP_IMPORT_ERROR = None
+try:
+    from pysnmp.hlapi.asyncio import SnmpEngine, UdpTransportTarget, getCmd, nextCmd, bulkCmd
+    ASYNC_SNMP_AVAILABLE = True
+except (ImportError, AttributeError) as e:
+    ASYNC_SNMP_AVAILABLE = False
+    ASYNC_SNMP_IMPORT_ERROR = f"{type(e).__name__}: {e}"
+    SnmpEngine = UdpTransportTarget = getCmd = nextCmd = bulkCmd = None
+
+# SNMP请求的执行方式
+BACKEND_ASYNCIO = 'asyncio'  # 在事件循环中直接发送
+BACKEND_THREAD = 'thread'  # 在有界线程池中用asyncore接口发送
+
+# 请求类型对应的asyncio接口和asyncore接口（回调方式，每次只发送一个PDU）
+ASYNCIO_COMMANDS = {'get': getCmd, 'next': nextCmd, 'bulk': bulkCmd}
+THREAD_COMMANDS = {'get': thread_cmdgen.getCmd, 'next': thread_cmdgen.nextCmd, 'bulk': thread_cmdgen.bulkCmd}
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 轮询目标，只保存SNMP访问参数，避免在协程中访问ORM对象
+PollTarget = namedtuple('PollTarget', ['device_id', 'ip_address', 'port', 'community', 'version'])
+
+
+def check_async_snmp():
+    """
+    检查pysnmp的asyncio接口是否可用，应用启动时调用，记录并发轮询使用的执行方式
+
+    返回:
+        asyncio接口是否可用
+    """
+    if not ASYNC_SNMP_AVAILABLE:
+        logger.info(
+            f"pysnmp asyncio接口不可用（{ASYNC_SNMP_IMPORT_ERROR}），SNMP请求在线程池中并发执行，"
+            f"线程数为SNMP_POLL_CONCURRENCY"
+        )
+    return ASYNC_SNMP_AVAILABLE
+
+
+def default_backend():
+    """asyncio接口可用时直接在事件循环中发送请求，否则使用线程池"""
+    return BACKEND_ASYNCIO if ASYNC_SNMP_AVAILABLE else BACKEND_THREAD
+
+
+def make_poll_target(device):
+    """
+    从Device对象生成轮询目标
+
+    参数:
+        device: Device对象
+
+    返回:
+        PollTarget
+    """
+    return PollTarget(
+        device.id,
+        device.ip_address,
+        device.snmp_port or 161,
+        device.snmp_community or 'public',
+        device.snmp_version or '2c'
+    )
+
+
+class PollReport:
+    """单轮轮询的完成报告"""
+
+    def __init__(self, total, interval=None):
+        self.total = total
+        self.interval = interval  # 轮询周期（秒），用于判断是否超时运行
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.succeeded = 0
+        self.offline = 0
+        self.skipped = 0  # 处于断路状态、本轮跳过的设备数
+        self.timed_out = []  # 超过截止时间的设备ID
+        self.failed = []  # 采集出错的设备ID
+        self.slowest = []  # 耗时最长的设备 (耗时, 设备ID)
+        self._start = time.monotonic()
+        self.duration = 0.0
+
+    def record(self, result):
+        """记录单台设备的轮询结果"""
+        status = result['status']
+        if status == 'ok':
+            self.succeeded += 1
+        elif status == 'offline':
+            self.offline += 1
+        elif status == 'skipped':
+            self.skipped += 1
+            return
+        elif status == 'timeout':
+            self.timed_out.append(result['device_id'])
+        else:
+            self.failed.append(result['device_id'])
+
+        self.slowest.append((result['duration'], result['device_id']))
+        self.slowest.sort(reverse=True)
+        del self.slowest[10:]
+
+    def finish(self):
+        """结束本轮轮询"""
+        self.finished_at = datetime.now()
+        self.duration = time.monotonic() - self._start
+
+    @property
+    def overrun(self):
+        """本轮耗时是否超过了轮询周期"""
+        return bool(self.interval) and self.duration > self.interval
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'offline': self.offline,
+            'skipped': self.skipped,
+            'timed_out': len(self.timed_out),
+            'failed': len(self.failed),
+            'duration': round(self.duration, 3),
+            'interval': self.interval,
+            'overrun': self.overrun,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'slowest': [{'device_id': device_id, 'duration': round(duration, 3)}
+                        for duration, device_id in self.slowest]
+        }
+
+    def __repr__(self):
+        return (f'<PollReport {self.succeeded}/{self.total} ok, {self.offline} offline, {self.skipped} skipped, '
+                f'{len(self.timed_out)} timeout, {len(self.failed)} failed in {self.duration:.2f}s>')
+
+
+class AsyncSnmpPoller:
+    """异步SNMP轮询引擎"""
+
+    def __init__(self, concurrency=100, device_deadline=30.0, timeout=2.0, retries=1, interval=None,
+                 max_repetitions=SNMP_MAX_REPETITIONS, backend=None):
+        """
+        参数:
+            concurrency: 同时轮询的最大设备数（线程池方式下也是线程数）
+            device_deadline: 单台设备的采集截止时间（秒）
+            timeout: 单个SNMP请求的超时时间（秒）
+            retries: 单个SNMP请求的重试次数
+            interval: 轮询周期（秒），仅用于完成报告
+            max_repetitions: GETBULK每次请求返回的最大行数
+            backend: 请求的执行方式（asyncio或thread），默认按asyncio接口是否可用选择
+        """
+        self.backend = backend or default_backend()
+        if self.backend == BACKEND_ASYNCIO and not ASYNC_SNMP_AVAILABLE:
+            raise ValueError(f'pysnmp asyncio接口不可用: {ASYNC_SNMP_IMPORT_ERROR}')
+        self.concurrency = max(1, int(concurrency))
+        self.device_deadline = float(device_deadline)
+        self.timeout = float(timeout)
+        self.retries = int(retries)
+        self.interval = interval
+        self.max_repetitions = int(max_repetitions)
+        self.last_report = None
+        # 事件循环、SnmpEngine和线程池在多轮轮询之间复用，传输目标由会话池缓存
+        self._loop = None
+        self._engine = None
+        self._executor = None
+        self.pool = SnmpSessionPool(
+            transport_cls=UdpTransportTarget if self.backend == BACKEND_ASYNCIO else ThreadUdpTransportTarget,
+            timeout=self.timeout, retries=self.retries
+        )
+
+    def configure(self, concurrency=None, device_deadline=None, interval=None, max_repetitions=None):
+        """更新轮询参数（不影响已缓存的引擎和传输目标）"""
+        if concurrency is not None and max(1, int(concurrency)) != self.concurrency:
+            self.concurrency = max(1, int(concurrency))
+            # 线程数随并发数变化，下一轮轮询时重新创建线程池
+            self._shutdown_executor()
+        if device_deadline is not None:
+            self.device_deadline = float(device_deadline)
+        if interval is not None:
+            self.interval = interval
+        if max_repetitions is not None:
+            self.max_repetitions = int(max_repetitions)
+        return self
+
+    def close(self):
+        """关闭SnmpEngine、线程池和事件循环"""
+        if self._engine is not None and self._engine.transportDispatcher is not None:
+            self._engine.transportDispatcher.closeDispatcher()
+        self._engine = None
+        self._shutdown_executor()
+        if self._loop is not None:
+            self._loop.close()
+        self._loop = None
+        self.pool.clear()
+
+    def run(self, targets):
+        """
+        并发轮询一组设备（阻塞直到本轮完成）
+
+        参数:
+            targets: PollTarget列表
+
+        返回:
+            (结果列表, PollReport)
+        """
+        report = PollReport(len(targets), self.interval)
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        results = self._loop.run_until_complete(self._poll_cycle(targets, report))
+        report.finish()
+        self.last_report = report
+        return results, report
+
+    def poll_and_save(self, devices, on_result=None):
+        """
+        并发轮询设备并保存结果
+        网络I/O在事件循环中并发完成，数据库写入在当前线程中顺序执行
+
+        参数:
+            devices: Device对象列表
+            on_result: 可选的回调函数，每台设备的结果保存后以结果字典调用
+
+        返回:
+            PollReport
+        """
+        devices_by_id = {device.id: device for device in devices}
+        results, report = self.run([make_poll_target(device) for device in devices])
+
+        for result in results:
+            # 超时或出错的设备本轮不更新状态，等待下一轮重新采集
+            if result['status'] in ('ok', 'offline'):
+                save_poll_result(
+                    devices_by_id[result['device_id']],
+                    result['status'] == 'ok',
+                    result['interfaces'],
+                    result['resource_usage'],
+                    timestamp=result['timestamp'],
+                    sys_uptime=result.get('sys_uptime')
+                )
+            if on_result:
+                on_result(result)
+
+        logger.info(f"设备轮询完成: {report}")
+        if report.overrun:
+            logger.warning(f"本轮轮询耗时 {report.duration:.2f}s，超过轮询周期 {report.interval}s")
+        return report
+
+    def _shutdown_executor(self):
+        """关闭线程池，已发出的请求在超时后结束"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _init_worker(self):
+        """
+        线程池中每个线程的初始化：创建线程自己的SnmpEngine并注册UDP传输
+        会话池中的传输目标由所有线程共享，预先注册传输后pysnmp不会再通过共享的传输目标打开传输
+        """
+        engine_config.addTransport(self.pool.get_engine(), udp.domainName, udp.UdpTransport().openClientMode())
+
+    async def _poll_cycle(self, targets, report):
+        """执行一轮轮询"""
+        if self.backend == BACKEND_ASYNCIO:
+            if self._engine is None:
+                self._engine = SnmpEngine()
+        elif self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix='snmp-poller', initializer=self._init_worker
+            )
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self.pool.evict_idle()
+        return await asyncio.gather(*[
+            self._poll_with_deadline(self._engine, semaphore, target, report)
+            for target in targets
+        ])
+
+    async def _poll_with_deadline(self, engine, semaphore, target, report):
+        """在信号量和截止时间的约束下轮询单台设备"""
+        async with semaphore:
+            start = time.monotonic()
+            result = {
+                'device_id': target.device_id,
+                'status': 'error',
+                'interfaces': [],
+                'resource_usage': None,
+                'timestamp': datetime.utcnow(),
+                'error': None
+            }
+            try:
+                result.update(await asyncio.wait_for(
+                    self.poll_device(engine, target), self.device_deadline
+                ))
+            except asyncio.TimeoutError:
+                result['status'] = 'timeout'
+                device_health.record_failure(target.ip_address)
+                logger.warning(f"设备{target.ip_address}轮询超过截止时间 {self.device_deadline}s")
+            except Exception as e:
+                result['error'] = str(e)
+                logger.error(f"轮询设备{target.ip_address}时出错: {e}")
+            result['duration'] = time.monotonic() - start
+            if result['status'] != 'skipped':
+                poll_metrics.observe_device(target.ip_address, result['duration'], result['status'])
+            report.record(result)
+            return result
+
+    async def poll_device(self, engine, target):
+        """
+        采集单台设备的状态、接口流量和资源使用率
+
+        参数:
+            engine: asyncio方式下的SnmpEngine对象，线程池方式下为None（每个线程使用自己的引擎）
+            target: PollTarget
+
+        返回:
+            包含status、interfaces、resource_usage的字典
+        """
+        # 断路中的设备本轮跳过，等待退避时间结束
+        if not device_health.allow(target.ip_address):
+            return {'status': 'skipped'}
+
+        system = await self._get(engine, target, [OID_SYS_DESCR, OID_SYS_UPTIME])
+        if not system or system[0] is None:
+            return {'status': 'offline'}
+        sys_uptime = int(system[1]) if system[1] is not None else None
+
+        # 每台设备只探测一次是否支持64位计数器
+        family = counter_families.get(target.device_id)
+        if family is None:
+            family = await self._probe_counter_family(engine, target)
+            if family is not None:
+                counter_families.set(target.device_id, family)
+
+        rows = await self._walk_interfaces(engine, target, family, sys_uptime)
+
+        cpu_usage, mem_used, mem_free = await self._get(
+            engine, target, [OID_CISCO_CPU_5SEC, OID_CISCO_MEM_USED, OID_CISCO_MEM_FREE]
+        ) or (None, None, None)
+
+        return {
+            'status': 'ok',
+            'interfaces': build_interface_records(rows),
+            'resource_usage': build_resource_usage(cpu_usage, mem_used, mem_free),
+            'sys_uptime': sys_uptime,
+            'timestamp': datetime.utcnow()
+        }
+
+    async def _walk_interfaces(self, engine, target, family, sys_uptime):
+        """
+        遍历接口表，接口表没有变化时只遍历计数器列，静态列从接口清单缓存中获取
+
+        返回:
+            按ifIndex组织的表格行字典
+        """
+        last_change, if_number = interface_table_state(
+            await self._get(engine, target, [OID_IF_TABLE_LAST_CHANGE, OID_IF_NUMBER])
+        )
+        static_columns = interface_static_columns(family)
+        refresh = interface_inventory.needs_refresh(
+            target.device_id, static_columns, last_change, if_number, sys_uptime
+        )
+
+        rows = await self._walk_table(
+            engine, target, interface_columns(family) if refresh else interface_counter_columns(family)
+        )
+
+        if not refresh and not interface_inventory.merge(target.device_id, rows):
+            # 出现了缓存中没有的接口，补充遍历静态列
+            for index, row in (await self._walk_table(engine, target, static_columns)).items():
+                if index in rows:
+                    rows[index].update(row)
+            refresh = True
+
+        if refresh and rows:
+            interface_inventory.update(
+                target.device_id, rows, static_columns, last_change, if_number, sys_uptime
+            )
+        else:
+            interface_inventory.touch(target.device_id, sys_uptime)
+        return rows
+
+    async def _request(self, engine, command, auth_data, transport, oids, *args):
+        """
+        发送一个SNMP请求PDU并等待响应
+
+        参数:
+            engine: asyncio方式下的SnmpEngine对象
+            command: 请求类型（get、next、bulk）
+            auth_data: 认证数据
+            transport: 传输目标
+            oids: OID字符串或ObjectName列表
+            args: 变量绑定之前的参数（GETBULK的nonRepeaters和maxRepetitions）
+
+        返回:
+            (errorIndication, errorStatus, errorIndex, varBinds)，GETNEXT和GETBULK的varBinds为变量绑定行列表
+        """
+        if self.backend == BACKEND_ASYNCIO:
+            return await ASYNCIO_COMMANDS[command](
+                engine, auth_data, transport, ContextData(), *args, *self._object_types(oids), lookupMib=False
+            )
+        # 被截止时间取消时，线程中已发出的请求在超时后结束，后续请求不再发送
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._blocking_request, command, auth_data, transport, oids, args
+        )
+
+    def _blocking_request(self, command, auth_data, transport, oids, args):
+        """在线程池中用当前线程的SnmpEngine发送一个请求PDU，阻塞直到收到响应或超时"""
+        engine = self.pool.get_engine()
+        context = {}
+
+        def callback(snmp_engine, send_request_handle, error_indication, error_status, error_index,
+                     var_binds, cb_context):
+            # 不返回True，GETNEXT和GETBULK只发送一个PDU，由调用方决定是否继续遍历
+            cb_context['response'] = (error_indication, error_status, error_index, var_binds)
+
+        THREAD_COMMANDS[command](
+            engine, auth_data, transport, ContextData(), *args, *self._object_types(oids),
+            cbFun=callback, cbCtx=context, lookupMib=False
+        )
+        engine.transportDispatcher.runDispatcher()
+        return context['response']
+
+    def _object_types(self, oids):
+        """把OID转换为ObjectType，OID字符串使用会话池中当前线程缓存的已解析对象"""
+        return [self.pool.get_object_type(oid) if isinstance(oid, str) else ObjectType(ObjectIdentity(oid))
+                for oid in oids]
+
+    async def _get(self, engine, target, oids):
+        """
+        在一个GET请求中获取多个OID的值
+
+        返回:
+            与oids顺序对应的值列表（不存在的OID为None），请求失败时返回None
+        """
+        # 已知设备不支持的OID不再请求
+        requested = [oid for oid in oids if not device_health.is_unsupported(target.ip_address, oid)]
+        values = dict.fromkeys(oids)
+        if not requested:
+            return list(values.values())
+
+        auth_data, transport = self.pool.get_target(
+            target.ip_address, target.port, target.community, target.version
+        )
+        timer = poll_metrics.time_request(target.ip_address, 'get', requested[0])
+        try:
+            error_indication, error_status, error_index, var_binds = await self._request(
+                engine, 'get', auth_data, transport, requested
+            )
+            if error_indication:
+                timer.fail(error_indication)
+            timer.varbinds = len(var_binds)
+        except asyncio.CancelledError:
+            # 超过设备截止时间被取消
+            timer.fail('timeout')
+            raise
+        finally:
+            timer.stop()
+
+        if error_indication:
+            logger.debug(f"设备{target.ip_address} SNMP GET失败: {error_indication}")
+            device_health.record_failure(target.ip_address)
+            return None
+
+        device_health.record_success(target.ip_address)
+        if error_status:
+            # SNMPv1设备对不存在的OID返回noSuchName，记录后下次不再请求
+            if error_status.prettyPrint() == 'noSuchName' and error_index:
+                device_health.mark_unsupported(target.ip_address, requested[int(error_index) - 1])
+            logger.debug(f"设备{target.ip_address} SNMP GET失败: {error_status.prettyPrint()}")
+            return None
+
+        for oid, (_, value) in zip(requested, var_binds):
+            if isinstance(value, (NoSuchObject, NoSuchInstance, EndOfMibView)):
+                device_health.mark_unsupported(target.ip_address, oid)
+            else:
+                values[oid] = value
+        return list(values.values())
+
+    async def _probe_counter_family(self, engine, target):
+        """
+        探测设备是否支持ifXTable的64位计数器
+
+        返回:
+            计数器类型，探测失败时返回None
+        """
+        if target.version == '1':
+            return COUNTER_FAMILY_32
+
+        auth_data, transport = self.pool.get_target(
+            target.ip_address, target.port, target.community, target.version
+        )
+        timer = poll_metrics.time_request(target.ip_address, 'probe', OID_IF_HC_IN_OCTETS)
+        try:
+            error_indication, error_status, error_index, var_bind_table = await self._request(
+                engine, 'next', auth_data, transport, [OID_IF_HC_IN_OCTETS]
+            )
+            if error_indication:
+                timer.fail(error_indication)
+        except asyncio.CancelledError:
+            timer.fail('timeout')
+            raise
+        finally:
+            timer.stop()
+        if error_indication:
+            return None
+        if error_status or not var_bind_table:
+            return COUNTER_FAMILY_32
+        return counter_family_from_response(var_bind_table[0])
+
+    async def _walk_table(self, engine, target, columns):
+        """
+        一次遍历获取表格的多个列
+        SNMPv2c使用GETBULK，SNMPv1回退为多变量GETNEXT
+
+        返回:
+            按索引组织的表格行字典，出错时返回已获取的部分
+        """
+        rows = {}
+        var_binds = list(columns)
+        auth_data, transport = self.pool.get_target(
+            target.ip_address, target.port, target.community, target.version
+        )
+        timer = poll_metrics.time_request(target.ip_address, 'table', columns[0])
+        timer.pdus = 0
+
+        try:
+            while True:
+                timer.pdus += 1
+                if target.version == '1':
+                    error_indication, error_status, error_index, var_bind_table = await self._request(
+                        engine, 'next', auth_data, transport, var_binds
+                    )
+                else:
+                    error_indication, error_status, error_index, var_bind_table = await self._request(
+                        engine, 'bulk', auth_data, transport, var_binds, 0, self.max_repetitions
+                    )
+
+                if error_indication or error_status or not var_bind_table:
+                    # SNMPv1设备在子树末尾返回noSuchName，同样视为遍历结束
+                    if error_indication:
+                        logger.debug(f"设备{target.ip_address} 表格WALK出错: {error_indication}")
+                        timer.fail(error_indication)
+                        device_health.record_failure(target.ip_address)
+                    return rows
+
+                timer.varbinds += sum(len(var_bind_row) for var_bind_row in var_bind_table)
+                if not collect_table_rows(columns, var_bind_table, rows):
+                    return rows
+
+                # 从最后一行继续遍历
+                var_binds = [name for name, _ in var_bind_table[-1]]
+        except asyncio.CancelledError:
+            timer.fail('timeout')
+            raise
+        finally:
+            timer.stop()
+
+
+# 全局异步轮询引擎，多轮轮询之间复用引擎和传输目标缓存
+_async_poller = None
+_async_poller_lock = threading.Lock()
+
+
+def get_async_poller(concurrency=100, device_deadline=30.0, timeout=2.0, retries=1, interval=None,
+                     max_repetitions=SNMP_MAX_REPETITIONS):
+    """
+    获取全局异步轮询引擎，首次调用时创建
+
+    返回:
+        AsyncSnmpPoller
+    """
+    global _async_poller
+    with _async_poller_lock:
+        if _async_poller is None:
+            _async_poller = AsyncSnmpPoller(
+                concurrency=concurrency,
+                device_deadline=device_deadline,
+                timeout=timeout,
+                retries=retries,
+                interval=interval,
+                max_repetitions=max_repetitions
+            )
+        else:
+            _async_poller.configure(concurrency, device_deadline, interval, max_repetitions)
+        return _async_poller
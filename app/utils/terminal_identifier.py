@@ -14,6 +14,7 @@ from sqlalchemy import or_
 from app import db
 from app.models.terminal import Terminal
 from app.models.device import Device
+from app.utils.snmp_collector import snmp_walk, check_device_status
 
 # 尝试导入user-agents库，如果不存在则使用替代方案
 try:
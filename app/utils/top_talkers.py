@@ -0,0 +1,405 @@
+"""
+流量大户（Top Talkers）统计模块
+
+流量解码后原来只保留接口字节数，源/目的地址在汇总时全部丢弃，出现故障时无法回答“现在是谁在占用上行链路”。
+本模块用Space-Saving算法为每个接口、每个时间窗口维护固定容量的流量大户摘要，分别统计源IP、目的IP和
+（源IP, 目的IP, 目的端口）会话。内存只与接口数、窗口数和摘要容量有关，与流量中出现的地址数无关。
+
+摘要以NumPy数组保存，一批流记录整体合并：已跟踪的键直接累加；接口摘要已满时，新键的计数加上该接口
+原有的最小计数并以此作为误差上界；合并后每个接口只保留计数最大的capacity个键。这与逐条执行Space-Saving
+的误差保证相同，但每批记录只需要固定次数的NumPy调用。窗口每分钟轮换，查询时合并最近若干个窗口的摘要，
+不需要保存或查询原始流记录。目前只统计IPv4地址。
+"""
+
+import ipaddress
+import logging
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 统计维度
+DIMENSION_SRC = 'src'
+DIMENSION_DST = 'dst'
+DIMENSION_CONVERSATION = 'conversation'
+DIMENSIONS = (DIMENSION_SRC, DIMENSION_DST, DIMENSION_CONVERSATION)
+
+# 默认参数
+DEFAULT_CAPACITY = 64  # 每个接口、每个维度最多跟踪的条目数
+DEFAULT_WINDOW_SECONDS = 60  # 时间窗口长度（秒）
+DEFAULT_WINDOWS = 15  # 保留的时间窗口数
+
+# 键的编码：高64位为 端口(16位) << 32 | 地址(32位)，低64位为 接口(32位) << 32 | 会话的目的地址(32位)
+# v9/IPFIX的接口字段和sFlow的ifIndex为32位（如NX-OS、Junos的436207616），接口占用低64位的高32位
+INTERFACE_SHIFT = np.uint64(32)
+PORT_SHIFT = np.uint64(32)
+ADDRESS_MASK = np.uint64(0xFFFFFFFF)
+
+
+def _group(high, low, values, errors):
+    """
+    按（高位, 低位）键分组求和
+
+    返回:
+        (唯一的高位, 唯一的低位, 计数和, 误差和, inverse)
+    """
+    if not low.any():
+        # 只有高位时（源/目的地址维度且都是接口0）单列排序更快
+        unique_high, inverse = np.unique(high, return_inverse=True)
+        unique_low = np.zeros(len(unique_high), dtype=np.uint64)
+    else:
+        order = np.lexsort((low, high))
+        sorted_high, sorted_low = high[order], low[order]
+        starts = np.empty(len(order), dtype=bool)
+        starts[0] = True
+        starts[1:] = (sorted_high[1:] != sorted_high[:-1]) | (sorted_low[1:] != sorted_low[:-1])
+        unique_high, unique_low = sorted_high[starts], sorted_low[starts]
+        inverse = np.empty(len(order), dtype=np.intp)
+        inverse[order] = np.cumsum(starts) - 1
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, weights=values, minlength=len(unique_high))
+    error_sums = np.bincount(inverse, weights=errors, minlength=len(unique_high))
+    return unique_high, unique_low, counts, error_sums, inverse
+
+
+class SpaceSavingSketch:
+    """一个导出设备、一个维度的所有接口的Space-Saving摘要"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.high = np.zeros(0, dtype=np.uint64)
+        self.low = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.float64)
+        self.errors = np.zeros(0, dtype=np.float64)
+
+    def interfaces(self):
+        """摘要中每个条目所属的接口"""
+        return (self.low >> INTERFACE_SHIFT).astype(np.int64)
+
+    def update(self, high, low, counts, errors=None):
+        """
+        合并一批键
+
+        参数:
+            high: 键的高64位数组
+            low: 键的低64位数组（包含接口）
+            counts: 字节数数组，同一个键可以出现多次
+            errors: 误差数组，合并其他摘要时传入
+        """
+        if not len(high):
+            return
+        existing = len(self.high)
+        errors = np.zeros(len(high)) if errors is None else errors
+        high, low, counts, error_sums, inverse = _group(
+            np.concatenate([self.high, high]), np.concatenate([self.low, low]),
+            np.concatenate([self.counts, counts]), np.concatenate([self.errors, errors])
+        )
+        interfaces = (low >> INTERFACE_SHIFT).astype(np.int64)
+
+        # 接口摘要已满时，新键可能曾经被淘汰过，计数加上该接口原有的最小计数作为误差上界
+        if existing:
+            tracked = np.zeros(len(high), dtype=bool)
+            tracked[inverse[:existing]] = True
+            old_interfaces = self.interfaces()
+            order = np.lexsort((self.counts, old_interfaces))
+            old_ids, first, sizes = np.unique(old_interfaces[order], return_index=True, return_counts=True)
+            full = sizes >= self.capacity
+            if full.any():
+                full_ids, minimum = old_ids[full], self.counts[order][first[full]]
+                position = np.minimum(np.searchsorted(full_ids, interfaces), len(full_ids) - 1)
+                floor = np.where((full_ids[position] == interfaces) & ~tracked, minimum[position], 0.0)
+                counts += floor
+                error_sums += floor
+
+        # 每个接口只保留计数最大的capacity个键
+        order = np.lexsort((-counts, interfaces))
+        sorted_interfaces = interfaces[order]
+        starts = np.flatnonzero(np.r_[True, sorted_interfaces[1:] != sorted_interfaces[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        keep = order[rank < self.capacity]
+        self.high, self.low, self.counts, self.errors = high[keep], low[keep], counts[keep], error_sums[keep]
+
+    def merge(self, other):
+        """合并另一个摘要，计数和误差分别相加"""
+        self.update(other.high, other.low, other.counts, other.errors)
+        return self
+
+    def select(self, interface_id=None):
+        """
+        取出一个接口的条目（interface_id为None时取出所有接口的条目，并去掉接口合并相同的键）
+
+        返回:
+            (高位, 低位, 计数, 误差)，低位中不包含接口
+        """
+        if interface_id is None:
+            mask = np.ones(len(self.high), dtype=bool)
+        else:
+            mask = self.interfaces() == interface_id
+        return self.high[mask], self.low[mask] & ADDRESS_MASK, self.counts[mask], self.errors[mask]
+
+    def __len__(self):
+        return len(self.high)
+
+
+def _ipv4_to_int(address):
+    """将点分IPv4地址转换为整数，不是IPv4地址时返回None"""
+    if isinstance(address, int):
+        return address
+    try:
+        return struct.unpack('!I', socket.inet_aton(address))[0]
+    except (OSError, TypeError):
+        return None
+
+
+def _decode_key(dimension, high, low):
+    """将编码后的键转换为查询结果字段"""
+    address = str(ipaddress.IPv4Address(high & 0xFFFFFFFF))
+    if dimension == DIMENSION_CONVERSATION:
+        return {'src_addr': address, 'dst_addr': str(ipaddress.IPv4Address(low)), 'dst_port': (high >> 32) & 0xFFFF}
+    return {'src_addr' if dimension == DIMENSION_SRC else 'dst_addr': address}
+
+
+class TopTalkers:
+    """按导出设备、接口和时间窗口维护流量大户摘要"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, window_seconds=DEFAULT_WINDOW_SECONDS, windows=DEFAULT_WINDOWS):
+        """
+        参数:
+            capacity: 每个接口、每个维度最多跟踪的条目数
+            window_seconds: 时间窗口长度（秒）
+            windows: 保留的时间窗口数
+        """
+        self._lock = threading.Lock()
+        self.configure(capacity, window_seconds, windows)
+
+    def configure(self, capacity=DEFAULT_CAPACITY, window_seconds=DEFAULT_WINDOW_SECONDS, windows=DEFAULT_WINDOWS):
+        """修改参数并清空所有窗口"""
+        with self._lock:
+            self.capacity = capacity
+            self.window_seconds = window_seconds
+            self._windows = deque(maxlen=windows)  # [(窗口开始时间戳, {(导出设备, 维度): 摘要})]
+            self._totals = deque(maxlen=windows)  # [(窗口开始时间戳, {(导出设备, 接口): 字节数})]
+        return self
+
+    def _window(self, now):
+        """获取时间戳所在窗口的（摘要, 接口总字节数），新窗口开始时丢弃最旧的窗口，太旧的数据返回None"""
+        start = int(now // self.window_seconds) * self.window_seconds
+        for (window_start, sketches), (_, totals) in zip(reversed(self._windows), reversed(self._totals)):
+            if window_start == start:
+                return sketches, totals
+            if window_start < start:
+                break
+        if self._windows and start < self._windows[-1][0]:
+            # 迟到的数据所在的窗口已经被丢弃
+            return None
+        self._windows.append((start, {}))
+        self._totals.append((start, {}))
+        return self._windows[-1][1], self._totals[-1][1]
+
+    def observe_arrays(self, exporter, input_if, output_if, src_addr, dst_addr, dst_port, octets, now=None):
+        """
+        用NumPy数组形式的流记录更新摘要，每条流同时计入输入接口和输出接口
+
+        参数:
+            exporter: 导出设备IP
+            input_if, output_if, src_addr, dst_addr, dst_port: 整数数组
+            octets: 字节数数组
+            now: 流量的时间戳（秒），默认为time.time()
+        """
+        if not len(octets):
+            return
+        interfaces = np.concatenate([input_if, output_if]).astype(np.uint64) << INTERFACE_SHIFT
+        src = np.concatenate([src_addr, src_addr]).astype(np.uint64)
+        dst = np.concatenate([dst_addr, dst_addr]).astype(np.uint64)
+        ports = np.concatenate([dst_port, dst_port]).astype(np.uint64) << PORT_SHIFT
+        weights = np.concatenate([octets, octets]).astype(np.float64)
+
+        interface_ids, inverse = np.unique(np.concatenate([input_if, output_if]), return_inverse=True)
+        interface_bytes = np.bincount(inverse.reshape(-1), weights=weights)
+
+        with self._lock:
+            window = self._window(time.time() if now is None else now)
+            if window is None:
+                return
+            sketches, totals = window
+            for dimension, high, low in ((DIMENSION_SRC, src, interfaces),
+                                         (DIMENSION_DST, dst, interfaces),
+                                         (DIMENSION_CONVERSATION, ports | src, interfaces | dst)):
+                sketch = sketches.get((exporter, dimension))
+                if sketch is None:
+                    sketch = sketches[(exporter, dimension)] = SpaceSavingSketch(self.capacity)
+                sketch.update(high, low, weights)
+            for interface_id, total in zip(interface_ids.tolist(), interface_bytes.tolist()):
+                totals[(exporter, interface_id)] = totals.get((exporter, interface_id), 0) + int(total)
+
+    def observe_v5(self, exporter, records, now=None, scale=1):
+        """
+        用NetFlow v5记录数组更新摘要
+
+        参数:
+            exporter: 导出设备IP
+            records: decode_netflow_v5返回的记录数组
+            now: 流量的时间戳（秒），默认为time.time()
+            scale: 字节数的放大倍数，标量或逐条记录的数组
+        """
+        self.observe_arrays(exporter, records['input_if'], records['output_if'], records['src_addr'],
+                            records['dst_addr'], records['dst_port'], records['octets'].astype(np.float64) * scale, now)
+
+    def observe_flows(self, exporter, flows, now=None):
+        """
+        用流记录字典更新摘要（sFlow流样本、NetFlow v9/IPFIX记录），跳过不是IPv4地址的流
+
+        参数:
+            exporter: 导出设备IP
+            flows: 包含input_if、output_if、src_addr、dst_addr、dst_port和bytes的字典序列
+            now: 流量的时间戳（秒），默认为time.time()
+        """
+        rows = []
+        for flow in flows:
+            src, dst = _ipv4_to_int(flow.get('src_addr')), _ipv4_to_int(flow.get('dst_addr'))
+            if src is None or dst is None or not flow.get('bytes'):
+                continue
+            rows.append((flow.get('input_if') or 0, flow.get('output_if') or 0, src, dst,
+                         flow.get('dst_port') or 0, flow['bytes']))
+        if rows:
+            columns = np.array(rows, dtype=np.float64).T
+            self.observe_arrays(exporter, *(column.astype(np.uint64) for column in columns[:5]), columns[5], now)
+
+    def observe_template(self, exporter, template, records, now=None, scale=1):
+        """
+        用NetFlow v9/IPFIX数据记录更新摘要，模板中没有IPv4地址、接口或字节数字段时跳过
+
+        参数:
+            exporter: 导出设备IP
+            template: 记录所属的模板
+            records: 记录元组列表
+            now: 流量的时间戳（秒），默认为time.time()
+            scale: 字节数的放大倍数，标量或逐条记录的列表
+        """
+        positions = template.positions
+        bytes_name = 'in_bytes' if 'in_bytes' in positions else 'total_bytes'
+        names = ('input_if', 'output_if', 'src_addr', 'dst_addr', 'dst_port', bytes_name)
+        if not records or any(name not in positions for name in names):
+            return
+        indexes = [positions[name] for name in names]
+        columns = np.array([[record[index] for index in indexes] for record in records], dtype=np.float64).T
+        octets = columns[5] * np.asarray(scale, dtype=np.float64)
+        self.observe_arrays(exporter, *(column.astype(np.uint64) for column in columns[:5]), octets, now)
+
+    def query(self, exporter, interface_id=None, dimension=DIMENSION_SRC, windows=1, limit=10, now=None):
+        """
+        查询最近若干个窗口的流量大户
+
+        参数:
+            exporter: 导出设备IP
+            interface_id: 接口索引，为None时合并设备的所有接口
+            dimension: 统计维度
+            windows: 合并的窗口数（包括当前窗口）
+            limit: 返回的条目数
+            now: 当前时间戳（秒），默认为time.time()
+
+        返回:
+            {'window_start', 'window_end', 'total_bytes', 'talkers': [{地址字段, 'bytes', 'error'}]}，
+            bytes是估计值，真实值不小于bytes - error
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"不支持的统计维度: {dimension}")
+        now = time.time() if now is None else now
+        end = (int(now // self.window_seconds) + 1) * self.window_seconds
+        start = end - windows * self.window_seconds
+
+        parts, total_bytes = [], 0
+        with self._lock:
+            for (window_start, sketches), (_, totals) in zip(self._windows, self._totals):
+                if not start <= window_start < end:
+                    continue
+                sketch = sketches.get((exporter, dimension))
+                if sketch is not None:
+                    parts.append(sketch.select(interface_id))
+                total_bytes += sum(total for (total_exporter, total_interface), total in totals.items()
+                                   if total_exporter == exporter and interface_id in (None, total_interface))
+
+        talkers = []
+        if parts:
+            high, low, counts, errors = (np.concatenate(column) for column in zip(*parts))
+            if len(high):
+                high, low, counts, errors, _ = _group(high, low, counts, errors)
+                for index in np.argsort(-counts, kind='stable')[:limit].tolist():
+                    talker = _decode_key(dimension, int(high[index]), int(low[index]))
+                    talker.update(bytes=int(counts[index]), error=int(errors[index]))
+                    talkers.append(talker)
+        return {
+            'exporter': exporter,
+            'interface_id': interface_id,
+            'dimension': dimension,
+            'window_start': start,
+            'window_end': end,
+            'total_bytes': total_bytes,
+            'talkers': talkers
+        }
+
+    def interfaces(self):
+        """获取保留窗口中出现过的（导出设备, 接口）"""
+        with self._lock:
+            return sorted({key for _, totals in self._totals for key in totals})
+
+    def drain(self):
+        """
+        取出并清空所有窗口，多进程模式下由收集进程发送给父进程
+
+        返回:
+            [(窗口开始时间戳, 摘要字典, 接口总字节数字典)]
+        """
+        with self._lock:
+            windows = [(start, sketches, totals)
+                       for (start, sketches), (_, totals) in zip(self._windows, self._totals)]
+            self._windows.clear()
+            self._totals.clear()
+        return windows
+
+    def merge_windows(self, windows):
+        """
+        合并drain()取出的窗口
+
+        参数:
+            windows: [(窗口开始时间戳, 摘要字典, 接口总字节数字典)]
+        """
+        with self._lock:
+            for window_start, sketches, totals in windows:
+                window = self._window(window_start)
+                if window is None:
+                    continue
+                target_sketches, target_totals = window
+                for key, sketch in sketches.items():
+                    existing = target_sketches.get(key)
+                    if existing is None:
+                        target_sketches[key] = sketch
+                    else:
+                        existing.merge(sketch)
+                for key, total in totals.items():
+                    target_totals[key] = target_totals.get(key, 0) + total
+
+
+# 全局流量大户统计实例
+top_talkers = TopTalkers()
+
+
+def init_top_talkers(config=None):
+    """
+    按配置设置流量大户统计参数
+
+    参数:
+        config: 应用配置，读取TOP_TALKERS_CAPACITY、TOP_TALKERS_WINDOW_SECONDS和TOP_TALKERS_WINDOWS
+    """
+    config = config or {}
+    return top_talkers.configure(
+        capacity=config.get('TOP_TALKERS_CAPACITY', DEFAULT_CAPACITY),
+        window_seconds=config.get('TOP_TALKERS_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS),
+        windows=config.get('TOP_TALKERS_WINDOWS', DEFAULT_WINDOWS)
+    )
@@ -65,6 +65,9 @@ def collect_device_traffic(device):
             out_errors=out_errors,
             bandwidth=bandwidth,
             utilization=utilization,
+            in_rate=in_rate,
+            out_rate=out_rate,
+            interval=5,
             timestamp=datetime.utcnow()
         )
         
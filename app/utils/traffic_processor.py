@@ -38,11 +38,14 @@ def process_traffic_stats():
         
         for device in devices:
             # 按小时计算统计数据
+            # 优先使用采集时已算好的速率，旧记录仍按5秒字节数换算为bps
+            in_rate = func.coalesce(Traffic.in_rate, Traffic.in_octets * 8 / 5)
+            out_rate = func.coalesce(Traffic.out_rate, Traffic.out_octets * 8 / 5)
             hour_stats = db.session.query(
-                func.avg(Traffic.in_octets * 8 / 5).label('avg_in_rate'),  # 转换为bps
-                func.avg(Traffic.out_octets * 8 / 5).label('avg_out_rate'),  # 转换为bps
-                func.max(Traffic.in_octets * 8 / 5).label('max_in_rate'),  # 转换为bps
-                func.max(Traffic.out_octets * 8 / 5).label('max_out_rate'),  # 转换为bps
+                func.avg(in_rate).label('avg_in_rate'),
+                func.avg(out_rate).label('avg_out_rate'),
+                func.max(in_rate).label('max_in_rate'),
+                func.max(out_rate).label('max_out_rate'),
                 func.avg(Traffic.utilization).label('avg_utilization')
             ).filter(
                 Traffic.device_id == device.id,
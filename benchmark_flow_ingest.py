@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+"""
+流量采集性能测试工具
+测量收集器每秒能处理的流记录数、解码延迟、内核丢包和写入存储的端到端延迟
+
+合成导出设备与generate_all_data.py生成的校园网一致：核心路由器导出NetFlow v5，
+各区域汇聚交换机导出NetFlow v9，接入交换机导出IPFIX，无线AP导出sFlow；
+流记录的源/目的地址取自各网段的终端，字节数按终端类型的流量范围生成。
+发送进程按指定速率把预先编码的数据报发往本机的收集器，汇总周期写入SQLite（默认内存库），
+提交时记录每个周期从结束到写入完成的延迟。
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+# 校园网区域和网段，与generate_all_data.py一致
+CAMPUS_AREAS = [
+    ("行政楼", ["192.168.1.0/24"]),
+    ("教学楼A", ["192.168.2.0/24", "192.168.3.0/24"]),
+    ("教学楼B", ["192.168.4.0/24", "192.168.5.0/24"]),
+    ("图书馆", ["192.168.6.0/24"]),
+    ("学生宿舍1区", ["192.168.7.0/24", "192.168.8.0/24"]),
+    ("学生宿舍2区", ["192.168.9.0/24", "192.168.10.0/24"]),
+    ("食堂", ["192.168.11.0/24"]),
+    ("体育馆", ["192.168.12.0/24"]),
+    ("科研楼", ["192.168.13.0/24", "192.168.14.0/24"]),
+]
+
+# 终端类型及每小时的入/出流量范围（字节），与generate_all_data.py一致
+TERMINAL_TYPES = [
+    ("PC", (5000000, 50000000), (2000000, 20000000)),
+    ("笔记本", (3000000, 30000000), (1000000, 10000000)),
+    ("手机", (1000000, 10000000), (500000, 5000000)),
+    ("平板", (1000000, 10000000), (500000, 5000000)),
+    ("服务器", (5000000, 50000000), (2000000, 20000000)),
+]
+
+# 每个终端每小时的流数，用于把每小时流量折算为单条流的字节数
+FLOWS_PER_HOUR = 200
+
+# 终端访问的外部服务器和端口，少数服务器承载大部分流量
+SERVER_COUNT = 64
+SERVICE_PORTS = np.array([443, 443, 443, 80, 80, 53, 8080, 22, 3389, 1935], dtype=np.uint16)
+
+# 各协议每个数据报的记录数
+V5_RECORDS = 30
+V9_RECORDS = 50
+SFLOW_SAMPLES = 8
+
+# v9/IPFIX模板：src_addr, dst_addr, src_port, dst_port, protocol, in_bytes, in_pkts, input_if, output_if
+TEMPLATE_ID = 256
+TEMPLATE_FIELDS = [(8, 4), (12, 4), (7, 2), (11, 2), (4, 1), (1, 4), (2, 4), (10, 2), (14, 2)]
+TEMPLATE_DTYPE = np.dtype([
+    ('src_addr', '>u4'), ('dst_addr', '>u4'), ('src_port', '>u2'), ('dst_port', '>u2'), ('protocol', 'u1'),
+    ('in_bytes', '>u4'), ('in_pkts', '>u4'), ('input_if', '>u2'), ('output_if', '>u2'),
+])
+
+# 合成流记录
+FLOW_DTYPE = np.dtype([
+    ('src_addr', 'u4'), ('dst_addr', 'u4'), ('src_port', 'u2'), ('dst_port', 'u2'), ('protocol', 'u1'),
+    ('octets', 'u4'), ('packets', 'u4'), ('input_if', 'u2'), ('output_if', 'u2'),
+])
+
+PROTOCOLS = ('v5', 'v9', 'ipfix', 'sflow')
+
+
+def ip_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+
+def build_exporters(terminal_count, protocols, rng):
+    """
+    按generate_all_data.py的拓扑构建合成导出设备和终端
+
+    参数:
+        terminal_count: 终端数
+        protocols: 启用的协议
+        rng: 随机数生成器
+
+    返回:
+        导出设备列表 [{'name', 'ip', 'protocol', 'domain', 'terminals', 'types', 'ports'}]
+    """
+    subnets = [(area, subnet.split('/')[0].rsplit('.', 1)[0]) for area, area_subnets in CAMPUS_AREAS
+               for subnet in area_subnets]
+    # 终端随机分布在各网段，主机号避开接入交换机(.1)和AP(.200+)
+    subnet_index = rng.integers(0, len(subnets), terminal_count)
+    hosts = rng.integers(2, 200, terminal_count)
+    addresses = np.array([ip_to_int(f"{subnets[s][1]}.{h}") for s, h in zip(subnet_index, hosts)], dtype=np.uint32)
+    types = rng.integers(0, len(TERMINAL_TYPES), terminal_count)
+
+    def exporter(name, ip, protocol, domain, mask, ports):
+        return {'name': name, 'ip': ip, 'protocol': protocol, 'domain': domain,
+                'terminals': addresses[mask], 'types': types[mask], 'ports': ports[mask]}
+
+    exporters = []
+    everyone = np.ones(terminal_count, dtype=bool)
+    area_names = [area for area, _ in CAMPUS_AREAS]
+    area_index = np.array([area_names.index(subnets[s][0]) for s in subnet_index])
+    # 核心路由器：上联口1，下联各汇聚交换机
+    exporters.append(exporter("核心路由器", "10.0.0.1", 'v5', 0, everyone, area_index + 2))
+    for i, area in enumerate(area_names):
+        # 汇聚交换机：上联口1，下联各接入交换机
+        mask = area_index == i
+        exporters.append(exporter(f"{area}汇聚交换机", f"10.0.0.{i + 10}", 'v9', i + 10, mask,
+                                  subnet_index + 2))
+    for s, (area, prefix) in enumerate(subnets):
+        # 接入交换机：上联口1，终端接在2-25口；AP：上联口1，无线口2
+        mask = subnet_index == s
+        exporters.append(exporter(f"{area}接入交换机", f"{prefix}.1", 'ipfix', s + 100, mask, hosts % 24 + 2))
+        for k in range(1 + s % 2):
+            ap_mask = mask & (hosts % 2 == k)
+            exporters.append(exporter(f"{area}无线AP{k + 1}", f"{prefix}.{200 + k}", 'sflow', 0, ap_mask,
+                                      np.full(terminal_count, 2)))
+    return [item for item in exporters if item['protocol'] in protocols and len(item['terminals'])]
+
+
+def generate_flows(exporter, count, rng):
+    """
+    为一台导出设备生成合成流记录，七成为下载、三成为上传
+
+    返回:
+        FLOW_DTYPE结构化数组
+    """
+    picks = rng.integers(0, len(exporter['terminals']), count)
+    terminals = exporter['terminals'][picks]
+    kinds = exporter['types'][picks]
+    ports = exporter['ports'][picks]
+    in_low, in_high = (np.array([TERMINAL_TYPES[k][1][i] for k in range(len(TERMINAL_TYPES))])[kinds] for i in (0, 1))
+    out_low, out_high = (np.array([TERMINAL_TYPES[k][2][i] for k in range(len(TERMINAL_TYPES))])[kinds] for i in (0, 1))
+
+    download = rng.random(count) < 0.7
+    octets = np.where(download, rng.uniform(in_low, in_high), rng.uniform(out_low, out_high)) / FLOWS_PER_HOUR
+    servers = ip_to_int('202.112.0.0') + (rng.zipf(1.3, count) % SERVER_COUNT)
+    service = SERVICE_PORTS[rng.integers(0, len(SERVICE_PORTS), count)]
+    ephemeral = rng.integers(49152, 65535, count)
+
+    flows = np.zeros(count, dtype=FLOW_DTYPE)
+    flows['src_addr'] = np.where(download, servers, terminals)
+    flows['dst_addr'] = np.where(download, terminals, servers)
+    flows['src_port'] = np.where(download, service, ephemeral)
+    flows['dst_port'] = np.where(download, ephemeral, service)
+    flows['protocol'] = np.where(service == 53, 17, 6)
+    flows['octets'] = np.maximum(octets, 64)
+    flows['packets'] = np.maximum(flows['octets'] // 1000, 1)
+    flows['input_if'] = np.where(download, 1, ports)
+    flows['output_if'] = np.where(download, ports, 1)
+    return flows
+
+
+def flow_set(set_id, body):
+    """构建一个FlowSet，按4字节对齐填充"""
+    padding = (-len(body) - 4) % 4
+    return struct.pack('!HH', set_id, len(body) + 4 + padding) + body + b'\x00' * padding
+
+
+def template_set(set_id):
+    body = struct.pack('!HH', TEMPLATE_ID, len(TEMPLATE_FIELDS))
+    body += b''.join(struct.pack('!HH', field_type, length) for field_type, length in TEMPLATE_FIELDS)
+    return flow_set(set_id, body)
+
+
+def encode_v5(flows, sequence):
+    """编码一个NetFlow v5数据报"""
+    from app.utils.netflow_v5 import NETFLOW_V5_HEADER, NETFLOW_V5_DTYPE
+
+    records = np.zeros(len(flows), dtype=NETFLOW_V5_DTYPE)
+    for name in ('src_addr', 'dst_addr', 'src_port', 'dst_port', 'protocol', 'octets', 'packets',
+                 'input_if', 'output_if'):
+        records[name] = flows[name]
+    header = NETFLOW_V5_HEADER.pack(5, len(flows), 1000, int(time.time()), 0, sequence, 0, 0, 0)
+    return header + records.tobytes()
+
+
+def encode_template_records(flows):
+    records = np.zeros(len(flows), dtype=TEMPLATE_DTYPE)
+    for name in TEMPLATE_DTYPE.names:
+        records[name] = flows['octets' if name == 'in_bytes' else 'packets' if name == 'in_pkts' else name]
+    return records.tobytes()
+
+
+def encode_v9(flows, sequence, source_id, with_template):
+    """编码一个NetFlow v9数据报，with_template为True时在数据前附带模板"""
+    sets = [template_set(0)] if with_template else []
+    sets.append(flow_set(TEMPLATE_ID, encode_template_records(flows)))
+    return struct.pack('!HHIIII', 9, len(sets), 1000, int(time.time()), sequence, source_id) + b''.join(sets)
+
+
+def encode_ipfix(flows, sequence, domain, with_template):
+    """编码一个IPFIX消息，with_template为True时在数据前附带模板"""
+    sets = [template_set(2)] if with_template else []
+    sets.append(flow_set(TEMPLATE_ID, encode_template_records(flows)))
+    body = b''.join(sets)
+    return struct.pack('!HHIII', 10, 16 + len(body), int(time.time()), sequence, domain) + body
+
+
+def sflow_record(record_type, body):
+    return struct.pack('!II', record_type, len(body)) + body
+
+
+def encode_sflow(flows, sequence, agent, sampling_rate, rng):
+    """
+    编码一个sFlow数据报：每条流记录对应一个流样本（以太网+IPv4+TCP/UDP报头），另附一个接口计数器样本
+
+    返回:
+        (数据报, 收集器放大后的字节数)
+    """
+    from app.utils.sflow import GENERIC_INTERFACE
+
+    samples = []
+    frames = rng.integers(64, 1519, len(flows))
+    for flow, frame_length in zip(flows, frames.tolist()):
+        ethernet = b'\x00' * 12 + struct.pack('!H', 0x0800)
+        ip = struct.pack('!BBHHHBBHII', 0x45, 0, frame_length - 14, 0, 0, 64, int(flow['protocol']), 0,
+                         int(flow['src_addr']), int(flow['dst_addr']))
+        transport = struct.pack('!HH', int(flow['src_port']), int(flow['dst_port'])) + b'\x00' * 16
+        header = ethernet + ip + transport
+        raw = struct.pack('!IIII', 1, frame_length, 4, len(header)) + header
+        body = struct.pack('!IIIIIIII', sequence, int(flow['input_if']), sampling_rate, sequence * sampling_rate, 0,
+                           int(flow['input_if']), int(flow['output_if']), 1) + sflow_record(1, raw)
+        samples.append(sflow_record(1, body))
+    counters = GENERIC_INTERFACE.pack(1, 6, 1000000000, 1, 3, sequence * 1000, sequence, 0, 0, 0, 1,
+                                      0, sequence * 800, sequence, 0, 0, 0, 2, 0)
+    samples.append(sflow_record(2, struct.pack('!III', sequence, 1, 1) + sflow_record(1, counters)))
+    datagram = (struct.pack('!II4sIIII', 5, 1, socket.inet_aton(agent), 0, sequence, sequence * 1000, len(samples))
+                + b''.join(samples))
+    return datagram, int(frames.sum()) * sampling_rate
+
+
+def build_datagrams(exporters, count, sampling_rate, template_interval, rng):
+    """
+    预先编码合成数据报，各导出设备轮流发送
+
+    参数:
+        exporters: build_exporters()返回的导出设备
+        count: 数据报总数
+        sampling_rate: sFlow采样率
+        template_interval: v9/IPFIX每隔多少个数据报重发一次模板
+        rng: 随机数生成器
+
+    返回:
+        [(协议, 数据报, 记录数, 应入库的入方向字节数)]
+    """
+    datagrams = []
+    sequences = [0] * len(exporters)
+    for index in range(count):
+        position = index % len(exporters)
+        exporter = exporters[position]
+        sequence = sequences[position]
+        sequences[position] += 1
+        protocol = exporter['protocol']
+        if protocol == 'v5':
+            flows = generate_flows(exporter, V5_RECORDS, rng)
+            data, octets = encode_v5(flows, sequence * V5_RECORDS), int(flows['octets'].sum())
+        elif protocol in ('v9', 'ipfix'):
+            flows = generate_flows(exporter, V9_RECORDS, rng)
+            encode = encode_v9 if protocol == 'v9' else encode_ipfix
+            data = encode(flows, sequence, exporter['domain'], sequence % template_interval == 0)
+            octets = int(flows['octets'].sum())
+        else:
+            flows = generate_flows(exporter, SFLOW_SAMPLES, rng)
+            data, octets = encode_sflow(flows, sequence + 1, exporter['ip'], sampling_rate, rng)
+        datagrams.append((protocol, data, len(flows), octets))
+    return datagrams
+
+
+def sender_worker(datagrams, ports, rate, duration, barrier, results):
+    """
+    发送进程：按速率循环发送预先编码的数据报
+
+    参数:
+        datagrams: [(协议, 数据报, 记录数, 字节数)]
+        ports: {'netflow': 端口, 'sflow': 端口}
+        rate: 每秒数据报数，0表示不限速
+        duration: 发送时长（秒）
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    targets = [('127.0.0.1', ports['sflow' if protocol == 'sflow' else 'netflow']) for protocol, _, _, _ in datagrams]
+    payloads = [data for _, data, _, _ in datagrams]
+    total = len(payloads)
+    counts = [0] * total
+    errors = 0
+
+    barrier.wait()
+    start = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            break
+        # 按1毫秒的节拍补齐到目标数量，避免逐个数据报sleep
+        target = int(rate * elapsed) + 1 if rate else sent + 256
+        while sent < target:
+            position = sent % total
+            try:
+                sock.sendto(payloads[position], targets[position])
+                counts[position] += 1
+            except OSError:
+                errors += 1
+            sent += 1
+        if rate:
+            time.sleep(0.001)
+    sock.close()
+    results.put((counts, errors, time.perf_counter() - start))
+
+
+class TimedSession:
+    """包装数据库会话，提交时记录各汇总周期从结束到写入完成的延迟"""
+
+    def __init__(self, session, bucket_seconds):
+        self.session = session
+        self.bucket_seconds = bucket_seconds
+        self.lags = []
+        self.rows = 0
+        self.in_octets = 0
+        self._pending = []
+
+    def bulk_insert_mappings(self, mapper, rows):
+        self._pending = rows
+        self.session.bulk_insert_mappings(mapper, rows)
+
+    def commit(self):
+        self.session.commit()
+        now = time.time()
+        buckets = {row['timestamp'].timestamp() for row in self._pending}
+        self.lags.extend(now - (bucket + self.bucket_seconds) for bucket in buckets)
+        self.rows += len(self._pending)
+        self.in_octets += sum(row['in_octets'] for row in self._pending)
+        self._pending = []
+
+    def rollback(self):
+        self._pending = []
+        self.session.rollback()
+
+
+def open_storage(url, bucket_seconds):
+    """创建存储会话，默认使用SQLite内存库"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.models.traffic import Traffic
+
+    engine = create_engine(url, connect_args={'check_same_thread': False}, poolclass=StaticPool) \
+        if url.startswith('sqlite') else create_engine(url)
+    # 外键不生效，直接创建流量表即可
+    Traffic.__table__.create(engine, checkfirst=True)
+    return TimedSession(sessionmaker(bind=engine)(), bucket_seconds)
+
+
+def latency_quantiles(histograms, quantiles=(0.5, 0.95, 0.99)):
+    """
+    合并多个Histogram.to_dict()的累计桶并估算分位数（返回所在桶的上限）
+
+    返回:
+        {分位数: 秒}
+    """
+    merged = {}
+    maximum = 0.0
+    for histogram in histograms:
+        maximum = max(maximum, histogram['max'])
+        for bound, cumulative in histogram['buckets']:
+            merged[bound] = merged.get(bound, 0) + cumulative
+    bounds = list(merged)
+    total = merged[bounds[-1]] if bounds else 0
+    result = {}
+    for q in quantiles:
+        result[q] = 0.0
+        for bound in bounds:
+            if total and merged[bound] >= q * total:
+                result[q] = maximum if bound == '+Inf' else bound
+                break
+    return result
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(args):
+    """执行一次测试并打印结果"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.utils.flow_collector import NetFlowCollector, SFlowCollector, DeviceAddressMap
+
+    rng = np.random.default_rng(args.seed)
+    protocols = [protocol.strip() for protocol in args.protocols.split(',') if protocol.strip()]
+    exporters = build_exporters(args.terminals, protocols, rng)
+    if not exporters:
+        print("没有可用的导出设备，请检查--protocols")
+        return
+    datagrams = build_datagrams(exporters, args.pool, args.sflow_rate, args.template_interval, rng)
+    mix = {protocol: sum(1 for item in exporters if item['protocol'] == protocol) for protocol in protocols}
+    print(f"合成导出设备: {len(exporters)} 台 {mix}，终端 {args.terminals} 个，预编码数据报 {len(datagrams)} 个")
+
+    # 收集器与存储：所有NetFlow导出设备从127.0.0.1发出，sFlow按代理地址区分
+    storage = open_storage(args.database, args.bucket)
+    address_map = DeviceAddressMap(loader=lambda: [('127.0.0.1', 1)] + [
+        (item['ip'], index + 2) for index, item in enumerate(exporters) if item['protocol'] == 'sflow'])
+    ports = {'netflow': free_port(), 'sflow': free_port()}
+    collectors = {
+        'netflow': NetFlowCollector('127.0.0.1', ports['netflow'], db_session=storage),
+        'sflow': SFlowCollector('127.0.0.1', ports['sflow'], db_session=storage),
+    }
+    options = {'rcvbuf': args.rcvbuf, 'slots': args.slots, 'workers': args.workers, 'batch_size': args.batch_size}
+    for collector in collectors.values():
+        collector.bucket_seconds = args.bucket
+        collector.device_map = address_map
+
+    pool = None
+    if args.processes > 1:
+        from app.utils.flow_workers import FlowCollectorPool
+        from app.utils.sflow import SFlowCounterStore
+        from app.utils.top_talkers import TopTalkers
+
+        pool_options = dict(options, listen_ip='127.0.0.1', netflow_port=ports['netflow'], sflow_port=ports['sflow'])
+        pool = FlowCollectorPool(args.processes, pool_options, netflow_collector=collectors['netflow'],
+                                 sflow_collector=collectors['sflow'], counter_store=SFlowCounterStore(),
+                                 talkers=TopTalkers()).start()
+    else:
+        for collector in collectors.values():
+            collector.configure(**options).start()
+
+    # 写入线程按节拍关闭已结束的汇总周期，与FLOW_FLUSH_INTERVAL定时任务的做法一致
+    stop_flush = threading.Event()
+
+    def flush_loop():
+        while not stop_flush.wait(args.flush_interval):
+            for collector in collectors.values():
+                collector.flush()
+
+    flusher = threading.Thread(target=flush_loop, name='benchmark-flush', daemon=True)
+    flusher.start()
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.senders + 1)
+    results = context.Queue()
+    senders = [
+        context.Process(target=sender_worker,
+                        args=(datagrams[index::args.senders], ports, args.rate / args.senders, args.duration,
+                              barrier, results))
+        for index in range(args.senders)
+    ]
+    for sender in senders:
+        sender.start()
+    barrier.wait()
+    start = time.perf_counter()
+    sender_results = [results.get() for _ in senders]
+    send_elapsed = max(elapsed for _, _, elapsed in sender_results)
+    for sender in senders:
+        sender.join()
+
+    def ingest_stats():
+        if pool is not None:
+            return pool.stats()
+        return {name: collector.ingest_stats() for name, collector in collectors.items()}
+
+    # 等待接收环中剩余的数据报解码完成
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        stats = ingest_stats()
+        if pool is not None:
+            # 收集进程每FORWARD_INTERVAL上报一次，等待最后一次上报
+            time.sleep(1.5)
+            stats = ingest_stats()
+        if all(item['backlog'] == 0 for item in stats.values()):
+            break
+        time.sleep(0.05)
+    decode_elapsed = time.perf_counter() - start
+
+    # 等待最后一个汇总周期结束并写入
+    deadline = time.monotonic() + args.bucket + args.flush_interval + 10
+    while time.monotonic() < deadline:
+        if all(not collector.cache and not collector._closed for collector in collectors.values()):
+            break
+        time.sleep(0.05)
+    stop_flush.set()
+    flusher.join()
+    if pool is not None:
+        pool.stop()
+    else:
+        for collector in collectors.values():
+            collector.stop()
+
+    # 汇总结果
+    sent = {}
+    for index, (counts, _, _) in enumerate(sender_results):
+        for position, count in enumerate(counts):
+            protocol, _, records, octets = datagrams[index + position * args.senders]
+            entry = sent.setdefault(protocol, [0, 0, 0])
+            entry[0] += count
+            entry[1] += count * records
+            entry[2] += count * octets
+    send_errors = sum(errors for _, errors, _ in sender_results)
+    sent_datagrams = sum(entry[0] for entry in sent.values())
+
+    decoded_records = 0
+    for name in collectors:
+        kinds = ['sflow'] if name == 'sflow' else ['v5', 'v9', 'ipfix']
+        datagram_count = sum(sent.get(kind, [0])[0] for kind in kinds)
+        record_count = sum(sent.get(kind, [0, 0])[1] for kind in kinds)
+        decoded = sum(item['decoded'] for key, item in stats.items() if key.split('/')[0] == name)
+        if datagram_count:
+            decoded_records += decoded * record_count / datagram_count
+    totals = {key: sum(item[key] or 0 for item in stats.values())
+              for key in ('received', 'decoded', 'decode_errors', 'ring_full', 'kernel_drops')}
+    quantiles = latency_quantiles([item['decode_latency'] for item in stats.values()])
+    expected_octets = sum(entry[2] for entry in sent.values())
+
+    print(f"发送: {sent_datagrams} 个数据报，{sent_datagrams / send_elapsed:.0f} 数据报/秒，发送错误 {send_errors}")
+    for protocol, (count, records, _) in sorted(sent.items()):
+        print(f"       {protocol:<6} {count:>9} 个数据报 {records:>10} 条记录")
+    print(f"接收: {totals['received']} 个数据报，解码 {totals['decoded']}，解码错误 {totals['decode_errors']}")
+    print(f"吞吐: {decoded_records / decode_elapsed:>10.0f} 记录/秒（解码完成耗时 {decode_elapsed:.2f}s）")
+    print(f"解码延迟: p50 {quantiles[0.5] * 1000:.1f}ms  p95 {quantiles[0.95] * 1000:.1f}ms  "
+          f"p99 {quantiles[0.99] * 1000:.1f}ms")
+    lost = sent_datagrams - totals['received']
+    print(f"丢包: 内核丢包 {totals['kernel_drops']}  未收到 {lost} ({lost / max(sent_datagrams, 1):.2%})  "
+          f"环满等待 {totals['ring_full']}")
+    if storage.lags:
+        lags = np.array(storage.lags)
+        print(f"入库延迟: {storage.rows} 行，周期结束到提交 p50 {np.percentile(lags, 50):.2f}s  "
+              f"p95 {np.percentile(lags, 95):.2f}s  最大 {lags.max():.2f}s")
+    print(f"入库完整性: 入方向字节 {storage.in_octets} / {expected_octets} "
+          f"({storage.in_octets / max(expected_octets, 1):.2%})")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='流量采集性能测试工具')
+    parser.add_argument('--rate', type=float, default=5000, help='每秒发送的数据报数，0表示不限速')
+    parser.add_argument('--duration', type=float, default=10, help='发送时长（秒）')
+    parser.add_argument('--senders', type=int, default=1, help='发送进程数')
+    parser.add_argument('--protocols', default=','.join(PROTOCOLS), help='启用的协议，逗号分隔（v5,v9,ipfix,sflow）')
+    parser.add_argument('--terminals', type=int, default=2000, help='合成终端数')
+    parser.add_argument('--pool', type=int, default=2048, help='预编码的数据报数，发送时循环使用')
+    parser.add_argument('--sflow-rate', type=int, default=512, help='sFlow采样率')
+    parser.add_argument('--template-interval', type=int, default=20, help='v9/IPFIX每隔多少个数据报重发模板')
+    parser.add_argument('--processes', type=int, default=1, help='收集进程数，大于1时使用SO_REUSEPORT多进程模式')
+    parser.add_argument('--workers', type=int, default=None, help='每个收集器的解码线程数')
+    parser.add_argument('--slots', type=int, default=None, help='接收环槽位数')
+    parser.add_argument('--batch-size', type=int, default=None, help='解码线程每次最多取出的数据报数')
+    parser.add_argument('--rcvbuf', type=int, default=None, help='套接字接收缓冲区（字节）')
+    parser.add_argument('--bucket', type=int, default=5, help='接口流量汇总周期（秒）')
+    parser.add_argument('--flush-interval', type=float, default=1, help='写入已结束汇总周期的节拍（秒）')
+    parser.add_argument('--database', default='sqlite://', help='存储的数据库URL，默认为SQLite内存库')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    args = parser.parse_args()
+
+    print(f"CPU核心数: {os.cpu_count()}")
+    print(f"发送速率: {'不限速' if not args.rate else f'{args.rate:.0f} 数据报/秒'}，时长 {args.duration}s，"
+          f"收集进程 {args.processes}")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
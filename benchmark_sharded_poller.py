@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+分片轮询性能测试工具
+测量不同工作进程数下每秒能处理的设备数
+
+默认使用合成数据：每台设备的ifTable GETBULK响应预先编码为BER报文，工作进程对其解码、
+组装接口表、计算计数器增量并构建Traffic对象，即轮询中受GIL限制的CPU部分。
+使用--live时通过ShardedPoller轮询数据库中的真实设备。
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+
+def build_response_message(interfaces):
+    """
+    构建一台设备的ifTable GETBULK响应报文（BER编码）
+
+    参数:
+        interfaces: 接口数
+
+    返回:
+        (编码后的报文, 列OID列表)
+    """
+    from pyasn1.codec.ber import encoder
+    from pysnmp.proto import api
+    from pysnmp.proto.rfc1902 import ObjectName, OctetString, Counter32, Gauge32, Integer
+    from app.utils.snmp_collector import INTERFACE_TRAFFIC_COLUMNS, OID_IF_DESCR, OID_IF_SPEED, OID_IF_OPER_STATUS
+
+    p_mod = api.protoModules[api.protoVersion2c]
+    var_binds = []
+    for index in range(1, interfaces + 1):
+        for column in INTERFACE_TRAFFIC_COLUMNS:
+            if column == OID_IF_DESCR:
+                value = OctetString(f'GigabitEthernet0/{index}')
+            elif column == OID_IF_SPEED:
+                value = Gauge32(1000000000)
+            elif column == OID_IF_OPER_STATUS:
+                value = Integer(1)
+            else:
+                value = Counter32(index * 1000003 % 4294967295)
+            var_binds.append((ObjectName(f'{column}.{index}'), value))
+
+    pdu = p_mod.GetResponsePDU()
+    p_mod.apiPDU.setDefaults(pdu)
+    p_mod.apiPDU.setVarBinds(pdu, var_binds)
+    message = p_mod.Message()
+    p_mod.apiMessage.setDefaults(message)
+    p_mod.apiMessage.setCommunity(message, 'public')
+    p_mod.apiMessage.setPDU(message, pdu)
+    return encoder.encode(message), list(INTERFACE_TRAFFIC_COLUMNS)
+
+
+def process_device(device_id, message, columns, store, timestamp):
+    """
+    处理一台设备的轮询响应：解码、组装接口表、计算增量并构建Traffic对象
+
+    返回:
+        构建的Traffic对象数
+    """
+    from pyasn1.codec.ber import decoder
+    from pysnmp.proto import api
+    from app.models.traffic import Traffic
+    from app.utils.snmp_collector import build_interface_records, collect_table_rows
+
+    p_mod = api.protoModules[api.protoVersion2c]
+    decoded, _ = decoder.decode(message, asn1Spec=p_mod.Message())
+    var_binds = p_mod.apiPDU.getVarBinds(p_mod.apiMessage.getPDU(decoded))
+
+    width = len(columns)
+    table = [var_binds[i:i + width] for i in range(0, len(var_binds), width)]
+    rows = {}
+    collect_table_rows(columns, table, rows)
+    interfaces = build_interface_records(rows)
+    store.apply(device_id, interfaces, timestamp)
+
+    traffics = [
+        Traffic(device_id=device_id, interface=data['interface'], in_octets=data['in_octets'],
+                out_octets=data['out_octets'], bandwidth=data['bandwidth'], utilization=data['utilization'],
+                in_rate=data['in_rate'], out_rate=data['out_rate'])
+        for data in interfaces
+    ]
+    return len(traffics)
+
+
+def synthetic_worker(shard, shard_count, device_count, interfaces, rounds, barrier, results):
+    """合成数据测试的工作进程"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.utils.counter_state import CounterStateStore
+    from app.utils.sharded_poller import shard_for
+
+    message, columns = build_response_message(interfaces)
+    device_ids = [device_id for device_id in range(1, device_count + 1)
+                  if shard_for(device_id, shard_count) == shard]
+    store = CounterStateStore()
+
+    barrier.wait()
+    start = time.perf_counter()
+    processed = 0
+    for round_index in range(rounds):
+        for device_id in device_ids:
+            process_device(device_id, message, columns, store, 1000.0 + round_index * 300)
+            processed += 1
+    results.put((shard, processed, time.perf_counter() - start))
+
+
+def run_synthetic(workers, device_count, interfaces, rounds):
+    """
+    使用合成数据测试指定工作进程数的吞吐量
+
+    返回:
+        每秒处理的设备数
+    """
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=synthetic_worker,
+                        args=(shard, workers, device_count, interfaces, rounds, barrier, results))
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # 所有工作进程完成初始化后同时开始计时
+    barrier.wait()
+    start = time.perf_counter()
+    shard_results = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    processed = sum(count for _, count, _ in shard_results)
+    sizes = sorted(count // rounds for _, count, _ in shard_results)
+    print(f"{workers:>4} 个进程: {processed / elapsed:>10.1f} 设备/秒  "
+          f"耗时 {elapsed:.2f}s  分片大小 {sizes[0]}-{sizes[-1]}")
+    return processed / elapsed
+
+
+def run_live(workers, config_name):
+    """
+    使用数据库中的真实设备测试指定工作进程数的吞吐量
+
+    返回:
+        每秒轮询的设备数
+    """
+    from app.utils.sharded_poller import ShardedPoller, COMMAND_POLL
+
+    poller = ShardedPoller(workers, config_name).start()
+    try:
+        summary = poller.run(COMMAND_POLL)
+    finally:
+        poller.close()
+    print(f"{workers:>4} 个进程: {summary['devices_per_second']:>10.1f} 设备/秒  "
+          f"耗时 {summary['duration']:.2f}s  设备 {summary['devices']}  "
+          f"成功 {summary['succeeded']}  超时 {summary['timed_out']}")
+    return summary['devices_per_second']
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='分片轮询性能测试工具')
+    parser.add_argument('--workers', default='1,2,4,8,16', help='要测试的工作进程数，逗号分隔')
+    parser.add_argument('--devices', type=int, default=2000, help='合成设备数')
+    parser.add_argument('--interfaces', type=int, default=48, help='每台合成设备的接口数')
+    parser.add_argument('--rounds', type=int, default=3, help='合成数据的轮询轮数')
+    parser.add_argument('--live', action='store_true', help='轮询数据库中的真实设备')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG', 'development'), help='应用配置名称')
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(',') if count.strip()]
+    print(f"CPU核心数: {os.cpu_count()}")
+    if args.live:
+        print("轮询数据库中的真实设备")
+    else:
+        print(f"合成数据: {args.devices} 台设备 x {args.interfaces} 个接口 x {args.rounds} 轮")
+
+    baseline = None
+    for workers in worker_counts:
+        if args.live:
+            rate = run_live(workers, args.config)
+        else:
+            rate = run_synthetic(workers, args.devices, args.interfaces, args.rounds)
+        baseline = baseline or rate
+        if baseline:
+            print(f"       相对{worker_counts[0]}个进程的加速比: {rate / baseline:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
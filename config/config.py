@@ -30,6 +30,52 @@ class Config:
     SNMP_VERSION = 2  # SNMP版本，1或2c
     SNMP_RETRIES = 3  # 重试次数
     SNMP_TIMEOUT = 1  # 超时时间（秒）
+    SNMP_POLL_INTERVAL = 300  # 设备轮询周期（秒）
+    SNMP_POLL_CONCURRENCY = int(os.environ.get('SNMP_POLL_CONCURRENCY', '200'))  # 同时轮询的最大设备数
+    SNMP_DEVICE_DEADLINE = int(os.environ.get('SNMP_DEVICE_DEADLINE', '30'))  # 单台设备采集截止时间（秒）
+    SNMP_MAX_REPETITIONS = 25  # GETBULK每次请求返回的最大行数
+    SNMP_ADAPTIVE_POLLING = True  # 按设备独立周期轮询，False时每5分钟集中轮询所有设备
+    SNMP_SCHEDULER_TICK = 10  # 轮询调度节拍（秒）
+    SNMP_POLL_ROLE_INTERVALS = {'router': 60, 'firewall': 60, 'switch': 300, 'ap': 600}  # 各设备类型的轮询周期上限（秒）
+    SNMP_POLL_MIN_INTERVAL = 30  # 流量波动时的最短轮询周期（秒）
+    SNMP_POLL_JITTER = 0.1  # 轮询时间的随机抖动比例
+    SNMP_POLL_MAX_BATCH = None  # 每个节拍最多轮询的设备数
+    SNMP_POLL_WORKERS = int(os.environ.get('SNMP_POLL_WORKERS', '0'))  # 分片轮询的工作进程数，0或1时在调度器进程内轮询
+    SNMP_FAILURE_THRESHOLD = 3  # 设备连续失败多少次后暂停采集
+    SNMP_BACKOFF_BASE = 60  # 暂停采集的初始时间（秒），之后按指数退避
+    SNMP_BACKOFF_MAX = 3600  # 暂停采集的最长时间（秒）
+    COUNTER_STATE_PATH = os.path.join(basedir, 'instance', 'counter_state.json')  # 接口计数器状态文件
+    INTERFACE_INVENTORY_PATH = os.path.join(basedir, 'instance', 'interface_inventory.json')  # 接口清单缓存文件
+    
+    # NetFlow/sFlow配置
+    SFLOW_COUNTER_POLLING = True  # 有sFlow计数器样本的设备使用样本代替SNMP轮询
+    SFLOW_COUNTER_MAX_AGE = 120  # sFlow计数器样本的有效期（秒），超过后恢复SNMP轮询
+    FLOW_RCVBUF = 32 * 1024 * 1024  # 流量采集套接字的接收缓冲区（字节）
+    FLOW_RING_SLOTS = 4096  # 接收环形缓冲区的槽位数
+    FLOW_DECODE_WORKERS = 2  # 每个收集器的解码线程数
+    FLOW_DECODE_BATCH = 64  # 解码线程每次最多处理的数据报数
+    FLOW_COLLECTOR_PROCESSES = int(os.environ.get('FLOW_COLLECTOR_PROCESSES', '0'))  # 用SO_REUSEPORT绑定同一端口的收集进程数，0或1时在应用进程内收集
+    FLOW_BUCKET_SECONDS = 300  # 接口流量的汇总周期（秒），按墙上时间对齐
+    FLOW_FLUSH_INTERVAL = 10  # 检查并批量写入已结束汇总周期的间隔（秒）
+    FLOW_DEVICE_MAP_TTL = 300  # 导出设备IP到设备ID映射的有效期（秒）
+    TOP_TALKERS_ENABLED = True  # 按接口统计流量大户（源IP、目的IP和会话）
+    TOP_TALKERS_CAPACITY = 64  # 每个接口、每个维度最多跟踪的条目数
+    TOP_TALKERS_WINDOW_SECONDS = 60  # 流量大户统计窗口（秒）
+    TOP_TALKERS_WINDOWS = 15  # 保留的统计窗口数
+    FLOW_SPOOL_ENABLED = False  # 把解码后的原始流记录追加写入磁盘分段，用于事后排查
+    FLOW_SPOOL_PATH = os.path.join(basedir, 'instance', 'flow_spool')  # 流记录分段目录
+    FLOW_SPOOL_SEGMENT_BYTES = 256 * 1024 * 1024  # 单个分段的大小上限（字节）
+    FLOW_SPOOL_PARTITION_SECONDS = 3600  # 分段的时间分区长度（秒）
+    FLOW_SPOOL_INDEX_INTERVAL = 10  # 分段时间索引的间隔（秒）
+    FLOW_SPOOL_RETENTION = 7 * 24 * 3600  # 分段保留时间（秒）
+    PIPELINE_WORKERS = 3  # 数据处理流水线的工作线程数
+    PIPELINE_BATCH_SIZE = 200  # 工作线程每批最多取出的数据数，整批通过各处理器并一次批量写入
+    PIPELINE_BATCH_WAIT_MS = 50  # 凑满一批的最长等待时间（毫秒）
+    PIPELINE_QUEUE_SIZE = 10000  # 流水线队列容量，数据库变慢时队列不再无限增长
+    PIPELINE_QUEUE_POLICY = os.environ.get('PIPELINE_QUEUE_POLICY', 'block')  # 队列满时的策略：block、drop_oldest、priority或coalesce
+    PIPELINE_BLOCK_TIMEOUT = 1.0  # block策略下提交数据的最长等待时间（秒），超时后丢弃新数据
+    PIPELINE_PROCESSES = int(os.environ.get('PIPELINE_PROCESSES', '0'))  # 流水线进程池的进程数，0时所有处理器都在工作线程中执行
+    PIPELINE_PROCESS_STAGES = ['AnomalyDetector', 'TrafficFeatureAnalyzer']  # 进程池启用时放到进程池执行的处理器
     
     # 流量监控配置
     TRAFFIC_MONITOR_INTERVAL = 60  # 数据采集间隔（秒）
@@ -38,6 +84,16 @@ class Config:
     # 异常检测配置
     ANOMALY_DETECTION_INTERVAL = 300  # 异常检测间隔（秒）
     ANOMALY_DETECTION_WINDOW = 24 * 60 * 60  # 异常检测时间窗口（秒）
+    ANOMALY_BASELINE_PATH = os.path.join(basedir, 'instance', 'anomaly_baselines.npz')  # 流量基线快照文件，进程池分片使用各自的文件
+    ANOMALY_BASELINE_MAX_SOURCES = 100000  # 最多保存基线的数据源数，超过时淘汰最久未更新的数据源
+    ANOMALY_BASELINE_TTL = 24 * 3600  # 超过该时间没有样本的数据源基线被淘汰（秒）
+    ANOMALY_BASELINE_SNAPSHOT_INTERVAL = 300  # 流量基线快照的保存间隔（秒）
+    ANOMALY_DETECTOR = os.environ.get('ANOMALY_DETECTOR', 'zscore')  # 动态基线的检测方法：zscore（最近24个样本）或seasonal（一周中同一小时的历史画像）
+    ANOMALY_SEASONAL_PATH = os.path.join(basedir, 'instance', 'seasonal_profiles.npz')  # 同时段流量画像文件，进程池中的检测器共享
+    ANOMALY_SEASONAL_WEEKS = 4  # 建立同时段画像使用的历史周数
+    ANOMALY_SEASONAL_MIN_SAMPLES = 3  # 时段至少有该数量的样本才按画像检测，否则按最近的样本检测
+    ANOMALY_SEASONAL_REBUILD_HOURS = 24  # 重新建立同时段画像的间隔（小时）
+    ANOMALY_SEASONAL_TIMEZONE = os.environ.get('ANOMALY_SEASONAL_TIMEZONE', '')  # 计算同时段使用的时区（如Asia/Shanghai），为空时使用服务器本地时区；流量记录的时间为UTC
     
     @staticmethod
     def init_app(app):
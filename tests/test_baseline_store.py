@@ -0,0 +1,79 @@
+"""
+流量基线存储测试脚本
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.baseline_store import BaselineStore
+from app.utils.data_processor import AnomalyDetector
+
+
+def sample(source_id, in_rate):
+    return {'source_id': source_id, 'calculated': True, 'metrics': {'in_rate': in_rate}}
+
+
+class TestBaselineStore(unittest.TestCase):
+    """流量基线存储测试类"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_window_statistics_match_numpy(self):
+        """测试增量维护的均值和标准差与最近N个值的np.mean/np.std一致，大数值的常量序列标准差为0"""
+        store = BaselineStore(window=25)
+        rng = np.random.default_rng(3)
+        values = rng.normal(5e8, 1e7, 200)
+        for index, value in enumerate(values):
+            mean, std, count = store.update('a', value, now=1000.0)
+            window = values[max(0, index - 24):index + 1]
+            self.assertEqual(count, len(window))
+            self.assertAlmostEqual(mean, window.mean(), delta=1e-3)
+            self.assertAlmostEqual(std, window.std(), delta=1e-3)
+
+        for _ in range(60):
+            mean, std, _ = store.update('b', 1234567890.5, now=1000.0)
+        self.assertEqual((mean, std), (1234567890.5, 0.0))
+
+    def test_ttl_and_lru_eviction(self):
+        """测试空闲超过TTL的数据源被淘汰，数据源数不超过上限，数组不再增长"""
+        store = BaselineStore(max_sources=100, ttl=60)
+        for index in range(1000):
+            store.update(index, 1.0, now=1000.0)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store.to_dict()['capacity'], 100)
+        self.assertEqual(store.evictions['lru'], 900)
+        self.assertIsNone(store.get(0))
+        self.assertEqual(store.get(999)['count'], 1)
+
+        store.update('late', 1.0, now=1100.0)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.evictions['ttl'], 100)
+
+    def test_snapshot_restores_detector_baselines(self):
+        """测试检测器关闭时保存快照，重启后基线不从零开始，第一个突增样本就能检测到"""
+        path = os.path.join(self.directory, 'baselines.npz')
+        detector = AnomalyDetector({'path': path})
+        for index in range(30):
+            detector._detect(sample('10.0.0.1:3', 100 + index % 3))
+        detector.close()
+
+        restarted = AnomalyDetector({'path': path})
+        self.assertEqual(restarted.baselines.get('10.0.0.1:3')['count'], 25)
+        data = restarted._detect(sample('10.0.0.1:3', 5000))
+        self.assertEqual([anomaly['type'] for anomaly in data['anomalies']], ['baseline'])
+
+
+if __name__ == '__main__':
+    unittest.main()
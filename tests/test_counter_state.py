@@ -0,0 +1,116 @@
+"""
+接口计数器状态测试脚本
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.counter_state import CounterStateStore, COUNTER_BITS_HC, counter_delta
+from app.utils.sflow import SFLOW_COUNTER_BITS
+
+
+def make_interface(in_octets, out_octets, bandwidth=1000000000, bits=32):
+    return {
+        'if_index': '1',
+        'interface': 'Gi0/1',
+        'in_octets': in_octets,
+        'out_octets': out_octets,
+        'in_packets': 0,
+        'out_packets': 0,
+        'in_errors': 0,
+        'out_errors': 0,
+        'bandwidth': bandwidth,
+        'counter_bits': bits,
+        'status': 'up'
+    }
+
+
+class TestCounterState(unittest.TestCase):
+    """计数器状态测试类"""
+
+    def test_counter_delta_wrap(self):
+        """测试32位和64位计数器回绕"""
+        self.assertEqual(counter_delta(100, 250), 150)
+        self.assertEqual(counter_delta(2 ** 32 - 10, 5), 15)
+        self.assertEqual(counter_delta(2 ** 64 - 1, 1, bits=64), 2)
+
+    def test_rate_between_polls(self):
+        """测试两次轮询之间的速率计算"""
+        store = CounterStateStore()
+        first = store.apply(1, [make_interface(1000, 2000)], 1000.0, sys_uptime=10000)
+        self.assertIsNone(first[0]['in_rate'])
+
+        second = store.apply(1, [make_interface(1000 + 375000, 2000 + 750000)], 1300.0, sys_uptime=40000)
+        interface = second[0]
+        self.assertEqual(interface['interval'], 300)
+        self.assertEqual(interface['in_octets'], 375000)
+        self.assertAlmostEqual(interface['in_rate'], 10000.0)
+        self.assertAlmostEqual(interface['out_rate'], 20000.0)
+        self.assertAlmostEqual(interface['utilization'], 0.002)
+
+    def test_reboot_resets_baseline(self):
+        """测试sysUpTime回退时丢弃本周期"""
+        store = CounterStateStore()
+        store.apply(1, [make_interface(5000000, 5000000)], 1000.0, sys_uptime=900000)
+        result = store.apply(1, [make_interface(100, 100)], 1300.0, sys_uptime=3000)
+        self.assertIsNone(result[0]['in_rate'])
+
+        # 重启后的下一次轮询恢复正常
+        result = store.apply(1, [make_interface(30100, 100)], 1600.0, sys_uptime=33000)
+        self.assertAlmostEqual(result[0]['in_rate'], 800.0)
+
+    def test_implausible_rate_discarded(self):
+        """测试速率超过带宽时丢弃本周期"""
+        store = CounterStateStore()
+        store.apply(1, [make_interface(0, 0, bandwidth=10000000)], 1000.0)
+        result = store.apply(1, [make_interface(2 ** 31, 0, bandwidth=10000000)], 1300.0)
+        self.assertIsNone(result[0]['in_rate'])
+
+    def test_persistence(self):
+        """测试状态保存后重新加载"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'counter_state.json')
+            now = time.time()
+            store = CounterStateStore(path)
+            store.apply(7, [make_interface(1000, 1000)], now)
+            self.assertTrue(store.save())
+
+            restored = CounterStateStore(path)
+            self.assertEqual(restored.load(), 1)
+            result = restored.apply(7, [make_interface(1000 + 3750, 1000)], now + 300)
+            self.assertAlmostEqual(result[0]['in_rate'], 100.0)
+
+    def test_per_field_counter_bits(self):
+        """测试64位字节计数器的接口上32位包数和错误数回绕时按各自的位数计算增量"""
+        for bits in (SFLOW_COUNTER_BITS, COUNTER_BITS_HC):
+            store = CounterStateStore()
+            before = dict(make_interface(2 ** 40, 2 ** 40, bits=bits), in_packets=2 ** 32 - 100,
+                          in_errors=2 ** 32 - 1)
+            store.apply(1, [before], 1000.0)
+            after = dict(make_interface(2 ** 40 + 3750, 2 ** 40, bits=bits), in_packets=20, in_errors=4)
+            interface = store.apply(1, [after], 1300.0)[0]
+            self.assertEqual(interface['in_octets'], 3750)
+            self.assertEqual(interface['in_errors'], 5)
+            if bits is SFLOW_COUNTER_BITS:
+                self.assertEqual(interface['in_packets'], 120)
+
+        # 字节计数器在64位处回绕
+        store = CounterStateStore()
+        store.apply(1, [make_interface(2 ** 64 - 10, 0, bits=SFLOW_COUNTER_BITS)], 1000.0)
+        interface = store.apply(1, [make_interface(30, 0, bits=SFLOW_COUNTER_BITS)], 1300.0)[0]
+        self.assertEqual(interface['in_octets'], 40)
+
+        # 旧版本状态文件中的整数位数与按字段的位数不同，重新建立基线
+        store = CounterStateStore()
+        store.apply(1, [make_interface(1000, 0, bits=64)], 1000.0)
+        self.assertIsNone(store.apply(1, [make_interface(2000, 0, bits=COUNTER_BITS_HC)], 1300.0)[0]['in_rate'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+流量汇总周期定时写入测试脚本
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.flow_collector import NetFlowCollector, DeviceAddressMap, MAX_FLUSH_RETRIES
+
+
+class FakeSession:
+    """记录批量插入的数据库会话"""
+
+    def __init__(self, failures=0):
+        self.inserts = []
+        self.commits = 0
+        self.failures = failures  # 前N次批量插入抛出异常
+
+    def bulk_insert_mappings(self, model, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        self.inserts.append(list(rows))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class TestFlowFlush(unittest.TestCase):
+    """流量汇总周期定时写入测试类"""
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.loads = 0
+
+        def loader():
+            self.loads += 1
+            return [('10.0.0.1', 7)]
+
+        self.collector = NetFlowCollector(db_session=self.session)
+        self.collector.device_map = DeviceAddressMap(ttl=300, loader=loader)
+
+    def test_buckets_close_on_wall_clock(self):
+        """测试周期按墙上时间关闭，空闲接口写入后从缓存中删除"""
+        collector = self.collector
+        collector._record_interface_traffic('10.0.0.1', 3, 1000, 0, now=1200.0)
+        collector._record_interface_traffic('10.0.0.1', 3, 500, 2000, now=1450.0)
+        collector._record_interface_traffic('10.0.0.1', 4, 300, 0, now=1490.0)
+
+        # 周期尚未结束时不写入
+        self.assertEqual(collector.flush(now=1499.0), 0)
+        self.assertEqual(len(collector.cache), 2)
+
+        # 没有新的流量，周期结束后也会写入，所有接口一次批量插入
+        self.assertEqual(collector.flush(now=1500.0), 2)
+        self.assertEqual(self.session.commits, 1)
+        rows = {row['interface']: row for row in self.session.inserts[0]}
+        self.assertEqual((rows['ifIndex3']['in_octets'], rows['ifIndex3']['out_octets']), (1500, 2000))
+        self.assertEqual(rows['ifIndex3']['device_id'], 7)
+        self.assertEqual(rows['ifIndex3']['interval'], 300)
+        self.assertEqual(rows['ifIndex3']['timestamp'], datetime(1970, 1, 1, 0, 20))
+        self.assertAlmostEqual(rows['ifIndex4']['in_rate'], 300 * 8 / 300)
+        self.assertEqual(collector.cache, {})
+
+    def test_late_records_start_new_bucket(self):
+        """测试新周期的数据到达时上一个周期移入待写入列表"""
+        collector = self.collector
+        collector._record_interface_traffic('10.0.0.1', 3, 1000, 0, now=1200.0)
+        collector._record_interface_traffic('10.0.0.1', 3, 50, 0, now=1510.0)
+        self.assertEqual(collector.flush(now=1511.0), 1)
+        self.assertEqual(self.session.inserts[0][0]['in_octets'], 1000)
+        self.assertEqual(collector.cache['10.0.0.1:3'], (1500, 50, 0))
+
+    def test_unknown_exporter_skipped_without_per_row_queries(self):
+        """测试设备映射只加载一次，未知导出设备的数据被跳过"""
+        collector = self.collector
+        for interface_id in range(1, 6):
+            collector._record_interface_traffic('10.0.0.1', interface_id, 100, 100, now=1200.0)
+        collector._record_interface_traffic('10.9.9.9', 1, 100, 100, now=1200.0)
+        self.assertEqual(collector.flush(now=1500.0), 5)
+        self.assertEqual(collector.flush_stats['unknown_exporter'], 1)
+        self.assertEqual(self.loads, 1)
+
+    def test_failed_flush_is_retried(self):
+        """测试写入失败的周期在下一个节拍重试，超过重试次数后才丢弃"""
+        collector = self.collector
+        self.session.failures = 2
+        collector._record_interface_traffic('10.0.0.1', 3, 1000, 0, now=1200.0)
+        self.assertEqual(collector.flush(now=1500.0), 0)
+        self.assertEqual(collector.flush(now=1510.0), 0)
+        collector._record_interface_traffic('10.0.0.1', 3, 70, 0, now=1520.0)
+        self.assertEqual(collector.flush(now=1800.0), 2)
+        self.assertEqual(sorted(row['in_octets'] for row in self.session.inserts[0]), [70, 1000])
+        self.assertEqual((collector.flush_stats['retried'], collector.flush_stats['failed']), (2, 0))
+        self.assertEqual(collector._flush_attempts, {})
+
+        self.session.failures = MAX_FLUSH_RETRIES + 1
+        collector._record_interface_traffic('10.0.0.1', 3, 5, 0, now=1900.0)
+        for tick in range(MAX_FLUSH_RETRIES + 1):
+            self.assertEqual(collector.flush(now=2100.0 + tick), 0)
+        self.assertEqual(collector.flush_stats['failed'], 1)
+        self.assertEqual(collector._closed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+流量采样率放大测试脚本
+"""
+
+import os
+import struct
+import sys
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.flow_collector import NetFlowCollector
+from app.utils.flow_sampling import decode_v5_sampling, options_sampling_rate, sampling_registry
+from app.utils.netflow_v9 import NetFlowV9Decoder, aggregate_interface_bytes
+from tests.test_netflow_v5 import v5_packet
+from tests.test_netflow_v9 import TEMPLATE_FIELDS, RECORDS, flow_set, template_set, data_set, v9_packet
+
+
+def sampled_v5_packet(records, sampling_interval):
+    packet = bytearray(v5_packet(records))
+    struct.pack_into('!H', packet, 22, sampling_interval)
+    return bytes(packet)
+
+
+class TestFlowSampling(unittest.TestCase):
+    """流量采样率放大测试类"""
+
+    def test_decode_v5_sampling_interval(self):
+        """测试v5包头的采样模式位和采样间隔"""
+        self.assertEqual(decode_v5_sampling(0), ('none', 1))
+        self.assertEqual(decode_v5_sampling((1 << 14) | 100), ('deterministic', 100))
+        self.assertEqual(decode_v5_sampling((2 << 14) | 1000), ('random', 1000))
+        self.assertEqual(options_sampling_rate({'sampling_packet_interval': 1, 'sampling_packet_space': 99}), 100)
+        self.assertIsNone(options_sampling_rate({'sampling_algorithm': 2}))
+
+    def test_v5_bytes_scaled_per_datagram(self):
+        """测试同一批中采样率不同的v5数据报分别放大，并登记导出设备的采样模式"""
+        collector = NetFlowCollector()
+        collector._process_packets([
+            (sampled_v5_packet([(1, 2, 3, 4, 1000)], (2 << 14) | 100), '10.0.0.1'),
+            (sampled_v5_packet([(1, 2, 3, 4, 10)], (2 << 14) | 1000), '10.0.0.1'),
+            (sampled_v5_packet([(1, 2, 3, 4, 10)], 0), '10.0.0.2'),
+        ])
+        self.assertEqual(collector.cache['10.0.0.1:3'][1], 1000 * 100 + 10 * 1000)
+        self.assertEqual(collector.cache['10.0.0.2:3'][1], 10)
+        self.assertEqual(sampling_registry.get('10.0.0.1')['mode'], 'random')
+        self.assertEqual(sampling_registry.rate('10.0.0.1'), 1000)
+
+    def test_v9_options_and_sampler_ids(self):
+        """测试v9按导出设备的选项数据放大，带sampler_id的记录按各自采样器放大"""
+        decoder = NetFlowV9Decoder()
+        # 选项模板：范围字段为接口，选项字段为sampler_id(48，1字节)和sampler_random_interval(50，4字节)
+        options_template = flow_set(1, struct.pack('!HHH', 300, 4, 8) + struct.pack('!HHHHHH', 2, 4, 48, 1, 50, 4))
+        options = flow_set(300, struct.pack('!IBI', 1, 1, 100) + struct.pack('!IBI', 1, 2, 10))
+        decoder.decode(v9_packet(7, options_template, options), '192.168.1.1')
+
+        template, records = decoder.decode(
+            v9_packet(7, template_set(0, 256, TEMPLATE_FIELDS), data_set(256, RECORDS)), '192.168.1.1')[0]
+        scale, source = decoder.sampling_scale('192.168.1.1', template, records)
+        self.assertEqual((scale, source), (10, 'v9_options'))
+        in_totals, _ = aggregate_interface_bytes(template, records, scale)
+        self.assertEqual(in_totals, {1: 15000, 2: 2000})
+
+        # 数据记录带sampler_id时逐条查找采样器
+        fields = TEMPLATE_FIELDS[:-1] + [(48, 1)]
+        template, records = decoder.decode(v9_packet(7, template_set(0, 257, fields), flow_set(
+            257, b''.join(struct.pack('!IIIIHH3sB', *record[:-1], sampler)
+                          for record, sampler in zip(RECORDS, (1, 2, 2))))), '192.168.1.1')[0]
+        scale, _ = decoder.sampling_scale('192.168.1.1', template, records)
+        self.assertEqual(scale, [100, 10, 10])
+        self.assertEqual(aggregate_interface_bytes(template, records, scale)[0], {1: 105000, 2: 2000})
+
+        # 没有采样信息的导出设备不放大
+        template, records = decoder.decode(
+            v9_packet(7, template_set(0, 256, TEMPLATE_FIELDS), data_set(256, RECORDS)), '192.168.1.2')[0]
+        self.assertEqual(decoder.sampling_scale('192.168.1.2', template, records), (1, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+多进程流量收集测试脚本
+"""
+
+import os
+import socket
+import sys
+import time
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.flow_collector import NetFlowCollector, SFlowCollector
+from app.utils.flow_workers import ForwardingAggregator, FlowCollectorPool
+from app.utils.sflow import SFlowCounterStore
+from tests.test_netflow_v5 import v5_packet, random_records, reference_totals
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestFlowWorkers(unittest.TestCase):
+    """多进程流量收集测试类"""
+
+    def test_forwarding_collector_aggregates_locally(self):
+        """测试设置本地汇总器后接口流量不写入本进程的缓存，合并后进入父进程收集器"""
+        aggregator = ForwardingAggregator()
+        child = NetFlowCollector()
+        child.forward = aggregator
+        records = random_records(30)
+        child._process_packets([(v5_packet(records), '10.0.0.1'), (v5_packet(records), '10.0.0.1')])
+        self.assertEqual(child.cache, {})
+
+        parent = NetFlowCollector()
+        store = SFlowCounterStore()
+        pool = FlowCollectorPool(2, netflow_collector=parent, sflow_collector=SFlowCollector(), counter_store=store)
+        aggregator.counters('10.0.0.9', [{'if_index': 1}], 1000)
+        pool.merge(*aggregator.drain())
+
+        in_totals, _ = reference_totals(records)
+        for interface_id, octets in in_totals.items():
+            self.assertEqual(parent.cache[f'10.0.0.1:{interface_id}'][1], 2 * octets)
+        self.assertEqual(store.agents(), ['10.0.0.9'])
+        self.assertEqual(aggregator.drain(), ({}, []))
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), '需要SO_REUSEPORT')
+    def test_processes_share_port(self):
+        """测试多个收集进程绑定同一端口，汇总结果全部合并到父进程"""
+        parent = NetFlowCollector()
+        netflow_port = free_port()
+        options = {'listen_ip': '127.0.0.1', 'netflow_port': netflow_port, 'sflow_port': free_port(),
+                   'rcvbuf': 1024 * 1024, 'slots': 64, 'workers': 1}
+        pool = FlowCollectorPool(2, options, netflow_collector=parent, sflow_collector=SFlowCollector(),
+                                 counter_store=SFlowCounterStore()).start(ready_timeout=60)
+        try:
+            sent = []
+            senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(8)]
+            for sender in senders:
+                records = random_records(30)
+                sender.sendto(v5_packet(records), ('127.0.0.1', netflow_port))
+                sent.extend(records)
+                sender.close()
+
+            in_totals, _ = reference_totals(sent)
+            expected = sum(in_totals.values())
+            deadline = time.time() + 20
+            while time.time() < deadline:
+                merged = sum(value[1] for key, value in parent.cache.items())
+                if merged >= expected:
+                    break
+                time.sleep(0.2)
+            self.assertEqual(merged, expected)
+            self.assertEqual(len(pool.process_stats), 2)
+        finally:
+            pool.stop()
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), '需要SO_REUSEPORT')
+    def test_bind_failure_is_not_ready(self):
+        """测试端口被占用时收集进程报告启动失败，不被当作就绪的进程，也不会被立即重启"""
+        blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blocker.bind(('127.0.0.1', 0))
+        self.addCleanup(blocker.close)
+        options = {'listen_ip': '127.0.0.1', 'netflow_port': blocker.getsockname()[1], 'sflow_port': free_port(),
+                   'slots': 64, 'workers': 1}
+        pool = FlowCollectorPool(1, options, netflow_collector=NetFlowCollector(), sflow_collector=SFlowCollector(),
+                                 counter_store=SFlowCounterStore()).start(ready_timeout=60)
+        try:
+            self.assertEqual(pool.process_stats, {})
+            self.assertIn('netflow', pool.failures[0])
+            pool._processes[0].join(timeout=10)
+            self.assertEqual(pool.supervise(), 0)
+        finally:
+            pool.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+接口清单缓存测试脚本
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pysnmp.proto.rfc1902 import Integer, OctetString, Counter32, Gauge32
+
+from app.utils.interface_inventory import InterfaceInventory
+from app.utils.snmp_collector import (
+    INTERFACE_STATIC_COLUMNS, OID_IF_DESCR, OID_IF_SPEED, OID_IF_IN_OCTETS, OID_IF_OPER_STATUS,
+    build_interface_records
+)
+
+
+def full_rows():
+    return {
+        '1': {OID_IF_DESCR: OctetString('Gi0/1'), OID_IF_SPEED: Gauge32(1000000000),
+              OID_IF_IN_OCTETS: Counter32(100), OID_IF_OPER_STATUS: Integer(1)},
+        '2': {OID_IF_DESCR: OctetString('Gi0/2'), OID_IF_SPEED: Gauge32(100000000),
+              OID_IF_IN_OCTETS: Counter32(200), OID_IF_OPER_STATUS: Integer(2)},
+    }
+
+
+class TestInterfaceInventory(unittest.TestCase):
+    """接口清单缓存测试类"""
+
+    def test_refresh_conditions(self):
+        """测试接口表变化、设备重启时需要重新遍历"""
+        inventory = InterfaceInventory()
+        self.assertTrue(inventory.needs_refresh(1, INTERFACE_STATIC_COLUMNS, 500, 2, 10000))
+
+        inventory.update(1, full_rows(), INTERFACE_STATIC_COLUMNS, 500, 2, 10000)
+        self.assertFalse(inventory.needs_refresh(1, INTERFACE_STATIC_COLUMNS, 500, 2, 40000))
+        self.assertTrue(inventory.needs_refresh(1, INTERFACE_STATIC_COLUMNS, 35000, 2, 40000))
+        self.assertTrue(inventory.needs_refresh(1, INTERFACE_STATIC_COLUMNS, 500, 3, 40000))
+        self.assertTrue(inventory.needs_refresh(1, INTERFACE_STATIC_COLUMNS, 500, 2, 3000))
+
+    def test_merge_counter_rows(self):
+        """测试计数器行与缓存的静态列合并"""
+        inventory = InterfaceInventory()
+        inventory.update(1, full_rows(), INTERFACE_STATIC_COLUMNS, 500, 2, 10000)
+
+        rows = {
+            '1': {OID_IF_IN_OCTETS: Counter32(150), OID_IF_OPER_STATUS: Integer(1)},
+            '2': {OID_IF_IN_OCTETS: Counter32(250), OID_IF_OPER_STATUS: Integer(2)},
+        }
+        self.assertTrue(inventory.merge(1, rows))
+        interfaces = build_interface_records(rows)
+        self.assertEqual([i['interface'] for i in interfaces], ['Gi0/1', 'Gi0/2'])
+        self.assertEqual(interfaces[1]['bandwidth'], 100000000)
+        self.assertEqual(interfaces[0]['in_octets'], 150)
+
+        # 未知的ifIndex需要重新遍历静态列
+        rows['3'] = {OID_IF_IN_OCTETS: Counter32(1)}
+        self.assertFalse(inventory.merge(1, rows))
+
+    def test_persistence(self):
+        """测试缓存保存后重新加载"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'interface_inventory.json')
+            inventory = InterfaceInventory(path)
+            inventory.update(7, full_rows(), INTERFACE_STATIC_COLUMNS, 500, 2, 10000)
+            self.assertTrue(inventory.save())
+
+            restored = InterfaceInventory(path)
+            self.assertEqual(restored.load(), 1)
+            self.assertFalse(restored.needs_refresh(7, INTERFACE_STATIC_COLUMNS, 500, 2, 40000))
+            rows = {'2': {OID_IF_IN_OCTETS: Counter32(1)}}
+            self.assertTrue(restored.merge(7, rows))
+            self.assertEqual(rows['2'][OID_IF_DESCR], 'Gi0/2')
+
+
+if __name__ == "__main__":
+    unittest.main()
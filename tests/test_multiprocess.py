@@ -0,0 +1,58 @@
+"""
+多进程启动测试脚本
+"""
+
+import os
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.multiprocess import spawn_context
+
+
+def child_flag(results=None):
+    flag = os.environ.get('FLASK_RUN_FROM_CLI')
+    if results is not None:
+        results.put(flag)
+    return flag
+
+
+class TestSpawnContext(unittest.TestCase):
+    """spawn上下文测试类"""
+
+    def test_children_skip_scheduler_parent_unchanged(self):
+        """测试子进程启动时带上FLASK_RUN_FROM_CLI，父进程的环境变量保持不变，之后的create_app()仍启动调度器"""
+        with mock.patch.dict(os.environ):
+            os.environ.pop('FLASK_RUN_FROM_CLI', None)
+            context = spawn_context()
+            self.assertEqual(context.get_start_method(), 'spawn')
+
+            results = context.Queue()
+            process = context.Process(target=child_flag, args=(results,))
+            process.start()
+            self.assertEqual(results.get(timeout=30), '1')
+            process.join(timeout=10)
+            self.assertNotIn('FLASK_RUN_FROM_CLI', os.environ)
+
+            # ProcessPoolExecutor提交任务时才创建工作进程，同样经过上下文
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                self.assertEqual(executor.submit(child_flag).result(timeout=30), '1')
+            self.assertNotIn('FLASK_RUN_FROM_CLI', os.environ)
+
+    def test_restores_existing_value(self):
+        """测试父进程原来设置的值在启动子进程后恢复"""
+        with mock.patch.dict(os.environ, {'FLASK_RUN_FROM_CLI': 'true'}):
+            context = spawn_context()
+            process = context.Process(target=child_flag)
+            process.start()
+            process.join(timeout=30)
+            self.assertEqual(process.exitcode, 0)
+            self.assertEqual(os.environ['FLASK_RUN_FROM_CLI'], 'true')
+
+
+if __name__ == "__main__":
+    unittest.main()
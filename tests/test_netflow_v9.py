@@ -0,0 +1,120 @@
+"""
+NetFlow v9/IPFIX解码测试脚本
+"""
+
+import os
+import struct
+import sys
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.netflow_v9 import NetFlowV9Decoder, FlowTemplate, aggregate_interface_bytes
+
+# 模板字段：src_addr, dst_addr, in_bytes(4), in_pkts(4), input_if(2), output_if(2), 未知字段(3), protocol(1)
+TEMPLATE_FIELDS = [(8, 4), (12, 4), (1, 4), (2, 4), (10, 2), (14, 2), (999, 3), (4, 1)]
+
+
+def flow_set(set_id, body):
+    """构建一个FlowSet，按4字节对齐填充"""
+    padding = (-len(body) - 4) % 4
+    return struct.pack('!HH', set_id, len(body) + 4 + padding) + body + b'\x00' * padding
+
+
+def template_set(set_id, template_id, fields):
+    body = struct.pack('!HH', template_id, len(fields))
+    for field_type, length in fields:
+        body += struct.pack('!HH', field_type, length)
+    return flow_set(set_id, body)
+
+
+def data_set(template_id, records):
+    body = b''.join(struct.pack('!IIIIHH3sB', *record) for record in records)
+    return flow_set(template_id, body)
+
+
+def v9_packet(source_id, *sets):
+    return struct.pack('!HHIIII', 9, len(sets), 1000, 1700000000, 1, source_id) + b''.join(sets)
+
+
+def ipfix_packet(domain, *sets):
+    body = b''.join(sets)
+    return struct.pack('!HHIII', 10, 16 + len(body), 1700000000, 1, domain) + body
+
+
+RECORDS = [
+    (0x0A000001, 0x0A000002, 1000, 10, 1, 2, b'abc', 6),
+    (0x0A000003, 0x0A000004, 500, 5, 1, 3, b'abc', 17),
+    (0x0A000005, 0x0A000006, 200, 2, 2, 3, b'abc', 6),
+]
+
+
+class TestNetFlowV9Decoder(unittest.TestCase):
+    """NetFlow v9/IPFIX解码测试类"""
+
+    def test_template_compiles_to_single_struct(self):
+        """测试模板编译为一个struct格式，不需要的字段编译为填充字节"""
+        template = FlowTemplate(256, [(t, l, 0) for t, l in TEMPLATE_FIELDS])
+        self.assertEqual(template.record_length, 24)
+        self.assertEqual(template.struct.format, '!IIIIHH3xB')
+        self.assertEqual(template.names, ('src_addr', 'dst_addr', 'in_bytes', 'in_pkts',
+                                          'input_if', 'output_if', 'protocol'))
+
+    def test_v9_template_and_data(self):
+        """测试同一报文中先收到模板再解码数据"""
+        decoder = NetFlowV9Decoder()
+        packet = v9_packet(7, template_set(0, 256, TEMPLATE_FIELDS), data_set(256, RECORDS))
+        batches = decoder.decode(packet, '192.168.1.1')
+
+        self.assertEqual(len(batches), 1)
+        template, records = batches[0]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(template.records_as_dicts(records)[0]['in_bytes'], 1000)
+        self.assertEqual(records[2][template.positions['protocol']], 6)
+
+        in_totals, out_totals = aggregate_interface_bytes(template, records)
+        self.assertEqual(in_totals, {1: 1500, 2: 200})
+        self.assertEqual(out_totals, {2: 1000, 3: 700})
+
+    def test_templates_are_scoped_by_exporter_and_source_id(self):
+        """测试模板按导出设备和source_id区分，缺少模板的数据被丢弃"""
+        decoder = NetFlowV9Decoder()
+        decoder.decode(v9_packet(7, template_set(0, 256, TEMPLATE_FIELDS)), '192.168.1.1')
+
+        self.assertEqual(len(decoder.decode(v9_packet(7, data_set(256, RECORDS)), '192.168.1.1')), 1)
+        self.assertEqual(decoder.decode(v9_packet(8, data_set(256, RECORDS)), '192.168.1.1'), [])
+        self.assertEqual(decoder.decode(v9_packet(7, data_set(256, RECORDS)), '192.168.1.2'), [])
+        self.assertEqual(decoder.stats['missing_template'], 2)
+
+    def test_v9_options_template(self):
+        """测试v9选项模板和选项数据记录"""
+        decoder = NetFlowV9Decoder()
+        # 范围字段：接口(类型2，长度4)；选项字段：sampling_interval(34，4字节)、sampling_algorithm(35，1字节)
+        body = struct.pack('!HHH', 300, 4, 8) + struct.pack('!HHHHHH', 2, 4, 34, 4, 35, 1)
+        options = flow_set(1, body)
+        data = flow_set(300, struct.pack('!IIB', 1, 100, 2))
+        self.assertEqual(decoder.decode(v9_packet(7, options, data), '192.168.1.1'), [])
+        self.assertEqual(decoder.exporter_options('192.168.1.1'),
+                         {'sampling_interval': 100, 'sampling_algorithm': 2})
+
+    def test_ipfix_enterprise_fields_and_withdrawal(self):
+        """测试IPFIX企业私有字段、可变长度字段和模板撤销"""
+        decoder = NetFlowV9Decoder()
+        fields = struct.pack('!HH', 0x8000 | 5, 2) + struct.pack('!I', 9) + struct.pack('!HHHHHH', 1, 8, 10, 4, 82, 65535)
+        template = flow_set(2, struct.pack('!HH', 400, 4) + fields)
+        record = struct.pack('!HQI', 77, 4096, 5) + b'\x03eth'
+        packet = ipfix_packet(3, template, flow_set(400, record + record))
+
+        batches = decoder.decode(packet, '10.0.0.1')
+        template, records = batches[0]
+        self.assertIsNone(template.struct)
+        self.assertEqual(template.records_as_dicts(records), [{'in_bytes': 4096, 'input_if': 5}] * 2)
+
+        withdrawal = flow_set(2, struct.pack('!HH', 400, 0))
+        decoder.decode(ipfix_packet(3, withdrawal), '10.0.0.1')
+        self.assertEqual(len(decoder.templates), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+数据处理流水线进程池测试脚本
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.data_processor import AnomalyDetector, ProcessorPipeline, PLACEMENT_PROCESS
+from app.utils.multiprocess import SpawnContext
+from app.utils.pipeline_workers import ProcessStagePool, shard_for
+
+
+def sample(source_id, in_rate):
+    # lock字段无法序列化，不在remote_fields中，不会发送给子进程
+    return {'source_id': source_id, 'calculated': True, 'metrics': {'in_rate': in_rate}, 'lock': threading.Lock()}
+
+
+class TestPipelineWorkers(unittest.TestCase):
+    """数据处理流水线进程池测试类"""
+
+    def test_shard_is_stable(self):
+        """测试分片只取决于source_id和分片数"""
+        self.assertEqual(shard_for('10.0.0.1:3', 4), shard_for('10.0.0.1:3', 4))
+        self.assertEqual({shard_for(index, 3) for index in range(100)}, {0, 1, 2})
+
+    def test_pool_spawns_without_scheduler(self):
+        """测试进程池只在启动子进程时设置FLASK_RUN_FROM_CLI，子进程重新导入主模块时不启动调度器"""
+        with mock.patch.dict(os.environ):
+            os.environ.pop('FLASK_RUN_FROM_CLI', None)
+            pool = ProcessStagePool(1)
+            self.assertIsInstance(pool._context, SpawnContext)
+            self.assertEqual(pool._context.get_start_method(), 'spawn')
+            self.assertNotIn('FLASK_RUN_FROM_CLI', os.environ)
+
+    def test_stateful_stage_keeps_affinity(self):
+        """测试基线保留在固定的子进程中，跨批次累积后能检测到突增，只取回检测结果"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        pool = ProcessStagePool(2)
+        detector = AnomalyDetector({'path': os.path.join(directory, 'baselines.npz')})
+        alerted = []
+        detector._complete_batch = lambda items: alerted.extend(items) or items
+        try:
+            sources = [f'device-{index}' for index in range(6)]
+            for round_index in range(10):
+                results = pool.run(detector, [sample(source, 100 + round_index % 2) for source in sources])
+                self.assertEqual(len(results), len(sources))
+            results = pool.run(detector, [sample(source, 10000) for source in sources])
+        finally:
+            pool.shutdown()
+
+        for data in results:
+            self.assertEqual([anomaly['type'] for anomaly in data['anomalies']], ['baseline'])
+            self.assertIn('lock', data)
+        # 基线只在子进程中，本进程的处理器没有状态；关闭时各分片保存自己的快照
+        self.assertEqual(len(detector.baselines), 0)
+        self.assertEqual(sorted(os.listdir(directory)), ['baselines.shard0.npz', 'baselines.shard1.npz'])
+        self.assertEqual(pool.stats()['stages']['AnomalyDetector']['fallbacks'], 0)
+        self.assertEqual(len(alerted), 11 * len(sources))
+
+    def test_pipeline_places_stage(self):
+        """测试流水线按执行位置把处理器交给进程池，没有进程池时仍在工作线程中执行"""
+        pipeline = ProcessorPipeline()
+        pipeline.add_processor(AnomalyDetector())
+        self.assertTrue(pipeline.set_placement('AnomalyDetector', PLACEMENT_PROCESS))
+        self.assertFalse(pipeline.set_placement('Missing', PLACEMENT_PROCESS))
+        head = pipeline.create_pipeline('test', ['AnomalyDetector'])
+        results = pipeline._run_chain(head, [sample('a', 1)])
+        self.assertEqual(results[0]['anomalies'], [])
+        self.assertIsNone(pipeline.stats()['process_pool'])
+
+
+if __name__ == '__main__':
+    unittest.main()
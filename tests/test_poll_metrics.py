@@ -0,0 +1,65 @@
+"""
+轮询指标测试脚本
+"""
+
+import os
+import sys
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.poll_metrics import PollMetrics, Histogram, to_prometheus
+
+
+class TestPollMetrics(unittest.TestCase):
+    """轮询指标测试类"""
+
+    def test_histogram_quantiles(self):
+        """测试直方图计数和分位数"""
+        histogram = Histogram()
+        for value in [0.005] * 90 + [3.0] * 10:
+            histogram.observe(value)
+        data = histogram.to_dict()
+        self.assertEqual(data['count'], 100)
+        self.assertEqual(data['p50'], 0.01)
+        self.assertEqual(data['p95'], 5.0)
+        self.assertEqual(data['buckets'][-1], ['+Inf', 100])
+
+    def test_cycle_counts_requests(self):
+        """测试每轮的PDU数、变量绑定数和超时次数"""
+        metrics = PollMetrics()
+        metrics.observe_request('192.0.2.1', 'get', '1.3.6.1.2.1.1.1.0', 0.01, varbinds=2)
+        cycle = metrics.begin_cycle()
+        metrics.observe_request('192.0.2.1', 'table', '1.3.6.1.2.1.2.2.1.2', 0.2, pdus=3, varbinds=120)
+        timer = metrics.time_request('192.0.2.2', 'get', '1.3.6.1.2.1.1.1.0')
+        timer.fail('No SNMP response received before timeout')
+        timer.stop()
+        metrics.observe_device('192.0.2.1', 0.25, 'ok')
+        metrics.observe_device('192.0.2.2', 5.0, 'timeout')
+        result = metrics.end_cycle(cycle, devices=2, interval=300)
+
+        self.assertEqual(result['pdus'], 4)
+        self.assertEqual(result['varbinds'], 120)
+        self.assertEqual(result['timeouts'], 1)
+        self.assertFalse(result['overrun'])
+
+        # 超时的请求记在OID上，超时的设备轮询记在设备上，各计一次
+        data = metrics.to_dict()
+        self.assertEqual(data['devices']['192.0.2.2']['timeouts'], 1)
+        self.assertEqual([stats['timeouts'] for stats in data['oids'] if stats['oid'] == '1.3.6.1.2.1.1.1.0'], [1])
+        self.assertEqual(data['devices']['192.0.2.1']['pdus'], 4)
+        self.assertIn('snmp_device_poll_duration_seconds_bucket{device="192.0.2.1",le="0.5"} 1',
+                      to_prometheus(data))
+
+    def test_bounded_devices(self):
+        """测试设备数超过上限时淘汰最久未更新的设备"""
+        metrics = PollMetrics(max_devices=3)
+        for index in range(5):
+            metrics.observe_device(f'192.0.2.{index}', 0.1)
+        devices = metrics.to_dict(top=None)['devices']
+        self.assertEqual(sorted(devices), ['192.0.2.2', '192.0.2.3', '192.0.2.4'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+设备轮询调度测试脚本
+"""
+
+import os
+import sys
+import unittest
+from collections import namedtuple
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.poll_scheduler import PollScheduler, total_rate
+
+FakeDevice = namedtuple('FakeDevice', ['id', 'device_type'])
+
+
+class TestPollScheduler(unittest.TestCase):
+    """设备轮询调度测试类"""
+
+    def test_initial_polls_spread(self):
+        """测试新设备的首次轮询在周期内分散"""
+        scheduler = PollScheduler(default_interval=300, role_intervals={})
+        devices = [FakeDevice(i, 'switch') for i in range(1, 101)]
+        self.assertEqual(scheduler.sync(devices, now=1000.0), 100)
+
+        # 每个30秒窗口内到期的设备数接近总数的十分之一
+        offsets = sorted(scheduler.next_due(i) - 1000.0 for i in range(1, 101))
+        self.assertTrue(all(0 <= offset < 300 for offset in offsets))
+        for start in range(0, 300, 30):
+            in_window = [o for o in offsets if start <= o < start + 30]
+            self.assertEqual(len(in_window), 10)
+
+    def test_role_interval_and_due(self):
+        """测试角色周期和到期设备的取出"""
+        scheduler = PollScheduler(default_interval=300, role_intervals={'router': 60}, jitter=0)
+        scheduler.sync([FakeDevice(1, 'router'), FakeDevice(2, 'switch')], now=0.0)
+        self.assertEqual(sorted(scheduler.due(now=301.0)), [1, 2])
+        self.assertEqual(scheduler.due(now=301.0), [])
+
+        # 错过的周期不补轮询，从当前时间重新开始
+        self.assertEqual(scheduler.record(1, 'ok', 1000.0, now=301.0), 301.0)
+        self.assertEqual(scheduler.record(1, 'ok', 1000.0, now=301.0), 361.0)
+        switch_due = scheduler.next_due(2)
+        self.assertEqual(scheduler.record(2, 'ok', 1000.0, now=switch_due), switch_due + 300)
+        self.assertEqual(scheduler.due(now=362.0), [1])
+
+    def test_volatile_device_polled_faster(self):
+        """测试流量波动大的设备缩短周期，平稳后恢复"""
+        scheduler = PollScheduler(default_interval=300, role_intervals={}, min_interval=30, jitter=0)
+        scheduler.sync([FakeDevice(1, None)], now=0.0)
+        scheduler.record(1, 'ok', 1000.0, now=300.0)
+        for step, rate in enumerate([5000.0, 200.0, 8000.0, 100.0]):
+            scheduler.record(1, 'ok', rate, now=600.0 + step)
+        schedule = scheduler._schedules[1]
+        self.assertLess(schedule.interval, 300)
+
+        for step in range(30):
+            scheduler.record(1, 'ok', schedule.mean_rate, now=2000.0 + step)
+        self.assertEqual(schedule.interval, 300)
+
+        # 离线设备恢复角色周期
+        schedule.interval = 30
+        scheduler.record(1, 'offline', now=5000.0)
+        self.assertEqual(schedule.interval, 300)
+
+    def test_total_rate(self):
+        """测试设备总速率计算"""
+        interfaces = [{'in_rate': 100.0, 'out_rate': 50.0}, {'in_rate': None, 'out_rate': None}]
+        self.assertEqual(total_rate(interfaces), 150.0)
+        self.assertIsNone(total_rate([{'in_rate': None}]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+数据处理流水线批处理和有界队列测试脚本
+"""
+
+import os
+import sys
+import time
+import unittest
+from datetime import datetime
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.traffic import Traffic, TrafficStats
+from app.utils.data_processor import (
+    Processor, ProcessorPipeline, PipelineQueue, DataCleanProcessor, TrafficCalculator, DataPersister,
+    POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_PRIORITY, POLICY_COALESCE
+)
+
+
+class FakeSession:
+    """记录批量插入的数据库会话"""
+
+    def __init__(self):
+        self.inserts = []
+        self.commits = 0
+
+    def bulk_insert_mappings(self, model, rows):
+        self.inserts.append((model, list(rows)))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class BatchRecorder(Processor):
+    """记录每批数据条数的处理器"""
+
+    def __init__(self):
+        super().__init__("BatchRecorder")
+        self.batches = []
+
+    def _process_impl(self, data):
+        return data
+
+    def _process_batch_impl(self, items):
+        self.batches.append(len(items))
+        return items
+
+
+def traffic_data(source_id, in_bytes):
+    return {'source_id': source_id, 'type': 'traffic', 'device_id': 1, 'interface_id': 3,
+            'timestamp': datetime(2024, 1, 1, 8), 'interval_seconds': 300,
+            'data': {'in_bytes': in_bytes, 'out_bytes': 100, 'bandwidth': 1000000}}
+
+
+def drain(work_queue):
+    items = []
+    while work_queue.qsize():
+        items.append(work_queue.get_nowait()[1])
+        work_queue.task_done()
+    return items
+
+
+class TestProcessorPipeline(unittest.TestCase):
+    """数据处理流水线批处理测试类"""
+
+    def test_process_batch_defaults_to_per_item(self):
+        """测试默认的批处理逐条调用_process_impl，被过滤的数据不传给下一个处理器"""
+        clean = DataCleanProcessor()
+        calculator = TrafficCalculator()
+        clean.set_next(calculator)
+        results = clean.process_batch([traffic_data('a', 3000), {'source_id': 'b'}, traffic_data('c', 600)])
+        self.assertEqual([data['source_id'] for data in results], ['a', 'c'])
+        self.assertEqual(results[0]['metrics']['in_rate'], 10)
+
+    def test_persister_bulk_inserts_once_per_batch(self):
+        """测试持久化处理器整批一次批量插入、一次提交，字段与Traffic和TrafficStats一致"""
+        session = FakeSession()
+        persister = DataPersister(db_session=session)
+        calculator = TrafficCalculator()
+        calculator.set_next(persister)
+        items = [dict(traffic_data(str(index), 3000), cleaned=True) for index in range(5)]
+        items.append({'source_id': 's', 'type': 'stats', 'device_id': 2, 'timestamp': datetime(2024, 1, 1, 9),
+                      'metrics': {'in_rate': 100, 'out_rate': 50, 'in_utilization': 70, 'out_utilization': 60}})
+        results = calculator.process_batch(items)
+
+        self.assertEqual(session.commits, 1)
+        self.assertEqual([model for model, _ in session.inserts], [Traffic, TrafficStats])
+        row = session.inserts[0][1][0]
+        self.assertEqual((row['interface'], row['in_octets'], row['in_rate']), ('3', 3000, 80))
+        columns = set(Traffic.__table__.columns.keys())
+        self.assertTrue(set(row) <= columns)
+        stats = session.inserts[1][1][0]
+        self.assertEqual((stats['hour'], stats['avg_in_rate']), (9, 800))
+        # 利用率取入、出方向中较大的一个，不超过100
+        self.assertEqual(stats['avg_utilization'], 70)
+        self.assertEqual(DataPersister._utilization({'in_utilization': 20, 'out_utilization': 130}), 100)
+        self.assertTrue(set(stats) <= set(TrafficStats.__table__.columns.keys()))
+        self.assertTrue(all(data['persisted'] for data in results))
+
+    def test_workers_drain_batches(self):
+        """测试工作线程一次取出多条数据，凑批等待超时后处理不足一批的数据"""
+        pipeline = ProcessorPipeline(batch_size=50, batch_wait_ms=100)
+        recorder = pipeline.add_processor(BatchRecorder())
+        pipeline.create_pipeline('test', ['BatchRecorder'])
+        for index in range(120):
+            pipeline.process('test', {'source_id': index})
+        pipeline.start(num_workers=1)
+        try:
+            deadline = time.monotonic() + 5
+            while sum(recorder.batches) < 120 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            pipeline.stop()
+        self.assertEqual(recorder.batches, [50, 50, 20])
+
+    def test_bounded_queue_policies(self):
+        """测试队列满时按策略拒绝、丢弃最早或最低优先级的数据，按source_id合并只保留最新样本"""
+        blocking = PipelineQueue(2, POLICY_BLOCK, block_timeout=0.05)
+        self.assertTrue(blocking.put(('p', {'source_id': 1})))
+        self.assertTrue(blocking.put(('p', {'source_id': 2})))
+        self.assertFalse(blocking.put(('p', {'source_id': 3})))
+        self.assertEqual([data['source_id'] for data in drain(blocking)], [1, 2])
+
+        oldest = PipelineQueue(2, POLICY_DROP_OLDEST)
+        for index in range(5):
+            oldest.put(('p', {'source_id': index}))
+        self.assertEqual([data['source_id'] for data in drain(oldest)], [3, 4])
+        self.assertEqual(oldest.to_dict()['dropped_oldest'], 3)
+
+        priority = PipelineQueue(3, POLICY_PRIORITY)
+        for index, level in enumerate([1, 0, 2, 0, 1, 0]):
+            priority.put(('p', {'source_id': index, 'priority': level}))
+        self.assertEqual([data['source_id'] for data in drain(priority)], [0, 2, 4])
+
+        coalesce = PipelineQueue(2, POLICY_COALESCE)
+        for value in range(3):
+            coalesce.put(('p', {'source_id': 'a', 'value': value}))
+            coalesce.put(('p', {'source_id': 'b', 'value': value}))
+        self.assertEqual(coalesce.to_dict()['coalesced'], 4)
+        self.assertEqual([(data['source_id'], data['value']) for data in drain(coalesce)], [('a', 2), ('b', 2)])
+
+    def test_overload_keeps_memory_flat(self):
+        """测试消费者停止时持续提交，队列内部条目数不超过容量的两倍"""
+        for policy in (POLICY_DROP_OLDEST, POLICY_PRIORITY, POLICY_COALESCE):
+            work_queue = PipelineQueue(100, policy)
+            for index in range(10000):
+                work_queue.put(('p', {'source_id': index % 300, 'priority': index % 3}))
+                if index % 7 == 0 and work_queue.qsize():
+                    work_queue.get_nowait()
+            stats = work_queue.to_dict()
+            self.assertEqual(stats['depth'], 100)
+            self.assertLessEqual(len(work_queue._entries), 200)
+            self.assertLessEqual(sum(len(entries) for entries in work_queue._by_priority.values()), 200)
+            self.assertEqual(stats['accepted'] + stats['coalesced'] + stats['rejected'], stats['submitted'])
+            self.assertGreater(stats['wait_latency']['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+同时段流量基线测试脚本
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db
+from app.models.traffic import Traffic, TrafficStats
+from app.utils.data_processor import (
+    AnomalyDetector, DataCleanProcessor, TrafficCalculator, DETECTOR_ZSCORE, DETECTOR_SEASONAL
+)
+from app.utils.seasonal_baseline import (
+    ProfileBuilder, SeasonalProfiles, DEVICE_LEVEL, hour_of_week, hours_of_week, rebuild_seasonal_profiles
+)
+
+# 2024-01-01是周一
+MONDAY = datetime(2024, 1, 1)
+NOW = MONDAY + timedelta(weeks=4)
+
+# 本地时区比UTC早8小时，本地周一8点是UTC周一0点
+LOCAL_TIMEZONE = 'Asia/Shanghai'
+LOCAL_OFFSET = timedelta(hours=8)
+
+
+def rate_at(timestamp, week):
+    """周一8点流量上升10倍，其余时段为平时流量，每周略有波动（bps）"""
+    base = 8000000 if (timestamp.weekday(), timestamp.hour) == (0, 8) else 800000
+    return base * (1 + 0.02 * (week - 1.5))
+
+
+def sample(timestamp, in_rate):
+    return {'source_id': '1:3', 'calculated': True, 'device_id': 1, 'interface_id': 3, 'timestamp': timestamp,
+            'metrics': {'in_rate': in_rate}}
+
+
+class TestSeasonalBaseline(unittest.TestCase):
+    """同时段流量基线测试类"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profiles.npz')
+        engine = create_engine('sqlite://')
+        db.Model.metadata.create_all(engine)
+        self.session = Session(engine)
+
+        rows, stats = [], []
+        for week in range(4):
+            for hour in range(7 * 24):
+                timestamp = MONDAY + timedelta(weeks=week, hours=hour)
+                rows.append({'device_id': 1, 'interface': '3', 'timestamp': timestamp,
+                             'in_rate': rate_at(timestamp, week), 'out_rate': None, 'in_octets': 0, 'out_octets': None})
+                stats.append({'device_id': 2, 'year': timestamp.year, 'month': timestamp.month, 'day': timestamp.day,
+                              'hour': timestamp.hour, 'avg_in_rate': rate_at(timestamp, week), 'avg_out_rate': 1000,
+                              'created_at': timestamp})
+            # 每日汇总记录（hour为0，次日生成）不计入0点的时段
+            stats.append({'device_id': 2, 'year': 2024, 'month': 1, 'day': 1 + 7 * week, 'hour': 0,
+                          'avg_in_rate': 1e12, 'avg_out_rate': 1e12, 'created_at': MONDAY + timedelta(weeks=week, days=1)})
+        self.session.bulk_insert_mappings(Traffic, rows)
+        self.session.bulk_insert_mappings(TrafficStats, stats)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_vectorized_slots_and_chunked_stats(self):
+        """测试向量化的时段计算与逐条计算一致，分块累加的均值和标准差与一次计算一致"""
+        timestamps = [MONDAY + timedelta(minutes=37 * index) for index in range(2000)]
+        self.assertEqual(hours_of_week(np.array(timestamps, dtype='datetime64[s]')).tolist(),
+                         [hour_of_week(timestamp) for timestamp in timestamps])
+        # 按本地时区计算时，夏令时切换前后的偏移不同
+        for name, start in ((LOCAL_TIMEZONE, MONDAY), ('America/New_York', datetime(2024, 3, 1))):
+            tz = ZoneInfo(name)
+            timestamps = [start + timedelta(minutes=37 * index) for index in range(2000)]
+            self.assertEqual(hours_of_week(np.array(timestamps, dtype='datetime64[s]'), tz).tolist(),
+                             [hour_of_week(timestamp, tz) for timestamp in timestamps])
+
+        values = np.random.default_rng(1).normal(1e9, 1e6, size=(600, 2))
+        values[::7, 1] = np.nan
+        slots = np.array([MONDAY + timedelta(hours=index % 3) for index in range(600)], dtype='datetime64[s]')
+        builder = ProfileBuilder()
+        for start in range(0, 600, 250):
+            builder.add(np.ones(len(values[start:start + 250])), ['a'] * len(values[start:start + 250]),
+                        slots[start:start + 250], values[start:start + 250])
+        keys, mean, std, count = builder.build()
+        self.assertEqual(keys, [(1, 'a')])
+        for slot in range(3):
+            for metric in range(2):
+                column = values[slot::3, metric]
+                column = column[~np.isnan(column)]
+                self.assertEqual(count[0, slot, metric], len(column))
+                self.assertAlmostEqual(mean[0, slot, metric], column.mean(), delta=1e-3)
+                self.assertAlmostEqual(std[0, slot, metric], column.std(), delta=1e-3)
+
+    def test_profiles_from_history(self):
+        """测试从Traffic建立接口画像、从TrafficStats建立设备画像，跳过每日汇总记录"""
+        profiles = rebuild_seasonal_profiles(self.path, session=self.session, now=NOW, timezone='UTC')
+        self.assertEqual(sorted(profiles.keys), [(1, '3'), (2, DEVICE_LEVEL)])
+
+        slot, mean, std, samples = profiles.lookup(1, 3, MONDAY + timedelta(weeks=5, hours=8, minutes=20))
+        self.assertEqual((slot, samples), (8, 4))
+        self.assertAlmostEqual(mean, 8000000, delta=1)
+        self.assertIsNone(profiles.lookup(1, 3, NOW, metric='out_rate'))
+        self.assertAlmostEqual(profiles.lookup(2, None, MONDAY)[1], 800000, delta=1)
+        self.assertIsNone(profiles.lookup(3, None, MONDAY))
+
+        reloaded = SeasonalProfiles(self.path, timezone='UTC')
+        self.assertEqual(reloaded.load(), 2)
+        self.assertEqual(reloaded.built_at, NOW)
+        self.assertEqual(reloaded.lookup(1, '3', MONDAY), profiles.lookup(1, '3', MONDAY))
+        # 时区不同的画像文件时段不对应，不加载
+        self.assertEqual(SeasonalProfiles(self.path, timezone=LOCAL_TIMEZONE).load(), 0)
+
+    def test_seasonal_detector_ignores_weekly_ramp(self):
+        """测试周一8点的规律性上升不再告警，同样的流量出现在凌晨时仍然告警，画像文件更新后检测器重新加载"""
+        rebuild_seasonal_profiles(self.path, session=self.session, now=NOW, timezone='UTC')
+        detectors = {name: AnomalyDetector(detector=name, seasonal_options={'path': self.path, 'timezone': 'UTC'})
+                     for name in (DETECTOR_ZSCORE, DETECTOR_SEASONAL)}
+        results = {}
+        for name, detector in detectors.items():
+            night = NOW - timedelta(hours=3)
+            for index in range(10):
+                detector._detect(sample(night + timedelta(minutes=5 * index), 100000 + index % 2 * 1000))
+            ramp = detector._detect(sample(NOW + timedelta(hours=8), 1000000))
+            spike = detector._detect(sample(NOW + timedelta(hours=3), 1000000))
+            results[name] = ([anomaly['type'] for anomaly in ramp['anomalies']],
+                             [anomaly['type'] for anomaly in spike['anomalies']])
+
+        self.assertEqual(results[DETECTOR_ZSCORE], (['baseline'], []))
+        self.assertEqual(results[DETECTOR_SEASONAL], ([], ['seasonal']))
+
+        # 没有画像的数据源仍按最近的样本检测
+        seasonal = detectors[DETECTOR_SEASONAL]
+        for index in range(10):
+            seasonal._detect(dict(sample(NOW, 100000 + index % 2 * 1000), source_id='9:3', device_id=9))
+        unknown = seasonal._detect(dict(sample(NOW, 1000000), source_id='9:3', device_id=9))
+        self.assertEqual([anomaly['type'] for anomaly in unknown['anomalies']], ['baseline'])
+
+        profiles = SeasonalProfiles(self.path, timezone='UTC')
+        profiles.replace([(9, '3')], np.full((1, 168, 2), 8e6), np.full((1, 168, 2), 8e5), np.full((1, 168, 2), 4))
+        profiles.save()
+        os.utime(self.path, (0, 0))
+        self.assertTrue(seasonal.seasonal.refresh(force=True))
+        self.assertEqual(seasonal.seasonal.keys, [(9, '3')])
+        self.assertEqual(seasonal.remote_options(1)['detector'], DETECTOR_SEASONAL)
+
+    def test_local_time_profiles_from_pipeline(self):
+        """测试按本地作息变化、以UTC存储的记录按本地时段建立画像，处理管道中的UTC样本查到同一时段"""
+        rows, stats = [], []
+        for week in range(4):
+            for hour in range(7 * 24):
+                timestamp = MONDAY + timedelta(weeks=week, hours=hour)
+                in_rate = rate_at(timestamp + LOCAL_OFFSET, week)
+                rows.append({'device_id': 5, 'interface': '3', 'timestamp': timestamp, 'in_rate': in_rate})
+                stats.append({'device_id': 6, 'year': timestamp.year, 'month': timestamp.month, 'day': timestamp.day,
+                              'hour': timestamp.hour, 'avg_in_rate': in_rate, 'created_at': timestamp})
+        self.session.bulk_insert_mappings(Traffic, rows)
+        self.session.bulk_insert_mappings(TrafficStats, stats)
+        self.session.commit()
+
+        profiles = rebuild_seasonal_profiles(self.path, session=self.session, now=NOW, timezone=LOCAL_TIMEZONE)
+        for device_id, interface in ((5, 3), (6, None)):
+            slot, mean, _, _ = profiles.lookup(device_id, interface, NOW)
+            self.assertEqual(slot, 8)
+            self.assertAlmostEqual(mean, 8000000, delta=1)
+        # Unix时间戳与不带时区的UTC时间查到同一时段
+        self.assertEqual(profiles.lookup(5, 3, (NOW - datetime(1970, 1, 1)).total_seconds()),
+                         profiles.lookup(5, 3, NOW))
+
+        clean = DataCleanProcessor()
+        calculator = TrafficCalculator()
+        detector = AnomalyDetector(detector=DETECTOR_SEASONAL,
+                                   seasonal_options={'path': self.path, 'timezone': LOCAL_TIMEZONE})
+        clean.set_next(calculator)
+
+        def detect(timestamp):
+            # 清洗后的时间戳为不带时区的UTC时间，8Mbps，5分钟的字节数
+            result = clean.process({'source_id': '5:3', 'type': 'traffic', 'device_id': 5, 'interface_id': 3,
+                                    'timestamp': timestamp.isoformat(), 'interval_seconds': 300,
+                                    'data': {'in_bytes': 8000000 // 8 * 300, 'out_bytes': 0}})
+            result = detector._detect(result)
+            return [(anomaly['type'], anomaly.get('slot')) for anomaly in result['anomalies']]
+
+        # UTC 0点是本地周一8点的上班高峰，UTC 8点是本地16点
+        self.assertEqual(detect(NOW + timedelta(minutes=10)), [])
+        self.assertEqual(detect(NOW + timedelta(hours=8, minutes=10)), [('seasonal', 16)])
+
+
+if __name__ == '__main__':
+    unittest.main()
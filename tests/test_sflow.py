@@ -0,0 +1,91 @@
+"""
+sFlow v5解码测试脚本
+"""
+
+import os
+import socket
+import struct
+import sys
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.counter_state import CounterStateStore
+from app.utils.sflow import SFlowDecoder, SFlowCounterStore, GENERIC_INTERFACE
+
+
+def record(record_type, body):
+    return struct.pack('!II', record_type, len(body)) + body
+
+
+def counter_sample(if_index, in_octets, out_octets, status=3):
+    counters = GENERIC_INTERFACE.pack(if_index, 6, 1000000000, 1, status, in_octets, 10, 0, 0, 0, 1,
+                                      0, out_octets, 20, 0, 0, 0, 2, 0)
+    body = struct.pack('!III', 1, if_index, 1) + record(1, counters)
+    return record(2, body)
+
+
+def flow_sample(sampling_rate, input_if, output_if, frame_length):
+    # 以太网 + IPv4 + TCP头
+    ethernet = b'\x00' * 12 + struct.pack('!H', 0x0800)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40, 0, 0, 64, 6, 0,
+                     socket.inet_aton('10.1.1.1'), socket.inet_aton('10.2.2.2'))
+    tcp = struct.pack('!HH', 51000, 443) + b'\x00' * 16
+    header = ethernet + ip + tcp
+    raw = struct.pack('!IIII', 1, frame_length, 4, len(header)) + header
+    body = struct.pack('!IIIIIIII', 1, input_if, sampling_rate, 1000, 0, input_if, output_if, 1) + record(1, raw)
+    return record(1, body)
+
+
+def datagram(uptime, *samples):
+    return (struct.pack('!II4sIIII', 5, 1, socket.inet_aton('192.168.10.2'), 0, 1, uptime, len(samples))
+            + b''.join(samples))
+
+
+class TestSFlowDecoder(unittest.TestCase):
+    """sFlow v5解码测试类"""
+
+    def test_decode_counter_and_flow_samples(self):
+        """测试解析通用接口计数器样本和流样本，流样本字节数按采样率放大"""
+        decoder = SFlowDecoder()
+        result = decoder.decode(datagram(60000, counter_sample(3, 5000, 7000), flow_sample(512, 3, 7, 1500)),
+                                '192.168.10.200')
+
+        self.assertEqual(result.agent, '192.168.10.2')
+        self.assertEqual(result.counters[0]['if_index'], 3)
+        self.assertEqual(result.counters[0]['in_octets'], 5000)
+        self.assertEqual(result.counters[0]['out_errors'], 2)
+
+        flow = result.flows[0]
+        self.assertEqual(flow['bytes'], 1500 * 512)
+        self.assertEqual((flow['input_if'], flow['output_if']), (3, 7))
+        self.assertEqual((flow['src_addr'], flow['dst_addr'], flow['protocol']), ('10.1.1.1', '10.2.2.2', 6))
+        self.assertEqual((flow['src_port'], flow['dst_port']), (51000, 443))
+
+    def test_counter_samples_replace_snmp_polling(self):
+        """测试计数器样本转换为接口数据后按各自的采样时间计算速率"""
+        store = SFlowCounterStore(max_age=120)
+        decoder = SFlowDecoder()
+        store.update('192.168.10.2', decoder.decode(datagram(60000, counter_sample(3, 5000, 7000))).counters,
+                     60000, now=1000.0)
+        self.assertTrue(store.is_fresh('192.168.10.2', now=1100.0))
+        self.assertFalse(store.is_fresh('192.168.10.2', now=1200.0))
+
+        counters = CounterStateStore()
+        interfaces = store.interface_records('192.168.10.2', names={'3': 'Gi0/3'}, now=1000.0)
+        self.assertEqual(interfaces[0]['interface'], 'Gi0/3')
+        self.assertEqual(interfaces[0]['status'], 'up')
+        counters.apply(1, interfaces, 5000.0)
+
+        store.update('192.168.10.2', decoder.decode(datagram(90000, counter_sample(3, 130000, 7000))).counters,
+                     90000, now=1030.0)
+        interfaces = store.interface_records('192.168.10.2', now=1030.0)
+        counters.apply(1, interfaces, 5000.0)
+        # 间隔取自代理运行时间（30秒），而不是调用方传入的统一采集时间
+        self.assertEqual(interfaces[0]['interval'], 30.0)
+        self.assertAlmostEqual(interfaces[0]['in_rate'], 125000 * 8 / 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+分片轮询测试脚本
+"""
+
+import os
+import sys
+import unittest
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.sharded_poller import shard_for, shard_state_path
+
+
+class TestSharding(unittest.TestCase):
+    """设备分片测试类"""
+
+    def test_shards_balanced(self):
+        """测试设备在分片间大致均匀分布"""
+        counts = [0] * 16
+        for device_id in range(1, 16001):
+            counts[shard_for(device_id, 16)] += 1
+        self.assertGreater(min(counts), 800)
+        self.assertLess(max(counts), 1200)
+
+    def test_resize_moves_few_devices(self):
+        """测试增加一个工作进程时只有约1/N的设备迁移"""
+        moved = sum(1 for device_id in range(1, 10001)
+                    if shard_for(device_id, 8) != shard_for(device_id, 9))
+        self.assertLess(moved, 10000 * 2 / 9)
+        # 迁移的设备都迁移到了新分片
+        for device_id in range(1, 1001):
+            if shard_for(device_id, 8) != shard_for(device_id, 9):
+                self.assertEqual(shard_for(device_id, 9), 8)
+
+    def test_state_path(self):
+        """测试分片状态文件路径"""
+        self.assertEqual(shard_state_path('/data/counter_state.json', 3), '/data/counter_state.shard3.json')
+        self.assertEqual(shard_for(42, 1), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
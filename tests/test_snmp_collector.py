@@ -0,0 +1,197 @@
+"""
+SNMP采集模块测试脚本
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pysnmp.proto.rfc1902 import ObjectName, Integer, OctetString, Counter32, Counter64, Gauge32
+from pysnmp.proto.rfc1905 import endOfMibView, noSuchObject
+
+from app.utils.snmp_collector import (
+    SnmpSessionPool, DeviceHealthTracker, collect_table_rows, build_interface_records, counter_family_from_response,
+    OID_IF_DESCR, OID_IF_SPEED, OID_IF_IN_OCTETS, OID_IF_OPER_STATUS,
+    OID_IF_HIGH_SPEED, OID_IF_HC_IN_OCTETS, OID_IF_HC_OUT_OCTETS,
+    COUNTER_FAMILY_32, COUNTER_FAMILY_64
+)
+from app.utils.counter_state import COUNTER_BITS_HC
+
+
+class TestSnmpSessionPool(unittest.TestCase):
+    """SNMP会话池测试类"""
+
+    def test_target_cached_by_key(self):
+        """测试相同参数复用传输目标"""
+        pool = SnmpSessionPool()
+        auth1, transport1 = pool.get_target('192.0.2.1', 161, 'public', '2c')
+        auth2, transport2 = pool.get_target('192.0.2.1', 161, 'public', '2c')
+        self.assertIs(auth1, auth2)
+        self.assertIs(transport1, transport2)
+
+        # 不同community视为不同的目标
+        auth3, transport3 = pool.get_target('192.0.2.1', 161, 'private', '2c')
+        self.assertIsNot(transport1, transport3)
+        self.assertEqual(len(pool), 2)
+
+    def test_engine_and_object_type_reused(self):
+        """测试引擎和OID对象在同一线程内复用"""
+        pool = SnmpSessionPool()
+        self.assertIs(pool.get_engine(), pool.get_engine())
+        self.assertIs(pool.get_object_type('1.3.6.1.2.1.1.1.0'),
+                      pool.get_object_type('1.3.6.1.2.1.1.1.0'))
+
+    def test_idle_eviction(self):
+        """测试闲置目标被淘汰"""
+        pool = SnmpSessionPool(idle_timeout=60)
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1000.0):
+            pool.get_target('192.0.2.1')
+            pool.get_target('192.0.2.2')
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1050.0):
+            pool.get_target('192.0.2.2')
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1100.0):
+            self.assertEqual(pool.evict_idle(), 1)
+        self.assertEqual(len(pool), 1)
+
+
+class TestDeviceHealthTracker(unittest.TestCase):
+    """设备健康状态测试类"""
+
+    def test_circuit_opens_with_backoff(self):
+        """测试连续失败后断路并按指数退避"""
+        health = DeviceHealthTracker(failure_threshold=2, base_backoff=60, max_backoff=200)
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1000.0):
+            self.assertEqual(health.record_failure('192.0.2.1'), 0)
+            self.assertTrue(health.allow('192.0.2.1'))
+            self.assertEqual(health.record_failure('192.0.2.1'), 60)
+            self.assertFalse(health.allow('192.0.2.1'))
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1060.0):
+            # 退避结束后允许一次尝试，再次失败时等待时间翻倍
+            self.assertTrue(health.allow('192.0.2.1'))
+            self.assertEqual(health.record_failure('192.0.2.1'), 120)
+            self.assertEqual(health.record_failure('192.0.2.1'), 200)
+
+        health.record_success('192.0.2.1')
+        self.assertTrue(health.allow('192.0.2.1'))
+        self.assertEqual(health.failure_count('192.0.2.1'), 0)
+
+    def test_half_open_admits_one_probe(self):
+        """测试半开状态只放行一个探测线程，探测结果记录后或探测超时后才放行其他调用方"""
+        health = DeviceHealthTracker(failure_threshold=1, base_backoff=60, probe_timeout=30)
+
+        def allow_from_other_thread():
+            results = []
+            thread = threading.Thread(target=lambda: results.append(health.allow('192.0.2.1')))
+            thread.start()
+            thread.join()
+            return results[0]
+
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1000.0):
+            health.record_failure('192.0.2.1')
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1060.0):
+            self.assertTrue(health.allow('192.0.2.1'))
+            # 同一次采集的后续请求仍然放行，其他线程等待探测结果
+            self.assertTrue(health.allow('192.0.2.1'))
+            self.assertFalse(allow_from_other_thread())
+            self.assertTrue(health.to_dict()['192.0.2.1']['probing'])
+            self.assertEqual(health.record_failure('192.0.2.1'), 120)
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1180.0):
+            self.assertTrue(allow_from_other_thread())
+            self.assertFalse(health.allow('192.0.2.1'))
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1210.0):
+            # 探测方没有记录结果，超时后允许其他调用方探测
+            self.assertTrue(health.allow('192.0.2.1'))
+            health.record_success('192.0.2.1')
+            self.assertTrue(allow_from_other_thread())
+        self.assertEqual(health.to_dict(), {})
+
+    def test_unsupported_oid_expires(self):
+        """测试不支持的OID记录在有效期后失效"""
+        health = DeviceHealthTracker(unsupported_ttl=100)
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1000.0):
+            health.mark_unsupported('192.0.2.1', '1.3.6.1.4.1.9.9.109.1.1.1.1.3.1')
+            self.assertTrue(health.is_unsupported('192.0.2.1', '1.3.6.1.4.1.9.9.109.1.1.1.1.3.1'))
+            self.assertFalse(health.is_unsupported('192.0.2.2', '1.3.6.1.4.1.9.9.109.1.1.1.1.3.1'))
+        with patch('app.utils.snmp_collector.time.monotonic', return_value=1200.0):
+            self.assertFalse(health.is_unsupported('192.0.2.1', '1.3.6.1.4.1.9.9.109.1.1.1.1.3.1'))
+
+
+class TestTableWalk(unittest.TestCase):
+    """表格遍历测试类"""
+
+    columns = [OID_IF_DESCR, OID_IF_SPEED, OID_IF_IN_OCTETS, OID_IF_OPER_STATUS]
+
+    def _row(self, index, descr, speed, in_octets, status):
+        return [
+            (ObjectName(f'{OID_IF_DESCR}.{index}'), OctetString(descr)),
+            (ObjectName(f'{OID_IF_SPEED}.{index}'), Gauge32(speed)),
+            (ObjectName(f'{OID_IF_IN_OCTETS}.{index}'), Counter32(in_octets)),
+            (ObjectName(f'{OID_IF_OPER_STATUS}.{index}'), Integer(status)),
+        ]
+
+    def test_rows_assembled_by_index(self):
+        """测试GETBULK响应按ifIndex组装为行"""
+        rows = {}
+        table = [
+            self._row(1, 'Gi0/1', 1000000000, 100, 1),
+            self._row(2, 'Gi0/2', 100000000, 200, 2),
+        ]
+        self.assertTrue(collect_table_rows(self.columns, table, rows))
+        self.assertEqual(set(rows), {'1', '2'})
+        self.assertEqual(int(rows['2'][OID_IF_IN_OCTETS]), 200)
+
+        interfaces = build_interface_records(rows)
+        self.assertEqual([i['interface'] for i in interfaces], ['Gi0/1', 'Gi0/2'])
+        self.assertEqual(interfaces[0]['status'], 'up')
+        self.assertEqual(interfaces[1]['status'], 'down')
+        self.assertEqual(interfaces[1]['bandwidth'], 100000000)
+
+    def test_walk_stops_outside_subtree(self):
+        """测试所有列超出子树范围后遍历结束"""
+        rows = {}
+        # ifXTable中的OID已不属于任何请求的列
+        next_columns = [(ObjectName('1.3.6.1.2.1.31.1.1.1.1.1'), OctetString('Gi0/1'))] * 4
+        table = [
+            self._row(3, 'Gi0/3', 1000, 1, 1),
+            next_columns,
+            [(ObjectName('1.3.6.1.2.1.2.2.1.2.4'), endOfMibView)] * 4,
+        ]
+        self.assertFalse(collect_table_rows(self.columns, table, rows))
+        self.assertEqual(list(rows), ['3'])
+
+    def test_high_capacity_row(self):
+        """测试64位计数器和ifHighSpeed"""
+        rows = {'49': {
+            OID_IF_DESCR: OctetString('Te1/0/1'),
+            OID_IF_SPEED: Gauge32(4294967295),
+            OID_IF_HIGH_SPEED: Gauge32(10000),
+            OID_IF_HC_IN_OCTETS: Counter64(2 ** 40),
+            OID_IF_HC_OUT_OCTETS: Counter64(2 ** 33),
+            OID_IF_OPER_STATUS: Integer(1),
+        }}
+        interface = build_interface_records(rows)[0]
+        # 错误数来自ifTable，仍为32位
+        self.assertEqual(interface['counter_bits'], COUNTER_BITS_HC)
+        self.assertEqual(interface['counter_bits']['in_errors'], 32)
+        self.assertEqual(interface['in_octets'], 2 ** 40)
+        self.assertEqual(interface['bandwidth'], 10000000000)
+
+    def test_counter_family_probe(self):
+        """测试根据GETNEXT响应判断计数器类型"""
+        supported = [(ObjectName(f'{OID_IF_HC_IN_OCTETS}.1'), Counter64(12345))]
+        self.assertEqual(counter_family_from_response(supported), COUNTER_FAMILY_64)
+
+        # 响应已越过ifHCInOctets列或返回异常值
+        unsupported = [(ObjectName('1.3.6.1.2.1.31.1.1.1.7.1'), Counter64(1))]
+        self.assertEqual(counter_family_from_response(unsupported), COUNTER_FAMILY_32)
+        missing = [(ObjectName(f'{OID_IF_HC_IN_OCTETS}.1'), noSuchObject)]
+        self.assertEqual(counter_family_from_response(missing), COUNTER_FAMILY_32)
+
+
+if __name__ == "__main__":
+    unittest.main()
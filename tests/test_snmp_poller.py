@@ -0,0 +1,253 @@
+"""
+异步SNMP轮询测试脚本
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import rfc1905
+from pysnmp.proto.api import v2c
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.interface_inventory import interface_inventory
+from app.utils.snmp_collector import (
+    OID_SYS_DESCR, OID_SYS_UPTIME, OID_IF_DESCR, OID_IF_SPEED, OID_IF_OPER_STATUS, OID_IF_IN_ERRORS,
+    OID_IF_OUT_ERRORS, OID_IF_HC_IN_OCTETS, OID_IF_HC_OUT_OCTETS, OID_IF_HC_IN_UCAST, OID_IF_HC_OUT_UCAST,
+    OID_IF_HIGH_SPEED, OID_IF_NUMBER, COUNTER_FAMILY_32, COUNTER_FAMILY_64, counter_families, device_health
+)
+from app.utils.snmp_poller import AsyncSnmpPoller, PollTarget, BACKEND_THREAD, check_async_snmp
+
+OFFLINE_ID = 100
+SLOW_ID = 101
+
+
+class FakePoller(AsyncSnmpPoller):
+    """用协程模拟SNMP请求的轮询引擎，记录同时在途的设备数"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._engine = object()  # 不创建真实的SnmpEngine
+        self.active = set()
+        self.max_active = 0
+
+    def close(self):
+        self._engine = None
+        super().close()
+
+    async def _get(self, engine, target, oids):
+        self.active.add(target.device_id)
+        self.max_active = max(self.max_active, len(self.active))
+        try:
+            await asyncio.sleep(5 if target.device_id == SLOW_ID else 0.02)
+        finally:
+            self.active.discard(target.device_id)
+        if oids[0] == OID_SYS_DESCR:
+            return None if target.device_id == OFFLINE_ID else ['switch', 1000]
+        return [None] * len(oids)
+
+    async def _probe_counter_family(self, engine, target):
+        return COUNTER_FAMILY_32
+
+    async def _walk_table(self, engine, target, columns):
+        return {}
+
+
+def target(device_id):
+    return PollTarget(device_id, f'192.0.2.{device_id}', 161, 'public', '2c')
+
+
+def oid_key(oid):
+    return tuple(int(part) for part in str(oid).split('.'))
+
+
+class SnmpAgent:
+    """本地UDP端口上的最小SNMPv2c应答方，每个请求在单独的线程中延迟后应答，记录同时在途的请求数"""
+
+    def __init__(self, host, mib, delay=0.0):
+        self.mib = sorted((oid_key(oid), value) for oid, value in mib.items())
+        self.values = dict(self.mib)
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.port = self.sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.sock.close()
+        self._thread.join(timeout=1)
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except OSError:
+                return
+            threading.Thread(target=self._respond, args=(data, address), daemon=True).start()
+
+    def _next(self, oid):
+        for key, value in self.mib:
+            if key > oid:
+                return key, value
+        return oid, rfc1905.endOfMibView
+
+    def _respond(self, data, address):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        # 应答之前结束计数，客户端收到应答后立即发出的下一个请求不会与本请求重叠
+        with self._lock:
+            self.active -= 1
+        try:
+            message, _ = decoder.decode(data, asn1Spec=v2c.Message())
+            request = v2c.apiMessage.getPDU(message)
+            oids = [oid_key(oid) for oid, _ in v2c.apiPDU.getVarBinds(request)]
+            if request.isSameTypeWith(v2c.GetRequestPDU()):
+                var_binds = [(oid, self.values.get(oid, rfc1905.noSuchObject)) for oid in oids]
+            elif request.isSameTypeWith(v2c.GetNextRequestPDU()):
+                var_binds = [self._next(oid) for oid in oids]
+            else:
+                var_binds = []
+                for _ in range(int(v2c.apiBulkPDU.getMaxRepetitions(request))):
+                    row = [self._next(oid) for oid in oids]
+                    var_binds.extend(row)
+                    oids = [oid for oid, _ in row]
+            response = v2c.apiMessage.getResponse(message)
+            v2c.apiPDU.setVarBinds(v2c.apiMessage.getPDU(response), var_binds)
+            self.sock.sendto(encoder.encode(response), address)
+        except OSError:
+            pass
+
+
+def interface_mib():
+    """两个支持64位计数器的接口"""
+    mib = {OID_SYS_DESCR: v2c.OctetString('switch'), OID_SYS_UPTIME: v2c.TimeTicks(123456),
+           OID_IF_NUMBER: v2c.Integer(2)}
+    for index in (1, 2):
+        mib.update({
+            f'{OID_IF_DESCR}.{index}': v2c.OctetString(f'GigabitEthernet0/{index}'),
+            f'{OID_IF_SPEED}.{index}': v2c.Gauge32(1000000000),
+            f'{OID_IF_HIGH_SPEED}.{index}': v2c.Gauge32(1000),
+            f'{OID_IF_OPER_STATUS}.{index}': v2c.Integer(1),
+            f'{OID_IF_IN_ERRORS}.{index}': v2c.Counter32(index),
+            f'{OID_IF_OUT_ERRORS}.{index}': v2c.Counter32(0),
+            f'{OID_IF_HC_IN_OCTETS}.{index}': v2c.Counter64(2 ** 40 * index),
+            f'{OID_IF_HC_OUT_OCTETS}.{index}': v2c.Counter64(5000),
+            f'{OID_IF_HC_IN_UCAST}.{index}': v2c.Counter64(700),
+            f'{OID_IF_HC_OUT_UCAST}.{index}': v2c.Counter64(30),
+        })
+    return mib
+
+
+class TestAsyncSnmpPoller(unittest.TestCase):
+    """异步SNMP轮询测试类"""
+
+    def test_semaphore_deadline_and_report(self):
+        """测试同时在途的设备数不超过并发上限，慢设备在截止时间后被取消，报告按状态计数"""
+        poller = FakePoller(concurrency=3, device_deadline=0.3)
+        self.addCleanup(poller.close)
+        targets = [target(device_id) for device_id in range(1, 11)] + [target(OFFLINE_ID), target(SLOW_ID)]
+        results, report = poller.run(targets)
+
+        self.assertEqual(poller.max_active, 3)
+        self.assertEqual([result['device_id'] for result in results], [item.device_id for item in targets])
+        self.assertEqual((report.total, report.succeeded, report.offline), (12, 10, 1))
+        self.assertEqual((report.timed_out, report.failed), ([SLOW_ID], []))
+        slow = results[-1]
+        self.assertEqual(slow['status'], 'timeout')
+        self.assertLess(slow['duration'], 1)
+        self.assertEqual(report.slowest[0][1], SLOW_ID)
+        self.assertEqual(report.to_dict()['timed_out'], 1)
+        # 采集时间为UTC，与Traffic的其他写入方一致
+        self.assertLess(abs(results[0]['timestamp'] - datetime.utcnow()), timedelta(minutes=1))
+
+    def test_open_circuit_is_skipped(self):
+        """测试断路中的设备本轮跳过，不计入耗时排名"""
+        poller = FakePoller(concurrency=2)
+        self.addCleanup(poller.close)
+        self.addCleanup(device_health.forget, '192.0.2.7')
+        for _ in range(device_health.failure_threshold):
+            device_health.record_failure('192.0.2.7')
+        _, report = poller.run([target(7), target(8)])
+        self.assertEqual((report.skipped, report.succeeded), (1, 1))
+        self.assertEqual([device_id for _, device_id in report.slowest], [8])
+
+    def test_startup_check(self):
+        """测试启动检查如实反映asyncio接口是否可用，不可用时记录使用线程池"""
+        from app.utils import snmp_poller
+        if snmp_poller.ASYNC_SNMP_AVAILABLE:
+            self.assertTrue(check_async_snmp())
+            return
+        self.assertEqual(AsyncSnmpPoller().backend, BACKEND_THREAD)
+        with self.assertLogs('app.utils.snmp_poller', 'INFO') as logs:
+            self.assertFalse(check_async_snmp())
+        self.assertIn('线程池', logs.output[0])
+
+
+class TestThreadBackend(unittest.TestCase):
+    """线程池方式通过真实的UDP传输轮询本地SNMP应答方"""
+
+    def setUp(self):
+        self.agent = SnmpAgent('127.0.0.1', interface_mib(), delay=0.05)
+        # 不应答的设备，使用另一个回环地址，不影响应答方的设备健康状态
+        self.silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.silent.bind(('127.0.0.2', 0))
+        self.device_ids = list(range(301, 307))
+        for address in ('127.0.0.1', '127.0.0.2'):
+            self.addCleanup(device_health.forget, address)
+        for device_id in self.device_ids + [399]:
+            self.addCleanup(counter_families.forget, device_id)
+            self.addCleanup(interface_inventory.forget_device, device_id)
+
+    def tearDown(self):
+        self.agent.close()
+        self.silent.close()
+
+    def test_concurrent_poll_over_udp(self):
+        """测试线程池方式按并发上限同时轮询，解析真实响应中的64位计数器，不应答的设备在截止时间后结束"""
+        # 请求超时长于截止时间，不应答的设备由截止时间结束
+        poller = AsyncSnmpPoller(concurrency=3, device_deadline=1.5, timeout=3, retries=0, backend=BACKEND_THREAD)
+        self.addCleanup(poller.close)
+        targets = [PollTarget(device_id, '127.0.0.1', self.agent.port, 'public', '2c')
+                   for device_id in self.device_ids]
+        targets.append(PollTarget(399, '127.0.0.2', self.silent.getsockname()[1], 'public', '2c'))
+
+        results, report = poller.run(targets)
+
+        self.assertEqual((report.total, report.succeeded, report.timed_out), (7, 6, [399]))
+        self.assertEqual(self.agent.max_active, 3)
+        self.assertLess(results[-1]['duration'], 2.5)
+
+        first = results[0]
+        self.assertEqual(first['sys_uptime'], 123456)
+        self.assertEqual(counter_families.get(self.device_ids[0]), COUNTER_FAMILY_64)
+        interfaces = {interface['interface']: interface for interface in first['interfaces']}
+        self.assertEqual(sorted(interfaces), ['GigabitEthernet0/1', 'GigabitEthernet0/2'])
+        self.assertEqual(interfaces['GigabitEthernet0/2']['in_octets'], 2 ** 41)
+        self.assertEqual(interfaces['GigabitEthernet0/2']['in_errors'], 2)
+        self.assertEqual(interfaces['GigabitEthernet0/1']['bandwidth'], 1000000000)
+        self.assertEqual(interfaces['GigabitEthernet0/1']['status'], 'up')
+
+        # 第二轮复用线程池和线程中的SnmpEngine，接口表未变化时只遍历计数器列
+        results, report = poller.run(targets[:2])
+        self.assertEqual(report.succeeded, 2)
+        self.assertEqual(len(results[0]['interfaces']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
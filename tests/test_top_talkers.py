@@ -0,0 +1,105 @@
+"""
+流量大户统计测试脚本
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# 将项目根目录添加到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.flow_collector import NetFlowCollector, SFlowCollector
+from app.utils.flow_workers import FlowCollectorPool
+from app.utils.sflow import SFlowCounterStore
+from app.utils.top_talkers import TopTalkers, DIMENSION_CONVERSATION, DIMENSION_DST
+from tests.test_netflow_v5 import v5_packet
+
+
+def ip(value):
+    return '.'.join(str((value >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+
+
+def zipf_batch(rng, count):
+    src = (rng.zipf(1.5, count) % 5000 + 1).astype(np.uint64)
+    octets = rng.integers(64, 1500, count).astype(np.float64)
+    return src, octets
+
+
+class TestTopTalkers(unittest.TestCase):
+    """流量大户统计测试类"""
+
+    def test_bounded_sketch_finds_heavy_hitters(self):
+        """测试摘要容量固定，重流量的源地址与精确统计一致，估计值满足误差界"""
+        talkers = TopTalkers(capacity=16)
+        rng = np.random.default_rng(1)
+        exact = {}
+        for _ in range(50):
+            src, octets = zipf_batch(rng, 500)
+            ones = np.ones(len(src), dtype=np.uint64)
+            talkers.observe_arrays('10.0.0.1', ones, ones * 2, src, src, ones * 80, octets, now=1000.0)
+            for key, value in zip(src.tolist(), octets.tolist()):
+                exact[ip(key)] = exact.get(ip(key), 0) + value
+
+        result = talkers.query('10.0.0.1', 1, limit=16, now=1000.0)
+        self.assertEqual(len(result['talkers']), 16)
+        expected = sorted(exact, key=exact.get, reverse=True)[:5]
+        self.assertEqual([talker['src_addr'] for talker in result['talkers'][:5]], expected)
+        for talker in result['talkers']:
+            true_value = exact.get(talker['src_addr'], 0)
+            self.assertGreaterEqual(talker['bytes'] + 1, true_value)
+            self.assertGreaterEqual(true_value + 1, talker['bytes'] - talker['error'])
+
+    def test_windows_rotate(self):
+        """测试窗口按分钟轮换，查询可以合并多个窗口，超出保留数的窗口被丢弃"""
+        talkers = TopTalkers(windows=2)
+        flow = {'input_if': 3, 'output_if': 4, 'src_addr': '10.1.1.1', 'dst_addr': '10.2.2.2', 'dst_port': 443}
+        talkers.observe_flows('10.0.0.1', [dict(flow, bytes=100)], now=1000.0)
+        talkers.observe_flows('10.0.0.1', [dict(flow, bytes=50)], now=1070.0)
+
+        self.assertEqual(talkers.query('10.0.0.1', 3, now=1070.0)['talkers'][0]['bytes'], 50)
+        self.assertEqual(talkers.query('10.0.0.1', 3, windows=2, now=1070.0)['talkers'][0]['bytes'], 150)
+        conversation = talkers.query('10.0.0.1', 4, DIMENSION_CONVERSATION, windows=2, now=1070.0)['talkers'][0]
+        self.assertEqual((conversation['src_addr'], conversation['dst_addr'], conversation['dst_port']),
+                         ('10.1.1.1', '10.2.2.2', 443))
+
+        talkers.observe_flows('10.0.0.1', [dict(flow, bytes=10)], now=1130.0)
+        self.assertEqual(talkers.query('10.0.0.1', 3, windows=3, now=1130.0)['talkers'][0]['bytes'], 60)
+
+    def test_large_interface_index(self):
+        """测试32位的ifIndex（NX-OS、Junos等设备常见）不被截断，查询结果归入正确的接口"""
+        talkers = TopTalkers()
+        flow = {'input_if': 436207616, 'output_if': 2 ** 32 - 1, 'src_addr': '10.1.1.1', 'dst_addr': '10.2.2.2',
+                'dst_port': 443, 'bytes': 100}
+        talkers.observe_flows('10.0.0.1', [flow, dict(flow, input_if=1, src_addr='10.3.3.3', bytes=40)], now=1000.0)
+
+        result = talkers.query('10.0.0.1', 436207616, now=1000.0)
+        self.assertEqual(result['total_bytes'], 100)
+        self.assertEqual([(talker['src_addr'], talker['bytes']) for talker in result['talkers']], [('10.1.1.1', 100)])
+        self.assertEqual(talkers.query('10.0.0.1', 0, now=1000.0)['talkers'], [])
+        conversation = talkers.query('10.0.0.1', 2 ** 32 - 1, DIMENSION_CONVERSATION, now=1000.0)['talkers']
+        self.assertEqual([(talker['src_addr'], talker['dst_addr'], talker['dst_port'], talker['bytes'])
+                          for talker in conversation],
+                         [('10.1.1.1', '10.2.2.2', 443, 100), ('10.3.3.3', '10.2.2.2', 443, 40)])
+        self.assertIn(('10.0.0.1', 436207616), talkers.interfaces())
+
+    def test_collector_and_pool_merge(self):
+        """测试收集器解码v5数据包时更新摘要，收集进程的摘要可以合并到父进程"""
+        child = NetFlowCollector()
+        child.talkers = TopTalkers()
+        child._process_packets([(v5_packet([(0x0A000001, 0x0A000002, 3, 4, 1500)]), '10.0.0.1')])
+
+        parent = TopTalkers()
+        pool = FlowCollectorPool(2, netflow_collector=NetFlowCollector(), sflow_collector=SFlowCollector(),
+                                 counter_store=SFlowCounterStore(), talkers=parent)
+        pool.merge({}, [], child.talkers.drain())
+        pool.merge({}, [], [])
+        result = parent.query('10.0.0.1', 4, DIMENSION_DST)
+        self.assertEqual(result['talkers'][0], {'dst_addr': '10.0.0.2', 'bytes': 1500, 'error': 0})
+        self.assertEqual(parent.interfaces(), [('10.0.0.1', 3), ('10.0.0.1', 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()